@@ -4,7 +4,7 @@ Uses Pydantic Settings for environment variable management
 """
 
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 
 class Settings(BaseSettings):
@@ -21,6 +21,12 @@ class Settings(BaseSettings):
     PORT: int = 8000
     WORKERS: int = 4
     
+    # Unix Domain Socket
+    UNIX_SOCKET_PATH: str = ""  # Serve on this socket instead of HOST:PORT when set
+    UNIX_SOCKET_MODE: str = "600"  # Octal permissions of the socket file
+    UNIX_SOCKET_ALLOWED_UIDS: List[int] = []  # Peer users allowed to connect; empty means the server's user
+    UNIX_SOCKET_KEEP_TCP: bool = False  # Also serve HOST:PORT alongside the socket
+    
     # Security
     SECRET_KEY: str = "change-this-in-production"
     API_TOKEN: str = "change-this-in-production"
@@ -34,27 +40,154 @@ class Settings(BaseSettings):
     
     # Body Size
     MAX_BODY_SIZE: int = 10485760  # 10MB
+    REQUEST_STREAM_PARSE_MIN_BYTES: int = 262144  # /agents/run bodies this large, or chunked, are parsed as they arrive
+    REQUEST_SPOOL_THRESHOLD_BYTES: int = 262144  # Strings this long are collected in a spooled temp file while parsing
+    REQUEST_SPOOL_MEMORY_BYTES: int = 1048576  # ...which moves to disk beyond this size
     
     # Database
     DATABASE_URL: str = "sqlite:///./agent_cockpit.db"
     
+    # Startup
+    STARTUP_PREWARM_ENABLED: bool = True
+    STARTUP_PREWARM_DELAY_SECONDS: float = 0.5  # Let the server bind its port first
+    STARTUP_PREWARM_CONNECTIONS: int = 2
+    
+    # Readiness
+    READINESS_REFRESH_SECONDS: float = 10.0
+    READINESS_PROBE_TIMEOUT_SECONDS: float = 2.0
+    READINESS_PROVIDER_ENDPOINTS: Dict[str, str] = {}  # name -> URL; any non-5xx response is reachable
+    
     # Logging
     LOG_LEVEL: str = "INFO"
-    LOG_FORMAT: str = "json"
+    LOG_FORMAT: str = "json"  # json or console
+    LOG_QUEUE_SIZE: int = 10000  # Events beyond this are dropped, never awaited
+    LOG_SAMPLE_RATES: Dict[str, float] = {"http_request:/api/health": 0.01}
+    LOG_RATE_LIMITS: Dict[str, int] = {}  # Max events per second by event name
     
     # AgentScope
     AGENTSCOPE_MODEL: str = "gpt-4"
     AGENTSCOPE_TEMPERATURE: float = 0.7
     AGENTSCOPE_MAX_TOKENS: int = 2000
     
+    # Streaming
+    STREAM_JOURNAL_MAX_EVENTS: int = 1000
+    STREAM_JOURNAL_SPILL_DIR: str = ""  # Empty keeps journals in memory only
+    STREAM_RESUME_GRACE_SECONDS: float = 60.0
+    
+    # WebSocket Connections
+    WS_HEARTBEAT_INTERVAL_SECONDS: float = 20.0  # Ping clients quiet this long; 0 disables
+    WS_HEARTBEAT_TIMEOUT_SECONDS: float = 10.0  # Close connections that do not answer a ping in time
+    WS_IDLE_TIMEOUT_SECONDS: float = 300.0  # Close connections without runs or client actions; 0 disables
+    WS_MAX_CONNECTIONS_PER_CLIENT: int = 16  # Open connections per client; 0 disables
+    WS_TRUSTED_PROXIES: List[str] = []  # Proxy addresses or CIDR ranges whose X-Forwarded-For names the client
+    WS_MAX_RUNS_PER_CONNECTION: int = 4  # Runs streamed concurrently over one connection; 0 disables
+    WS_MAX_BUFFERED_BYTES: int = 1048576  # Unsent frames before a slow client is closed; 0 disables
+    WS_MESSAGE_RATE_PER_SECOND: float = 10.0  # Client messages per connection; 0 disables
+    WS_MESSAGE_BURST: int = 20
+    
+    # Workflows
+    WORKFLOW_MAX_STEPS: int = 50
+    WORKFLOW_MAX_PARALLEL_STEPS: int = 4  # Concurrent steps per workflow run
+    WORKFLOW_MEMO_MAX_ENTRIES: int = 1000  # Memoized step results; 0 disables
+    WORKFLOW_MEMO_TTL_SECONDS: int = 3600
+    
+    # Compare Mode
+    COMPARE_MAX_MODELS: int = 4  # Models one compare run may fan out to
+    
+    # Agent Import
+    AGENT_IMPORT_CACHE_DIR: str = "data/agent_repos"  # Bare mirrors of imported repositories
+    AGENT_IMPORT_CONCURRENCY: int = 4  # Repositories cloned or fetched at once
+    AGENT_IMPORT_GLOBS: List[str] = ["*.agent.json", "agents/*.json"]
+    AGENT_IMPORT_MAX_FILE_BYTES: int = 262144
+    AGENT_IMPORT_GIT_TIMEOUT_SECONDS: float = 300.0
+    
+    # Prompt Prefix Cache
+    PROMPT_CACHE_ENABLED: bool = True
+    PROMPT_CACHE_MAX_ENTRIES: int = 256
+    PROMPT_CACHE_MIN_TOKENS: int = 1024  # Smallest prefix providers will cache
+    PROMPT_CACHE_GOOGLE_TTL_SECONDS: int = 3600  # Lifetime of Gemini cached content created for a prefix
+    
+    # Prompt Library
+    PROMPT_LIBRARY_CACHE_ENTRIES: int = 512  # Compiled prompt versions kept in memory; 0 disables
+    PROMPT_LIBRARY_LATEST_TTL_SECONDS: float = 5.0  # How long "latest version" lookups are reused
+    
+    # Embeddings
+    EMBEDDING_MODEL: str = "hashing"  # Or a local sentence-transformers model name
+    EMBEDDING_DIM: int = 512
+    
+    # Semantic Response Cache
+    SEMANTIC_CACHE_AGENTS: List[str] = []  # Agent IDs that opt in, e.g. ["agent-1"]
+    SEMANTIC_CACHE_THRESHOLD: float = 0.8
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1000  # Per agent
+    SEMANTIC_CACHE_TTL_SECONDS: int = 86400
+    
+    # Knowledge Retrieval
+    RETRIEVAL_INDEX_DIR: str = "data/retrieval"
+    RETRIEVAL_CHUNK_WORDS: int = 200
+    RETRIEVAL_CHUNK_OVERLAP: int = 40
+    RETRIEVAL_QUANTIZATION: str = "int8"  # int8 or float32
+    RETRIEVAL_NPROBE: int = 8
+    RETRIEVAL_DEFAULT_TOP_K: int = 4
+    
+    # Serialization
+    JSON_BACKEND: str = "auto"  # auto, orjson or stdlib
+    
+    # Tracing
+    TRACING_ENABLED: bool = True
+    TRACE_SAMPLE_RATE: float = 1.0  # Share of new traces recorded; propagated traces follow the caller
+    TRACE_BUFFER_SIZE: int = 500  # Finished traces kept for /api/debug/traces
+    TRACE_EXPORT_FILE: str = ""  # OTLP/JSON lines file; empty disables export
+    
+    # Event Loop Monitor
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_MS: float = 100.0  # Lag sampling interval
+    LOOP_BLOCK_THRESHOLD_MS: float = 250.0  # Capture the loop's stack when blocked this long
+    LOOP_SLOW_CALLBACK_DEBUG: bool = False  # asyncio debug mode; adds overhead
+    LOOP_SLOW_CALLBACK_MS: float = 100.0
+    
+    # Profiler
+    PROFILER_ENABLED: bool = False  # /api/debug/profile is also available when DEBUG is on
+    PROFILER_MAX_SECONDS: int = 60
+    PROFILER_INTERVAL_MS: float = 10.0
+    
+    # Executors (per server worker process)
+    EXECUTOR_THREADS: int = 8  # For work that releases the GIL
+    EXECUTOR_PROCESSES: int = 2  # For pure-Python CPU work; 0 disables the process pool
+    EXECUTOR_START_METHOD: str = "spawn"  # spawn, forkserver or fork
+    EXECUTOR_PRELOAD_MODULES: List[str] = ["numpy", "app.services.embeddings"]
+    EXECUTOR_PROCESS_MIN_BATCH: int = 64  # Embed batches at least this large in the process pool
+    
+    # Usage Accounting
+    USAGE_ACCOUNTING_ENABLED: bool = True
+    USAGE_FLUSH_SECONDS: float = 5.0  # How often pending rollups are merged into the database
+    USAGE_MINUTE_RETENTION_HOURS: int = 48
+    USAGE_HOUR_RETENTION_DAYS: int = 90  # Day rollups are kept indefinitely
+    USAGE_MODEL_PRICES: Dict[str, Dict[str, float]] = {}  # USD per 1K tokens: {"gpt-4": {"prompt": 0.03, "completion": 0.06}}
+    
+    # Conversation History
+    HISTORY_ENABLED: bool = True  # Record runs that carry metadata.conversation_id
+    HISTORY_FLUSH_SECONDS: float = 1.0  # How often recorded messages are written to the database
+    HISTORY_MAX_PENDING: int = 10000  # Unwritten messages kept per worker; the oldest are dropped beyond this (0 = no limit)
+    HISTORY_SEARCH_LANGUAGE: str = "simple"  # PostgreSQL text search configuration
+    
     # API Keys
     OPENAI_API_KEY: str = ""
     ANTHROPIC_API_KEY: str = ""
     GOOGLE_API_KEY: str = ""
     
+    # Providers
+    PROVIDER_BASE_URL: str = ""  # Send provider calls here, e.g. the provider emulator; empty uses mock responses
+    PROVIDER_TIMEOUT_SECONDS: float = 60.0
+    PROVIDER_MAX_CONNECTIONS: int = 100
+    
     # Audit Log
     AUDIT_LOG_ENABLED: bool = True
     AUDIT_LOG_FILE: str = "logs/audit.log"
+    AUDIT_LOG_MAX_BYTES: int = 64 * 1024 * 1024  # Seal the active file into a compressed segment at this size
+    AUDIT_LOG_ROTATE_SECONDS: int = 86400  # ...or when its first record is this old
+    AUDIT_LOG_BLOCK_RECORDS: int = 256  # Records per compressed block; one sparse index entry each
+    AUDIT_LOG_MAX_SEGMENTS: int = 0  # Oldest segments beyond this are deleted; 0 keeps all
+    AUDIT_LOG_QUEUE_SIZE: int = 10000
     
     # Monitoring
     METRICS_ENABLED: bool = True
@@ -18,7 +18,21 @@ from typing import Callable
 from app.config import settings
 from app.middleware.auth import AuthMiddleware
 from app.middleware.audit import AuditLogMiddleware
-from app.routes import agents, health
+from app.routes import agents, audit, debug, health, history, knowledge, prompts, usage
+from app.services.audit_log import audit_log
+from app.services.connections import connection_manager
+from app.services.database import dispose_engine
+from app.services.executor import executors
+from app.services.history import conversation_history
+from app.services.log_pipeline import log_pipeline
+from app.services.loop_monitor import loop_monitor
+from app.services.prewarm import prewarmer
+from app.services.providers import provider_client
+from app.services.readiness import readiness
+from app.services.serialization import FastJSONResponse
+from app.services.stream_journal import journals
+from app.services.tracing import new_request_id, tracer
+from app.services.usage import usage_accounting
 
 # Configure structured logging
 logger = structlog.get_logger(__name__)
@@ -34,9 +48,25 @@ async def lifespan(app: FastAPI):
     Handles startup and shutdown events
     """
     # Startup
+    log_pipeline.start()
+    tracer.start_exporter()
+    executors.start()
+    if settings.AUDIT_LOG_ENABLED:
+        audit_log.start()
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
     logger.info("application_startup", version=settings.APP_VERSION, env=settings.APP_ENV)
     
-    # Initialize database connection pool
+    # Warm the database pool and optional subsystems once the port is open,
+    # then start the background dependency probes
+    if settings.STARTUP_PREWARM_ENABLED:
+        prewarmer.start(then=readiness.start)
+    else:
+        readiness.start()
+    if settings.USAGE_ACCOUNTING_ENABLED:
+        usage_accounting.start()
+    if settings.HISTORY_ENABLED:
+        conversation_history.start()
     # Initialize AgentScope runtime
     # Load models
     
@@ -44,8 +74,21 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("application_shutdown")
+    connection_manager.shutdown()
+    await loop_monitor.stop()
+    await prewarmer.stop()
+    await readiness.stop()
+    await journals.shutdown()
+    await usage_accounting.stop()
+    await conversation_history.stop()
+    await executors.shutdown()
+    await provider_client.close()
     # Close database connections
+    dispose_engine()
     # Cleanup resources
+    tracer.stop_exporter()
+    audit_log.stop()
+    log_pipeline.stop()
 
 
 # Create FastAPI application
@@ -56,6 +99,7 @@ app = FastAPI(
     docs_url="/api/docs" if settings.DEBUG else None,
     redoc_url="/api/redoc" if settings.DEBUG else None,
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 # Add rate limiter to app state
@@ -75,7 +119,7 @@ if settings.CORS_ENABLED:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-        expose_headers=["X-Request-ID", "X-RateLimit-Remaining"],
+        expose_headers=["X-Request-ID", "X-RateLimit-Remaining", "traceparent"],
     )
 
 # GZip Compression
@@ -92,17 +136,27 @@ if settings.AUDIT_LOG_ENABLED:
 # Request timing middleware
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next: Callable):
-    """Add processing time header to all responses"""
+    """Add processing time, request ID and trace context headers to all responses"""
     start_time = time.time()
     
     # Add request ID
-    request_id = request.headers.get("X-Request-ID", f"req_{int(time.time() * 1000)}")
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    request.state.request_id = request_id
     
-    response = await call_next(request)
+    with tracer.start_trace(
+        "http_request",
+        traceparent=request.headers.get("traceparent"),
+        method=request.method,
+        path=request.url.path,
+        request_id=request_id,
+    ) as root:
+        response = await call_next(request)
+        root.set(status_code=response.status_code)
     
     process_time = time.time() - start_time
     response.headers["X-Process-Time"] = str(process_time)
     response.headers["X-Request-ID"] = request_id
+    response.headers["traceparent"] = root.traceparent
     
     # Log request
     logger.info(
@@ -112,6 +166,7 @@ async def add_process_time_header(request: Request, call_next: Callable):
         status_code=response.status_code,
         process_time=process_time,
         request_id=request_id,
+        trace_id=root.trace_id,
     )
     
     return response
@@ -140,6 +195,24 @@ app.include_router(health.router, prefix="/api/health", tags=["Health"])
 # Agent endpoints
 app.include_router(agents.router, prefix="/api/agents", tags=["Agents"])
 
+# Knowledge retrieval endpoints
+app.include_router(knowledge.router, prefix="/api/knowledge", tags=["Knowledge"])
+
+# Prompt library
+app.include_router(prompts.router, prefix="/api/prompts", tags=["Prompts"])
+
+# Conversation history search
+app.include_router(history.router, prefix="/api/history", tags=["History"])
+
+# Usage analytics
+app.include_router(usage.router, prefix="/api/usage", tags=["Usage"])
+
+# Audit log queries
+app.include_router(audit.router, prefix="/api/audit", tags=["Audit"])
+
+# Debug endpoints
+app.include_router(debug.router, prefix="/api/debug", tags=["Debug"])
+
 
 # ============================================================================
 # ROOT ENDPOINT
@@ -166,6 +239,10 @@ async def api_info():
         "endpoints": {
             "health": "/api/health",
             "agents": "/api/agents",
+            "knowledge": "/api/knowledge",
+            "usage": "/api/usage",
+            "audit": "/api/audit",
+            "debug": "/api/debug",
             "docs": "/api/docs" if settings.DEBUG else "disabled",
         },
     }
@@ -195,13 +272,19 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 
 if __name__ == "__main__":
-    import uvicorn
-    
-    uvicorn.run(
-        "app.main:app",
-        host=settings.HOST,
-        port=settings.PORT,
-        reload=settings.DEBUG,
-        workers=1 if settings.DEBUG else settings.WORKERS,
-        log_level=settings.LOG_LEVEL.lower(),
-    )
+    if settings.UNIX_SOCKET_PATH:
+        from app.services.unix_socket import serve
+        
+        serve()
+    else:
+        import uvicorn
+        
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            reload=settings.DEBUG,
+            workers=1 if settings.DEBUG else settings.WORKERS,
+            log_level=settings.LOG_LEVEL.lower(),
+            access_log=False,  # Requests are logged by add_process_time_header
+        )
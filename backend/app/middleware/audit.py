@@ -5,15 +5,10 @@ Logs all API requests for security and compliance
 
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
-import structlog
 import time
-import json
-from pathlib import Path
 
-from app.config import settings
-
-logger = structlog.get_logger(__name__)
+from app.services.audit_log import audit_log
+from app.services.tracing import tracer
 
 
 class AuditLogMiddleware(BaseHTTPMiddleware):
@@ -21,13 +16,6 @@ class AuditLogMiddleware(BaseHTTPMiddleware):
     Audit log middleware that records all API requests
     """
     
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
-        
-        # Ensure log directory exists
-        log_file = Path(settings.AUDIT_LOG_FILE)
-        log_file.parent.mkdir(parents=True, exist_ok=True)
-    
     async def dispatch(self, request: Request, call_next):
         """
         Log request details before and after processing
@@ -42,7 +30,7 @@ class AuditLogMiddleware(BaseHTTPMiddleware):
             "query_params": dict(request.query_params),
             "client_ip": request.client.host if request.client else None,
             "user_agent": request.headers.get("user-agent"),
-            "request_id": request.headers.get("X-Request-ID"),
+            "request_id": getattr(request.state, "request_id", None) or request.headers.get("X-Request-ID"),
         }
         
         # Process request
@@ -54,14 +42,8 @@ class AuditLogMiddleware(BaseHTTPMiddleware):
             "duration_ms": (time.time() - start_time) * 1000,
         })
         
-        # Write to audit log
-        try:
-            with open(settings.AUDIT_LOG_FILE, "a") as f:
-                f.write(json.dumps(request_info) + "\n")
-        except Exception as e:
-            logger.error("audit_log_write_failed", error=str(e))
-        
-        # Also log to structured logger
-        logger.info("audit_log", **request_info)
+        # Hand off to the audit log writer thread
+        with tracer.span("audit"):
+            audit_log.append(request_info)
         
         return response
@@ -10,6 +10,8 @@ from starlette.types import ASGIApp
 import structlog
 
 from app.config import settings
+from app.services.tracing import tracer
+from app.services.unix_socket import peer_credentials
 
 logger = structlog.get_logger(__name__)
 
@@ -42,6 +44,23 @@ class AuthMiddleware(BaseHTTPMiddleware):
         if request.url.path in PUBLIC_PATHS or request.url.path.startswith("/api/docs"):
             return await call_next(request)
         
+        # Unix socket peers were authenticated by their credentials on connect
+        if peer_credentials(request.scope) is not None:
+            return await call_next(request)
+        
+        with tracer.span("auth"):
+            rejection = self.authenticate(request)
+        if rejection is not None:
+            return rejection
+        
+        # Token is valid, continue
+        logger.debug("authenticated_request", path=request.url.path)
+        return await call_next(request)
+    
+    def authenticate(self, request: Request):
+        """
+        Return an error response if the request is not authenticated, else None
+        """
         # Get token from header
         auth_header = request.headers.get("Authorization")
         
@@ -74,6 +93,4 @@ class AuthMiddleware(BaseHTTPMiddleware):
                 content={"detail": "Invalid authentication token"},
             )
         
-        # Token is valid, continue
-        logger.debug("authenticated_request", path=request.url.path)
-        return await call_next(request)
+        return None
@@ -3,18 +3,35 @@ Agent Endpoints
 AgentScope integration for agent execution
 """
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, status
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Request, WebSocket, HTTPException, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import List, Dict, Any, Optional, TypeVar
+from contextlib import aclosing
 import structlog
 import asyncio
 import json
+import time
 
 from app.config import settings
+from app.services.agent_import import agent_importer
+from app.services.agent_registry import agent_registry
+from app.services.connections import Connection, connection_manager
+from app.services.context import RunContext, build_run_context
+from app.services.history import conversation_history
+from app.services.prompt_cache import estimate_tokens, provider_for_model
+from app.services.prompt_library import PromptNotFound, TemplateError, prompt_library
+from app.services.providers import ProviderError, ProviderUsage, provider_client
+from app.services.semantic_cache import RunLookup, semantic_cache
+from app.services.streaming_json import BodyTooLarge, JSONStreamError, StreamingObjectParser
+from app.services.stream_journal import JournalTruncated, RunJournal, journals
+from app.services.tracing import TracedRoute, tracer
+from app.services.usage import UsageEvent, usage_accounting
+from app.services.workflows import StepOutcome, WorkflowRequest, WorkflowRun, WorkflowStep
 
 logger = structlog.get_logger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 # ============================================================================
@@ -28,6 +45,20 @@ class Message(BaseModel):
     name: Optional[str] = None
 
 
+class RetrievalOptions(BaseModel):
+    """Knowledge retrieval settings for a run"""
+    top_k: int = Field(4, ge=1, le=50)
+    min_score: float = 0.0
+    query: Optional[str] = None  # Defaults to the last user message
+
+
+class PromptReference(BaseModel):
+    """A prompt library template to render into a run"""
+    id: str
+    version: Optional[int] = Field(None, ge=1)  # Defaults to the latest version
+    variables: Dict[str, str] = {}
+
+
 class AgentRunRequest(BaseModel):
     """Request model for agent execution"""
     agent_id: str
@@ -36,9 +67,26 @@ class AgentRunRequest(BaseModel):
     temperature: Optional[float] = None
     max_tokens: Optional[int] = None
     tools: Optional[List[Dict[str, Any]]] = None
+    pinned_documents: Optional[List[str]] = None
+    retrieval: Optional[RetrievalOptions] = None
+    prompt: Optional[PromptReference] = None
     metadata: Optional[Dict[str, Any]] = None
 
 
+class AgentCompareRequest(AgentRunRequest):
+    """Request model for running the same messages against several models"""
+    models: List[str] = Field(..., min_length=1)
+
+    @field_validator("models")
+    @classmethod
+    def _check_models(cls, models: List[str]) -> List[str]:
+        if len(set(models)) != len(models):
+            raise ValueError("Models must be unique")
+        if len(models) > settings.COMPARE_MAX_MODELS:
+            raise ValueError(f"At most {settings.COMPARE_MAX_MODELS} models can be compared")
+        return models
+
+
 class AgentRunResponse(BaseModel):
     """Response model for agent execution"""
     agent_id: str
@@ -48,88 +96,565 @@ class AgentRunResponse(BaseModel):
     duration_ms: float
 
 
+class ModelResult(BaseModel):
+    """One model's answer in a compare run"""
+    message: Optional[Message] = None
+    usage: Dict[str, int] = {}
+    metadata: Dict[str, Any] = {}
+    duration_ms: float
+    error: Optional[str] = None
+
+
+class AgentCompareResponse(BaseModel):
+    """Response model for compare runs"""
+    agent_id: str
+    results: Dict[str, ModelResult]
+    duration_ms: float
+
+
 # ============================================================================
 # REST ENDPOINT
 # ============================================================================
 
-@router.post("/run", response_model=AgentRunResponse)
-async def run_agent(request: AgentRunRequest):
+def _semantic_cache_metadata(lookup: Optional[RunLookup]) -> Dict[str, Any]:
+    """Response metadata describing the semantic cache outcome of a run"""
+    if lookup is None:
+        return {}
+    if lookup.hit is None:
+        return {"semantic_cache": {"hit": False}}
+    return {"semantic_cache": {"hit": True, "similarity": round(lookup.hit.similarity, 4)}}
+
+
+def _record_usage(
+    agent_id: str,
+    context: Optional[RunContext],
+    usage: Dict[str, int],
+    start_time: float,
+    **flags: bool,
+):
+    """Account a finished run in the usage rollups"""
+    model = context.model if context is not None else settings.AGENTSCOPE_MODEL
+    usage_accounting.record(UsageEvent.from_usage(
+        agent_id,
+        provider_for_model(model),
+        model,
+        usage,
+        latency_ms=(time.time() - start_time) * 1000,
+        **flags,
+    ))
+
+
+def _record_turn(request: AgentRunRequest, context: RunContext, answer: str):
+    """Add a finished run to the conversation history when it names a conversation"""
+    conversation_id = (request.metadata or {}).get("conversation_id")
+    if conversation_id:
+        conversation_history.record_turn(
+            str(conversation_id),
+            request.agent_id,
+            [message.model_dump() for message in request.messages],
+            answer,
+            model=context.model,
+        )
+
+
+def _inline_refs(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve a model schema's local $refs so it can be embedded in the OpenAPI document"""
+    defs = schema.pop("$defs", {})
+
+    def resolve(node: Any) -> Any:
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(defs[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        return node
+
+    return resolve(schema)
+
+
+def _prefixed_errors(error: ValidationError, *loc: Any) -> List[Dict[str, Any]]:
+    return [{**item, "loc": ("body", *loc, *item["loc"])} for item in error.errors(include_url=False)]
+
+
+async def _read_run_request(http_request: Request) -> AgentRunRequest:
+    """
+    Read and validate a run request body
+
+    Small bodies are validated in one go. Bodies of at least
+    REQUEST_STREAM_PARSE_MIN_BYTES, or without a Content-Length, are parsed as
+    they arrive: every message is validated as soon as it is complete, so an
+    invalid one rejects the request without reading the rest, and long
+    contents are spooled rather than buffered alongside the raw body.
+    """
+    content_length = http_request.headers.get("content-length")
+    if content_length is not None and int(content_length) < settings.REQUEST_STREAM_PARSE_MIN_BYTES:
+        with tracer.span("body_parse", mode="buffered"):
+            try:
+                return AgentRunRequest.model_validate_json(await http_request.body())
+            except ValidationError as e:
+                raise RequestValidationError(_prefixed_errors(e))
+
+    messages: List[Message] = []
+
+    def on_message(index: int, value: Any):
+        try:
+            messages.append(Message.model_validate(value))
+        except ValidationError as e:
+            raise RequestValidationError(_prefixed_errors(e, "messages", index))
+
+    parser = StreamingObjectParser(
+        "messages",
+        on_message,
+        spool_threshold=settings.REQUEST_SPOOL_THRESHOLD_BYTES,
+        spool_max_memory=settings.REQUEST_SPOOL_MEMORY_BYTES,
+        max_bytes=settings.MAX_BODY_SIZE,
+    )
+    with tracer.span("body_parse", mode="streaming") as span:
+        try:
+            async for chunk in http_request.stream():
+                parser.feed(chunk)
+            fields = parser.close()
+        except BodyTooLarge:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Request body too large",
+            )
+        except JSONStreamError as e:
+            raise RequestValidationError([{
+                "type": "json_invalid",
+                "loc": ("body", e.offset),
+                "msg": "JSON decode error",
+                "input": {},
+                "ctx": {"error": str(e)},
+            }])
+        if span is not None:
+            span.set(bytes=parser.received, messages=len(messages), spooled_strings=parser.spooled_strings)
+
+        if isinstance(fields.get("messages"), list):
+            # The array's items were streamed; already-validated messages pass through as model instances
+            fields = {**fields, "messages": messages}
+        try:
+            return AgentRunRequest.model_validate(fields)
+        except ValidationError as e:
+            raise RequestValidationError(_prefixed_errors(e))
+
+
+RunRequestT = TypeVar("RunRequestT", bound=AgentRunRequest)
+
+
+async def _apply_prompt(request: RunRequestT) -> RunRequestT:
+    """
+    Render the request's prompt library template into the run
+    
+    The template's messages go before the request's own, and its system
+    prompt is used unless the request sets one. The reference is pinned to
+    the version that was rendered.
+    """
+    if request.prompt is None:
+        return request
+    reference = request.prompt
+    try:
+        rendered = await prompt_library.resolve(reference.id, reference.version, reference.variables)
+    except PromptNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except TemplateError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return request.model_copy(update={
+        "system_prompt": request.system_prompt if request.system_prompt is not None else rendered.system_prompt,
+        "messages": [Message(**message) for message in rendered.messages] + request.messages,
+        "prompt": reference.model_copy(update={"version": rendered.version}),
+    })
+
+
+@router.post(
+    "/run",
+    response_model=AgentRunResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _inline_refs(AgentRunRequest.model_json_schema())}},
+        },
+    },
+)
+async def run_agent(http_request: Request):
     """
     Run an agent with the given messages and configuration
     
     This endpoint executes an agent synchronously and returns the complete response.
     For streaming responses, use the /stream WebSocket endpoint.
     """
+    request = await _apply_prompt(await _read_run_request(http_request))
+    
     try:
         logger.info("agent_run_request", agent_id=request.agent_id)
+        return await execute_run(request)
         
+    except ProviderError as e:
+        logger.error("agent_run_provider_error", agent_id=request.agent_id, status_code=e.status_code, error=str(e))
+        if e.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            headers = {"Retry-After": f"{e.retry_after:g}"} if e.retry_after is not None else None
+            raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
+    
+    except Exception as e:
+        logger.error("agent_run_error", agent_id=request.agent_id, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Agent execution failed: {str(e)}",
+        )
+
+
+async def execute_run(request: AgentRunRequest, model: Optional[str] = None) -> AgentRunResponse:
+    """Execute a run to completion; shared by /run, /compare and workflow steps"""
+    start_time = time.time()
+    context = None
+    
+    try:
         # TODO: Implement actual AgentScope execution
         # For now, return a mock response
         
-        import time
-        start_time = time.time()
+        context = await build_run_context(request, model=model)
+        cache_lookup = await semantic_cache.lookup_run(context)
+        
+        if cache_lookup is not None and cache_lookup.hit is not None:
+            _record_usage(request.agent_id, context, context.cached_answer_usage(), start_time, cache_hit=True)
+            if model is None:
+                _record_turn(request, context, cache_lookup.hit.entry.answer)
+            return AgentRunResponse(
+                agent_id=request.agent_id,
+                message=Message(role="assistant", content=cache_lookup.hit.entry.answer),
+                usage=context.cached_answer_usage(),
+                metadata={**context.metadata(), **_semantic_cache_metadata(cache_lookup)},
+                duration_ms=(time.time() - start_time) * 1000,
+            )
         
-        # Simulate agent processing
-        await asyncio.sleep(0.1)
+        with tracer.span("provider_call", provider=context.provider, model=context.model):
+            provider_usage = ProviderUsage()
+            if provider_client.enabled:
+                content = "".join([text async for text in provider_client.stream(context, provider_usage)])
+            else:
+                # Mock response
+                await asyncio.sleep(0.1)
+                content = "This is a mock response. AgentScope integration pending."
         
-        # Mock response
         response = AgentRunResponse(
             agent_id=request.agent_id,
             message=Message(
                 role="assistant",
-                content="This is a mock response. AgentScope integration pending.",
+                content=content,
             ),
-            usage={
-                "prompt_tokens": 100,
-                "completion_tokens": 50,
-                "total_tokens": 150,
-            },
-            metadata={
-                "model": settings.AGENTSCOPE_MODEL,
-                "temperature": request.temperature or settings.AGENTSCOPE_TEMPERATURE,
-            },
+            usage=context.usage(estimate_tokens(content), provider_usage.cached_tokens),
+            metadata={**context.metadata(), **_semantic_cache_metadata(cache_lookup)},
             duration_ms=(time.time() - start_time) * 1000,
         )
         
+        if cache_lookup is not None:
+            semantic_cache.store_run(context, cache_lookup, content)
+        
+        _record_usage(request.agent_id, context, response.usage, start_time)
+        if model is None:
+            _record_turn(request, context, content)
         logger.info("agent_run_complete", agent_id=request.agent_id, duration_ms=response.duration_ms)
         
         return response
         
+    except Exception:
+        _record_usage(request.agent_id, context, {}, start_time, error=True)
+        raise
+
+
+async def _compare_one(request: AgentCompareRequest, model: str) -> ModelResult:
+    start_time = time.time()
+    try:
+        response = await execute_run(request, model=model)
     except Exception as e:
-        logger.error("agent_run_error", agent_id=request.agent_id, error=str(e))
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Agent execution failed: {str(e)}",
-        )
+        logger.error("agent_compare_error", agent_id=request.agent_id, model=model, error=str(e))
+        return ModelResult(duration_ms=(time.time() - start_time) * 1000, error=str(e))
+    return ModelResult(
+        message=response.message,
+        usage=response.usage,
+        metadata=response.metadata,
+        duration_ms=response.duration_ms,
+    )
+
+
+@router.post("/compare", response_model=AgentCompareResponse)
+async def compare_agent(request: AgentCompareRequest):
+    """
+    Run the same messages against several models concurrently
+    
+    The run takes as long as the slowest model. A failing model is reported
+    in its result without failing the others. For token streaming, send the
+    same body with "action": "compare" over the /stream WebSocket.
+    """
+    start_time = time.time()
+    request = await _apply_prompt(request)
+    logger.info("agent_compare_request", agent_id=request.agent_id, models=request.models)
+    results = await asyncio.gather(*(_compare_one(request, model) for model in request.models))
+    return AgentCompareResponse(
+        agent_id=request.agent_id,
+        results=dict(zip(request.models, results)),
+        duration_ms=(time.time() - start_time) * 1000,
+    )
+
+
+# ============================================================================
+# WORKFLOWS
+# ============================================================================
+
+async def _execute_workflow_step(step: WorkflowStep, prompt: str) -> StepOutcome:
+    """Run one workflow step as an ordinary agent run"""
+    response = await execute_run(AgentRunRequest(
+        agent_id=step.agent_id,
+        messages=[Message(role="user", content=prompt)],
+        system_prompt=step.system_prompt,
+        temperature=step.temperature,
+        max_tokens=step.max_tokens,
+        metadata={"workflow_step": step.id},
+    ))
+    return response.message.content, response.usage
+
+
+@router.post("/workflow")
+async def run_workflow(request: WorkflowRequest):
+    """
+    Run a DAG of agent steps and return every step's result
+    
+    Independent steps run concurrently. For progress events, send the same
+    body with "action": "workflow" over the /stream WebSocket.
+    """
+    logger.info("workflow_request", steps=len(request.steps))
+    return await WorkflowRun(request, _execute_workflow_step).run()
 
 
 # ============================================================================
 # WEBSOCKET ENDPOINT
 # ============================================================================
 
-class ConnectionManager:
-    """Manages WebSocket connections"""
+async def _produce_run(journal: RunJournal, request: AgentRunRequest, traceparent: Optional[str] = None):
+    """
+    Execute a streaming agent run, appending every event to its journal
+    
+    Runs as a background task so that a client disconnect does not lose the run.
+    The run is traced as its own root span, continuing the trace of the
+    WebSocket handshake when the client sent a traceparent header.
+    """
+    with tracer.start_trace(
+        "agent_stream_run",
+        traceparent=traceparent,
+        agent_id=request.agent_id,
+        run_id=journal.run_id,
+    ):
+        tracer.record("queue_wait", journal.created_ns)
+        await _stream_run(journal, request)
+
+
+async def _stream_run(journal: RunJournal, request: AgentRunRequest):
+    agent_id = request.agent_id
+    
+    try:
+        # Send start event
+        journal.append({
+            "type": "start",
+            "agent_id": agent_id,
+            "run_id": journal.run_id,
+            "done": False,
+        })
+        
+        result = await _stream_answer(journal, request)
+        
+        # Send completion event
+        journal.append({
+            "type": "complete",
+            "usage": result["usage"],
+            "metadata": result["metadata"],
+            "done": True,
+        })
+        
+        logger.info("websocket_agent_complete", agent_id=agent_id, run_id=journal.run_id)
+    
+    except asyncio.CancelledError:
+        journal.append({"type": "error", "error": "Run cancelled", "done": True})
+        raise
+    
+    except Exception as e:
+        logger.error("websocket_agent_error", agent_id=agent_id, error=str(e))
+        event = {"type": "error", "error": str(e), "done": True}
+        if isinstance(e, ProviderError):
+            event.update(status_code=e.status_code, retry_after=e.retry_after)
+        journal.append(event)
+
+
+async def _mock_tokens():
+    # TODO: Implement actual AgentScope streaming
+    words = "This is a mock streaming response from AgentScope.".split()
+    for index, word in enumerate(words):
+        yield word if index == len(words) - 1 else word + " "
+        await asyncio.sleep(0.05)  # Simulate network delay
+
+
+async def _stream_answer(journal: RunJournal, request: AgentRunRequest, model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Stream one model's answer into the journal as token events
     
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    With ``model`` set (compare runs) the token events are tagged with it.
+    Returns the usage, metadata and timings of the answer.
+    """
+    tag = {"model": model} if model is not None else {}
+    start_time = time.time()
+    context = None
+    
+    try:
+        context = await build_run_context(request, model=model)
+        cache_lookup = await semantic_cache.lookup_run(context)
+        
+        if cache_lookup is not None and cache_lookup.hit is not None:
+            journal.append({
+                "type": "token",
+                **tag,
+                "content": cache_lookup.hit.entry.answer,
+                "done": False,
+            })
+            _record_usage(request.agent_id, context, context.cached_answer_usage(), start_time, cache_hit=True)
+            if model is None:
+                _record_turn(request, context, cache_lookup.hit.entry.answer)
+            elapsed_ms = (time.time() - start_time) * 1000
+            return {
+                "usage": context.cached_answer_usage(),
+                "metadata": {**context.metadata(), **_semantic_cache_metadata(cache_lookup)},
+                "ttft_ms": elapsed_ms,
+                "duration_ms": elapsed_ms,
+            }
+        
+        provider_usage = ProviderUsage()
+        tokens = provider_client.stream(context, provider_usage) if provider_client.enabled else _mock_tokens()
+        
+        provider_start = time.time_ns()
+        first_token_at = None
+        parts = []
+        async with aclosing(tokens):
+            async for text in tokens:
+                journal.append({
+                    "type": "token",
+                    **tag,
+                    "content": text,
+                    "done": False,
+                })
+                parts.append(text)
+                if first_token_at is None:
+                    first_token_at = time.time_ns()
+                    tracer.record("provider_ttft", provider_start, first_token_at, provider=context.provider)
+        tracer.record("streaming", first_token_at or provider_start, tokens=len(parts))
+        answer = "".join(parts)
+        
+        if cache_lookup is not None:
+            semantic_cache.store_run(context, cache_lookup, answer)
+        
+        usage = context.usage(estimate_tokens(answer), provider_usage.cached_tokens)
+        _record_usage(request.agent_id, context, usage, start_time)
+        if model is None:
+            _record_turn(request, context, answer)
+        return {
+            "usage": usage,
+            "metadata": {**context.metadata(), **_semantic_cache_metadata(cache_lookup)},
+            "ttft_ms": ((first_token_at or time.time_ns()) / 1e9 - start_time) * 1000,
+            "duration_ms": (time.time() - start_time) * 1000,
+        }
+    
+    except Exception:
+        _record_usage(request.agent_id, context, {}, start_time, error=True)
+        raise
+
+
+async def _produce_compare(journal: RunJournal, request: AgentCompareRequest, traceparent: Optional[str] = None):
+    """Stream a compare run in the background, all models into one journal"""
+    with tracer.start_trace(
+        "agent_compare_run",
+        traceparent=traceparent,
+        agent_id=request.agent_id,
+        run_id=journal.run_id,
+    ):
+        tracer.record("queue_wait", journal.created_ns)
+        await _stream_compare(journal, request)
+
+
+async def _stream_compare(journal: RunJournal, request: AgentCompareRequest):
+    """
+    Fan the messages out to every model at once
     
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info("websocket_connected", total_connections=len(self.active_connections))
+    Token events of all models interleave on the run, each tagged with its
+    model. A "model_complete" or "model_error" event marks the end of one
+    model's answer; the final "complete" event has the timings of all of them.
+    """
+    start_time = time.time()
+    journal.append({
+        "type": "start",
+        "agent_id": request.agent_id,
+        "run_id": journal.run_id,
+        "models": request.models,
+        "done": False,
+    })
     
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        logger.info("websocket_disconnected", total_connections=len(self.active_connections))
+    async def stream_model(model: str) -> Dict[str, Any]:
+        model_start = time.time()
+        try:
+            with tracer.span("compare_model", model=model):
+                result = await _stream_answer(journal, request, model=model)
+        except Exception as e:
+            logger.error("websocket_compare_error", agent_id=request.agent_id, model=model, error=str(e))
+            result = {"error": str(e), "duration_ms": (time.time() - model_start) * 1000}
+            journal.append({"type": "model_error", "model": model, "error": str(e), "done": False})
+        else:
+            journal.append({"type": "model_complete", "model": model, **result, "done": False})
+        return result
     
-    async def send_json(self, websocket: WebSocket, data: dict):
-        await websocket.send_json(data)
+    try:
+        results = await asyncio.gather(*(stream_model(model) for model in request.models))
+    except asyncio.CancelledError:
+        journal.append({"type": "error", "error": "Run cancelled", "done": True})
+        raise
     
-    async def send_text(self, websocket: WebSocket, message: str):
-        await websocket.send_text(message)
+    journal.append({
+        "type": "complete",
+        "models": dict(zip(request.models, results)),
+        "duration_ms": (time.time() - start_time) * 1000,
+        "done": True,
+    })
+    logger.info("websocket_compare_complete", agent_id=request.agent_id, run_id=journal.run_id)
 
 
-manager = ConnectionManager()
+async def _produce_workflow(journal: RunJournal, request: WorkflowRequest, traceparent: Optional[str] = None):
+    """Execute a workflow in the background, appending its progress to the journal"""
+    with tracer.start_trace("workflow_stream_run", traceparent=traceparent, run_id=journal.run_id):
+        tracer.record("queue_wait", journal.created_ns)
+        run = WorkflowRun(request, _execute_workflow_step, emit=journal.append, run_id=journal.run_id)
+        try:
+            await run.run()
+        except asyncio.CancelledError:
+            journal.append({"type": "error", "error": "Run cancelled", "done": True})
+            raise
+        except Exception as e:
+            logger.error("workflow_error", run_id=journal.run_id, error=str(e))
+            journal.append({"type": "error", "error": str(e), "done": True})
+
+
+async def _forward_run(connection: Connection, journal: RunJournal, last_seq: int = 0):
+    """Send journal events after ``last_seq`` to the client until the run ends"""
+    try:
+        async with aclosing(journal.follow(last_seq)) as events:
+            async for event in events:
+                # Runs share the connection, so every event says which run it belongs to
+                connection.send_json({**event, "run_id": journal.run_id})
+    except JournalTruncated:
+        connection.send_json({
+            "type": "error",
+            "run_id": journal.run_id,
+            "error": "Requested events are no longer available",
+            "done": True,
+        })
+    finally:
+        journals.detach(journal)
 
 
 @router.websocket("/stream")
@@ -151,7 +676,8 @@ async def stream_agent(websocket: WebSocket):
     {
         "type": "token",
         "content": "Hello",
-        "done": false
+        "done": false,
+        "seq": 2
     }
     
     Final message:
@@ -159,129 +685,192 @@ async def stream_agent(websocket: WebSocket):
         "type": "complete",
         "usage": {...},
         "metadata": {...},
-        "done": true
+        "done": true,
+        "seq": 12
     }
+    
+    {"action": "compare", "models": ["gpt-4", "claude-3-opus"], ...} streams
+    the same run from several models at once; token events carry a "model".
+    
+    {"action": "workflow", "steps": [...], "inputs": {...}} runs a workflow
+    (see POST /workflow) and streams "step_start", "step_complete",
+    "step_skipped" and "step_error" events before the final one.
+    
+    The "start" event carries a "run_id". A client that lost its connection
+    can reconnect and send {"action": "resume", "run_id": "...", "last_seq": 5}
+    to receive the events it missed followed by the live remainder of the run.
+    
+    The server sends {"type": "ping"} to clients that have been quiet for a
+    while and closes the connection if no message follows; clients answer
+    with {"action": "pong"}. See app.services.connections for the limits.
     """
-    await manager.connect(websocket)
+    connection = await connection_manager.connect(websocket)
+    if connection is None:
+        return
     
     try:
-        while True:
-            # Receive message from client
-            data = await websocket.receive_json()
-            
-            action = data.get("action")
-            
-            if action == "run":
-                agent_id = data.get("agent_id")
-                messages = data.get("messages", [])
-                
-                logger.info("websocket_agent_run", agent_id=agent_id)
-                
-                try:
-                    # TODO: Implement actual AgentScope streaming
-                    # For now, simulate streaming
-                    
-                    # Send start event
-                    await manager.send_json(websocket, {
-                        "type": "start",
-                        "agent_id": agent_id,
-                        "done": False,
-                    })
-                    
-                    # Simulate streaming tokens
-                    mock_response = "This is a mock streaming response from AgentScope."
-                    words = mock_response.split()
-                    
-                    for word in words:
-                        await manager.send_json(websocket, {
-                            "type": "token",
-                            "content": word + " ",
-                            "done": False,
-                        })
-                        await asyncio.sleep(0.05)  # Simulate network delay
-                    
-                    # Send completion event
-                    await manager.send_json(websocket, {
-                        "type": "complete",
-                        "usage": {
-                            "prompt_tokens": 100,
-                            "completion_tokens": 50,
-                            "total_tokens": 150,
-                        },
-                        "metadata": {
-                            "model": settings.AGENTSCOPE_MODEL,
-                        },
-                        "done": True,
-                    })
-                    
-                    logger.info("websocket_agent_complete", agent_id=agent_id)
-                    
-                except Exception as e:
-                    logger.error("websocket_agent_error", agent_id=agent_id, error=str(e))
-                    await manager.send_json(websocket, {
-                        "type": "error",
-                        "error": str(e),
-                        "done": True,
-                    })
-            
-            elif action == "ping":
-                # Heartbeat
-                await manager.send_json(websocket, {"type": "pong"})
-            
-            else:
-                await manager.send_json(websocket, {
-                    "type": "error",
-                    "error": f"Unknown action: {action}",
-                })
+        await connection.serve(_handle_stream_message)
+    finally:
+        connection_manager.disconnect(connection)
+
+
+async def _handle_stream_message(connection: Connection, data: Dict[str, Any]):
+    """Handle one client message on an /agents/stream connection"""
+    action = data.get("action")
     
-    except WebSocketDisconnect:
-        manager.disconnect(websocket)
-        logger.info("websocket_client_disconnected")
+    if action in ("run", "compare", "workflow", "resume") and connection.runs_at_limit():
+        connection.reject_run()
+        return
     
-    except Exception as e:
-        logger.error("websocket_error", error=str(e))
-        manager.disconnect(websocket)
+    traceparent = connection.websocket.headers.get("traceparent")
+    
+    if action == "run":
+        try:
+            run_request = await _apply_prompt(AgentRunRequest.model_validate(data))
+        except ValidationError as e:
+            connection.send_json({
+                "type": "error",
+                "error": f"Invalid run request: {e.errors(include_url=False)}",
+                "done": True,
+            })
+            return
+        except HTTPException as e:
+            connection.send_json({"type": "error", "error": e.detail, "done": True})
+            return
+        
+        journal = journals.create()
+        logger.info("websocket_agent_run", agent_id=run_request.agent_id, run_id=journal.run_id)
+        
+        journals.start(journal, _produce_run(journal, run_request, traceparent))
+        connection.start_run(_forward_run(connection, journal))
+    
+    elif action == "compare":
+        try:
+            compare_request = await _apply_prompt(AgentCompareRequest.model_validate(data))
+        except ValidationError as e:
+            connection.send_json({
+                "type": "error",
+                "error": f"Invalid compare request: {e.errors(include_url=False)}",
+                "done": True,
+            })
+            return
+        except HTTPException as e:
+            connection.send_json({"type": "error", "error": e.detail, "done": True})
+            return
+        
+        journal = journals.create()
+        logger.info(
+            "websocket_agent_compare",
+            agent_id=compare_request.agent_id,
+            models=compare_request.models,
+            run_id=journal.run_id,
+        )
+        
+        journals.start(journal, _produce_compare(journal, compare_request, traceparent))
+        connection.start_run(_forward_run(connection, journal))
+    
+    elif action == "workflow":
+        try:
+            workflow_request = WorkflowRequest.model_validate(data)
+        except ValidationError as e:
+            connection.send_json({
+                "type": "error",
+                "error": f"Invalid workflow: {e.errors(include_url=False)}",
+                "done": True,
+            })
+            return
+        
+        journal = journals.create()
+        logger.info("websocket_workflow_run", steps=len(workflow_request.steps), run_id=journal.run_id)
+        
+        journals.start(journal, _produce_workflow(journal, workflow_request, traceparent))
+        connection.start_run(_forward_run(connection, journal))
+    
+    elif action == "resume":
+        run_id = data.get("run_id")
+        last_seq = data.get("last_seq", 0)
+        
+        if not isinstance(last_seq, int) or isinstance(last_seq, bool) or last_seq < 0:
+            connection.send_json({
+                "type": "error",
+                "run_id": run_id,
+                "error": f"Invalid last_seq: {last_seq!r}, expected a non-negative integer",
+                "done": True,
+            })
+            return
+        
+        resumed = journals.get(run_id) if isinstance(run_id, str) else None
+        
+        if resumed is None:
+            connection.send_json({
+                "type": "error",
+                "run_id": run_id,
+                "error": f"Unknown or expired run: {run_id}",
+                "done": True,
+            })
+            return
+        
+        logger.info("websocket_agent_resume", run_id=run_id, last_seq=last_seq)
+        connection.start_run(_forward_run(connection, resumed, last_seq))
+    
+    elif action == "ping":
+        # Heartbeat
+        connection.send_json({"type": "pong"})
+    
+    else:
+        connection.send_json({
+            "type": "error",
+            "error": f"Unknown action: {action}",
+        })
 
 
 # ============================================================================
 # AGENT MANAGEMENT
 # ============================================================================
 
+class ImportRepository(BaseModel):
+    """One Git repository to import agent definitions from"""
+    url: str = Field(..., min_length=1)
+    ref: str = "HEAD"
+    path: str = ""  # Only import definitions below this directory
+
+
+class AgentImportRequest(BaseModel):
+    """Request model for importing agents from Git"""
+    repositories: List[ImportRepository] = Field(..., min_length=1)
+
+
 @router.get("/")
 async def list_agents():
-    """List available agents"""
-    # TODO: Implement actual agent listing from database
-    return {
-        "agents": [
-            {
-                "id": "agent-1",
-                "name": "General Assistant",
-                "description": "General purpose AI assistant",
-                "model": "gpt-4",
-                "status": "active",
-            },
-            {
-                "id": "agent-2",
-                "name": "Code Assistant",
-                "description": "Specialized in code generation and review",
-                "model": "gpt-4",
-                "status": "active",
-            },
-        ],
-        "total": 2,
-    }
+    """List built-in and imported agents"""
+    agents = await asyncio.to_thread(agent_registry.list_agents)
+    return {"agents": agents, "total": len(agents)}
+
+
+@router.post("/import")
+async def import_agents(request: AgentImportRequest):
+    """Clone or fetch repositories concurrently and sync their agent definitions"""
+    repositories = {repository.url: repository.model_dump() for repository in request.repositories}
+    with tracer.span("agent_import", repositories=len(repositories)) as span:
+        results = await agent_importer.sync_all(list(repositories.values()))
+        if span is not None:
+            span.set(failed=sum(result["status"] == "failed" for result in results))
+    return {"results": results}
+
+
+@router.get("/import/sources")
+async def list_import_sources():
+    """Repositories agents were imported from, with their last synced commit"""
+    return {"sources": await asyncio.to_thread(agent_registry.sources)}
 
 
 @router.get("/{agent_id}")
 async def get_agent(agent_id: str):
     """Get agent details"""
-    # TODO: Implement actual agent retrieval from database
-    return {
-        "id": agent_id,
-        "name": "Sample Agent",
-        "description": "A sample agent",
-        "model": settings.AGENTSCOPE_MODEL,
-        "temperature": settings.AGENTSCOPE_TEMPERATURE,
-        "max_tokens": settings.AGENTSCOPE_MAX_TOKENS,
-        "status": "active",
-    }
+    agent = await asyncio.to_thread(agent_registry.get, agent_id)
+    if agent is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Agent not found: {agent_id}",
+        )
+    return agent
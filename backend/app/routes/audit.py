@@ -0,0 +1,66 @@
+"""
+Audit Endpoints
+Time-range queries over the audit trail
+"""
+
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from app.services.audit_log import AuditQuery, audit_log
+from app.services.serialization import dumps
+from app.services.tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+def _parse_time(name: str, value: Optional[str]) -> Optional[float]:
+    """Unix seconds or an ISO 8601 datetime"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{name} must be Unix seconds or an ISO 8601 datetime",
+        )
+
+
+@router.get("/")
+async def query_audit_log(
+    start: Optional[str] = Query(None, description="Unix seconds or ISO 8601, inclusive"),
+    end: Optional[str] = Query(None, description="Unix seconds or ISO 8601, inclusive"),
+    client_ip: Optional[str] = None,
+    request_id: Optional[str] = None,
+    path: Optional[str] = Query(None, description="Exact request path"),
+    status_code: Optional[int] = None,
+    limit: int = Query(1000, ge=1, le=100000),
+):
+    """
+    Stream matching audit records as JSON lines
+
+    Sealed segments whose time range and bloom filters rule out a match are
+    skipped, and only index blocks overlapping the time range are
+    decompressed.
+    """
+    query = AuditQuery(
+        start=_parse_time("start", start),
+        end=_parse_time("end", end),
+        client_ip=client_ip,
+        request_id=request_id,
+        path=path,
+        status_code=status_code,
+    )
+
+    def lines():
+        # Sync generator: Starlette iterates it in a worker thread
+        for record in audit_log.query(query, limit=limit):
+            yield dumps(record) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,110 @@
+"""
+Debug Endpoints
+Recent request traces, per-stage latency breakdowns and on-demand profiling
+"""
+
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+
+from app.config import settings
+from app.services.profiler import PROFILE_MODES, ProfilerBusy, SamplingProfiler, profiler_guard
+from app.services.tracing import TracedRoute, tracer
+
+router = APIRouter(route_class=TracedRoute)
+
+
+@router.get("/traces")
+async def list_traces(
+    limit: int = Query(20, ge=1, le=500),
+    name: Optional[str] = Query(None, description="Root span name, e.g. http_request or agent_stream_run"),
+):
+    """Most recent traces from the in-memory ring buffer, newest first"""
+    return {
+        "traces": [
+            {
+                "trace_id": spans[-1].trace_id,
+                "name": spans[-1].name,
+                "duration_ms": spans[-1].duration_ms,
+                "attributes": spans[-1].attributes,
+                "spans": len(spans),
+            }
+            for spans in tracer.recent(limit=limit, name=name)
+        ],
+    }
+
+
+@router.get("/traces/summary")
+async def trace_summary(
+    name: Optional[str] = Query(None, description="Only traces with this root span name"),
+    path: Optional[str] = Query(None, description="Only HTTP traces for this path"),
+):
+    """
+    p50/p95/p99 latency per span name across buffered traces
+    
+    For example ``?path=/api/agents/run`` shows which stage the tail
+    latency of agent runs comes from.
+    """
+    return tracer.summary(name=name, path=path)
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """All spans of a buffered trace, in start order"""
+    spans = tracer.find(trace_id)
+    if spans is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Trace not found: {trace_id}",
+        )
+    return {
+        "trace_id": trace_id,
+        "spans": [span.to_dict() for span in sorted(spans, key=lambda span: span.start_ns)],
+    }
+
+
+@router.get("/profile")
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    mode: str = Query("wall", description="wall or cpu"),
+    interval_ms: Optional[float] = Query(None, ge=1.0, le=1000.0),
+    format: str = Query("collapsed", description="collapsed or json"),
+):
+    """
+    Profile this worker for ``seconds`` with a sampling profiler
+    
+    The worker keeps serving requests while it is sampled. The default
+    collapsed-stack output can be fed to flamegraph.pl or speedscope. Only
+    available when DEBUG or PROFILER_ENABLED is on; one profile at a time.
+    """
+    if not (settings.DEBUG or settings.PROFILER_ENABLED):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profiler is disabled",
+        )
+    
+    if seconds > settings.PROFILER_MAX_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"seconds must be at most {settings.PROFILER_MAX_SECONDS}",
+        )
+    if mode not in PROFILE_MODES or format not in ("collapsed", "json"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"mode must be one of {list(PROFILE_MODES)} and format collapsed or json",
+        )
+    
+    try:
+        profiler = SamplingProfiler(interval_ms=interval_ms or settings.PROFILER_INTERVAL_MS, mode=mode)
+        await profiler_guard.run(profiler, seconds)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    if format == "json":
+        return profiler.summary()
+    return PlainTextResponse(
+        profiler.collapsed() + "\n",
+        headers={"X-Profile-Samples": str(profiler.samples)},
+    )
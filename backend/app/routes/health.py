@@ -3,14 +3,29 @@ Health Check Endpoints
 System health and readiness checks
 """
 
-from fastapi import APIRouter, status
+from fastapi import APIRouter, Response, status
 from pydantic import BaseModel
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from app.config import settings
+from app.services.agent_import import agent_importer
+from app.services.audit_log import audit_log
+from app.services.connections import connection_manager
+from app.services.executor import executors
+from app.services.history import conversation_history
+from app.services.log_pipeline import log_pipeline
+from app.services.loop_monitor import loop_monitor
+from app.services.prewarm import prewarmer
+from app.services.prompt_cache import prefix_cache
+from app.services.prompt_library import prompt_library
+from app.services.readiness import readiness
+from app.services.semantic_cache import semantic_cache
+from app.services.tracing import TracedRoute
+from app.services.usage import usage_accounting
+from app.services.workflows import step_memo
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 class HealthResponse(BaseModel):
@@ -26,6 +41,7 @@ class ReadinessResponse(BaseModel):
     ready: bool
     checks: Dict[str, Any]
     timestamp: float
+    checked_at: Optional[float] = None
 
 
 @router.get("/", response_model=HealthResponse)
@@ -44,29 +60,17 @@ async def health_check():
 
 
 @router.get("/ready", response_model=ReadinessResponse)
-async def readiness_check():
+async def readiness_check(response: Response):
     """
     Readiness check endpoint
-    Validates that all dependencies are available
+    Reports the cached results of the background dependency probes
+    (database pool, model providers, job queue); 503 if any probe failed
     """
-    checks = {}
-    ready = True
-    
-    # Database check
-    try:
-        # TODO: Actual database connectivity check
-        checks["database"] = {"status": "ok", "latency_ms": 5}
-    except Exception as e:
-        checks["database"] = {"status": "error", "error": str(e)}
-        ready = False
+    ready, checks = await readiness.snapshot()
     
     # AgentScope check
-    try:
-        # TODO: Check if AgentScope is initialized
-        checks["agentscope"] = {"status": "ok"}
-    except Exception as e:
-        checks["agentscope"] = {"status": "error", "error": str(e)}
-        ready = False
+    # TODO: Check if AgentScope is initialized
+    checks["agentscope"] = {"status": "ok"}
     
     # API keys check
     checks["api_keys"] = {
@@ -75,12 +79,13 @@ async def readiness_check():
         "google": bool(settings.GOOGLE_API_KEY),
     }
     
-    status_code = status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    response.status_code = status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
     
     return ReadinessResponse(
         ready=ready,
         checks=checks,
         timestamp=time.time(),
+        checked_at=readiness.checked_at,
     )
 
 
@@ -95,6 +100,19 @@ async def metrics():
         "requests_total": 0,
         "requests_per_minute": 0,
         "average_response_time_ms": 0,
-        "active_connections": 0,
+        "active_connections": len(connection_manager.active_connections),
         "uptime_seconds": 0,
+        "prompt_cache": prefix_cache.stats(),
+        "prompt_library": prompt_library.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "logging": log_pipeline.stats(),
+        "event_loop": loop_monitor.stats(),
+        "prewarm": prewarmer.stats(),
+        "audit_log": audit_log.stats(),
+        "usage": usage_accounting.stats(),
+        "history": conversation_history.stats(),
+        "executors": executors.stats(),
+        "workflow_memo": step_memo.stats(),
+        "agent_import": agent_importer.stats(),
+        "websockets": connection_manager.stats(),
     }
@@ -0,0 +1,114 @@
+"""
+History Endpoints
+Search and browse past conversations
+"""
+
+from fastapi import APIRouter, HTTPException, Query, status
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import asyncio
+import time
+
+from app.services.history import SORTS, InvalidCursor, SearchFilters, conversation_history
+from app.services.tracing import TracedRoute, tracer
+
+router = APIRouter(route_class=TracedRoute)
+
+
+# ============================================================================
+# MODELS
+# ============================================================================
+
+class HistoryMessage(BaseModel):
+    """A conversation message to import"""
+    conversation_id: str = Field(..., min_length=1, max_length=255)
+    agent_id: str = Field(..., min_length=1, max_length=255)
+    role: str = Field(..., pattern=r"^(user|assistant|system)$")
+    content: str
+    model: Optional[str] = None
+    created_at: Optional[float] = None  # Defaults to now
+
+
+class HistoryImportRequest(BaseModel):
+    """Request model for importing conversation messages"""
+    messages: List[HistoryMessage] = Field(..., min_length=1, max_length=1000)
+
+
+# ============================================================================
+# ENDPOINTS
+# ============================================================================
+
+@router.get("/search")
+async def search_history(
+    q: str = Query(..., min_length=1, max_length=500),
+    agent_id: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    role: Optional[str] = None,
+    start: Optional[float] = Query(None, description="Unix seconds, inclusive"),
+    end: Optional[float] = Query(None, description="Unix seconds, exclusive"),
+    sort: str = "relevance",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+):
+    """
+    Search conversation messages
+
+    Every word must match the start of a word in the message. Results
+    carry an HTML snippet with matches in <mark>; pass ``next_cursor`` back
+    as ``cursor`` for the next page.
+    """
+    if sort not in SORTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"sort must be one of: {', '.join(SORTS)}",
+        )
+    filters = SearchFilters(agent_id=agent_id, conversation_id=conversation_id, role=role, start=start, end=end)
+    store = conversation_history.store
+    with tracer.span("history_search", sort=sort) as span:
+        try:
+            results, next_cursor = await asyncio.to_thread(store.search, q, filters, sort, cursor, limit)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if span is not None:
+            span.set(backend=store.backend, results=len(results))
+    return {"results": results, "next_cursor": next_cursor, "search_backend": store.backend}
+
+
+@router.post("/messages", status_code=status.HTTP_201_CREATED)
+async def import_history(request: HistoryImportRequest):
+    """Import existing conversation messages, e.g. chats kept in the browser"""
+    now = time.time()
+    messages = [
+        {**message.model_dump(), "created_at": message.created_at if message.created_at is not None else now}
+        for message in request.messages
+    ]
+    ids = await asyncio.to_thread(conversation_history.store.append, messages)
+    return {"ids": ids}
+
+
+@router.get("/conversations/{conversation_id}")
+async def get_conversation(
+    conversation_id: str,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    """Messages of one conversation, oldest first"""
+    try:
+        messages, next_cursor = await asyncio.to_thread(
+            conversation_history.store.conversation, conversation_id, cursor, limit,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"conversation_id": conversation_id, "messages": messages, "next_cursor": next_cursor}
+
+
+@router.delete("/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str):
+    """Delete a conversation's messages from the history and the search index"""
+    deleted = await asyncio.to_thread(conversation_history.store.delete_conversation, conversation_id)
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Conversation not found: {conversation_id}",
+        )
+    return {"deleted": deleted}
@@ -0,0 +1,118 @@
+"""
+Knowledge Endpoints
+Document ingestion and search for agent retrieval
+"""
+
+from fastapi import APIRouter, HTTPException, Query, status
+from pydantic import BaseModel
+from typing import List, Dict, Any, Optional
+import hashlib
+import structlog
+
+from app.services.retrieval import Document, knowledge_base
+from app.services.tracing import TracedRoute
+
+logger = structlog.get_logger(__name__)
+
+router = APIRouter(route_class=TracedRoute)
+
+
+# ============================================================================
+# MODELS
+# ============================================================================
+
+class DocumentIn(BaseModel):
+    """Document submitted for ingestion"""
+    doc_id: Optional[str] = None  # Defaults to a hash of the text
+    title: Optional[str] = None
+    text: str
+    metadata: Optional[Dict[str, Any]] = None
+
+
+class IngestRequest(BaseModel):
+    """Request model for document ingestion"""
+    documents: List[DocumentIn]
+
+
+class IngestResponse(BaseModel):
+    """Response model for document ingestion"""
+    generation: str
+    documents: int
+    chunks: int
+    embedded_chunks: int
+    reused_chunks: int
+
+
+class SearchResult(BaseModel):
+    """A retrieved chunk"""
+    doc_id: str
+    title: Optional[str] = None
+    chunk_id: int
+    text: str
+    score: float
+    metadata: Dict[str, Any]
+
+
+class SearchResponse(BaseModel):
+    """Response model for knowledge search"""
+    query: str
+    results: List[SearchResult]
+
+
+# ============================================================================
+# ENDPOINTS
+# ============================================================================
+# Index builds and searches are CPU-bound, so these are plain functions that
+# FastAPI runs in its threadpool instead of on the event loop.
+
+@router.get("/")
+def knowledge_stats():
+    """Index statistics"""
+    return knowledge_base.stats()
+
+
+@router.post("/documents", response_model=IngestResponse)
+def ingest_documents(request: IngestRequest):
+    """
+    Add or replace documents in the knowledge index
+
+    Documents are chunked and embedded, and a new index generation is
+    published. Unchanged documents are not embedded again.
+    """
+    documents = [
+        Document(
+            doc_id=doc.doc_id or hashlib.sha256(doc.text.encode("utf-8")).hexdigest()[:16],
+            text=doc.text,
+            title=doc.title,
+            metadata=doc.metadata or {},
+        )
+        for doc in request.documents
+    ]
+
+    logger.info("knowledge_ingest_request", documents=len(documents))
+    return IngestResponse(**knowledge_base.ingest(documents))
+
+
+@router.delete("/documents/{doc_id}")
+def delete_document(doc_id: str):
+    """Remove a document from the knowledge index"""
+    if not knowledge_base.delete(doc_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Document not found: {doc_id}",
+        )
+    return {"deleted": doc_id}
+
+
+@router.get("/search", response_model=SearchResponse)
+def search_knowledge(
+    q: str = Query(..., min_length=1),
+    k: int = Query(4, ge=1, le=50),
+    min_score: float = Query(0.0, ge=-1.0, le=1.0),
+):
+    """Search the knowledge index"""
+    results = knowledge_base.search(q, k=k, min_score=min_score)
+    return SearchResponse(
+        query=q,
+        results=[SearchResult(**chunk.__dict__) for chunk in results],
+    )
@@ -0,0 +1,172 @@
+"""
+Prompt Endpoints
+Versioned prompt templates for the prompt library
+"""
+
+from fastapi import APIRouter, HTTPException, Query, status
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, Dict, List, Optional
+import structlog
+
+from app.services.prompt_library import PromptNotFound, TemplateError, prompt_library
+from app.services.tracing import TracedRoute
+
+logger = structlog.get_logger(__name__)
+
+router = APIRouter(route_class=TracedRoute)
+
+
+# ============================================================================
+# MODELS
+# ============================================================================
+
+class TemplateMessage(BaseModel):
+    """A message template; ``{{ name }}`` placeholders are filled at run time"""
+    role: str
+    content: str
+
+
+class PromptTemplate(BaseModel):
+    """The versioned content of a prompt"""
+    system_prompt: Optional[str] = None
+    messages: List[TemplateMessage] = []
+    defaults: Dict[str, str] = {}
+
+    @model_validator(mode="after")
+    def _check_content(self) -> "PromptTemplate":
+        if self.system_prompt is None and not self.messages:
+            raise ValueError("A prompt needs a system_prompt or messages")
+        return self
+
+
+class PromptCreate(PromptTemplate):
+    """Request model for creating a prompt"""
+    id: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9_.-]+$", max_length=64)
+    name: str = Field(..., min_length=1, max_length=255)
+    description: str = ""
+    category: str = ""
+    tags: List[str] = []
+
+
+class PromptVersionCreate(PromptTemplate):
+    """Request model for a new prompt version; unset details are kept"""
+    name: Optional[str] = Field(None, min_length=1, max_length=255)
+    description: Optional[str] = None
+    category: Optional[str] = None
+    tags: Optional[List[str]] = None
+
+
+class RenderRequest(BaseModel):
+    """Request model for previewing a rendered prompt"""
+    version: Optional[int] = Field(None, ge=1)
+    variables: Dict[str, str] = {}
+
+
+# ============================================================================
+# ENDPOINTS
+# ============================================================================
+# Prompt storage is blocking database access, so these are plain functions
+# that FastAPI runs in its threadpool instead of on the event loop.
+
+def _template(body: PromptTemplate) -> Dict[str, Any]:
+    return {
+        "system_prompt": body.system_prompt,
+        "messages": [message.model_dump() for message in body.messages],
+        "defaults": body.defaults,
+    }
+
+
+@router.get("/")
+def list_prompts(
+    q: Optional[str] = Query(None, max_length=500),
+    category: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
+    """
+    List prompts, most recently updated first
+
+    With ``q`` the prompts are searched instead: every word must match the
+    start of a word in the name, description, category, tags or template,
+    and results are ranked by relevance.
+    """
+    if q is not None and q.strip():
+        prompts = prompt_library.search(q, category=category, limit=limit)
+        return {"prompts": prompts, "total": len(prompts)}
+    prompts, total = prompt_library.list(category=category, limit=limit, offset=offset)
+    return {"prompts": prompts, "total": total}
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+def create_prompt(body: PromptCreate):
+    """Create a prompt; its template becomes version 1"""
+    try:
+        return prompt_library.create(
+            body.name,
+            _template(body),
+            description=body.description,
+            category=body.category,
+            tags=body.tags,
+            prompt_id=body.id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@router.get("/{prompt_id}")
+def get_prompt(prompt_id: str):
+    """A prompt with its latest version"""
+    try:
+        return prompt_library.get(prompt_id)
+    except PromptNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.delete("/{prompt_id}")
+def delete_prompt(prompt_id: str):
+    """Delete a prompt and all of its versions"""
+    if not prompt_library.delete(prompt_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Prompt not found: {prompt_id}")
+    return {"deleted": prompt_id}
+
+
+@router.post("/{prompt_id}/versions", status_code=status.HTTP_201_CREATED)
+def create_prompt_version(prompt_id: str, body: PromptVersionCreate):
+    """Save a new version of a prompt's template"""
+    try:
+        return prompt_library.add_version(
+            prompt_id,
+            _template(body),
+            name=body.name,
+            description=body.description,
+            category=body.category,
+            tags=body.tags,
+        )
+    except PromptNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.get("/{prompt_id}/versions/{version}")
+def get_prompt_version(prompt_id: str, version: int):
+    """One version of a prompt's template"""
+    try:
+        return prompt_library.get_version(prompt_id, version)
+    except PromptNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.post("/{prompt_id}/render")
+def render_prompt(prompt_id: str, body: RenderRequest):
+    """Preview a prompt with variables filled in, as a run would see it"""
+    try:
+        rendered = prompt_library.compiled(prompt_id, body.version).render(body.variables)
+    except PromptNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except TemplateError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {
+        "id": rendered.prompt_id,
+        "version": rendered.version,
+        "system_prompt": rendered.system_prompt,
+        "messages": rendered.messages,
+    }
@@ -0,0 +1,84 @@
+"""
+Usage Endpoints
+Token usage, latency and cost for the analytics dashboard
+"""
+
+from fastapi import APIRouter, HTTPException, Query, status
+from typing import Dict, List, Optional, Tuple
+import time
+
+from app.services.tracing import TracedRoute
+from app.services.usage import DIMENSIONS, RESOLUTIONS, usage_accounting
+
+router = APIRouter(route_class=TracedRoute)
+
+
+def _time_range(start: Optional[float], end: Optional[float]) -> Tuple[float, float]:
+    """Defaults to the last 24 hours"""
+    end = time.time() if end is None else end
+    start = end - 86400 if start is None else start
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end")
+    return start, end
+
+
+def _group_by(value: str) -> List[str]:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = set(names) - set(DIMENSIONS)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown group_by dimension(s): {', '.join(sorted(unknown))}",
+        )
+    return names
+
+
+def _filters(agent_id: Optional[str], provider: Optional[str], model: Optional[str]) -> Dict[str, str]:
+    values = {"agent_id": agent_id, "provider": provider, "model": model}
+    return {name: value for name, value in values.items() if value is not None}
+
+
+@router.get("/timeseries")
+async def usage_timeseries(
+    start: Optional[float] = Query(None, description="Unix seconds; defaults to 24 hours before end"),
+    end: Optional[float] = Query(None, description="Unix seconds; defaults to now"),
+    resolution: Optional[str] = Query(None, description="minute, hour or day; picked from the range if omitted"),
+    group_by: str = Query("agent_id,model", description="Comma-separated: agent_id, provider, model"),
+    agent_id: Optional[str] = None,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+):
+    """Usage per time bucket, read from the pre-aggregated rollups"""
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"resolution must be one of: {', '.join(RESOLUTIONS)}",
+        )
+    start, end = _time_range(start, end)
+    return await usage_accounting.query(
+        start,
+        end,
+        resolution=resolution,
+        group_by=_group_by(group_by),
+        filters=_filters(agent_id, provider, model),
+    )
+
+
+@router.get("/summary")
+async def usage_summary(
+    start: Optional[float] = Query(None, description="Unix seconds; defaults to 24 hours before end"),
+    end: Optional[float] = Query(None, description="Unix seconds; defaults to now"),
+    group_by: str = Query("agent_id", description="Comma-separated: agent_id, provider, model"),
+    agent_id: Optional[str] = None,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+):
+    """Usage totals over the range, merged across time buckets"""
+    start, end = _time_range(start, end)
+    return await usage_accounting.query(
+        start,
+        end,
+        group_by=_group_by(group_by),
+        filters=_filters(agent_id, provider, model),
+        bucketed=False,
+    )
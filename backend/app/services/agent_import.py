@@ -0,0 +1,338 @@
+"""
+Agent Import
+Syncs agent definitions from Git repositories into the agent registry
+
+Each repository is kept as a bare mirror under ``AGENT_IMPORT_CACHE_DIR``:
+it is cloned on the first sync and fetched afterwards, with at most
+``AGENT_IMPORT_CONCURRENCY`` Git operations running at once. Syncs of one
+repository are serialized across workers by a file lock next to its mirror. A sync reads
+only the files changed since the commit recorded for the repository (all
+matching files on the first sync, when that commit is gone after a force
+push, or when the requested path differs from the recorded one). Files whose content hash is unchanged are not parsed again,
+and definitions are parsed in the process pool when there are many of them.
+
+Definition files are JSON objects in the ``AgentDefinition`` format,
+matched by ``AGENT_IMPORT_GLOBS`` below the requested path. ``id`` defaults
+to the file name. Anything Git can clone works as a URL, including local
+bare repositories.
+"""
+
+import asyncio
+import fnmatch
+import hashlib
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import structlog
+from pydantic import ValidationError
+
+from app.config import settings
+from app.services.agent_registry import AgentDefinition, AgentRegistry, agent_registry
+from app.services.executor import executors
+from app.services.serialization import loads
+
+try:
+    import fcntl
+except ImportError:  # Windows: workers are not coordinated
+    fcntl = None  # type: ignore[assignment]
+
+logger = structlog.get_logger(__name__)
+
+_LOCK_POLL_SECONDS = 0.05
+_DEFINITION_SUFFIXES = (".agent.json", ".json")
+
+
+class GitError(RuntimeError):
+    """A git command failed or timed out, or its arguments were refused"""
+
+
+async def run_git(*args: str, cwd: Optional[Path] = None, stdin: Optional[bytes] = None) -> bytes:
+    """Run git without a terminal and return its stdout"""
+    process = await asyncio.create_subprocess_exec(
+        "git",
+        *args,
+        cwd=cwd,
+        stdin=asyncio.subprocess.PIPE if stdin is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            process.communicate(stdin), timeout=settings.AGENT_IMPORT_GIT_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise GitError(f"git {args[0]} timed out")
+    if process.returncode != 0:
+        raise GitError(f"git {args[0]} failed: {stderr.decode('utf-8', 'replace').strip()}")
+    return stdout
+
+
+def default_agent_id(path: str) -> str:
+    name = path.rsplit("/", 1)[-1]
+    for suffix in _DEFINITION_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def parse_definitions(files: List[Tuple[str, bytes]]) -> List[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """Process pool task: (path, definition, error) for each definition file"""
+    results: List[Tuple[str, Optional[Dict[str, Any]], Optional[str]]] = []
+    for path, data in files:
+        try:
+            document = loads(data)
+            if not isinstance(document, dict):
+                raise ValueError("Expected a JSON object")
+            document.setdefault("id", default_agent_id(path))
+            results.append((path, AgentDefinition.model_validate(document).model_dump(), None))
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            results.append((path, None, errors))
+        except ValueError as e:
+            results.append((path, None, str(e)))
+    return results
+
+
+def _parse_diff(output: bytes) -> Tuple[List[str], List[str]]:
+    """Changed and deleted paths from ``git diff --name-status -z``"""
+    fields = output.decode("utf-8", "surrogateescape").split("\0")
+    changed: List[str] = []
+    removed: List[str] = []
+    for status, path in zip(fields[0::2], fields[1::2]):
+        (removed if status.startswith("D") else changed).append(path)
+    return changed, removed
+
+
+def _parse_cat_file(output: bytes, paths: List[str]) -> Tuple[List[Tuple[str, bytes]], List[Dict[str, str]]]:
+    """Split ``git cat-file --batch`` output into file contents, in request order"""
+    files, errors = [], []
+    position = 0
+    for path in paths:
+        header_end = output.index(b"\n", position)
+        header = output[position:header_end].split(b" ")
+        position = header_end + 1
+        if header[-1] == b"missing":
+            errors.append({"path": path, "error": "File not found"})
+            continue
+        size = int(header[2])
+        data = output[position:position + size]
+        position += size + 1
+        if size > settings.AGENT_IMPORT_MAX_FILE_BYTES:
+            errors.append({"path": path, "error": f"File is larger than {settings.AGENT_IMPORT_MAX_FILE_BYTES} bytes"})
+        else:
+            files.append((path, data))
+    return files, errors
+
+
+class AgentImporter:
+    """
+    Imports agent definitions from Git repositories
+
+    ``sync_all`` syncs several repositories concurrently and reports each
+    separately; a failing repository does not affect the others.
+    """
+
+    def __init__(
+        self,
+        registry: Optional[AgentRegistry] = None,
+        cache_dir: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        globs: Optional[List[str]] = None,
+    ):
+        self.registry = registry or agent_registry
+        self.cache_dir = Path(cache_dir or settings.AGENT_IMPORT_CACHE_DIR)
+        self.concurrency = concurrency or settings.AGENT_IMPORT_CONCURRENCY
+        self.globs = globs if globs is not None else settings.AGENT_IMPORT_GLOBS
+        self.syncs = 0
+        self.failures = 0
+        self.files_parsed = 0
+        self.files_unchanged = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def mirror_path(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()[:16]}.git"
+
+    def matches(self, path: str, prefix: str) -> bool:
+        prefix = prefix.strip("/")
+        if prefix:
+            if not path.startswith(prefix + "/"):
+                return False
+            path = path[len(prefix) + 1:]
+        return any(fnmatch.fnmatchcase(path, pattern) for pattern in self.globs)
+
+    async def sync_all(self, repositories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Sync ``[{"url", "ref", "path"}, ...]`` concurrently"""
+        return list(await asyncio.gather(*(self.sync(**repository) for repository in repositories)))
+
+    async def sync(self, url: str, ref: str = "HEAD", path: str = "") -> Dict[str, Any]:
+        """Bring the registry up to date with ``ref`` of one repository"""
+        started = time.time()
+        lock = self._locks.setdefault(url, asyncio.Lock())
+        async with lock:
+            try:
+                # A leading "-" would be read as an option by git
+                if url.startswith("-") or ref.startswith("-"):
+                    raise GitError("Repository URL and ref must not start with '-'")
+                async with self._mirror_lock(url):
+                    result = await self._sync(url, ref, path)
+            except (GitError, OSError) as e:
+                self.failures += 1
+                logger.error("agent_import_failed", url=url, ref=ref, error=str(e))
+                result = {"url": url, "ref": ref, "status": "failed", "error": str(e)}
+        self.syncs += 1
+        result["duration_ms"] = (time.time() - started) * 1000
+        return result
+
+    async def _sync(self, url: str, ref: str, prefix: str) -> Dict[str, Any]:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+        prefix = prefix.strip("/")
+        async with self._slots:
+            mirror = await self._update_mirror(url)
+            commit = (await run_git("rev-parse", "--verify", f"{ref}^{{commit}}", cwd=mirror)).decode().strip()
+            last_commit, last_prefix = await asyncio.to_thread(self.registry.last_sync, url) or (None, None)
+            result: Dict[str, Any] = {"url": url, "ref": ref, "commit_sha": commit, "previous_commit_sha": last_commit}
+            # A diff since the last commit misses files that only came into scope with a new path
+            same_scope = prefix == last_prefix
+            if commit == last_commit and same_scope:
+                return {**result, "status": "unchanged"}
+
+            known = await asyncio.to_thread(self.registry.content_hashes, url)
+            if last_commit is not None and same_scope and await self._has_commit(mirror, last_commit):
+                diff = await run_git("diff", "--name-status", "-z", "--no-renames", last_commit, commit, cwd=mirror)
+                changed, removed = _parse_diff(diff)
+                mode = "incremental"
+            else:
+                tree = await run_git("ls-tree", "-r", "-z", "--name-only", commit, cwd=mirror)
+                changed = [p for p in tree.decode("utf-8", "surrogateescape").split("\0") if p]
+                removed = []
+                mode = "full"
+
+            changed = [p for p in changed if self.matches(p, prefix) and "\n" not in p]
+            if mode == "full":
+                # Agents from files no longer in the tree, or no longer below the path
+                removed = sorted(set(known) - set(changed))
+            removed = [p for p in removed if p in known]
+            files, errors = await self._read_files(mirror, commit, changed)
+
+        fresh = []
+        for file_path, data in files:
+            content_hash = hashlib.sha256(data).hexdigest()
+            if known.get(file_path) == content_hash:
+                self.files_unchanged += 1
+            else:
+                fresh.append((file_path, data, content_hash))
+
+        hashes = {file_path: content_hash for file_path, _, content_hash in fresh}
+        definitions = []
+        for file_path, definition, error in await self._parse([(p, data) for p, data, _ in fresh]):
+            if error is not None:
+                errors.append({"path": file_path, "error": error})
+            else:
+                definitions.append({**definition, "path": file_path, "content_hash": hashes[file_path]})
+        self.files_parsed += len(fresh)
+
+        counts = await asyncio.to_thread(self.registry.apply_sync, url, ref, commit, definitions, removed, prefix)
+        logger.info("agent_import_synced", url=url, commit_sha=commit, mode=mode, changed=len(changed), **{
+            key: value for key, value in counts.items() if key != "conflicts"
+        })
+        return {
+            **result,
+            "status": "synced",
+            "mode": mode,
+            "files_changed": len(changed),
+            "files_parsed": len(fresh),
+            **counts,
+            "errors": errors,
+        }
+
+    async def _update_mirror(self, url: str) -> Path:
+        mirror = self.mirror_path(url)
+        if mirror.exists():
+            await run_git(
+                "fetch", "--quiet", "--prune", "--force", "--", "origin",
+                "+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*",
+                cwd=mirror,
+            )
+            return mirror
+
+        # Clone next to the final location so a failed clone leaves nothing behind
+        partial = mirror.with_suffix(".partial")
+        shutil.rmtree(partial, ignore_errors=True)
+        try:
+            await run_git("clone", "--bare", "--quiet", "--", url, str(partial))
+            partial.rename(mirror)
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+        return mirror
+
+    @asynccontextmanager
+    async def _mirror_lock(self, url: str) -> AsyncIterator[None]:
+        """Hold the mirror's file lock, polling so the event loop is never blocked"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.mirror_path(url).with_suffix(".lock"), "w") as lock_file:
+            if fcntl is not None:
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        await asyncio.sleep(_LOCK_POLL_SECONDS)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    async def _has_commit(mirror: Path, commit: str) -> bool:
+        try:
+            await run_git("cat-file", "-e", f"{commit}^{{commit}}", cwd=mirror)
+        except GitError:
+            return False
+        return True
+
+    @staticmethod
+    async def _read_files(mirror: Path, commit: str, paths: List[str]):
+        """Contents of ``paths`` at ``commit``, read with one git process"""
+        if not paths:
+            return [], []
+        requests = "".join(f"{commit}:{path}\n" for path in paths).encode("utf-8", "surrogateescape")
+        output = await run_git("cat-file", "--batch", cwd=mirror, stdin=requests)
+        return _parse_cat_file(output, paths)
+
+    @staticmethod
+    async def _parse(files: List[Tuple[str, bytes]]):
+        if not files:
+            return []
+        workers = executors.processes
+        if workers > 0 and len(files) >= settings.EXECUTOR_PROCESS_MIN_BATCH:
+            # Validation is pure Python: split large imports across the process pool
+            size = -(-len(files) // workers)
+            slices = await asyncio.gather(*(
+                executors.run_in_process(parse_definitions, files[i:i + size])
+                for i in range(0, len(files), size)
+            ))
+            return [result for part in slices for result in part]
+        return await executors.run_in_thread(parse_definitions, files)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "syncs": self.syncs,
+            "failures": self.failures,
+            "files_parsed": self.files_parsed,
+            "files_unchanged": self.files_unchanged,
+        }
+
+
+# Global agent importer
+agent_importer = AgentImporter()
@@ -0,0 +1,273 @@
+"""
+Agent Registry
+Agent definitions available to run, built in or imported from Git repositories
+
+Imported agents live in the ``agents`` table with the repository, path,
+commit and content hash they came from; ``agent_sources`` records the
+commit each repository was last synced at. Built-in agents are always
+listed first and cannot be overridden by an import.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.config import settings
+from app.services.database import get_engine
+from app.services.lazy import lazy_import
+from app.services.serialization import dumps_str, loads
+
+sqlalchemy = lazy_import("sqlalchemy")
+
+BUILTIN_AGENTS: List[Dict[str, Any]] = [
+    {
+        "id": "agent-1",
+        "name": "General Assistant",
+        "description": "General purpose AI assistant",
+        "model": "gpt-4",
+        "status": "active",
+    },
+    {
+        "id": "agent-2",
+        "name": "Code Assistant",
+        "description": "Specialized in code generation and review",
+        "model": "gpt-4",
+        "status": "active",
+    },
+]
+
+
+class AgentDefinition(BaseModel):
+    """Agent definition file format, JSON"""
+    model_config = ConfigDict(extra="ignore")
+
+    id: str = Field(..., pattern=r"^[A-Za-z0-9_.-]+$", max_length=255)
+    name: str
+    description: str = ""
+    model: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    system_prompt: Optional[str] = None
+    tools: List[Dict[str, Any]] = []
+    tags: List[str] = []
+
+
+@lru_cache()
+def agents_table():
+    """The ``agents`` table, defined on first use to keep SQLAlchemy off the import path"""
+    sa = sqlalchemy
+    return sa.Table(
+        "agents",
+        _metadata(),
+        sa.Column("id", sa.String(255), primary_key=True),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("description", sa.Text, nullable=False, default=""),
+        sa.Column("model", sa.String(255)),
+        sa.Column("temperature", sa.Float),
+        sa.Column("max_tokens", sa.Integer),
+        sa.Column("system_prompt", sa.Text),
+        sa.Column("tools", sa.Text, nullable=False, default="[]"),
+        sa.Column("tags", sa.Text, nullable=False, default="[]"),
+        sa.Column("content_hash", sa.String(64), nullable=False, index=True),
+        sa.Column("source", sa.String(1024), nullable=False, index=True),
+        sa.Column("path", sa.String(1024), nullable=False),
+        sa.Column("commit_sha", sa.String(64), nullable=False),
+        sa.Column("imported_at", sa.Float, nullable=False),
+    )
+
+
+@lru_cache()
+def sources_table():
+    """The ``agent_sources`` table: one row per imported repository"""
+    sa = sqlalchemy
+    return sa.Table(
+        "agent_sources",
+        _metadata(),
+        sa.Column("url", sa.String(1024), primary_key=True),
+        sa.Column("ref", sa.String(255), nullable=False),
+        sa.Column("path", sa.String(1024), nullable=False, default=""),
+        sa.Column("last_commit_sha", sa.String(64), nullable=False),
+        sa.Column("synced_at", sa.Float, nullable=False),
+    )
+
+
+@lru_cache()
+def _metadata():
+    return sqlalchemy.MetaData()
+
+
+def _public(row: Dict[str, Any]) -> Dict[str, Any]:
+    """API representation of an imported agent row"""
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "description": row["description"],
+        "model": row["model"] or settings.AGENTSCOPE_MODEL,
+        "temperature": row["temperature"] if row["temperature"] is not None else settings.AGENTSCOPE_TEMPERATURE,
+        "max_tokens": row["max_tokens"] or settings.AGENTSCOPE_MAX_TOKENS,
+        "system_prompt": row["system_prompt"],
+        "tools": loads(row["tools"]),
+        "tags": loads(row["tags"]),
+        "status": "active",
+        "source": {"url": row["source"], "path": row["path"], "commit_sha": row["commit_sha"]},
+    }
+
+
+class AgentRegistry:
+    """Reads and writes imported agents in the database"""
+
+    def __init__(self, engine_factory=get_engine):
+        self.engine_factory = engine_factory
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def ensure_schema(self):
+        # Concurrent syncs call this from several worker threads at once
+        with self._schema_lock:
+            if not self._schema_ready:
+                engine = self.engine_factory()
+                agents_table().create(engine, checkfirst=True)
+                sources_table().create(engine, checkfirst=True)
+                self._schema_ready = True
+
+    def list_agents(self) -> List[Dict[str, Any]]:
+        """Built-in agents followed by imported ones, by id"""
+        self.ensure_schema()
+        table = agents_table()
+        with self.engine_factory().connect() as connection:
+            rows = connection.execute(sqlalchemy.select(table).order_by(table.c.id)).mappings().all()
+        return [dict(agent) for agent in BUILTIN_AGENTS] + [_public(row) for row in rows]
+
+    def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        for agent in BUILTIN_AGENTS:
+            if agent["id"] == agent_id:
+                return dict(agent)
+        self.ensure_schema()
+        table = agents_table()
+        with self.engine_factory().connect() as connection:
+            row = connection.execute(sqlalchemy.select(table).where(table.c.id == agent_id)).mappings().first()
+        return _public(row) if row is not None else None
+
+    def sources(self) -> List[Dict[str, Any]]:
+        self.ensure_schema()
+        table = sources_table()
+        with self.engine_factory().connect() as connection:
+            rows = connection.execute(sqlalchemy.select(table).order_by(table.c.url)).mappings().all()
+        return [dict(row) for row in rows]
+
+    def last_sync(self, url: str) -> Optional[Tuple[str, str]]:
+        """Commit and path of the last sync of ``url``"""
+        self.ensure_schema()
+        table = sources_table()
+        with self.engine_factory().connect() as connection:
+            row = connection.execute(
+                sqlalchemy.select(table.c.last_commit_sha, table.c.path).where(table.c.url == url)
+            ).first()
+        return tuple(row) if row is not None else None
+
+    def content_hashes(self, url: str) -> Dict[str, str]:
+        """Content hash of every agent imported from ``url``, by path"""
+        self.ensure_schema()
+        table = agents_table()
+        with self.engine_factory().connect() as connection:
+            rows = connection.execute(
+                sqlalchemy.select(table.c.path, table.c.content_hash).where(table.c.source == url)
+            ).all()
+        return {path: content_hash for path, content_hash in rows}
+
+    def apply_sync(
+        self,
+        url: str,
+        ref: str,
+        commit_sha: str,
+        definitions: Iterable[Dict[str, Any]],
+        removed_paths: Iterable[str],
+        prefix: str = "",
+    ) -> Dict[str, Any]:
+        """
+        Record one repository sync in a single transaction
+
+        ``definitions`` are parsed agents with their ``path`` and
+        ``content_hash``; ``prefix`` is the repository path that was synced. A definition whose content is already registered
+        under another path is a duplicate and is skipped, as is one whose
+        id belongs to a built-in agent or to another repository.
+        """
+        self.ensure_schema()
+        table = agents_table()
+        builtin_ids = {agent["id"] for agent in BUILTIN_AGENTS}
+        now = time.time()
+        counts: Dict[str, Any] = {"imported": 0, "removed": 0, "duplicates": 0, "conflicts": []}
+
+        with self.engine_factory().begin() as connection:
+            removed_paths = list(removed_paths)
+            if removed_paths:
+                counts["removed"] += connection.execute(
+                    table.delete().where(table.c.source == url, table.c.path.in_(removed_paths))
+                ).rowcount
+
+            for definition in definitions:
+                path, content_hash = definition["path"], definition["content_hash"]
+                # The file may have changed its id: drop what it defined before
+                counts["removed"] += connection.execute(
+                    table.delete().where(table.c.source == url, table.c.path == path, table.c.id != definition["id"])
+                ).rowcount
+
+                same_content = connection.execute(
+                    sqlalchemy.select(table.c.id).where(
+                        table.c.content_hash == content_hash,
+                        (table.c.source != url) | (table.c.path != path),
+                    ).limit(1)
+                ).first()
+                if same_content is not None:
+                    counts["duplicates"] += 1
+                    continue
+
+                owner = connection.execute(
+                    sqlalchemy.select(table.c.source, table.c.path).where(table.c.id == definition["id"])
+                ).first()
+                if definition["id"] in builtin_ids or (owner is not None and tuple(owner) != (url, path)):
+                    counts["conflicts"].append({"path": path, "id": definition["id"]})
+                    continue
+
+                values = {
+                    "name": definition["name"],
+                    "description": definition["description"],
+                    "model": definition["model"],
+                    "temperature": definition["temperature"],
+                    "max_tokens": definition["max_tokens"],
+                    "system_prompt": definition["system_prompt"],
+                    "tools": dumps_str(definition["tools"]),
+                    "tags": dumps_str(definition["tags"]),
+                    "content_hash": content_hash,
+                    "source": url,
+                    "path": path,
+                    "commit_sha": commit_sha,
+                    "imported_at": now,
+                }
+                if owner is None:
+                    connection.execute(table.insert().values(id=definition["id"], **values))
+                else:
+                    connection.execute(table.update().where(table.c.id == definition["id"]).values(**values))
+                counts["imported"] += 1
+
+            sources = sources_table()
+            updated = connection.execute(
+                sources.update().where(sources.c.url == url).values(
+                    ref=ref, path=prefix, last_commit_sha=commit_sha, synced_at=now,
+                )
+            ).rowcount
+            if not updated:
+                connection.execute(sources.insert().values(
+                    url=url, ref=ref, path=prefix, last_commit_sha=commit_sha, synced_at=now,
+                ))
+
+        return counts
+
+
+# Global agent registry
+agent_registry = AgentRegistry()
@@ -0,0 +1,577 @@
+"""
+Audit Log Store
+Rotating, compressed and indexed storage for the audit trail
+
+Records are appended as JSON lines to the active file (``AUDIT_LOG_FILE``)
+by a background writer thread. When the active file reaches
+``AUDIT_LOG_MAX_BYTES`` or gets older than ``AUDIT_LOG_ROTATE_SECONDS`` it is
+sealed into a segment in ``<AUDIT_LOG_FILE>.segments/``:
+
+- ``<name>.log.gz`` holds the records as a series of independently gzipped
+  blocks of ``AUDIT_LOG_BLOCK_RECORDS`` lines. Concatenated gzip members are
+  still one valid gzip file, so ``zcat`` reads a whole segment.
+- ``<name>.idx.json`` holds the sparse index (byte offset, length and
+  timestamp range of every block) and the segment summary: timestamp and
+  status code min/max, plus bloom filters over ``client_ip``,
+  ``request_id`` and ``path``.
+
+Queries skip whole segments using the summary, then seek straight to the
+blocks whose timestamp range overlaps the query, so irrelevant data is
+never decompressed.
+
+Every worker appends to the same active file. Appends and query snapshots
+hold a shared file lock on ``<AUDIT_LOG_FILE>.lock`` and rotation, sealing
+and retention hold it exclusively, so only one worker seals at a time and
+queries list the segment directory to see segments sealed by any worker.
+"""
+
+import base64
+import gzip
+import hashlib
+import math
+import os
+import queue
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.serialization import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # Windows: workers are not coordinated
+    fcntl = None  # type: ignore[assignment]
+
+logger = structlog.get_logger(__name__)
+
+# Record fields with a per-segment bloom filter, queried by exact match
+BLOOM_FIELDS = ("client_ip", "request_id", "path")
+
+# Writer queue marker that seals the active file
+_ROTATE = object()
+
+
+def _decode_record(line: bytes) -> Optional[Dict[str, Any]]:
+    """The record on one line of a plain audit file, or None if the line is corrupt"""
+    try:
+        record = loads(line)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
+
+
+class BloomFilter:
+    """Fixed-size bloom filter using double hashing over a blake2b digest"""
+
+    def __init__(self, size_bits: int, hashes: int, bits: Optional[bytearray] = None):
+        self.size_bits = max(8, size_bits)
+        self.hashes = max(1, hashes)
+        self.bits = bits if bits is not None else bytearray((self.size_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, fp_rate: float = 0.01) -> "BloomFilter":
+        capacity = max(1, capacity)
+        size_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        hashes = round(size_bits / capacity * math.log(2))
+        return cls(size_bits, hashes)
+
+    def _positions(self, value: str) -> Iterator[int]:
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size_bits
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "size_bits": self.size_bits,
+            "hashes": self.hashes,
+            "bits": base64.b64encode(bytes(self.bits)).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BloomFilter":
+        return cls(data["size_bits"], data["hashes"], bytearray(base64.b64decode(data["bits"])))
+
+
+@dataclass
+class AuditQuery:
+    """Time range and exact-match filters for audit records"""
+    start: Optional[float] = None
+    end: Optional[float] = None
+    client_ip: Optional[str] = None
+    request_id: Optional[str] = None
+    path: Optional[str] = None
+    status_code: Optional[int] = None
+
+    @property
+    def exact(self) -> Dict[str, Any]:
+        return {
+            name: getattr(self, name)
+            for name in BLOOM_FIELDS + ("status_code",)
+            if getattr(self, name) is not None
+        }
+
+    def overlaps(self, low: float, high: float) -> bool:
+        return (self.start is None or high >= self.start) and (self.end is None or low <= self.end)
+
+    def matches(self, record: Dict[str, Any]) -> bool:
+        timestamp = record.get("timestamp", 0)
+        if self.start is not None and timestamp < self.start:
+            return False
+        if self.end is not None and timestamp > self.end:
+            return False
+        return all(record.get(name) == value for name, value in self.exact.items())
+
+
+@dataclass
+class Segment:
+    """A sealed, compressed segment and its index"""
+    data_path: Path
+    index_path: Path
+    blocks: List[Tuple[int, int, float, float]]  # offset, length, min timestamp, max timestamp
+    records: int
+    min_timestamp: float
+    max_timestamp: float
+    min_status: int
+    max_status: int
+    blooms: Dict[str, BloomFilter] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, index_path: Path) -> "Segment":
+        index = loads(index_path.read_bytes())
+        return cls(
+            data_path=index_path.with_name(index["data"]),
+            index_path=index_path,
+            blocks=[tuple(block) for block in index["blocks"]],
+            records=index["records"],
+            min_timestamp=index["min_timestamp"],
+            max_timestamp=index["max_timestamp"],
+            min_status=index["min_status"],
+            max_status=index["max_status"],
+            blooms={name: BloomFilter.from_dict(data) for name, data in index["blooms"].items()},
+        )
+
+    def might_match(self, query: AuditQuery) -> bool:
+        if not query.overlaps(self.min_timestamp, self.max_timestamp):
+            return False
+        if query.status_code is not None and not self.min_status <= query.status_code <= self.max_status:
+            return False
+        for name in BLOOM_FIELDS:
+            value = getattr(query, name)
+            if value is not None and name in self.blooms and str(value) not in self.blooms[name]:
+                return False
+        return True
+
+
+class AuditLog:
+    """
+    Append-only audit trail with rotation into indexed, compressed segments
+
+    ``append`` only enqueues, so request handling never touches the disk. A
+    daemon thread writes batches to the active file and seals it into a
+    segment when it is due. If the queue is full, records are dropped and
+    counted rather than blocking the event loop.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        rotate_seconds: Optional[float] = None,
+        block_records: Optional[int] = None,
+        max_segments: Optional[int] = None,
+        queue_size: Optional[int] = None,
+    ):
+        self.path = Path(path or settings.AUDIT_LOG_FILE)
+        self.segment_dir = self.path.with_name(self.path.name + ".segments")
+        self.max_bytes = max_bytes or settings.AUDIT_LOG_MAX_BYTES
+        self.rotate_seconds = rotate_seconds or settings.AUDIT_LOG_ROTATE_SECONDS
+        self.block_records = block_records or settings.AUDIT_LOG_BLOCK_RECORDS
+        self.max_segments = settings.AUDIT_LOG_MAX_SEGMENTS if max_segments is None else max_segments
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size or settings.AUDIT_LOG_QUEUE_SIZE)
+        self.thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+        self.corrupt_lines = 0  # Skipped while sealing because they were not JSON objects
+        self._lock = threading.Lock()  # Guards the file set seen by queries
+        self._segment_cache: Dict[str, Segment] = {}  # Loaded indexes by file name, as of the last listing
+        self._start_lock = threading.Lock()
+        self._active_bytes = 0
+        self._active_since: Optional[float] = None
+
+    @property
+    def sealing_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".sealing")
+
+    @property
+    def lock_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".lock")
+
+    @property
+    def segments(self) -> List[Segment]:
+        """Sealed segments on disk, oldest first; blocking"""
+        with self._file_lock(shared=True):
+            return self._list_segments()
+
+    def start(self):
+        """Load segment indexes, finish an interrupted seal and start the writer thread"""
+        with self._start_lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.segment_dir.mkdir(parents=True, exist_ok=True)
+            with self._file_lock():
+                self._list_segments()
+                self._recover_seal()
+                self._active_bytes, self._active_since = self._inspect_active()
+
+            self.thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Flush queued records and stop the writer thread"""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def append(self, record: Dict[str, Any]):
+        self._enqueue(record)
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until every record appended so far is on disk"""
+        done = threading.Event()
+        self._enqueue(done)
+        done.wait(timeout)
+
+    def rotate(self, timeout: float = 5.0):
+        """Seal the active file now, from the writer thread"""
+        self._enqueue(_ROTATE)
+        self.flush(timeout)
+
+    def _enqueue(self, item: Any):
+        """Hand a record, flush event or rotation marker to the writer thread"""
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def query(self, query: AuditQuery, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Matching records, oldest segment first
+
+        Blocking; run it in a thread. Records within a segment are in write
+        order, which can differ slightly from timestamp order because the
+        timestamp is taken when the request starts.
+        """
+        if self.thread is None:
+            self.start()
+        returned = 0
+        with ExitStack() as stack:
+            with self._file_lock(shared=True):
+                segments = self._list_segments()
+                # Open plain files now: a writer may rename them right after
+                plain = []
+                for path in (self.sealing_path, self.path):
+                    try:
+                        plain.append(stack.enter_context(open(path, "rb")))
+                    except FileNotFoundError:
+                        continue
+
+            sources = [self._scan_segment(segment, query) for segment in segments if segment.might_match(query)]
+            sources += [self._scan_plain(handle, query) for handle in plain]
+            for source in sources:
+                for record in source:
+                    yield record
+                    returned += 1
+                    if limit is not None and returned >= limit:
+                        return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.thread is not None and self.thread.is_alive(),
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "corrupt_lines": self.corrupt_lines,
+            "active_bytes": self._active_bytes,
+            # As of the last query or rotation, to keep the disk off the event loop
+            "segments": len(self._segment_cache),
+            "segment_records": sum(segment.records for segment in self._segment_cache.values()),
+        }
+
+    def _scan_segment(self, segment: Segment, query: AuditQuery) -> Iterator[Dict[str, Any]]:
+        try:
+            handle = open(segment.data_path, "rb")
+        except FileNotFoundError:
+            return  # Removed by retention since the query started
+        with handle:
+            for offset, length, low, high in segment.blocks:
+                if not query.overlaps(low, high):
+                    continue
+                handle.seek(offset)
+                for line in gzip.decompress(handle.read(length)).splitlines():
+                    record = loads(line)
+                    if query.matches(record):
+                        yield record
+
+    def _scan_plain(self, handle, query: AuditQuery) -> Iterator[Dict[str, Any]]:
+        for line in handle:
+            if not line.endswith(b"\n"):
+                break  # Partially written tail
+            record = _decode_record(line)
+            if record is not None and query.matches(record):
+                yield record
+
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                batch = [self.queue.get(timeout=60)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < 512:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif item is _ROTATE:
+                    self._append_lines(lines)
+                    lines = []
+                    self._rotate(force=True)
+                elif isinstance(item, threading.Event):
+                    self._write(lines)
+                    lines = []
+                    item.set()
+                else:
+                    if self._active_since is None:
+                        self._active_since = time.time()
+                    lines.append(dumps(item))
+            self._write(lines)
+
+    def _write(self, lines: List[bytes]):
+        """Append to the active file, then seal it if it is due"""
+        self._append_lines(lines)
+        if self._due():
+            self._rotate()
+
+    def _due(self) -> bool:
+        return self._active_bytes >= self.max_bytes or (
+            self._active_since is not None and time.time() - self._active_since >= self.rotate_seconds
+        )
+
+    def _append_lines(self, lines: List[bytes]):
+        if not lines:
+            return
+        data = b"\n".join(lines) + b"\n"
+        try:
+            with self._file_lock(shared=True), open(self.path, "ab") as f:
+                f.write(data)
+                # Other workers append to the same file
+                self._active_bytes = f.tell()
+            self.written += len(lines)
+        except Exception as e:
+            self.dropped += len(lines)
+            logger.error("audit_log_write_failed", error=str(e))
+
+    def _rotate(self, force: bool = False):
+        """Seal the active file if it is still due once the lock is held"""
+        if self._active_bytes == 0 and not force:
+            return
+        try:
+            with self._file_lock():
+                self._recover_seal()
+                # Another worker may have sealed it while this one waited
+                self._active_bytes, self._active_since = self._inspect_active()
+                if self._active_bytes == 0 or not (force or self._due()):
+                    return
+                os.replace(self.path, self.sealing_path)
+                self._active_bytes, self._active_since = 0, None
+                self._seal(self.sealing_path)
+                self._apply_retention()
+        except Exception as e:
+            logger.error("audit_log_rotate_failed", error=str(e))
+
+    def _recover_seal(self):
+        """Seal a file left by a worker that died mid-seal; needs the exclusive lock"""
+        for partial in self.segment_dir.glob(".sealing-*.log.gz.tmp"):
+            partial.unlink(missing_ok=True)
+        if self.sealing_path.exists():
+            self._seal(self.sealing_path)
+
+    def _seal(self, source: Path):
+        """
+        Compress ``source`` into a new segment with its index, then remove it; needs the exclusive lock
+
+        The file is streamed a block at a time. Lines that are not a JSON
+        object (a torn or corrupted write) are skipped and counted, so a seal
+        always finishes.
+        """
+        partial_path = self.segment_dir / f".sealing-{os.getpid()}.log.gz.tmp"
+        blocks: List[Tuple[int, int, float, float]] = []
+        values: Dict[str, set] = {key: set() for key in BLOOM_FIELDS}
+        records = skipped = offset = 0
+        min_status: Optional[int] = None
+        max_status: Optional[int] = None
+
+        def write_block(out, chunk: List[Dict[str, Any]]):
+            nonlocal offset
+            block = gzip.compress(b"".join(dumps(record) + b"\n" for record in chunk))
+            out.write(block)
+            stamps = [record.get("timestamp", 0) for record in chunk]
+            blocks.append((offset, len(block), min(stamps), max(stamps)))
+            offset += len(block)
+
+        with open(source, "rb") as f, open(partial_path, "wb") as out:
+            chunk: List[Dict[str, Any]] = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partially written tail
+                record = _decode_record(line)
+                if record is None:
+                    skipped += 1
+                    continue
+                records += 1
+                status = record.get("status_code") or 0
+                if min_status is None or status < min_status:
+                    min_status = status
+                if max_status is None or status > max_status:
+                    max_status = status
+                for key in BLOOM_FIELDS:
+                    if record.get(key) is not None:
+                        values[key].add(str(record[key]))
+                chunk.append(record)
+                if len(chunk) >= self.block_records:
+                    write_block(out, chunk)
+                    chunk = []
+            if chunk:
+                write_block(out, chunk)
+
+        if skipped:
+            self.corrupt_lines += skipped
+            logger.warning("audit_log_corrupt_lines_skipped", lines=skipped, source=source.name)
+        if not records:
+            partial_path.unlink()
+            source.unlink()
+            return
+
+        min_timestamp = min(block[2] for block in blocks)
+        max_timestamp = max(block[3] for block in blocks)
+        name = f"audit-{int(min_timestamp * 1000)}-{os.getpid()}-{int(time.time() * 1000)}"
+        data_path = self.segment_dir / f"{name}.log.gz"
+        index_path = self.segment_dir / f"{name}.idx.json"
+        os.replace(partial_path, data_path)
+
+        blooms = {}
+        for key in BLOOM_FIELDS:
+            bloom = BloomFilter.for_capacity(len(values[key]))
+            for value in values[key]:
+                bloom.add(value)
+            blooms[key] = bloom
+
+        segment = Segment(
+            data_path=data_path,
+            index_path=index_path,
+            blocks=blocks,
+            records=records,
+            min_timestamp=min_timestamp,
+            max_timestamp=max_timestamp,
+            min_status=min_status or 0,
+            max_status=max_status or 0,
+            blooms=blooms,
+        )
+        index = {
+            "data": data_path.name,
+            "blocks": blocks,
+            "records": segment.records,
+            "min_timestamp": segment.min_timestamp,
+            "max_timestamp": segment.max_timestamp,
+            "min_status": segment.min_status,
+            "max_status": segment.max_status,
+            "blooms": {key: bloom.to_dict() for key, bloom in blooms.items()},
+        }
+        tmp_path = index_path.with_suffix(".tmp")
+        tmp_path.write_bytes(dumps(index))
+
+        # Queries wait for the lock, so they see the segment or the source, never both
+        os.replace(tmp_path, index_path)
+        self._segment_cache[index_path.name] = segment
+        source.unlink()
+        logger.info("audit_log_sealed", segment=data_path.name, records=segment.records, bytes=offset)
+
+    def _apply_retention(self):
+        """Delete the oldest segments of every worker beyond ``max_segments``; needs the exclusive lock"""
+        if not self.max_segments:
+            return
+        segments = self._list_segments()
+        for segment in segments[:-self.max_segments]:
+            segment.index_path.unlink(missing_ok=True)
+            segment.data_path.unlink(missing_ok=True)
+            self._segment_cache.pop(segment.index_path.name, None)
+
+    def _list_segments(self) -> List[Segment]:
+        """Segments in the directory, oldest first; indexes are loaded once and cached"""
+        cache = {}
+        for index_path in self.segment_dir.glob("*.idx.json"):
+            segment = self._segment_cache.get(index_path.name)
+            if segment is None:
+                try:
+                    segment = Segment.load(index_path)
+                except FileNotFoundError:
+                    continue  # Removed by retention since the listing
+                except Exception as e:
+                    logger.error("audit_log_index_unreadable", index=index_path.name, error=str(e))
+                    continue
+            cache[index_path.name] = segment
+        self._segment_cache = cache
+        return sorted(cache.values(), key=lambda segment: (segment.min_timestamp, segment.data_path.name))
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False) -> Iterator[None]:
+        """Shared for appends and query snapshots, exclusive for rotation, across workers"""
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _inspect_active(self) -> Tuple[int, Optional[float]]:
+        try:
+            with open(self.path, "rb") as f:
+                first = f.readline()
+                size = os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            return 0, None
+        try:
+            return size, loads(first).get("timestamp") if first else None
+        except ValueError:
+            return size, time.time()
+
+
+# Global audit log
+audit_log = AuditLog()
@@ -0,0 +1,375 @@
+"""
+WebSocket Connections
+Heartbeats, idle reaping and per-connection resource caps for streaming clients
+"""
+
+import asyncio
+import ipaddress
+import time
+import uuid
+from contextlib import suppress
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional, Set, Tuple
+
+import structlog
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from app.config import settings
+from app.services.serialization import dumps_str
+from app.services.unix_socket import peer_credentials
+
+logger = structlog.get_logger(__name__)
+
+# Close codes (RFC 6455)
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TRY_AGAIN_LATER = 1013
+
+# How long a server-initiated close may take before the connection is abandoned
+CLOSE_TIMEOUT_SECONDS = 5.0
+
+Handler = Callable[["Connection", Any], Awaitable[None]]
+
+
+@lru_cache(maxsize=8)
+def _trusted_networks(proxies: Tuple[str, ...]) -> List[Any]:
+    return [ipaddress.ip_network(proxy, strict=False) for proxy in proxies]
+
+
+def _is_trusted_proxy(host: str, proxies: Tuple[str, ...]) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _trusted_networks(proxies))
+
+
+def client_identity(websocket: WebSocket, trusted_proxies: List[str]) -> str:
+    """
+    Who a WebSocket belongs to, for the per-client connection cap
+
+    Unix socket peers are identified by their user id. TCP clients are
+    identified by address; a connection from a trusted proxy is attributed to
+    the nearest untrusted address in its X-Forwarded-For header, so users
+    behind the bundled nginx do not all share the proxy's address.
+    """
+    credentials = peer_credentials(websocket.scope)
+    if credentials is not None:
+        return f"uid:{credentials.uid}"
+
+    host = websocket.client.host if websocket.client else "unknown"
+    proxies = tuple(trusted_proxies)
+    if not proxies or not _is_trusted_proxy(host, proxies):
+        return host
+
+    # Each proxy appends the address it received the request from; walk back
+    # past the trusted ones to the client
+    forwarded = [part.strip() for part in websocket.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    for address in reversed(forwarded):
+        if not _is_trusted_proxy(address, proxies):
+            return address
+    return forwarded[0] if forwarded else host
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average, in bursts of up to ``burst``"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Connection:
+    """
+    One accepted WebSocket and the tasks serving it
+
+    Frames are queued and written by a dedicated task, so runs never wait on
+    a slow client; a client whose unsent frames exceed ``max_buffered_bytes``
+    is closed, and can resume its runs from their journals after
+    reconnecting. Client messages are handled one at a time by the reader
+    while runs are forwarded by their own tasks, so pongs and new actions
+    are read even mid-run.
+
+    When the client has sent nothing for ``heartbeat_interval`` seconds the
+    server sends ``{"type": "ping"}``. Any message from the client counts as
+    the reply; without one within ``heartbeat_timeout`` seconds the
+    connection is treated as half-open and closed. A connection with no run
+    in progress and no client action for ``idle_timeout`` seconds is closed
+    as idle.
+    """
+
+    def __init__(self, websocket: WebSocket, client: str, manager: "ConnectionManager"):
+        self.id = f"ws_{uuid.uuid4().hex[:12]}"
+        self.websocket = websocket
+        self.client = client
+        self.manager = manager
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at  # Last message of any kind from the client
+        self.last_active = self.connected_at  # Last client action or finished run
+        self.ping_sent_at: Optional[float] = None
+        self.buffered_bytes = 0
+        self.runs: Set[asyncio.Task] = set()
+        self.close_code: Optional[int] = None
+        self.close_reason: Optional[str] = None
+        self._frames: asyncio.Queue = asyncio.Queue()
+        self._closing = asyncio.Event()
+        self._messages = TokenBucket(manager.message_rate, manager.message_burst)
+
+    @property
+    def closing(self) -> bool:
+        return self._closing.is_set()
+
+    def send_json(self, data: Dict[str, Any]) -> bool:
+        """Queue an event for the client; False if it was dropped"""
+        if self.closing:
+            return False
+        frame = dumps_str(data)
+        limit = self.manager.max_buffered_bytes
+        if limit and self.buffered_bytes + len(frame) > limit:
+            self.manager.counts["slow_consumers"] += 1
+            logger.warning("websocket_slow_consumer", connection_id=self.id, buffered_bytes=self.buffered_bytes)
+            self.close(CLOSE_TRY_AGAIN_LATER, "Client is not reading fast enough")
+            return False
+        self.buffered_bytes += len(frame)
+        self._frames.put_nowait(frame)
+        return True
+
+    def runs_at_limit(self) -> bool:
+        limit = self.manager.max_runs
+        return bool(limit) and len(self.runs) >= limit
+
+    def reject_run(self):
+        """Tell the client a run action was refused because of the concurrency cap"""
+        self.manager.counts["runs_rejected"] += 1
+        self.send_json({
+            "type": "error",
+            "error": f"Too many concurrent runs on this connection (limit {self.manager.max_runs})",
+            "done": True,
+        })
+
+    def start_run(self, forward: Coroutine[Any, Any, None]) -> asyncio.Task:
+        """Forward a run to the client in the background; cancelled when the connection closes"""
+        task = asyncio.create_task(forward)
+        self.runs.add(task)
+        task.add_done_callback(self._run_finished)
+        return task
+
+    def close(self, code: int, reason: str):
+        """Ask the serving tasks to stop and close the socket with ``code``"""
+        if self.closing:
+            return
+        self.close_code = code
+        self.close_reason = reason
+        self._closing.set()
+
+    async def serve(self, handle: Handler):
+        """Read, write and heartbeat until the client leaves or the connection is closed"""
+        reader = asyncio.create_task(self._read(handle))
+        tasks = [reader, asyncio.create_task(self._write()), asyncio.create_task(self._closing.wait())]
+        if self.manager.heartbeat_interval > 0 or self.manager.idle_timeout > 0:
+            tasks.append(asyncio.create_task(self._heartbeat()))
+
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            pending = tasks + list(self.runs)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if reader.done() and not reader.cancelled() and reader.exception() is not None:
+            error = reader.exception()
+            if isinstance(error, WebSocketDisconnect):
+                logger.info("websocket_client_disconnected", connection_id=self.id, code=error.code)
+            else:
+                logger.error("websocket_error", connection_id=self.id, error=str(error))
+
+        if self.close_code is not None:
+            with suppress(Exception):
+                await asyncio.wait_for(
+                    self.websocket.close(self.close_code, self.close_reason), CLOSE_TIMEOUT_SECONDS
+                )
+
+    async def _read(self, handle: Handler):
+        while True:
+            data = await self.websocket.receive_json()
+            self.last_seen = time.monotonic()
+            self.ping_sent_at = None
+
+            if isinstance(data, dict) and data.get("action") == "pong":
+                self.manager.counts["pongs"] += 1
+                continue
+
+            if not self._messages.take():
+                self.manager.counts["messages_rate_limited"] += 1
+                self.send_json({"type": "error", "error": "Too many messages, slow down"})
+                continue
+
+            self.last_active = self.last_seen
+            await handle(self, data)
+
+    async def _write(self):
+        while True:
+            frame = await self._frames.get()
+            await self.websocket.send_text(frame)
+            self.buffered_bytes -= len(frame)
+
+    async def _heartbeat(self):
+        manager = self.manager
+        periods = [p for p in (manager.heartbeat_interval, manager.heartbeat_timeout, manager.idle_timeout) if p > 0]
+        tick = min(periods) / 4
+
+        while True:
+            await asyncio.sleep(tick)
+            now = time.monotonic()
+
+            if self.ping_sent_at is not None:
+                if now - self.ping_sent_at >= manager.heartbeat_timeout:
+                    manager.counts["heartbeat_timeouts"] += 1
+                    logger.info("websocket_heartbeat_timeout", connection_id=self.id, client=self.client)
+                    self.close(CLOSE_GOING_AWAY, "Heartbeat timeout")
+                    return
+            elif manager.heartbeat_interval > 0 and now - self.last_seen >= manager.heartbeat_interval:
+                self.ping_sent_at = now
+                manager.counts["pings_sent"] += 1
+                self.send_json({"type": "ping", "ts": time.time()})
+
+            if manager.idle_timeout > 0 and not self.runs and now - self.last_active >= manager.idle_timeout:
+                manager.counts["idle_closed"] += 1
+                logger.info("websocket_idle_closed", connection_id=self.id, client=self.client)
+                self.close(CLOSE_NORMAL, "Idle timeout")
+                return
+
+    def _run_finished(self, task: asyncio.Task):
+        self.runs.discard(task)
+        self.last_active = time.monotonic()
+
+
+class ConnectionManager:
+    """
+    Tracks open WebSocket connections
+
+    Connections are counted per client (see ``client_identity``), which is
+    the user for the single-token deployments; a client over
+    ``max_per_client`` open connections is refused with close code 1008.
+    """
+
+    def __init__(
+        self,
+        heartbeat_interval: Optional[float] = None,
+        heartbeat_timeout: Optional[float] = None,
+        idle_timeout: Optional[float] = None,
+        max_per_client: Optional[int] = None,
+        max_runs: Optional[int] = None,
+        max_buffered_bytes: Optional[int] = None,
+        message_rate: Optional[float] = None,
+        message_burst: Optional[int] = None,
+        trusted_proxies: Optional[List[str]] = None,
+    ):
+        def pick(value, default):
+            return value if value is not None else default
+
+        self.heartbeat_interval = pick(heartbeat_interval, settings.WS_HEARTBEAT_INTERVAL_SECONDS)
+        self.heartbeat_timeout = pick(heartbeat_timeout, settings.WS_HEARTBEAT_TIMEOUT_SECONDS)
+        self.idle_timeout = pick(idle_timeout, settings.WS_IDLE_TIMEOUT_SECONDS)
+        self.max_per_client = pick(max_per_client, settings.WS_MAX_CONNECTIONS_PER_CLIENT)
+        self.max_runs = pick(max_runs, settings.WS_MAX_RUNS_PER_CONNECTION)
+        self.max_buffered_bytes = pick(max_buffered_bytes, settings.WS_MAX_BUFFERED_BYTES)
+        self.message_rate = pick(message_rate, settings.WS_MESSAGE_RATE_PER_SECOND)
+        self.message_burst = pick(message_burst, settings.WS_MESSAGE_BURST)
+        self.trusted_proxies = pick(trusted_proxies, settings.WS_TRUSTED_PROXIES)
+        self.active_connections: Dict[str, Connection] = {}
+        self.per_client: Dict[str, int] = {}
+        self.counts = {
+            "opened": 0,
+            "closed": 0,
+            "rejected": 0,
+            "pings_sent": 0,
+            "pongs": 0,
+            "heartbeat_timeouts": 0,
+            "idle_closed": 0,
+            "slow_consumers": 0,
+            "runs_rejected": 0,
+            "messages_rate_limited": 0,
+        }
+
+    async def connect(self, websocket: WebSocket) -> Optional[Connection]:
+        """Accept a WebSocket; None if its client already has too many connections"""
+        client = client_identity(websocket, self.trusted_proxies)
+
+        if self.max_per_client and self.per_client.get(client, 0) >= self.max_per_client:
+            self.counts["rejected"] += 1
+            logger.warning("websocket_rejected", client=client, limit=self.max_per_client)
+            # Accept first so the client sees the close code and reason
+            await websocket.accept()
+            await websocket.close(CLOSE_POLICY_VIOLATION, "Too many connections")
+            return None
+
+        # Counted before the handshake completes, so concurrent handshakes see each other
+        connection = Connection(websocket, client, self)
+        self.active_connections[connection.id] = connection
+        self.per_client[client] = self.per_client.get(client, 0) + 1
+        self.counts["opened"] += 1
+        try:
+            await websocket.accept()
+        except BaseException:
+            self.disconnect(connection)
+            raise
+        logger.info("websocket_connected", connection_id=connection.id, total_connections=len(self.active_connections))
+        return connection
+
+    def disconnect(self, connection: Connection):
+        if self.active_connections.pop(connection.id, None) is None:
+            return
+        remaining = self.per_client.get(connection.client, 1) - 1
+        if remaining > 0:
+            self.per_client[connection.client] = remaining
+        else:
+            self.per_client.pop(connection.client, None)
+        self.counts["closed"] += 1
+        logger.info("websocket_disconnected", connection_id=connection.id, total_connections=len(self.active_connections))
+
+    def shutdown(self):
+        """Close every connection as going away"""
+        for connection in list(self.active_connections.values()):
+            connection.close(CLOSE_GOING_AWAY, "Server shutting down")
+
+    def stats(self) -> Dict[str, Any]:
+        connections = list(self.active_connections.values())
+        return {
+            "active": len(connections),
+            "clients": len(self.per_client),
+            "runs": sum(len(c.runs) for c in connections),
+            "awaiting_pong": sum(c.ping_sent_at is not None for c in connections),
+            "buffered_bytes": sum(c.buffered_bytes for c in connections),
+            "max_buffered_bytes": max((c.buffered_bytes for c in connections), default=0),
+            **self.counts,
+            "limits": {
+                "heartbeat_interval_seconds": self.heartbeat_interval,
+                "heartbeat_timeout_seconds": self.heartbeat_timeout,
+                "idle_timeout_seconds": self.idle_timeout,
+                "max_connections_per_client": self.max_per_client,
+                "max_runs_per_connection": self.max_runs,
+                "max_buffered_bytes": self.max_buffered_bytes,
+                "message_rate_per_second": self.message_rate,
+                "message_burst": self.message_burst,
+            },
+        }
+
+
+# Global connection manager
+connection_manager = ConnectionManager()
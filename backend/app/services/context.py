@@ -0,0 +1,159 @@
+"""
+Run Context
+Builds the provider-ready prompt for an agent run
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from app.config import settings
+from app.services.prompt_cache import (
+    PreparedPrefix,
+    estimate_tokens,
+    prefix_cache,
+    provider_for_model,
+)
+from app.services.executor import executors
+from app.services.retrieval import RetrievedChunk, knowledge_base
+from app.services.tracing import tracer
+
+if TYPE_CHECKING:
+    from app.routes.agents import AgentRunRequest
+
+
+@dataclass
+class RunContext:
+    """Everything a provider call needs for a single run"""
+    agent_id: str
+    model: str
+    provider: str
+    temperature: float
+    max_tokens: int
+    prefix: PreparedPrefix
+    prefix_cached: bool
+    messages: List[Dict[str, Any]]
+    prompt_tokens: int
+    retrieved: Optional[List[RetrievedChunk]] = None
+
+    @property
+    def estimated_cached_prefix_tokens(self) -> int:
+        # Only prefixes sent with provider caching options can be read from the
+        # provider's cache, and only once this worker has sent them before
+        return self.prefix.token_count if self.prefix_cached and self.prefix.cacheable else 0
+
+    def usage(self, completion_tokens: int, provider_cached_tokens: Optional[int] = None) -> Dict[str, int]:
+        """
+        Token usage for the run, including prefix tokens served from cache
+
+        ``provider_cached_tokens`` is what the provider reported reading from
+        its prompt cache. Without it (mock runs, or a provider that sent no
+        usage) the count is this worker's estimate.
+        """
+        if provider_cached_tokens is None:
+            provider_cached_tokens = self.estimated_cached_prefix_tokens
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": self.prompt_tokens + completion_tokens,
+            "cached_prefix_tokens": provider_cached_tokens,
+        }
+
+    def cached_answer_usage(self) -> Dict[str, int]:
+        """Usage for an answer served from the semantic cache, which calls no provider"""
+        return {
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "cached_prefix_tokens": 0,
+        }
+
+    def metadata(self) -> Dict[str, Any]:
+        metadata = {
+            "model": self.model,
+            "temperature": self.temperature,
+            "prefix_fingerprint": self.prefix.fingerprint,
+        }
+        if self.retrieved is not None:
+            metadata["retrieved_chunks"] = [
+                {"doc_id": c.doc_id, "chunk_id": c.chunk_id, "score": round(c.score, 4)}
+                for c in self.retrieved
+            ]
+        return metadata
+
+
+async def retrieve_context(request: "AgentRunRequest") -> Optional[List[RetrievedChunk]]:
+    """
+    Top-k knowledge chunks for the run, or None when retrieval was not requested
+
+    The search reads the memory-mapped index and scores it with numpy, so it
+    runs in the shared thread pool rather than on the event loop.
+    """
+    options = request.retrieval
+    if options is None:
+        return None
+
+    query = options.query
+    if query is None:
+        user_messages = [m.content for m in request.messages if m.role == "user"]
+        query = user_messages[-1] if user_messages else ""
+    if not query.strip():
+        return []
+
+    return await executors.run_in_thread(
+        knowledge_base.search, query, k=options.top_k, min_score=options.min_score
+    )
+
+
+def render_retrieved(chunks: List[RetrievedChunk]) -> Dict[str, Any]:
+    """System message carrying retrieved chunks"""
+    parts = [
+        f"<chunk doc_id=\"{c.doc_id}\" chunk_id=\"{c.chunk_id}\">\n{c.text}\n</chunk>"
+        for c in chunks
+    ]
+    return {
+        "role": "system",
+        "content": "Relevant context from the knowledge base:\n\n" + "\n\n".join(parts),
+    }
+
+
+async def build_run_context(request: "AgentRunRequest", model: Optional[str] = None) -> RunContext:
+    """
+    Assemble the prompt for a run
+
+    The stable prefix (system prompt, tool definitions and pinned documents)
+    is prepared once and reused from the prefix cache; only the conversation
+    messages are templated and counted per run. Retrieved knowledge chunks
+    vary per question, so they go after the prefix to keep it cacheable.
+    """
+    model = model or settings.AGENTSCOPE_MODEL
+
+    with tracer.span("context_build", model=model) as span:
+        prefix, cached = prefix_cache.get_or_prepare(
+            model,
+            system_prompt=request.system_prompt,
+            tools=request.tools,
+            documents=request.pinned_documents,
+        )
+
+        conversation = [message.model_dump(exclude_none=True) for message in request.messages]
+        with tracer.span("retrieval"):
+            retrieved = await retrieve_context(request)
+        if retrieved:
+            conversation.insert(0, render_retrieved(retrieved))
+        prompt_tokens = prefix.token_count + sum(estimate_tokens(m["content"]) for m in conversation)
+
+        if span is not None:
+            span.set(prefix_cached=cached, prompt_tokens=prompt_tokens)
+
+    return RunContext(
+        agent_id=request.agent_id,
+        model=model,
+        provider=provider_for_model(model),
+        temperature=request.temperature if request.temperature is not None else settings.AGENTSCOPE_TEMPERATURE,
+        max_tokens=request.max_tokens or settings.AGENTSCOPE_MAX_TOKENS,
+        prefix=prefix,
+        prefix_cached=cached,
+        messages=prefix.messages + conversation,
+        prompt_tokens=prompt_tokens,
+        retrieved=retrieved,
+    )
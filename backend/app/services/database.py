@@ -0,0 +1,31 @@
+"""
+Database
+Shared SQLAlchemy engine and connection pool
+"""
+
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from app.config import settings
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Engine
+
+
+@lru_cache()
+def get_engine() -> "Engine":
+    """Process-wide engine, created on first use"""
+    # SQLAlchemy is imported here so it stays off the startup path
+    from sqlalchemy import create_engine
+
+    connect_args = {}
+    if settings.DATABASE_URL.startswith("sqlite"):
+        # Connections are handed between the event loop's worker threads
+        connect_args["check_same_thread"] = False
+    return create_engine(settings.DATABASE_URL, pool_pre_ping=True, connect_args=connect_args)
+
+
+def dispose_engine():
+    """Close pooled connections if the engine was ever created"""
+    if get_engine.cache_info().currsize:
+        get_engine().dispose()
@@ -0,0 +1,148 @@
+"""
+Text Embeddings
+Local CPU embedders used by the semantic cache and knowledge retrieval
+"""
+
+from __future__ import annotations
+
+import re
+import zlib
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Sequence, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.executor import executors
+from app.services.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import("numpy")
+
+logger = structlog.get_logger(__name__)
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Function words that carry little meaning for FAQ-style matching
+STOPWORDS = frozenset(
+    """
+    a an and are as at be by can could do does for from how i in is it me my
+    of on or our please should that the this to was we what when where which
+    who why will with would you your
+    """.split()
+)
+
+
+@lru_cache(maxsize=65536)
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    """Stable hash of a feature to a (column, sign) pair"""
+    h = zlib.crc32(feature.encode("utf-8"))
+    return (h & 0x7FFFFFFF) % dim, 1.0 if h & 0x80000000 else -1.0
+
+
+class HashingEmbedder:
+    """
+    Signed feature-hashing vectorizer
+
+    Features are content words, word bigrams and character trigrams, so
+    paraphrases that share vocabulary or word stems land close together.
+    Vectors are L2-normalized, so a dot product is the cosine similarity.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def features(self, text: str) -> List[Tuple[str, float]]:
+        words = [w for w in _WORD_PATTERN.findall(text.lower()) if w not in STOPWORDS]
+        features = [(f"w:{w}", 1.0) for w in words]
+        features += [(f"b:{a} {b}", 0.5) for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            features += [(f"c:{padded[i:i + 3]}", 0.25) for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self.features(text):
+            column, sign = _bucket(feature, self.dim)
+            vector[column] += sign * weight
+
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        workers = executors.processes
+        if workers > 0 and len(texts) >= settings.EXECUTOR_PROCESS_MIN_BATCH:
+            # Feature hashing is pure Python and holds the GIL: split large
+            # batches across the process pool
+            size = -(-len(texts) // workers)
+            futures = [
+                executors.submit("process", _embed_slice, self.dim, list(texts[i:i + size]))
+                for i in range(0, len(texts), size)
+            ]
+            return np.vstack([future.result() for future in futures])
+        return np.vstack([self.embed(text) for text in texts])
+
+
+def _embed_slice(dim: int, texts: List[str]) -> np.ndarray:
+    """Process pool task: embed part of a batch"""
+    embedder = HashingEmbedder(dim)
+    return np.vstack([embedder.embed(text) for text in texts])
+
+
+async def embed_off_loop(embedder, text: str) -> np.ndarray:
+    """
+    Embed ``text`` without blocking the event loop
+
+    Feature hashing is pure Python and holds the GIL, so it runs in the
+    process pool when there is one; model embedders release the GIL in
+    their native code and run in the thread pool.
+    """
+    if isinstance(embedder, HashingEmbedder) and executors.processes > 0:
+        vectors = await executors.run_in_process(_embed_slice, embedder.dim, [text])
+        return vectors[0]
+    return await executors.run_in_thread(embedder.embed, text)
+
+
+class SentenceTransformerEmbedder:
+    """Wrapper around a locally installed sentence-transformers model"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self.model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32, copy=False)
+
+
+@lru_cache(maxsize=1)
+def get_embedder():
+    """
+    Return the configured embedder
+
+    EMBEDDING_MODEL "hashing" uses the dependency-free hashing vectorizer.
+    Any other value is loaded with sentence-transformers, falling back to
+    hashing when the package or model is unavailable.
+    """
+    if settings.EMBEDDING_MODEL != "hashing":
+        try:
+            return SentenceTransformerEmbedder(settings.EMBEDDING_MODEL)
+        except Exception as e:
+            logger.warning("embedding_model_unavailable", model=settings.EMBEDDING_MODEL, error=str(e))
+
+    return HashingEmbedder(settings.EMBEDDING_DIM)
@@ -0,0 +1,274 @@
+"""
+Executors
+Shared thread and process pools for offloading CPU-heavy work from the event loop
+
+Use the thread pool for work that releases the GIL (numpy, hashing, I/O,
+compression) and the process pool for pure-Python CPU work such as
+tokenization or feature hashing. Process workers are started with
+``EXECUTOR_START_METHOD`` (spawn by default, which is safe next to the
+server's threads). They import ``EXECUTOR_PRELOAD_MODULES`` once and are
+warmed at startup, so the first offloaded call does not pay for either.
+
+    @offload("process")
+    def tokenize(text: str) -> List[str]:
+        ...
+
+    tokens = await tokenize(text)        # Runs in a worker process
+    tokens = tokenize.sync(text)         # Runs inline
+"""
+
+import asyncio
+import contextvars
+import functools
+import importlib
+import multiprocessing
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.loop_monitor import LagHistogram
+
+logger = structlog.get_logger(__name__)
+
+POOL_KINDS = ("thread", "process")
+
+
+def _init_process_worker(preload: List[str]):
+    """Process pool initializer: leave Ctrl-C to the parent and import hot modules"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+
+def _warm_process_worker(seconds: float) -> int:
+    # Holding each task briefly makes the pool start a separate worker for each
+    time.sleep(seconds)
+    return 0
+
+
+class FunctionRef:
+    """
+    Picklable reference to a module-level function
+
+    Decorating a function with ``offload`` rebinds its name to the async
+    wrapper, so the function itself can no longer be pickled by name. The
+    reference resolves the name in the worker and unwraps the decorator.
+    """
+
+    def __init__(self, fn: Callable):
+        if "<locals>" in fn.__qualname__:
+            raise ValueError(f"{fn.__qualname__} must be defined at module level to run in a process")
+        self.module = fn.__module__
+        self.qualname = fn.__qualname__
+
+    def resolve(self) -> Callable:
+        target: Any = importlib.import_module(self.module)
+        for part in self.qualname.split("."):
+            target = getattr(target, part)
+        return getattr(target, "sync", target)
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return self.resolve()(*args, **kwargs)
+
+
+def _timed_call(fn: Callable, submitted_at: float, args: Tuple, kwargs: Dict[str, Any]) -> Tuple[Any, float, float]:
+    """Run ``fn`` and report when it started and how long it ran"""
+    started_at = time.time()
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, started_at - submitted_at, time.perf_counter() - started
+
+
+class PoolStats:
+    """Task counters and timings for one pool"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.queue_wait = LagHistogram()
+        self.run_time = LagHistogram()
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self.submitted - self.completed - self.failed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "queue_wait": self.queue_wait.to_dict(),
+            "task_time": self.run_time.to_dict(),
+        }
+
+
+class Executors:
+    """
+    Process-wide thread and process pools with task metrics
+
+    Created in the lifespan; callers that run before that (scripts, tests)
+    start the pools on first use. ``submit`` can be called from any thread
+    and returns a ``concurrent.futures.Future``; ``run`` awaits it on the
+    event loop.
+    """
+
+    def __init__(
+        self,
+        threads: Optional[int] = None,
+        processes: Optional[int] = None,
+        start_method: Optional[str] = None,
+        preload: Optional[List[str]] = None,
+    ):
+        self.threads = threads or settings.EXECUTOR_THREADS
+        self.processes = settings.EXECUTOR_PROCESSES if processes is None else processes
+        self.start_method = start_method or settings.EXECUTOR_START_METHOD
+        self.preload = settings.EXECUTOR_PRELOAD_MODULES if preload is None else preload
+        self.thread_pool: Optional[ThreadPoolExecutor] = None
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+        self.pool_stats = {"thread": PoolStats(self.threads), "process": PoolStats(self.processes)}
+        self._start_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.thread_pool is not None
+
+    def start(self, warm: bool = True):
+        """Create the pools and, with ``warm``, spawn every process worker now"""
+        with self._start_lock:
+            if self.thread_pool is not None:
+                return
+            self.thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="offload")
+            if self.processes > 0:
+                self.process_pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_process_worker,
+                    initargs=(list(self.preload),),
+                )
+                if warm:
+                    for _ in range(self.processes):
+                        self.process_pool.submit(_warm_process_worker, 0.05)
+            logger.info("executors_started", threads=self.threads, processes=self.processes)
+
+    async def shutdown(self):
+        """Wait for running tasks, drop queued ones and stop the workers"""
+        with self._start_lock:
+            pools = [pool for pool in (self.thread_pool, self.process_pool) if pool is not None]
+            self.thread_pool = self.process_pool = None
+        for pool in pools:
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+    def submit(self, kind: str, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        """Run ``fn(*args, **kwargs)`` in the ``kind`` pool"""
+        if kind not in POOL_KINDS:
+            raise ValueError(f"Unknown pool: {kind}")
+        if self.thread_pool is None:
+            self.start(warm=False)
+
+        pool: Any = self.thread_pool
+        call: Callable = _timed_call
+        if kind == "process":
+            if self.process_pool is None:
+                raise RuntimeError("The process pool is disabled (EXECUTOR_PROCESSES=0)")
+            pool = self.process_pool
+            if not isinstance(fn, (FunctionRef, functools.partial)) and hasattr(fn, "sync"):
+                fn = FunctionRef(fn.sync)
+        else:
+            # Like asyncio.to_thread: tracing spans and other context carry over
+            call = functools.partial(contextvars.copy_context().run, _timed_call)
+
+        stats = self.pool_stats[kind]
+        with stats._lock:
+            stats.submitted += 1
+        inner = pool.submit(call, fn, time.time(), args, kwargs)
+
+        outer: Future = Future()
+        inner.add_done_callback(functools.partial(self._finished, stats, outer))
+        return outer
+
+    async def run(self, kind: str, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(kind, fn, *args, **kwargs))
+
+    async def run_in_thread(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        return await self.run("thread", fn, *args, **kwargs)
+
+    async def run_in_process(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        return await self.run("process", fn, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "start_method": self.start_method,
+            **{kind: stats.to_dict() for kind, stats in self.pool_stats.items()},
+        }
+
+    @staticmethod
+    def _finished(stats: PoolStats, outer: Future, inner: Future):
+        if inner.cancelled():
+            with stats._lock:
+                stats.failed += 1
+            outer.cancel()
+            return
+
+        error = inner.exception()
+        with stats._lock:
+            if error is not None:
+                stats.failed += 1
+            else:
+                result, waited, ran = inner.result()
+                stats.completed += 1
+                stats.queue_wait.observe(max(0.0, waited) * 1000)
+                stats.run_time.observe(ran * 1000)
+        # A cancelled await cancels the wrapped future; claim it atomically
+        # so a late result does not raise InvalidStateError in the worker
+        if not outer.set_running_or_notify_cancel():
+            return
+        if error is not None:
+            outer.set_exception(error)
+        else:
+            outer.set_result(result)
+
+
+def offload(kind: str = "thread"):
+    """
+    Make a function run in the shared ``kind`` pool when awaited
+
+    The decorated name becomes an async function; the original stays
+    available as ``.sync`` for callers that are already off the loop.
+    Functions offloaded to processes must be defined at module level, and
+    their arguments and results must be picklable.
+    """
+    if kind not in POOL_KINDS:
+        raise ValueError(f"Unknown pool: {kind}")
+
+    def decorate(fn: Callable) -> Callable:
+        target: Callable = fn
+        if kind == "process":
+            target = FunctionRef(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return await executors.run(kind, target, *args, **kwargs)
+
+        wrapper.sync = fn  # type: ignore[attr-defined]
+        return wrapper
+
+    return decorate
+
+
+# Global executors
+executors = Executors()
@@ -0,0 +1,507 @@
+"""
+Conversation History
+Stores conversation messages and searches them through a full-text index
+
+Runs whose metadata carries a ``conversation_id`` add their new user
+messages and the answer to the ``conversation_messages`` table. Messages
+are buffered in memory and written in batches every
+``HISTORY_FLUSH_SECONDS``, so recording never waits for the database.
+Existing chats can be imported in bulk.
+
+The index is kept up to date by the database as rows are written:
+- SQLite: an external-content FTS5 table maintained by triggers, ranked by BM25
+- PostgreSQL: a generated ``tsvector`` column with a GIN index, ranked by
+  ``ts_rank_cd``
+- Anything else, or SQLite without FTS5: unranked substring matching
+
+Every query term matches word prefixes and all terms must match. Results
+are paged with opaque keyset cursors, so deep pages cost the same as the
+first one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import html
+import re
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.database import get_engine
+from app.services.lazy import lazy_import
+from app.services.serialization import dumps, loads
+
+sqlalchemy = lazy_import("sqlalchemy")
+
+logger = structlog.get_logger(__name__)
+
+SORTS = ("relevance", "recent")
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS conversation_messages_fts USING fts5("
+    "content, content='conversation_messages', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS conversation_messages_ai AFTER INSERT ON conversation_messages BEGIN "
+    "INSERT INTO conversation_messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS conversation_messages_ad AFTER DELETE ON conversation_messages BEGIN "
+    "INSERT INTO conversation_messages_fts(conversation_messages_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS conversation_messages_au AFTER UPDATE OF content ON conversation_messages BEGIN "
+    "INSERT INTO conversation_messages_fts(conversation_messages_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); "
+    "INSERT INTO conversation_messages_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that was not issued for this query"""
+
+
+@lru_cache()
+def messages_table():
+    """The ``conversation_messages`` table, defined on first use to keep SQLAlchemy off the import path"""
+    sa = sqlalchemy
+    return sa.Table(
+        "conversation_messages",
+        _metadata(),
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("conversation_id", sa.String(255), nullable=False),
+        sa.Column("agent_id", sa.String(255), nullable=False),
+        sa.Column("role", sa.String(32), nullable=False),
+        sa.Column("content", sa.Text, nullable=False),
+        sa.Column("model", sa.String(255)),
+        sa.Column("created_at", sa.Float, nullable=False),
+        sa.Index("ix_conversation_messages_conversation", "conversation_id", "id"),
+        sa.Index("ix_conversation_messages_agent", "agent_id", "created_at"),
+        sa.Index("ix_conversation_messages_created", "created_at"),
+    )
+
+
+@lru_cache()
+def _metadata():
+    return sqlalchemy.MetaData()
+
+
+@dataclass
+class SearchFilters:
+    agent_id: Optional[str] = None
+    conversation_id: Optional[str] = None
+    role: Optional[str] = None
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+    def clauses(self, table) -> List[Any]:
+        clauses = []
+        for name in ("agent_id", "conversation_id", "role"):
+            value = getattr(self, name)
+            if value is not None:
+                clauses.append(table.c[name] == value)
+        if self.start is not None:
+            clauses.append(table.c.created_at >= self.start)
+        if self.end is not None:
+            clauses.append(table.c.created_at < self.end)
+        return clauses
+
+
+def query_terms(query: str) -> List[str]:
+    """Lowercased search words; query syntax characters are dropped"""
+    return list(dict.fromkeys(_TERM.findall(query.lower())))
+
+
+def encode_cursor(kind: str, key: Sequence[Any]) -> str:
+    return base64.urlsafe_b64encode(dumps({"k": kind, "v": list(key)})).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str) -> List[Any]:
+    try:
+        data = loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if data["k"] != kind:
+            raise InvalidCursor(f"Cursor is for a {data['k']} query, not {kind}")
+        return list(data["v"])
+    except InvalidCursor:
+        raise
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+
+
+def highlight(content: str, terms: List[str], words: int = 24) -> str:
+    """
+    HTML snippet of ``content`` around the first match, matches in <mark>
+
+    The rest of the text is escaped, so the snippet is safe to render.
+    """
+    tokens = list(_TERM.finditer(content))
+    if not tokens:
+        return html.escape(content[:200])
+    matching = [i for i, token in enumerate(tokens) if any(token.group().lower().startswith(t) for t in terms)]
+    first = matching[0] if matching else 0
+    lo = max(0, first - words // 3)
+    hi = min(len(tokens), lo + words)
+    start = tokens[lo].start() if lo > 0 else 0
+    end = tokens[hi - 1].end() if hi < len(tokens) else len(content)
+    parts = ["…" if lo > 0 else ""]
+    position = start
+    for i in matching:
+        if lo <= i < hi:
+            token = tokens[i]
+            parts.append(html.escape(content[position:token.start()]))
+            parts.append(f"<mark>{html.escape(token.group())}</mark>")
+            position = token.end()
+    parts.append(html.escape(content[position:end]))
+    parts.append("…" if hi < len(tokens) else "")
+    return "".join(parts)
+
+
+def _message(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "conversation_id": row["conversation_id"],
+        "agent_id": row["agent_id"],
+        "role": row["role"],
+        "content": row["content"],
+        "model": row["model"],
+        "created_at": row["created_at"],
+    }
+
+
+class HistoryStore:
+    """Writes, reads and searches conversation messages in the database"""
+
+    def __init__(self, engine_factory=get_engine, language: Optional[str] = None):
+        self.engine_factory = engine_factory
+        self.language = language or settings.HISTORY_SEARCH_LANGUAGE
+        self.backend = "substring"
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def ensure_schema(self):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            engine = self.engine_factory()
+            messages_table().create(engine, checkfirst=True)
+            dialect = engine.dialect.name
+            if dialect == "sqlite":
+                self._create_fts5(engine)
+            elif dialect == "postgresql":
+                self._create_tsvector(engine)
+            logger.info("history_search_backend", backend=self.backend)
+            self._schema_ready = True
+
+    def _create_fts5(self, engine):
+        try:
+            with engine.begin() as connection:
+                exists = connection.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'conversation_messages_fts'"
+                ).first()
+                for statement in _FTS_DDL:
+                    connection.exec_driver_sql(statement)
+                if exists is None:
+                    # Index messages written before the index existed
+                    connection.exec_driver_sql(
+                        "INSERT INTO conversation_messages_fts(conversation_messages_fts) VALUES ('rebuild')"
+                    )
+            self.backend = "fts5"
+        except sqlalchemy.exc.OperationalError as e:
+            logger.warning("history_search_fts_unavailable", error=str(e))
+
+    def _create_tsvector(self, engine):
+        if not re.fullmatch(r"[a-z_]+", self.language):
+            raise ValueError(f"Invalid HISTORY_SEARCH_LANGUAGE: {self.language}")
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                "ALTER TABLE conversation_messages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('{self.language}'::regconfig, content)) STORED"
+            )
+            connection.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_conversation_messages_search "
+                "ON conversation_messages USING GIN (search_vector)"
+            )
+        self.backend = "tsvector"
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def append(self, messages: List[Dict[str, Any]]) -> List[int]:
+        """Insert messages in one transaction and return their ids"""
+        self.ensure_schema()
+        if not messages:
+            return []
+        table = messages_table()
+        with self.engine_factory().begin() as connection:
+            if connection.dialect.insert_executemany_returning:
+                result = connection.execute(table.insert().returning(table.c.id), messages)
+                return [row[0] for row in result]
+            return [connection.execute(table.insert().values(**message)).inserted_primary_key[0] for message in messages]
+
+    def delete_conversation(self, conversation_id: str) -> int:
+        self.ensure_schema()
+        table = messages_table()
+        with self.engine_factory().begin() as connection:
+            return connection.execute(table.delete().where(table.c.conversation_id == conversation_id)).rowcount
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def conversation(
+        self, conversation_id: str, cursor: Optional[str] = None, limit: int = 100,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Messages of one conversation, oldest first"""
+        self.ensure_schema()
+        table = messages_table()
+        query = sqlalchemy.select(table).where(table.c.conversation_id == conversation_id)
+        if cursor is not None:
+            (after_id,) = decode_cursor(cursor, "conversation")
+            query = query.where(table.c.id > after_id)
+        with self.engine_factory().connect() as connection:
+            rows = connection.execute(query.order_by(table.c.id).limit(limit + 1)).mappings().all()
+        messages = [_message(row) for row in rows[:limit]]
+        next_cursor = encode_cursor("conversation", [messages[-1]["id"]]) if len(rows) > limit else None
+        return messages, next_cursor
+
+    def search(
+        self,
+        query: str,
+        filters: Optional[SearchFilters] = None,
+        sort: str = "relevance",
+        cursor: Optional[str] = None,
+        limit: int = 20,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Messages matching every term of ``query``, one page at a time
+
+        ``relevance`` puts the best matches first and ``recent`` the newest
+        messages first. Without a full-text index results are always newest
+        first. Returns the page and the cursor of the next one, if any.
+        """
+        self.ensure_schema()
+        terms = query_terms(query)
+        if not terms:
+            return [], None
+        filters = filters or SearchFilters()
+        if self.backend == "substring":
+            sort = "recent"
+        after = decode_cursor(cursor, sort) if cursor is not None else None
+
+        with self.engine_factory().connect() as connection:
+            if self.backend == "fts5":
+                rows = self._search_fts5(connection, terms, filters, sort, after, limit + 1)
+            elif self.backend == "tsvector":
+                rows = self._search_tsvector(connection, terms, filters, sort, after, limit + 1)
+            else:
+                rows = self._search_substring(connection, terms, filters, after, limit + 1)
+
+        results = []
+        for row in rows[:limit]:
+            result = _message(row)
+            content = result.pop("content")
+            result["snippet"] = highlight(content, terms)
+            result["score"] = row["score"]
+            results.append(result)
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            key = [last["rank"], last["id"]] if sort == "relevance" else [last["id"]]
+            next_cursor = encode_cursor(sort, key)
+        return results, next_cursor
+
+    def _search_fts5(self, connection, terms, filters, sort, after, limit):
+        table = messages_table()
+        fts = sqlalchemy.table("conversation_messages_fts", sqlalchemy.column("rowid"))
+        rank = sqlalchemy.func.bm25(sqlalchemy.literal_column("conversation_messages_fts"))
+        query = (
+            sqlalchemy.select(table, rank.label("rank"))
+            .select_from(fts.join(table, table.c.id == fts.c.rowid))
+            .where(
+                sqlalchemy.literal_column("conversation_messages_fts").op("MATCH")(
+                    " ".join(f'"{term}"*' for term in terms)
+                ),
+                *filters.clauses(table),
+            )
+        )
+        # BM25 is lower for better matches; FTS5 walks rowids in order, so
+        # newest-first pages stop as soon as they are full
+        if sort == "relevance":
+            if after is not None:
+                query = query.where(sqlalchemy.or_(rank > after[0], sqlalchemy.and_(rank == after[0], table.c.id > after[1])))
+            query = query.order_by(rank, table.c.id)
+        else:
+            if after is not None:
+                query = query.where(fts.c.rowid < after[0])
+            query = query.order_by(fts.c.rowid.desc())
+        rows = connection.execute(query.limit(limit)).mappings().all()
+        return [{**row, "score": -row["rank"]} for row in rows]
+
+    def _search_tsvector(self, connection, terms, filters, sort, after, limit):
+        table = messages_table()
+        tsquery = sqlalchemy.func.to_tsquery(
+            sqlalchemy.literal_column(f"'{self.language}'::regconfig"),
+            " & ".join(f"{term}:*" for term in terms),
+        )
+        vector = sqlalchemy.literal_column("conversation_messages.search_vector")
+        # ts_rank_cd is higher for better matches; negate it so both backends page ascending
+        rank = -sqlalchemy.func.ts_rank_cd(vector, tsquery)
+        query = sqlalchemy.select(table, rank.label("rank")).where(vector.op("@@")(tsquery), *filters.clauses(table))
+        if sort == "relevance":
+            if after is not None:
+                query = query.where(sqlalchemy.or_(rank > after[0], sqlalchemy.and_(rank == after[0], table.c.id > after[1])))
+            query = query.order_by(rank, table.c.id)
+        else:
+            if after is not None:
+                query = query.where(table.c.id < after[0])
+            query = query.order_by(table.c.id.desc())
+        rows = connection.execute(query.limit(limit)).mappings().all()
+        return [{**row, "score": -row["rank"]} for row in rows]
+
+    def _search_substring(self, connection, terms, filters, after, limit):
+        table = messages_table()
+        query = sqlalchemy.select(table).where(
+            *(sqlalchemy.func.lower(table.c.content).contains(term, autoescape=True) for term in terms),
+            *filters.clauses(table),
+        )
+        if after is not None:
+            query = query.where(table.c.id < after[0])
+        rows = connection.execute(query.order_by(table.c.id.desc()).limit(limit)).mappings().all()
+        return [{**row, "rank": None, "score": None} for row in rows]
+
+
+class ConversationHistory:
+    """
+    Records conversation turns and flushes them to the store in batches
+
+    ``record_turn`` only appends to an in-memory buffer, so it is safe to
+    call on the event loop. A failed flush keeps its messages for the next one;
+    beyond ``max_pending`` buffered messages the oldest are dropped and
+    counted, so a database outage cannot grow the buffer without bound.
+    """
+
+    def __init__(
+        self,
+        store: Optional[HistoryStore] = None,
+        flush_interval: Optional[float] = None,
+        max_pending: Optional[int] = None,
+    ):
+        self.store = store or HistoryStore()
+        self.flush_interval = flush_interval or settings.HISTORY_FLUSH_SECONDS
+        self.max_pending = max_pending if max_pending is not None else settings.HISTORY_MAX_PENDING
+        self.pending: List[Dict[str, Any]] = []
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flush_errors = 0
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def record_turn(
+        self,
+        conversation_id: str,
+        agent_id: str,
+        messages: Sequence[Dict[str, Any]],
+        answer: str,
+        model: Optional[str] = None,
+    ):
+        """
+        Record a run's new messages and its answer
+
+        Clients send the whole conversation with every run; only the user
+        messages after the last assistant message are new.
+        """
+        if not settings.HISTORY_ENABLED:
+            return
+        new = []
+        for message in reversed(messages):
+            if message["role"] == "assistant":
+                break
+            if message["role"] == "user":
+                new.append(message)
+        now = time.time()
+        for message in reversed(new):
+            self.pending.append({
+                "conversation_id": conversation_id,
+                "agent_id": agent_id,
+                "role": "user",
+                "content": message["content"],
+                "model": None,
+                "created_at": now,
+            })
+        self.pending.append({
+            "conversation_id": conversation_id,
+            "agent_id": agent_id,
+            "role": "assistant",
+            "content": answer,
+            "model": model,
+            "created_at": now,
+        })
+        self.recorded += len(new) + 1
+        self._trim()
+
+    def _trim(self):
+        excess = len(self.pending) - self.max_pending
+        if self.max_pending > 0 and excess > 0:
+            del self.pending[:excess]
+            self.dropped += excess
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._flush_forever(), name="history-flush")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Write buffered messages to the database"""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, []
+            try:
+                await asyncio.to_thread(self.store.append, pending)
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error("history_flush_failed", error=str(e), messages=len(pending))
+                self.pending[:0] = pending
+                self._trim()
+                return
+            self.flushed += len(pending)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "search_backend": self.store.backend,
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "pending": len(self.pending),
+            "dropped": self.dropped,
+            "flush_errors": self.flush_errors,
+        }
+
+
+# Global conversation history
+conversation_history = ConversationHistory()
@@ -0,0 +1,43 @@
+"""
+Lazy Imports
+Defer heavy optional dependencies until they are first used
+"""
+
+import importlib
+import sys
+import types
+from typing import Any
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is imported on first attribute access
+
+    After the first access the real module's namespace is copied in, so
+    later lookups are plain attribute reads without going through
+    ``__getattr__``. Modules that annotate signatures with types from a lazy
+    module need ``from __future__ import annotations``, otherwise the
+    annotations themselves trigger the import.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_target"] = name
+
+    def __getattr__(self, attr: str) -> Any:
+        module = importlib.import_module(self._lazy_target)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        loaded = "loaded" if self._lazy_target in sys.modules else "not loaded"
+        return f"<lazy module {self._lazy_target!r} ({loaded})>"
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """The module itself if it is already imported, else a ``LazyModule`` for it"""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def is_loaded(name: str) -> bool:
+    return name in sys.modules
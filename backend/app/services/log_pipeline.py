@@ -0,0 +1,235 @@
+"""
+Logging Pipeline
+Structured logging with sampling on the event loop and rendering in a background thread
+"""
+
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, List, MutableMapping, Optional, TextIO, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.serialization import dumps
+
+# Levels that are never sampled or rate limited
+ALWAYS_KEEP = {"warning", "warn", "error", "critical", "exception", "fatal"}
+
+
+class EventSampler:
+    """
+    structlog processor that drops a share of noisy events
+
+    ``sample_rates`` maps ``"event"`` or ``"event:/path/prefix"`` to the share
+    of matching events to keep, e.g. ``{"http_request:/api/health": 0.01}``.
+    ``rate_limits`` caps how many events with a given name are kept per
+    second. Warnings, errors and responses with a 4xx/5xx status always pass.
+    """
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limits: Dict[str, int]):
+        self.rules: Dict[str, List[Tuple[str, float]]] = {}
+        for key, rate in sample_rates.items():
+            event, _, prefix = key.partition(":")
+            self.rules.setdefault(event, []).append((prefix, rate))
+        for rules in self.rules.values():
+            # Most specific prefix wins
+            rules.sort(key=lambda rule: len(rule[0]), reverse=True)
+
+        self.rate_limits = dict(rate_limits)
+        self._windows: Dict[str, List[float]] = {}
+        self.sampled_out = 0
+        self.rate_limited = 0
+
+    def __call__(
+        self, logger: Any, method_name: str, event_dict: MutableMapping[str, Any]
+    ) -> MutableMapping[str, Any]:
+        if method_name in ALWAYS_KEEP or event_dict.get("status_code", 0) >= 400:
+            return event_dict
+
+        event: str = event_dict.get("event", "")
+        rules = self.rules.get(event)
+        if rules:
+            path = event_dict.get("path") or ""
+            for prefix, rate in rules:
+                if path.startswith(prefix):
+                    if rate < 1.0 and random.random() >= rate:
+                        self.sampled_out += 1
+                        raise structlog.DropEvent
+                    break
+
+        limit = self.rate_limits.get(event)
+        if limit is not None:
+            now = time.monotonic()
+            window = self._windows.get(event)
+            if window is None or now - window[0] >= 1.0:
+                window = self._windows[event] = [now, 0]
+            if window[1] >= limit:
+                self.rate_limited += 1
+                raise structlog.DropEvent
+            window[1] += 1
+
+        return event_dict
+
+
+class QueueLogger:
+    """Wrapped logger that hands event dicts to the pipeline queue"""
+
+    def __init__(self, pipeline: "LogPipeline"):
+        self._pipeline = pipeline
+
+    def msg(self, event_dict: Dict[str, Any]):
+        self._pipeline.enqueue(event_dict)
+
+    log = debug = info = warn = warning = error = critical = exception = fatal = msg
+
+
+def _to_queue(
+    logger: Any, method_name: str, event_dict: MutableMapping[str, Any]
+) -> Tuple[Tuple[MutableMapping[str, Any]], Dict[str, Any]]:
+    """Final processor: pass the event dict through to ``QueueLogger`` unrendered"""
+    return (event_dict,), {}
+
+
+class LogPipeline:
+    """
+    Background structured log emitter
+
+    Call sites only filter by level, sample and enqueue the event dict. A
+    daemon thread renders events to JSON (or console format) and writes
+    them in batches. When the queue is full, events are dropped and counted
+    rather than blocking the event loop.
+    """
+
+    def __init__(self):
+        self.queue: Optional[queue.Queue] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stream: TextIO = sys.stdout
+        self.sampler: Optional[EventSampler] = None
+        self.renderer = None
+        self.emitted = 0
+        self.dropped = 0
+
+    def configure(
+        self,
+        level: Optional[str] = None,
+        log_format: Optional[str] = None,
+        sample_rates: Optional[Dict[str, float]] = None,
+        rate_limits: Optional[Dict[str, int]] = None,
+        queue_size: Optional[int] = None,
+        stream: Optional[TextIO] = None,
+    ):
+        """Configure structlog to log through this pipeline"""
+        level = (level or settings.LOG_LEVEL).upper()
+        log_format = log_format or settings.LOG_FORMAT
+
+        self.stream = stream or sys.stdout
+        self.queue = queue.Queue(maxsize=queue_size or settings.LOG_QUEUE_SIZE)
+        self.sampler = EventSampler(
+            settings.LOG_SAMPLE_RATES if sample_rates is None else sample_rates,
+            settings.LOG_RATE_LIMITS if rate_limits is None else rate_limits,
+        )
+        if log_format == "console":
+            self.renderer = structlog.dev.ConsoleRenderer(colors=False)
+        else:
+            self.renderer = None
+
+        logging.getLogger().setLevel(level)
+        structlog.configure(
+            processors=[
+                structlog.contextvars.merge_contextvars,
+                self.sampler,
+                structlog.processors.add_log_level,
+                structlog.processors.TimeStamper(key="timestamp"),
+                structlog.processors.format_exc_info,
+                _to_queue,
+            ],
+            wrapper_class=structlog.make_filtering_bound_logger(logging.getLevelName(level)),
+            logger_factory=lambda *args: QueueLogger(self),
+            cache_logger_on_first_use=True,
+        )
+
+    def start(self):
+        """Configure if needed and start the writer thread"""
+        if self.queue is None:
+            self.configure()
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="log-pipeline", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """Flush queued events and stop the writer thread"""
+        if self.thread is None or self.queue is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def enqueue(self, event_dict: Dict[str, Any]):
+        if self.queue is None:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(event_dict)
+        except queue.Full:
+            self.dropped += 1
+
+    def render(self, event_dict: Dict[str, Any]) -> str:
+        if self.renderer is not None:
+            return self.renderer(None, event_dict.get("level", "info"), dict(event_dict))
+        try:
+            return dumps(event_dict).decode("utf-8")
+        except (TypeError, ValueError):
+            return dumps({key: _plain(value) for key, value in event_dict.items()}).decode("utf-8")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.thread is not None and self.thread.is_alive(),
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "emitted": self.emitted,
+            "dropped": self.dropped,
+            "sampled_out": self.sampler.sampled_out if self.sampler else 0,
+            "rate_limited": self.sampler.rate_limited if self.sampler else 0,
+        }
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            # Drain whatever else is waiting so one write covers a burst
+            while len(batch) < 512:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for event_dict in batch:
+                if event_dict is None:
+                    stop = True
+                    continue
+                lines.append(self.render(event_dict))
+
+            if lines:
+                try:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.stream.flush()
+                    self.emitted += len(lines)
+                except Exception:
+                    self.dropped += len(lines)
+
+
+def _plain(value: Any) -> Any:
+    """The value itself if it is JSON serializable, else its repr"""
+    try:
+        dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+# Global logging pipeline
+log_pipeline = LogPipeline()
@@ -0,0 +1,262 @@
+"""
+Event Loop Monitor
+Measures event-loop lag and captures the stack of whatever is blocking the loop
+"""
+
+import asyncio
+import bisect
+import logging
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Sequence
+
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+# Upper bounds (ms) of the lag histogram buckets; the last bucket is open-ended
+LAG_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+# Locations in asyncio's debug-mode handle reprs, most specific first: where
+# a task's coroutine is suspended, where it is defined, where a handle was created
+_SOURCE_LOCATIONS = [
+    re.compile(rf"{marker} (\S+:\d+)") for marker in ("running at", "defined at", "created at")
+]
+
+
+class LagHistogram:
+    """Fixed-bucket histogram of loop lag samples"""
+
+    def __init__(self, bounds: Sequence[float] = LAG_BUCKETS_MS):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, lag_ms: float):
+        self.counts[bisect.bisect_left(self.bounds, lag_ms)] += 1
+        self.count += 1
+        self.total_ms += lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th sample (max for the open bucket)"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return float(bound)
+        return round(self.max_ms, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        buckets = {f"le_{bound}": count for bound, count in zip(self.bounds, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.quantile(0.5),
+            "p99_ms": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class SlowCallbackHandler(logging.Handler):
+    """
+    Collects asyncio's debug-mode "Executing <handle> took N seconds" warnings
+
+    Slow callbacks are aggregated by the source location asyncio reports
+    for the handle, so repeated offenders show up as one entry.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.callbacks: Dict[str, Dict[str, Any]] = {}
+
+    def emit(self, record: logging.LogRecord):
+        args = record.args
+        if not str(record.msg).startswith("Executing") or not isinstance(args, tuple) or len(args) != 2:
+            return
+        handle = str(args[0])
+        seconds = args[1]
+        if not isinstance(seconds, (int, float)):
+            return
+        location = handle[:200]
+        for pattern in _SOURCE_LOCATIONS:
+            match = pattern.search(handle)
+            if match:
+                location = match.group(1)
+                break
+
+        entry = self.callbacks.setdefault(location, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += seconds * 1000
+        entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+
+
+class LoopMonitor:
+    """
+    Event loop watchdog
+
+    A task on the loop sleeps for ``interval_ms`` and records how late it
+    wakes up. A daemon thread watches that task's heartbeat; when the loop
+    has not run it for longer than ``block_threshold_ms``, the thread
+    captures the loop thread's current stack, which is the code holding
+    the loop. With ``slow_callback_debug`` the loop runs in asyncio debug
+    mode and callbacks slower than ``slow_callback_ms`` are counted by
+    source location. Debug mode has a noticeable overhead, so it is opt-in.
+    """
+
+    def __init__(
+        self,
+        interval_ms: Optional[float] = None,
+        block_threshold_ms: Optional[float] = None,
+        slow_callback_debug: Optional[bool] = None,
+        slow_callback_ms: Optional[float] = None,
+        max_blocks: int = 20,
+    ):
+        self.interval = (interval_ms or settings.LOOP_MONITOR_INTERVAL_MS) / 1000
+        self.block_threshold = (block_threshold_ms or settings.LOOP_BLOCK_THRESHOLD_MS) / 1000
+        self.slow_callback_debug = (
+            settings.LOOP_SLOW_CALLBACK_DEBUG if slow_callback_debug is None else slow_callback_debug
+        )
+        self.slow_callback_ms = slow_callback_ms or settings.LOOP_SLOW_CALLBACK_MS
+
+        self.histogram = LagHistogram()
+        self.blocks: Deque[Dict[str, Any]] = deque(maxlen=max_blocks)
+        self.blocked_total = 0
+        self.slow_callbacks: Optional[SlowCallbackHandler] = None
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_beat = 0.0
+        self._open_block: Optional[Dict[str, Any]] = None
+        self._captured_beat: Optional[float] = None
+        self._previous_debug: Optional[bool] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start monitoring the running loop; call from a coroutine on that loop"""
+        if self.running:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+
+        if self.slow_callback_debug:
+            self._previous_debug = self._loop.get_debug()
+            self._loop.set_debug(True)
+            self._loop.slow_callback_duration = self.slow_callback_ms / 1000
+            self.slow_callbacks = SlowCallbackHandler()
+            logging.getLogger("asyncio").addHandler(self.slow_callbacks)
+
+        self._task = self._loop.create_task(self._sample_lag(), name="loop-monitor")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        """Stop the lag task and the watchdog thread"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self.slow_callbacks is not None:
+            logging.getLogger("asyncio").removeHandler(self.slow_callbacks)
+            self._loop.set_debug(self._previous_debug)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "running": self.running,
+            "lag": self.histogram.to_dict(),
+            "blocked": {
+                "threshold_ms": self.block_threshold * 1000,
+                "count": self.blocked_total,
+                "recent": list(self.blocks),
+            },
+        }
+        if self.slow_callbacks is not None:
+            stats["slow_callbacks"] = {
+                location: {**entry, "total_ms": round(entry["total_ms"], 3), "max_ms": round(entry["max_ms"], 3)}
+                for location, entry in sorted(
+                    self.slow_callbacks.callbacks.items(),
+                    key=lambda item: item[1]["total_ms"],
+                    reverse=True,
+                )
+            }
+        return stats
+
+    async def _sample_lag(self):
+        while True:
+            scheduled = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - scheduled - self.interval)
+            self._last_beat = now
+            self.histogram.observe(lag * 1000)
+
+            block = self._open_block
+            if block is not None:
+                # The loop is running again: record how long the block lasted
+                self._open_block = None
+                block["lag_ms"] = round(lag * 1000, 3)
+
+    def _watch(self):
+        poll = min(self.interval, self.block_threshold) / 2
+        while not self._stop.wait(poll):
+            beat = self._last_beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.block_threshold or self._open_block is not None:
+                continue
+            if beat == self._captured_beat:
+                continue  # Already captured this block
+            self._capture(beat, stalled)
+
+    def _capture(self, beat: float, stalled: float):
+        thread_id = self._loop_thread_id
+        frame = sys._current_frames().get(thread_id) if thread_id is not None else None
+        stack = traceback.format_stack(frame, limit=30) if frame is not None else []
+        location = None
+        if frame is not None:
+            location = f"{frame.f_code.co_filename}:{frame.f_lineno}"
+
+        block = {
+            "detected_at": time.time(),
+            "blocked_ms_at_capture": round(stalled * 1000, 3),
+            "lag_ms": None,
+            "location": location,
+            "stack": "".join(stack),
+        }
+        self._captured_beat = beat
+        self.blocks.append(block)
+        self.blocked_total += 1
+        self._open_block = block
+        logger.warning("event_loop_blocked", blocked_ms=block["blocked_ms_at_capture"], location=location)
+
+
+# Global loop monitor
+loop_monitor = LoopMonitor()
@@ -0,0 +1,106 @@
+"""
+Prewarm
+Warms connection pools and lazily loaded subsystems after startup
+"""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+
+def warm_database():
+    """Open pool connections up front so the first queries do not pay for connecting"""
+    from app.services.database import get_engine
+
+    engine = get_engine()
+    connections = [engine.connect() for _ in range(settings.STARTUP_PREWARM_CONNECTIONS)]
+    for connection in connections:
+        connection.close()
+
+
+def warm_http_client():
+    """Import the HTTP client stack used by provider and readiness probes"""
+    import httpx  # noqa: F401
+
+
+def warm_retrieval():
+    """Load numpy, the embedder and the current knowledge index generation"""
+    from app.services.embeddings import get_embedder
+    from app.services.retrieval import knowledge_base
+
+    get_embedder().embed("warm up")
+    knowledge_base.current()
+
+
+def default_steps() -> List[Tuple[str, Callable[[], None]]]:
+    steps = [("database", warm_database), ("http_client", warm_http_client)]
+    if settings.SEMANTIC_CACHE_AGENTS or (Path(settings.RETRIEVAL_INDEX_DIR) / "CURRENT").exists():
+        steps.append(("retrieval", warm_retrieval))
+    return steps
+
+
+class Prewarmer:
+    """
+    Runs warm-up steps in a worker thread once the server is up
+
+    Lifespan startup finishes before uvicorn binds its port, so the steps
+    wait ``delay`` seconds and run off the event loop; the first health
+    ping is never held up by them. Failed steps are logged and skipped.
+    """
+
+    def __init__(self, steps: Optional[List[Tuple[str, Callable[[], None]]]] = None, delay: Optional[float] = None):
+        self.steps = steps
+        self.delay = settings.STARTUP_PREWARM_DELAY_SECONDS if delay is None else delay
+        self.timings_ms: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.done = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, then: Optional[Callable[[], None]] = None):
+        """Schedule the warm-up, calling ``then`` on the loop when it finishes unless it is cancelled"""
+        self._task = asyncio.create_task(self._run(then), name="prewarm")
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, object]:
+        return {"done": self.done, "timings_ms": dict(self.timings_ms), "errors": dict(self.errors)}
+
+    async def _run(self, then: Optional[Callable[[], None]]):
+        try:
+            await asyncio.sleep(self.delay)
+            await asyncio.to_thread(self._run_steps)
+            logger.info("prewarm_complete", timings_ms=self.timings_ms)
+        except Exception as e:
+            logger.error("prewarm_failed", error=str(e))
+        finally:
+            self.done = True
+        # Not reached when cancelled at shutdown, which must not start anything new
+        if then is not None:
+            then()
+
+    def _run_steps(self):
+        for name, step in self.steps if self.steps is not None else default_steps():
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.errors[name] = str(e)
+                logger.warning("prewarm_step_failed", step=name, error=str(e))
+            self.timings_ms[name] = round((time.perf_counter() - started) * 1000, 3)
+
+
+# Global prewarmer
+prewarmer = Prewarmer()
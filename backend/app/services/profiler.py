@@ -0,0 +1,235 @@
+"""
+Sampling Profiler
+Low-overhead statistical profiler for a running worker
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+PROFILE_MODES = ("wall", "cpu")
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running"""
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _thread_stack(frame: Optional[FrameType], max_depth: int) -> List[str]:
+    """Frame labels from the outermost call to ``frame``"""
+    labels: List[str] = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _await_stack(coro: Any, max_depth: int) -> List[str]:
+    """Frame labels of a suspended coroutine, following what it is awaiting"""
+    labels: List[str] = []
+    while coro is not None and len(labels) < max_depth:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return labels
+
+
+def _task_label(task: asyncio.Task) -> str:
+    coro = task.get_coro()
+    return f"task:{getattr(coro, '__qualname__', task.get_name())}"
+
+
+class SamplingProfiler:
+    """
+    Periodically samples the stacks of every thread in the process
+
+    In ``wall`` mode every thread is sampled on every tick, and so are the
+    coroutines of suspended asyncio tasks, so time spent awaiting shows up
+    under a ``suspended`` root. In ``cpu`` mode a thread is only sampled if
+    it used CPU time since the previous tick (Linux and other platforms with
+    per-thread CPU clocks). Samples on the event loop thread are attributed
+    to the asyncio task that was running. Output is in collapsed-stack
+    format (``frame;frame;frame count``), which flamegraph.pl, speedscope
+    and inferno read directly.
+    """
+
+    def __init__(
+        self,
+        interval_ms: float = 10.0,
+        mode: str = "wall",
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        max_depth: int = 128,
+    ):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        if mode == "cpu" and not hasattr(time, "pthread_getcpuclockid"):
+            raise ValueError("CPU profiling needs per-thread CPU clocks, which this platform lacks")
+
+        self.interval = interval_ms / 1000
+        self.mode = mode
+        self.loop = loop
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._cpu_times: Dict[int, float] = {}
+
+    def run(self, seconds: float):
+        """Sample for ``seconds`` on the calling thread"""
+        own_id = threading.get_ident()
+        started = time.monotonic()
+        deadline = started + seconds
+        next_tick = started
+
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if now < next_tick:
+                time.sleep(next_tick - now)
+            next_tick += self.interval
+            self._sample(own_id)
+
+        self.duration = time.monotonic() - started
+
+    async def profile(self, seconds: float, on_finish: Optional[Callable[[], None]] = None):
+        """
+        Sample the current loop's process from a dedicated thread for ``seconds``
+
+        ``on_finish`` is called on the sampling thread once sampling has
+        actually ended, even if the awaiting task was cancelled earlier.
+        """
+        loop = self.loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        finished: asyncio.Future = loop.create_future()
+
+        def resolve(error: Optional[BaseException]):
+            if finished.done():
+                return
+            if error is not None:
+                finished.set_exception(error)
+            else:
+                finished.set_result(None)
+
+        def sample():
+            error: Optional[BaseException] = None
+            try:
+                self.run(seconds)
+            except BaseException as e:
+                error = e
+            finally:
+                if on_finish is not None:
+                    on_finish()
+            try:
+                loop.call_soon_threadsafe(resolve, error)
+            except RuntimeError:
+                pass  # The loop closed while sampling
+
+        thread = threading.Thread(target=sample, name="profiler", daemon=True)
+        try:
+            thread.start()
+        except RuntimeError:
+            if on_finish is not None:
+                on_finish()
+            raise
+        await finished
+
+    def collapsed(self) -> str:
+        return "\n".join(
+            f"{stack} {count}" for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1])
+        )
+
+    def summary(self, top: int = 50) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "interval_ms": self.interval * 1000,
+            "duration_s": round(self.duration, 3),
+            "samples": self.samples,
+            "stacks": [
+                {"stack": stack.split(";"), "count": count}
+                for stack, count in self.stacks.most_common(top)
+            ],
+        }
+
+    def _sample(self, own_id: int):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        running_task = None
+        if self.loop is not None:
+            # Read-only peek at the loop's running task from this thread
+            running_task = getattr(asyncio.tasks, "_current_tasks", {}).get(self.loop)
+
+        self.samples += 1
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (self.mode == "cpu" and not self._used_cpu(thread_id)):
+                continue
+
+            root = [thread_names.get(thread_id, f"thread-{thread_id}")]
+            if thread_id == self._loop_thread_id and running_task is not None:
+                root.append(_task_label(running_task))
+            self.stacks[";".join(root + _thread_stack(frame, self.max_depth))] += 1
+
+        if self.mode == "wall" and self.loop is not None:
+            self._sample_suspended_tasks(running_task)
+
+    def _sample_suspended_tasks(self, running_task: Optional[asyncio.Task]):
+        try:
+            tasks = asyncio.all_tasks(self.loop)
+        except RuntimeError:
+            return  # Task set changed under us; skip this tick
+        for task in tasks:
+            if task is running_task or task.done():
+                continue
+            stack = _await_stack(task.get_coro(), self.max_depth)
+            if stack:
+                self.stacks[";".join(["suspended", _task_label(task)] + stack)] += 1
+
+    def _used_cpu(self, thread_id: int) -> bool:
+        try:
+            cpu = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+        except (OSError, OverflowError):
+            return False
+        previous = self._cpu_times.get(thread_id)
+        self._cpu_times[thread_id] = cpu
+        return previous is not None and cpu > previous
+
+
+class ProfilerGuard:
+    """Lets only one profile run per process at a time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, profiler: SamplingProfiler, seconds: float) -> SamplingProfiler:
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        logger.info("profile_started", mode=profiler.mode, seconds=seconds)
+        # The sampling thread releases the lock when it stops, so a
+        # cancelled request cannot let a second profile overlap it
+        await profiler.profile(seconds, on_finish=self._lock.release)
+        logger.info("profile_finished", mode=profiler.mode, samples=profiler.samples)
+        return profiler
+
+
+# Global profile guard
+profiler_guard = ProfilerGuard()
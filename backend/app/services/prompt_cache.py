@@ -0,0 +1,164 @@
+"""
+Prompt Prefix Cache
+Fingerprints stable prompt prefixes and caches their prepared, tokenized form
+"""
+
+import hashlib
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.serialization import dumps
+
+# Rough BPE approximation: words, numbers and individual punctuation marks
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the provider token count of ``text``"""
+    return len(_TOKEN_PATTERN.findall(text)) if text else 0
+
+
+def provider_for_model(model: str) -> str:
+    """Map a model name to the provider that serves it"""
+    name = model.lower()
+    if name.startswith("claude"):
+        return "anthropic"
+    if name.startswith("gemini"):
+        return "google"
+    return "openai"
+
+
+@dataclass
+class PreparedPrefix:
+    """Templated and tokenized stable part of a prompt"""
+    fingerprint: str
+    messages: List[Dict[str, Any]]
+    tools: List[Dict[str, Any]]
+    token_count: int
+    provider_options: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def cacheable(self) -> bool:
+        """Whether requests mark the prefix for the provider's prompt cache"""
+        return bool(self.provider_options)
+
+
+def fingerprint_prefix(
+    model: str,
+    system_prompt: Optional[str],
+    tools: Optional[List[Dict[str, Any]]],
+    documents: Optional[List[str]],
+) -> str:
+    """Stable hash of everything that makes up the prompt prefix"""
+    canonical = dumps(
+        {
+            "model": model,
+            "system_prompt": system_prompt or "",
+            "tools": tools or [],
+            "documents": documents or [],
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical).hexdigest()
+
+
+def prepare_prefix(
+    fingerprint: str,
+    model: str,
+    system_prompt: Optional[str],
+    tools: Optional[List[Dict[str, Any]]],
+    documents: Optional[List[str]],
+) -> PreparedPrefix:
+    """Template the prefix into provider messages and count its tokens"""
+    parts = [system_prompt] if system_prompt else []
+    for index, document in enumerate(documents or [], start=1):
+        parts.append(f"<document index=\"{index}\">\n{document}\n</document>")
+
+    messages = [{"role": "system", "content": "\n\n".join(parts)}] if parts else []
+    tools = list(tools or [])
+
+    token_count = sum(estimate_tokens(m["content"]) for m in messages)
+    if tools:
+        token_count += estimate_tokens(dumps(tools).decode("utf-8"))
+
+    return PreparedPrefix(
+        fingerprint=fingerprint,
+        messages=messages,
+        tools=tools,
+        token_count=token_count,
+        provider_options=_provider_options(provider_for_model(model), fingerprint, token_count),
+    )
+
+
+def _provider_options(provider: str, fingerprint: str, token_count: int) -> Dict[str, Any]:
+    """Request options that let the provider reuse its own cache of the prefix"""
+    if token_count < settings.PROMPT_CACHE_MIN_TOKENS:
+        return {}
+
+    if provider == "anthropic":
+        # Breakpoint after the system block; tools and system are cached together
+        return {"system_cache_control": {"type": "ephemeral"}}
+    if provider == "openai":
+        # Prefix caching is automatic, the key improves routing to a warm cache
+        return {"prompt_cache_key": fingerprint[:32]}
+    if provider == "google":
+        # Explicit context caches are looked up by display name
+        return {"cached_content_display_name": f"prefix-{fingerprint[:32]}"}
+    return {}
+
+
+class PrefixCache:
+    """
+    LRU cache of prepared prompt prefixes keyed by fingerprint
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, PreparedPrefix]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_prepare(
+        self,
+        model: str,
+        system_prompt: Optional[str] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        documents: Optional[List[str]] = None,
+    ) -> Tuple[PreparedPrefix, bool]:
+        """Return the prepared prefix and whether it came from the cache"""
+        fingerprint = fingerprint_prefix(model, system_prompt, tools, documents)
+
+        prefix = self.entries.get(fingerprint)
+        if prefix is not None:
+            self.entries.move_to_end(fingerprint)
+            self.hits += 1
+            return prefix, True
+
+        self.misses += 1
+        prefix = prepare_prefix(fingerprint, model, system_prompt, tools, documents)
+        if self.max_entries > 0:
+            self.entries[fingerprint] = prefix
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return prefix, False
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Global prefix cache
+prefix_cache = PrefixCache(settings.PROMPT_CACHE_MAX_ENTRIES if settings.PROMPT_CACHE_ENABLED else 0)
@@ -0,0 +1,540 @@
+"""
+Prompt Library
+Versioned prompt templates, compiled once and searchable by full text
+
+A prompt has a name, description, category and tags, and one or more
+immutable versions. A version holds a system prompt and messages with
+``{{ variable }}`` placeholders, plus default values for variables.
+
+Versions never change once saved, so they are compiled on first use and
+kept in an LRU cache keyed by prompt and version: rendering a cached
+template is a string join. References without a version resolve to the
+latest one, which is cached for ``PROMPT_LIBRARY_LATEST_TTL_SECONDS`` so
+other workers pick up new versions within that time.
+
+On SQLite, prompts are indexed in an FTS5 table ranked by BM25, with
+name and description matches weighted above the template text. Other
+databases, and SQLite builds without FTS5, fall back to substring matching.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.database import get_engine
+from app.services.lazy import lazy_import
+from app.services.serialization import dumps_str, loads
+
+sqlalchemy = lazy_import("sqlalchemy")
+
+logger = structlog.get_logger(__name__)
+
+_VARIABLE = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+_SEARCH_TERM = re.compile(r"\w+", re.UNICODE)
+
+# BM25 column weights: prompt_id, name, description, category, tags, content
+_BM25_WEIGHTS = "0, 10.0, 5.0, 2.0, 3.0, 1.0"
+
+_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5("
+    "prompt_id UNINDEXED, name, description, category, tags, content, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+
+
+class PromptNotFound(LookupError):
+    """No prompt, or no such version of it"""
+
+
+class TemplateError(ValueError):
+    """A template could not be rendered with the given variables"""
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """A template split into literal text and the variables between it"""
+    literals: Tuple[str, ...]
+    names: Tuple[str, ...]
+
+    def render(self, variables: Dict[str, str]) -> str:
+        if not self.names:
+            return self.literals[0]
+        parts = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            parts.append(variables[name])
+            parts.append(literal)
+        return "".join(parts)
+
+
+def compile_template(text: str) -> CompiledTemplate:
+    pieces = _VARIABLE.split(text)
+    return CompiledTemplate(literals=tuple(pieces[0::2]), names=tuple(pieces[1::2]))
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """Every template of one prompt version, ready to render"""
+    prompt_id: str
+    version: int
+    system_prompt: Optional[CompiledTemplate]
+    messages: Tuple[Tuple[str, CompiledTemplate], ...]
+    defaults: Dict[str, str]
+    variables: Tuple[str, ...]
+
+    def render(self, variables: Optional[Dict[str, str]] = None) -> "RenderedPrompt":
+        values = {**self.defaults, **(variables or {})}
+        missing = [name for name in self.variables if name not in values]
+        if missing:
+            raise TemplateError(f"Missing variable(s) for prompt {self.prompt_id}: {', '.join(missing)}")
+        return RenderedPrompt(
+            prompt_id=self.prompt_id,
+            version=self.version,
+            system_prompt=self.system_prompt.render(values) if self.system_prompt is not None else None,
+            messages=[{"role": role, "content": template.render(values)} for role, template in self.messages],
+        )
+
+
+@dataclass
+class RenderedPrompt:
+    """A prompt version with its variables substituted"""
+    prompt_id: str
+    version: int
+    system_prompt: Optional[str]
+    messages: List[Dict[str, str]]
+
+
+def template_variables(system_prompt: Optional[str], messages: List[Dict[str, str]]) -> List[str]:
+    """Variable names in order of first use"""
+    texts = ([system_prompt] if system_prompt else []) + [message["content"] for message in messages]
+    return list(dict.fromkeys(name for text in texts for name in _VARIABLE.findall(text)))
+
+
+def _compile_version(row: Dict[str, Any]) -> CompiledPrompt:
+    messages = loads(row["messages"])
+    return CompiledPrompt(
+        prompt_id=row["prompt_id"],
+        version=row["version"],
+        system_prompt=compile_template(row["system_prompt"]) if row["system_prompt"] is not None else None,
+        messages=tuple((message["role"], compile_template(message["content"])) for message in messages),
+        defaults=loads(row["defaults"]),
+        variables=tuple(loads(row["variables"])),
+    )
+
+
+def _normalize(template: Dict[str, Any]) -> Dict[str, Any]:
+    """A template with every field set: ``system_prompt``, ``messages`` and ``defaults``"""
+    return {
+        "system_prompt": template.get("system_prompt"),
+        "messages": list(template.get("messages") or []),
+        "defaults": dict(template.get("defaults") or {}),
+    }
+
+
+def _search_text(name: str, description: str, category: str, tags: List[str], content: str) -> str:
+    return "\n".join([name, description, category, " ".join(tags), content]).lower()
+
+
+def _content(system_prompt: Optional[str], messages: List[Dict[str, str]]) -> str:
+    return "\n".join(([system_prompt] if system_prompt else []) + [message["content"] for message in messages])
+
+
+@lru_cache()
+def prompts_table():
+    """The ``prompts`` table, defined on first use to keep SQLAlchemy off the import path"""
+    sa = sqlalchemy
+    return sa.Table(
+        "prompts",
+        _metadata(),
+        sa.Column("id", sa.String(64), primary_key=True),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("description", sa.Text, nullable=False, default=""),
+        sa.Column("category", sa.String(255), nullable=False, default="", index=True),
+        sa.Column("tags", sa.Text, nullable=False, default="[]"),
+        sa.Column("latest_version", sa.Integer, nullable=False),
+        sa.Column("search_text", sa.Text, nullable=False),  # Substring search without FTS5
+        sa.Column("created_at", sa.Float, nullable=False),
+        sa.Column("updated_at", sa.Float, nullable=False, index=True),
+    )
+
+
+@lru_cache()
+def versions_table():
+    """The ``prompt_versions`` table: immutable template content"""
+    sa = sqlalchemy
+    return sa.Table(
+        "prompt_versions",
+        _metadata(),
+        sa.Column("prompt_id", sa.String(64), primary_key=True),
+        sa.Column("version", sa.Integer, primary_key=True),
+        sa.Column("system_prompt", sa.Text),
+        sa.Column("messages", sa.Text, nullable=False),
+        sa.Column("defaults", sa.Text, nullable=False),
+        sa.Column("variables", sa.Text, nullable=False),
+        sa.Column("created_at", sa.Float, nullable=False),
+    )
+
+
+@lru_cache()
+def _metadata():
+    return sqlalchemy.MetaData()
+
+
+def _summary(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "description": row["description"],
+        "category": row["category"],
+        "tags": loads(row["tags"]),
+        "latest_version": row["latest_version"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def _version(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "version": row["version"],
+        "system_prompt": row["system_prompt"],
+        "messages": loads(row["messages"]),
+        "defaults": loads(row["defaults"]),
+        "variables": loads(row["variables"]),
+        "created_at": row["created_at"],
+    }
+
+
+class PromptLibrary:
+    """
+    Prompt templates in the database with a cache of compiled versions
+
+    Database methods are blocking and called from worker threads;
+    ``resolve`` is the async entry point for runs and only leaves the
+    event loop on a cache miss.
+    """
+
+    def __init__(self, engine_factory=get_engine, cache_entries: Optional[int] = None):
+        self.engine_factory = engine_factory
+        self.cache_entries = settings.PROMPT_LIBRARY_CACHE_ENTRIES if cache_entries is None else cache_entries
+        self.fts = False
+        self.hits = 0
+        self.misses = 0
+        self._compiled: "OrderedDict[Tuple[str, int], CompiledPrompt]" = OrderedDict()
+        self._latest: Dict[str, Tuple[int, float]] = {}
+        self._cache_lock = threading.Lock()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def ensure_schema(self):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            engine = self.engine_factory()
+            prompts_table().create(engine, checkfirst=True)
+            versions_table().create(engine, checkfirst=True)
+            if engine.dialect.name == "sqlite":
+                try:
+                    with engine.begin() as connection:
+                        connection.exec_driver_sql(_FTS_DDL)
+                    self.fts = True
+                except sqlalchemy.exc.OperationalError as e:
+                    logger.warning("prompt_search_fts_unavailable", error=str(e))
+            self._schema_ready = True
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def create(
+        self,
+        name: str,
+        template: Dict[str, Any],
+        description: str = "",
+        category: str = "",
+        tags: Optional[List[str]] = None,
+        prompt_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Create a prompt with ``template`` as version 1"""
+        self.ensure_schema()
+        template = _normalize(template)
+        prompt_id = prompt_id or uuid.uuid4().hex[:16]
+        tags = tags or []
+        now = time.time()
+        table = prompts_table()
+        with self.engine_factory().begin() as connection:
+            exists = connection.execute(sqlalchemy.select(table.c.id).where(table.c.id == prompt_id)).first()
+            if exists is not None:
+                raise ValueError(f"Prompt already exists: {prompt_id}")
+            content = _content(template["system_prompt"], template["messages"])
+            connection.execute(table.insert().values(
+                id=prompt_id,
+                name=name,
+                description=description,
+                category=category,
+                tags=dumps_str(tags),
+                latest_version=1,
+                search_text=_search_text(name, description, category, tags, content),
+                created_at=now,
+                updated_at=now,
+            ))
+            self._insert_version(connection, prompt_id, 1, template, now)
+            self._index(connection, prompt_id, name, description, category, tags, content)
+        self._set_latest(prompt_id, 1)
+        logger.info("prompt_created", prompt_id=prompt_id)
+        return self.get(prompt_id)
+
+    def add_version(self, prompt_id: str, template: Dict[str, Any], **changes: Any) -> Dict[str, Any]:
+        """
+        Save ``template`` as the next version of a prompt
+
+        ``changes`` may update the name, description, category or tags,
+        which are not versioned.
+        """
+        self.ensure_schema()
+        template = _normalize(template)
+        table = prompts_table()
+        now = time.time()
+        with self.engine_factory().begin() as connection:
+            # Bump the counter first so concurrent writers get distinct versions
+            updated = connection.execute(
+                table.update().where(table.c.id == prompt_id).values(
+                    latest_version=table.c.latest_version + 1, updated_at=now,
+                )
+            ).rowcount
+            if not updated:
+                raise PromptNotFound(f"Prompt not found: {prompt_id}")
+            row = connection.execute(sqlalchemy.select(table).where(table.c.id == prompt_id)).mappings().one()
+            fields = {
+                "name": changes.get("name") or row["name"],
+                "description": row["description"] if changes.get("description") is None else changes["description"],
+                "category": row["category"] if changes.get("category") is None else changes["category"],
+                "tags": loads(row["tags"]) if changes.get("tags") is None else changes["tags"],
+            }
+            content = _content(template["system_prompt"], template["messages"])
+            connection.execute(table.update().where(table.c.id == prompt_id).values(
+                name=fields["name"],
+                description=fields["description"],
+                category=fields["category"],
+                tags=dumps_str(fields["tags"]),
+                search_text=_search_text(**fields, content=content),
+            ))
+            version = row["latest_version"]
+            self._insert_version(connection, prompt_id, version, template, now)
+            self._index(connection, prompt_id, **fields, content=content)
+        self._set_latest(prompt_id, version)
+        logger.info("prompt_version_created", prompt_id=prompt_id, version=version)
+        return self.get(prompt_id)
+
+    def delete(self, prompt_id: str) -> bool:
+        self.ensure_schema()
+        with self.engine_factory().begin() as connection:
+            deleted = connection.execute(
+                prompts_table().delete().where(prompts_table().c.id == prompt_id)
+            ).rowcount
+            connection.execute(versions_table().delete().where(versions_table().c.prompt_id == prompt_id))
+            if self.fts:
+                connection.exec_driver_sql("DELETE FROM prompts_fts WHERE prompt_id = ?", (prompt_id,))
+        with self._cache_lock:
+            self._latest.pop(prompt_id, None)
+            for key in [key for key in self._compiled if key[0] == prompt_id]:
+                del self._compiled[key]
+        return bool(deleted)
+
+    @staticmethod
+    def _insert_version(connection, prompt_id: str, version: int, template: Dict[str, Any], now: float):
+        connection.execute(versions_table().insert().values(
+            prompt_id=prompt_id,
+            version=version,
+            system_prompt=template["system_prompt"],
+            messages=dumps_str(template["messages"]),
+            defaults=dumps_str(template["defaults"]),
+            variables=dumps_str(template_variables(template["system_prompt"], template["messages"])),
+            created_at=now,
+        ))
+
+    def _index(self, connection, prompt_id: str, name: str, description: str, category: str, tags: List[str], content: str):
+        if not self.fts:
+            return
+        connection.exec_driver_sql("DELETE FROM prompts_fts WHERE prompt_id = ?", (prompt_id,))
+        connection.exec_driver_sql(
+            "INSERT INTO prompts_fts (prompt_id, name, description, category, tags, content) VALUES (?, ?, ?, ?, ?, ?)",
+            (prompt_id, name, description, category, " ".join(tags), content),
+        )
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get(self, prompt_id: str) -> Dict[str, Any]:
+        """A prompt with its latest version and the list of version numbers"""
+        self.ensure_schema()
+        table, versions = prompts_table(), versions_table()
+        with self.engine_factory().connect() as connection:
+            row = connection.execute(sqlalchemy.select(table).where(table.c.id == prompt_id)).mappings().first()
+            if row is None:
+                raise PromptNotFound(f"Prompt not found: {prompt_id}")
+            latest = connection.execute(
+                sqlalchemy.select(versions).where(
+                    versions.c.prompt_id == prompt_id, versions.c.version == row["latest_version"],
+                )
+            ).mappings().one()
+            numbers = connection.execute(
+                sqlalchemy.select(versions.c.version).where(versions.c.prompt_id == prompt_id).order_by(versions.c.version)
+            ).scalars().all()
+        return {**_summary(row), "template": _version(latest), "versions": list(numbers)}
+
+    def get_version(self, prompt_id: str, version: int) -> Dict[str, Any]:
+        self.ensure_schema()
+        versions = versions_table()
+        with self.engine_factory().connect() as connection:
+            row = connection.execute(
+                sqlalchemy.select(versions).where(versions.c.prompt_id == prompt_id, versions.c.version == version)
+            ).mappings().first()
+        if row is None:
+            raise PromptNotFound(f"Prompt version not found: {prompt_id} v{version}")
+        return {"id": prompt_id, **_version(row)}
+
+    def list(self, category: Optional[str] = None, limit: int = 50, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Prompts by most recently updated, and the total count"""
+        self.ensure_schema()
+        table = prompts_table()
+        query = sqlalchemy.select(table)
+        count = sqlalchemy.select(sqlalchemy.func.count()).select_from(table)
+        if category:
+            query = query.where(table.c.category == category)
+            count = count.where(table.c.category == category)
+        with self.engine_factory().connect() as connection:
+            rows = connection.execute(
+                query.order_by(table.c.updated_at.desc(), table.c.id).limit(limit).offset(offset)
+            ).mappings().all()
+            total = connection.execute(count).scalar_one()
+        return [_summary(row) for row in rows], total
+
+    def search(self, query: str, category: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Prompts matching every term of ``query``, best match first
+
+        Terms match word prefixes, so "summ" finds "summarize".
+        """
+        self.ensure_schema()
+        terms = _SEARCH_TERM.findall(query.lower())
+        if not terms:
+            return []
+        table = prompts_table()
+        with self.engine_factory().connect() as connection:
+            if self.fts:
+                match = " ".join(f'"{term}"*' for term in terms)
+                sql = f"SELECT prompt_id FROM prompts_fts WHERE prompts_fts MATCH ? ORDER BY bm25(prompts_fts, {_BM25_WEIGHTS})"
+                params: Tuple[Any, ...] = (match,)
+                if category:
+                    sql = (
+                        "SELECT f.prompt_id FROM prompts_fts f JOIN prompts p ON p.id = f.prompt_id "
+                        f"WHERE prompts_fts MATCH ? AND p.category = ? ORDER BY bm25(prompts_fts, {_BM25_WEIGHTS})"
+                    )
+                    params = (match, category)
+                ids = [row[0] for row in connection.exec_driver_sql(f"{sql} LIMIT {int(limit)}", params)]
+                rows = connection.execute(sqlalchemy.select(table).where(table.c.id.in_(ids))).mappings().all()
+                by_id = {row["id"]: row for row in rows}
+                return [_summary(by_id[prompt_id]) for prompt_id in ids if prompt_id in by_id]
+
+            select = sqlalchemy.select(table).where(*(table.c.search_text.contains(term, autoescape=True) for term in terms))
+            if category:
+                select = select.where(table.c.category == category)
+            rows = connection.execute(select.order_by(table.c.updated_at.desc()).limit(limit)).mappings().all()
+        return [_summary(row) for row in rows]
+
+    # ------------------------------------------------------------------
+    # Rendering
+    # ------------------------------------------------------------------
+
+    def compiled(self, prompt_id: str, version: Optional[int] = None) -> CompiledPrompt:
+        """The compiled version, from the cache or the database"""
+        key_version = version if version is not None else self._cached_latest(prompt_id)
+        if key_version is not None:
+            cached = self._cached(prompt_id, key_version)
+            if cached is not None:
+                return cached
+
+        self.misses += 1
+        self.ensure_schema()
+        table, versions = prompts_table(), versions_table()
+        with self.engine_factory().connect() as connection:
+            if version is None:
+                version = connection.execute(
+                    sqlalchemy.select(table.c.latest_version).where(table.c.id == prompt_id)
+                ).scalar_one_or_none()
+                if version is None:
+                    raise PromptNotFound(f"Prompt not found: {prompt_id}")
+                self._set_latest(prompt_id, version)
+            row = connection.execute(
+                sqlalchemy.select(versions).where(versions.c.prompt_id == prompt_id, versions.c.version == version)
+            ).mappings().first()
+        if row is None:
+            raise PromptNotFound(f"Prompt version not found: {prompt_id} v{version}")
+
+        compiled = _compile_version(row)
+        if self.cache_entries > 0:
+            with self._cache_lock:
+                self._compiled[(prompt_id, version)] = compiled
+                while len(self._compiled) > self.cache_entries:
+                    self._compiled.popitem(last=False)
+        return compiled
+
+    async def resolve(
+        self, prompt_id: str, version: Optional[int] = None, variables: Optional[Dict[str, str]] = None,
+    ) -> RenderedPrompt:
+        """Render a prompt for a run, reading the database only on a cache miss"""
+        key_version = version if version is not None else self._cached_latest(prompt_id)
+        compiled = self._cached(prompt_id, key_version) if key_version is not None else None
+        if compiled is None:
+            compiled = await asyncio.to_thread(self.compiled, prompt_id, version)
+        return compiled.render(variables)
+
+    def _cached(self, prompt_id: str, version: int) -> Optional[CompiledPrompt]:
+        with self._cache_lock:
+            compiled = self._compiled.get((prompt_id, version))
+            if compiled is not None:
+                self._compiled.move_to_end((prompt_id, version))
+                self.hits += 1
+        return compiled
+
+    def _cached_latest(self, prompt_id: str) -> Optional[int]:
+        entry = self._latest.get(prompt_id)
+        if entry is None or time.time() - entry[1] > settings.PROMPT_LIBRARY_LATEST_TTL_SECONDS:
+            return None
+        return entry[0]
+
+    def _set_latest(self, prompt_id: str, version: int):
+        self._latest[prompt_id] = (version, time.time())
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._compiled),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "full_text_search": self.fts,
+        }
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._compiled.clear()
+            self._latest.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Global prompt library
+prompt_library = PromptLibrary()
@@ -0,0 +1,700 @@
+"""
+Provider Emulator
+Local stand-in for the OpenAI, Anthropic and Google streaming APIs
+
+Answers chat requests in each provider's wire format, either by replaying
+recorded cassettes or with synthetic tokens paced by a configurable time
+to first token and inter-token latency distribution, with optional 429
+and error injection. Point ``PROVIDER_BASE_URL`` at it to load test runs
+and streams without paying for provider calls.
+
+Usage:
+    python -m app.services.provider_emulator [--port 9100] [--ttft-ms 300] [--itl-ms 30]
+        [--jitter lognormal] [--rate-limit-rate 0.05] [--error-rate 0.01] [--seed 1]
+        [--mode synthetic|replay|record] [--cassette cassettes/runs.jsonl]
+        [--upstream openai=https://api.openai.com]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.services.lazy import lazy_import
+from app.services.prompt_cache import estimate_tokens
+from app.services.serialization import dumps, dumps_str, loads
+
+if TYPE_CHECKING:
+    import httpx
+    import uvicorn
+else:
+    httpx = lazy_import("httpx")
+
+JITTERS = ("fixed", "uniform", "exponential", "lognormal")
+MODES = ("synthetic", "replay", "record")
+
+VOCABULARY = (
+    "the model returns a short answer that covers each part of the question with examples and notes "
+    "on edge cases so you can check the result against your data before you rely on it in production "
+    "where latency cost and accuracy all matter for every request we send through the agent pipeline"
+).split()
+
+
+@dataclass
+class EmulatorProfile:
+    """Pacing and fault injection for synthetic answers"""
+    ttft_ms: float = 300.0
+    inter_token_ms: float = 30.0
+    jitter: str = "lognormal"  # Distribution of each delay around its mean: fixed, uniform, exponential, lognormal
+    spread: float = 0.5  # Sigma for lognormal, relative half-width for uniform
+    tokens: int = 64  # Answer length, capped by the request's max tokens
+    rate_limit_rate: float = 0.0  # Share of requests answered with 429
+    error_rate: float = 0.0  # Share answered with a server error before streaming
+    stream_error_rate: float = 0.0  # Share that stop with an error event mid-stream
+    retry_after_seconds: float = 1.0
+    seed: Optional[int] = None  # Fixes answers, delays and injected faults
+
+    def __post_init__(self):
+        if self.jitter not in JITTERS:
+            raise ValueError(f"jitter must be one of: {', '.join(JITTERS)}")
+
+    def delay(self, rng: random.Random, mean_ms: float) -> float:
+        """One delay in seconds, drawn around ``mean_ms``"""
+        if mean_ms <= 0:
+            return 0.0
+        if self.jitter == "uniform":
+            spread = min(self.spread, 1.0)
+            ms = rng.uniform(mean_ms * (1 - spread), mean_ms * (1 + spread))
+        elif self.jitter == "exponential":
+            ms = rng.expovariate(1 / mean_ms)
+        elif self.jitter == "lognormal":
+            # Centered so the mean stays mean_ms; the tail grows with spread
+            ms = mean_ms * math.exp(rng.gauss(-self.spread ** 2 / 2, self.spread))
+        else:
+            ms = mean_ms
+        return ms / 1000
+
+
+def request_key(path: str, body: bytes) -> str:
+    """Cassette key of a request: its path and canonical JSON body"""
+    try:
+        canonical = dumps(loads(body), sort_keys=True)
+    except ValueError:
+        canonical = body
+    return hashlib.sha256(path.encode("utf-8") + b"\n" + canonical).hexdigest()
+
+
+@dataclass
+class Recording:
+    """One recorded provider response, as the chunks that arrived and when"""
+    key: str
+    path: str
+    status: int
+    content_type: str
+    chunks: List[Tuple[float, str]]  # (ms after the request, text)
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+class Cassette:
+    """
+    Recorded responses in a JSON Lines file, looked up by request key
+
+    Requests recorded more than once are replayed in turn.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path is not None else None
+        self.recordings: Dict[str, List[Recording]] = {}
+        self._turns: Counter = Counter()
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            for line in self.path.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    data = loads(line)
+                    self._remember(Recording(**{**data, "chunks": [tuple(chunk) for chunk in data["chunks"]]}))
+
+    def __len__(self) -> int:
+        return sum(len(recordings) for recordings in self.recordings.values())
+
+    def _remember(self, recording: Recording):
+        self.recordings.setdefault(recording.key, []).append(recording)
+
+    def find(self, key: str) -> Optional[Recording]:
+        recordings = self.recordings.get(key)
+        if not recordings:
+            return None
+        with self._lock:
+            turn = self._turns[key]
+            self._turns[key] += 1
+        return recordings[turn % len(recordings)]
+
+    def add(self, recording: Recording):
+        with self._lock:
+            self._remember(recording)
+            if self.path is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with self.path.open("a", encoding="utf-8") as f:
+                    f.write(dumps_str(asdict(recording)) + "\n")
+
+
+def _sse(data: Any, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {dumps_str(data)}\n\n"
+
+
+class OpenAIFormat:
+    """Chat completions, streamed as ``chat.completion.chunk`` events"""
+
+    def __init__(self, model: str, prompt_tokens: int, cache_read: int = 0, cache_written: int = 0):
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.cache_read = cache_read
+        self.id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        self.created = int(time.time())
+
+    def _chunk(self, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+        return _sse({
+            "id": self.id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        })
+
+    def _usage(self, completion_tokens: int) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": self.prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": self.cache_read},
+        }
+
+    def start(self) -> List[str]:
+        return [self._chunk({"role": "assistant", "content": ""})]
+
+    def delta(self, text: str) -> str:
+        return self._chunk({"content": text})
+
+    def end(self, completion_tokens: int) -> List[str]:
+        usage = {
+            "id": self.id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [],
+            "usage": self._usage(completion_tokens),
+        }
+        return [self._chunk({}, "stop"), _sse(usage), "data: [DONE]\n\n"]
+
+    def stream_error(self, message: str) -> str:
+        return _sse({"error": {"message": message, "type": "server_error", "code": None}})
+
+    def error(self, status_code: int, message: str) -> Dict[str, Any]:
+        kind = "rate_limit_exceeded" if status_code == 429 else "server_error"
+        return {"error": {"message": message, "type": kind, "code": kind}}
+
+    def body(self, text: str, completion_tokens: int) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "object": "chat.completion",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": self._usage(completion_tokens),
+        }
+
+
+class AnthropicFormat:
+    """Messages API, streamed as typed ``message_*`` and ``content_block_*`` events"""
+
+    error_status = 529  # Overloaded
+
+    def __init__(self, model: str, prompt_tokens: int, cache_read: int = 0, cache_written: int = 0):
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.cache_read = cache_read
+        self.cache_written = cache_written
+        self.id = f"msg_{uuid.uuid4().hex[:24]}"
+
+    def _message(self, content: List[Dict[str, Any]], output_tokens: int, stop_reason: Optional[str]) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": "message",
+            "role": "assistant",
+            "model": self.model,
+            "content": content,
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {
+                # Like the real API, input_tokens leaves out tokens read from or written to the cache
+                "input_tokens": self.prompt_tokens - self.cache_read - self.cache_written,
+                "cache_creation_input_tokens": self.cache_written,
+                "cache_read_input_tokens": self.cache_read,
+                "output_tokens": output_tokens,
+            },
+        }
+
+    def start(self) -> List[str]:
+        return [
+            _sse({"type": "message_start", "message": self._message([], 1, None)}, "message_start"),
+            _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start"),
+            _sse({"type": "ping"}, "ping"),
+        ]
+
+    def delta(self, text: str) -> str:
+        return _sse(
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}},
+            "content_block_delta",
+        )
+
+    def end(self, completion_tokens: int) -> List[str]:
+        return [
+            _sse({"type": "content_block_stop", "index": 0}, "content_block_stop"),
+            _sse({
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": completion_tokens},
+            }, "message_delta"),
+            _sse({"type": "message_stop"}, "message_stop"),
+        ]
+
+    def stream_error(self, message: str) -> str:
+        return _sse({"type": "error", "error": {"type": "overloaded_error", "message": message}}, "error")
+
+    def error(self, status_code: int, message: str) -> Dict[str, Any]:
+        kind = {429: "rate_limit_error", 529: "overloaded_error", 400: "invalid_request_error"}.get(status_code, "api_error")
+        return {"type": "error", "error": {"type": kind, "message": message}}
+
+    def body(self, text: str, completion_tokens: int) -> Dict[str, Any]:
+        return self._message([{"type": "text", "text": text}], completion_tokens, "end_turn")
+
+
+class GoogleFormat:
+    """Gemini ``generateContent``, streamed as SSE with ``alt=sse``"""
+
+    def __init__(self, model: str, prompt_tokens: int, cache_read: int = 0, cache_written: int = 0):
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.cache_read = cache_read
+
+    def _response(self, text: str, completion_tokens: int, finish_reason: Optional[str] = None) -> Dict[str, Any]:
+        candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        if finish_reason:
+            candidate["finishReason"] = finish_reason
+        usage = {
+            "promptTokenCount": self.prompt_tokens,
+            "candidatesTokenCount": completion_tokens,
+            "totalTokenCount": self.prompt_tokens + completion_tokens,
+        }
+        if self.cache_read:
+            usage["cachedContentTokenCount"] = self.cache_read
+        return {
+            "candidates": [candidate],
+            "usageMetadata": usage,
+            "modelVersion": self.model,
+        }
+
+    def start(self) -> List[str]:
+        return []
+
+    def delta(self, text: str) -> str:
+        return _sse(self._response(text, 0))
+
+    def end(self, completion_tokens: int) -> List[str]:
+        return [_sse(self._response("", completion_tokens, "STOP"))]
+
+    def stream_error(self, message: str) -> str:
+        return _sse({"error": {"code": 503, "message": message, "status": "UNAVAILABLE"}})
+
+    def error(self, status_code: int, message: str) -> Dict[str, Any]:
+        kind = {429: "RESOURCE_EXHAUSTED", 400: "INVALID_ARGUMENT", 404: "NOT_FOUND"}.get(status_code, "INTERNAL")
+        return {"error": {"code": status_code, "message": message, "status": kind}}
+
+    def body(self, text: str, completion_tokens: int) -> Dict[str, Any]:
+        return self._response(text, completion_tokens, "STOP")
+
+
+FORMATS: Dict[str, Any] = {"openai": OpenAIFormat, "anthropic": AnthropicFormat, "google": GoogleFormat}
+
+
+def _prompt_tokens(provider: str, payload: Dict[str, Any]) -> int:
+    if provider == "google":
+        texts = [part.get("text", "") for content in payload.get("contents") or [] for part in content.get("parts", [])]
+        texts += [part.get("text", "") for part in (payload.get("systemInstruction") or {}).get("parts", [])]
+    else:
+        system = payload.get("system")
+        if isinstance(system, list):
+            # Anthropic system blocks, e.g. with a cache breakpoint
+            system = "\n\n".join(block.get("text", "") for block in system if isinstance(block, dict))
+        texts = [m.get("content") for m in payload.get("messages") or []] + [system]
+    return sum(estimate_tokens(text) for text in texts if isinstance(text, str))
+
+
+def _tool_tokens(payload: Dict[str, Any]) -> int:
+    tools = payload.get("tools")
+    return estimate_tokens(dumps_str(tools)) if tools else 0
+
+
+def _requested_tokens(provider: str, payload: Dict[str, Any]) -> Optional[int]:
+    if provider == "google":
+        return (payload.get("generationConfig") or {}).get("maxOutputTokens")
+    return payload.get("max_completion_tokens") or payload.get("max_tokens")
+
+
+class ProviderEmulator:
+    """
+    Serves the provider APIs from synthetic answers or a cassette
+
+    ``mode`` is ``synthetic``, ``replay`` (cassette first, synthetic for
+    requests it has not seen) or ``record`` (forward to ``upstreams`` and
+    save each response to the cassette). Serve ``app`` with any ASGI
+    server, call ``start`` to run it on a background thread, or pass
+    ``transport()`` to an httpx client to call it in process.
+    """
+
+    def __init__(
+        self,
+        profile: Optional[EmulatorProfile] = None,
+        mode: str = "synthetic",
+        cassette: Optional[Cassette] = None,
+        upstreams: Optional[Dict[str, str]] = None,
+        upstream_transport: Optional[httpx.AsyncBaseTransport] = None,
+        replay_speed: float = 1.0,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of: {', '.join(MODES)}")
+        if mode != "synthetic" and cassette is None:
+            raise ValueError(f"{mode} mode needs a cassette")
+        self.profile = profile or EmulatorProfile()
+        self.mode = mode
+        self.cassette = cassette
+        self.upstreams = {name: url.rstrip("/") for name, url in (upstreams or {}).items()}
+        self.upstream_transport = upstream_transport
+        self.replay_speed = replay_speed
+        self.rng = random.Random(self.profile.seed)
+        self.counts: Counter = Counter()
+        self.active = 0
+        # Prompt cache key or cached content name -> cached prompt tokens
+        self.prompt_caches: Dict[str, int] = {}
+        self.base_url: Optional[str] = None
+        self.app = self._build_app()
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "active": self.active, **self.counts}
+
+    # ------------------------------------------------------------------
+    # Running
+    # ------------------------------------------------------------------
+
+    def transport(self) -> httpx.AsyncBaseTransport:
+        """In-process transport; responses arrive whole rather than streamed"""
+        # httpx 0.26 types ASGI apps more narrowly than Starlette declares them
+        return httpx.ASGITransport(app=self.app)  # type: ignore[arg-type]
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve on a background thread and return the base URL"""
+        import uvicorn
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        server = uvicorn.Server(uvicorn.Config(self.app, log_level="warning", lifespan="off"))
+        thread = threading.Thread(
+            target=server.run, kwargs={"sockets": [sock]}, daemon=True, name="provider-emulator",
+        )
+        self._server, self._thread = server, thread
+        thread.start()
+
+        deadline = time.monotonic() + 10
+        while not server.started:
+            if not thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("Provider emulator did not start")
+            time.sleep(0.01)
+        self.base_url = f"http://{host}:{sock.getsockname()[1]}"
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+            self._server = None
+            self._thread = None
+
+    def __enter__(self) -> "ProviderEmulator":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # ------------------------------------------------------------------
+    # Endpoints
+    # ------------------------------------------------------------------
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Provider Emulator", docs_url=None, redoc_url=None, openapi_url=None)
+
+        @app.post("/v1/chat/completions")
+        async def openai_chat(request: Request):
+            return await self.handle("openai", request)
+
+        @app.post("/v1/messages")
+        async def anthropic_messages(request: Request):
+            return await self.handle("anthropic", request)
+
+        @app.post("/v1beta/models/{target}")
+        async def google_generate(target: str, request: Request):
+            model, _, method = target.partition(":")
+            if method not in ("generateContent", "streamGenerateContent"):
+                return JSONResponse(GoogleFormat(model, 0).error(404, f"Unknown method: {method}"), status_code=404)
+            return await self.handle("google", request, model=model, stream=method == "streamGenerateContent")
+
+        @app.post("/v1beta/cachedContents")
+        async def google_cache(request: Request):
+            payload = loads(await request.body())
+            self.counts["google_cached_contents"] += 1
+            name = f"cachedContents/{request_key('cachedContents', dumps(payload))[:16]}"
+            self.prompt_caches[name] = _prompt_tokens("google", payload) + _tool_tokens(payload)
+            return {"name": name, "model": payload.get("model"), "displayName": payload.get("displayName", "")}
+
+        @app.get("/emulator/stats")
+        async def emulator_stats():
+            return self.stats()
+
+        return app
+
+    async def handle(self, provider: str, request: Request, model: Optional[str] = None, stream: Optional[bool] = None):
+        body = await request.body()
+        self.counts["requests"] += 1
+        self.counts[f"{provider}_requests"] += 1
+        key = request_key(request.url.path, body)
+
+        if self.mode == "record":
+            return await self._record(provider, request, body, key)
+        if self.mode == "replay" and self.cassette is not None:
+            recording = self.cassette.find(key)
+            if recording is not None:
+                self.counts["replayed"] += 1
+                return self._replay(recording)
+            self.counts["replay_misses"] += 1
+
+        try:
+            payload = loads(body)
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            return self._error(FORMATS[provider]("", 0), 400, "Request body must be a JSON object")
+        model = model or payload.get("model") or "unknown"
+        stream = bool(payload.get("stream")) if stream is None else stream
+        return await self._synthetic(provider, model, stream, payload, key)
+
+    # ------------------------------------------------------------------
+    # Synthetic answers
+    # ------------------------------------------------------------------
+
+    def _error(self, fmt, status_code: int, message: str) -> JSONResponse:
+        self.counts[f"status_{status_code}"] += 1
+        headers = {"retry-after": f"{self.profile.retry_after_seconds:g}"} if status_code == 429 else None
+        return JSONResponse(fmt.error(status_code, message), status_code=status_code, headers=headers)
+
+    def _prompt_cache(self, provider: str, payload: Dict[str, Any], prompt_tokens: int) -> Tuple[int, int]:
+        """
+        (read, written) prompt cache tokens for a request, counted the way the provider does
+
+        Anthropic caches tools and system blocks up to the last cache
+        breakpoint, OpenAI the leading system messages of requests sharing a
+        ``prompt_cache_key``, and Gemini whatever its cached content holds.
+        """
+        if provider == "google":
+            name = payload.get("cachedContent")
+            return (self.prompt_caches.get(name, 0), 0) if isinstance(name, str) else (0, 0)
+
+        if provider == "anthropic":
+            system = payload.get("system")
+            blocks = [block for block in system if isinstance(block, dict)] if isinstance(system, list) else []
+            marked = [index for index, block in enumerate(blocks) if block.get("cache_control")]
+            if not marked:
+                return 0, 0
+            prefix = blocks[:marked[-1] + 1]
+            texts = [block.get("text", "") for block in prefix]
+        else:
+            if not payload.get("prompt_cache_key"):
+                return 0, 0
+            prefix = []
+            for message in payload.get("messages") or []:
+                if not isinstance(message, dict) or message.get("role") != "system":
+                    break
+                prefix.append(message)
+            texts = [message.get("content", "") for message in prefix]
+
+        key = request_key(provider, dumps([payload.get("model"), payload.get("prompt_cache_key"), payload.get("tools"), prefix]))
+        tokens = min(prompt_tokens, _tool_tokens(payload) + sum(estimate_tokens(t) for t in texts if isinstance(t, str)))
+        if key in self.prompt_caches:
+            self.counts["prompt_cache_hits"] += 1
+            return self.prompt_caches[key], 0
+        self.prompt_caches[key] = tokens
+        return 0, tokens
+
+    def _tokens(self, provider: str, payload: Dict[str, Any], key: str) -> List[str]:
+        # The answer depends only on the request, so runs are reproducible
+        rng = random.Random(f"{self.profile.seed}:{key}")
+        count = max(1, min(self.profile.tokens, _requested_tokens(provider, payload) or self.profile.tokens))
+        words = rng.choices(VOCABULARY, k=count)
+        words[0] = words[0].capitalize()
+        words[-1] += "."
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    async def _synthetic(self, provider: str, model: str, stream: bool, payload: Dict[str, Any], key: str):
+        profile = self.profile
+        prompt_tokens = _prompt_tokens(provider, payload)
+        fmt = FORMATS[provider](model, prompt_tokens, *self._prompt_cache(provider, payload, prompt_tokens))
+
+        roll = self.rng.random()
+        if roll < profile.rate_limit_rate:
+            return self._error(fmt, 429, "Rate limit exceeded; retry after a short wait")
+        if roll < profile.rate_limit_rate + profile.error_rate:
+            return self._error(fmt, getattr(fmt, "error_status", 500), "The server had an error processing the request")
+
+        tokens = self._tokens(provider, payload, key)
+        fail_at = self.rng.randrange(len(tokens)) if self.rng.random() < profile.stream_error_rate else None
+        self.counts["synthetic"] += 1
+        self.counts["status_200"] += 1
+
+        if not stream:
+            delay = profile.delay(self.rng, profile.ttft_ms)
+            delay += sum(profile.delay(self.rng, profile.inter_token_ms) for _ in tokens[1:])
+            await asyncio.sleep(delay)
+            return JSONResponse(fmt.body("".join(tokens), len(tokens)))
+        return StreamingResponse(self._stream(fmt, tokens, fail_at), media_type="text/event-stream")
+
+    async def _stream(self, fmt, tokens: List[str], fail_at: Optional[int]) -> AsyncIterator[str]:
+        profile = self.profile
+        self.active += 1
+        try:
+            for event in fmt.start():
+                yield event
+            await asyncio.sleep(profile.delay(self.rng, profile.ttft_ms))
+            for index, token in enumerate(tokens):
+                if index:
+                    await asyncio.sleep(profile.delay(self.rng, profile.inter_token_ms))
+                if index == fail_at:
+                    self.counts["stream_errors"] += 1
+                    yield fmt.stream_error("Overloaded")
+                    return
+                yield fmt.delta(token)
+            for event in fmt.end(len(tokens)):
+                yield event
+        finally:
+            self.active -= 1
+
+    # ------------------------------------------------------------------
+    # Cassettes
+    # ------------------------------------------------------------------
+
+    def _replay(self, recording: Recording) -> StreamingResponse:
+        async def chunks() -> AsyncIterator[str]:
+            started = time.perf_counter()
+            for offset_ms, text in recording.chunks:
+                wait = offset_ms / 1000 / self.replay_speed - (time.perf_counter() - started)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                yield text
+
+        return StreamingResponse(
+            chunks(), status_code=recording.status, media_type=recording.content_type, headers=recording.headers,
+        )
+
+    async def _record(self, provider: str, request: Request, body: bytes, key: str):
+        upstream = self.upstreams.get(provider)
+        if upstream is None:
+            return self._error(FORMATS[provider]("", 0), 502, f"No upstream configured for {provider}")
+
+        started = time.perf_counter()
+        headers = {
+            name: value for name, value in request.headers.items()
+            if name not in ("host", "content-length", "accept-encoding", "connection")
+        }
+        url = upstream + request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        client = httpx.AsyncClient(transport=self.upstream_transport, timeout=None)
+        response = await client.send(client.build_request("POST", url, headers=headers, content=body), stream=True)
+        content_type = response.headers.get("content-type", "application/json")
+        kept = {name: response.headers[name] for name in ("retry-after",) if name in response.headers}
+
+        async def relay() -> AsyncIterator[str]:
+            chunks: List[Tuple[float, str]] = []
+            complete = False
+            try:
+                async for text in response.aiter_text():
+                    chunks.append((round((time.perf_counter() - started) * 1000, 3), text))
+                    yield text
+                complete = True
+            finally:
+                await response.aclose()
+                await client.aclose()
+                # A stream cut short by the caller is not worth replaying
+                if complete and self.cassette is not None:
+                    self.cassette.add(Recording(key, request.url.path, response.status_code, content_type, chunks, kept))
+                    self.counts["recorded"] += 1
+
+        return StreamingResponse(relay(), status_code=response.status_code, media_type=content_type, headers=kept)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI, Anthropic and Google APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--mode", choices=MODES, default="synthetic")
+    parser.add_argument("--cassette", type=Path, help="JSON Lines file to replay from or record to")
+    parser.add_argument("--upstream", action="append", default=[], help="provider=base URL to record from, repeatable")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="Replay faster (>1) or slower than recorded")
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--itl-ms", type=float, default=30.0, help="Mean inter-token latency")
+    parser.add_argument("--jitter", choices=JITTERS, default="lognormal")
+    parser.add_argument("--spread", type=float, default=0.5)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stream-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    emulator = ProviderEmulator(
+        EmulatorProfile(
+            ttft_ms=args.ttft_ms,
+            inter_token_ms=args.itl_ms,
+            jitter=args.jitter,
+            spread=args.spread,
+            tokens=args.tokens,
+            rate_limit_rate=args.rate_limit_rate,
+            error_rate=args.error_rate,
+            stream_error_rate=args.stream_error_rate,
+            seed=args.seed,
+        ),
+        mode=args.mode,
+        cassette=Cassette(args.cassette) if args.cassette else None,
+        upstreams=dict(upstream.split("=", 1) for upstream in args.upstream),
+        replay_speed=args.replay_speed,
+    )
+    uvicorn.run(emulator.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Provider Client
+Streams completions over the OpenAI, Anthropic and Google wire formats
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.lazy import lazy_import
+from app.services.serialization import dumps, loads
+
+if TYPE_CHECKING:
+    import httpx
+
+    from app.services.context import RunContext
+else:
+    httpx = lazy_import("httpx")
+
+logger = structlog.get_logger(__name__)
+
+ANTHROPIC_VERSION = "2023-06-01"
+
+
+@dataclass
+class ProviderUsage:
+    """Usage a provider reported for one streamed answer"""
+    # Prompt tokens read from the provider's prompt cache; None until a usage event arrives
+    cached_tokens: Optional[int] = None
+
+
+class ProviderError(Exception):
+    """A provider answered with an error status or an error event"""
+
+    def __init__(self, provider: str, status_code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{provider} returned {status_code}: {message}")
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _split_system(messages):
+    system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+    return system, [m for m in messages if m["role"] != "system"]
+
+
+def _functions(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Name, description and JSON schema of each tool, from OpenAI-style or bare definitions"""
+    functions = []
+    for tool in tools:
+        function = tool.get("function", tool) if isinstance(tool, dict) else None
+        if not isinstance(function, dict) or not function.get("name"):
+            continue
+        functions.append({
+            "name": function["name"],
+            "description": function.get("description", ""),
+            "parameters": function.get("parameters") or {"type": "object", "properties": {}},
+        })
+    return functions
+
+
+def build_request(
+    context: "RunContext",
+    api_key: str = "",
+    cached_content: Optional[str] = None,
+) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    """
+    Path, headers and streaming request body for the run's provider
+
+    Tools go in each provider's own format. A prefix long enough for the
+    provider's prompt cache is marked for it: a cache breakpoint after the
+    system block for Anthropic, ``prompt_cache_key`` for OpenAI, and for
+    Google ``cached_content``, the name of a cached content resource that
+    holds the prefix in place of its system instruction and tools.
+    """
+    options = context.prefix.provider_options
+    functions = _functions(context.prefix.tools)
+
+    if context.provider == "anthropic":
+        prefix_count = len(context.prefix.messages)
+        prefix_system, _ = _split_system(context.messages[:prefix_count])
+        rest_system, messages = _split_system(context.messages[prefix_count:])
+        body: Dict[str, Any] = {
+            "model": context.model,
+            "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+            "max_tokens": context.max_tokens,
+            "temperature": context.temperature,
+            "stream": True,
+        }
+        if functions:
+            body["tools"] = [
+                {"name": f["name"], "description": f["description"], "input_schema": f["parameters"]}
+                for f in functions
+            ]
+        if "system_cache_control" in options and prefix_system:
+            # Tools come before the system block, so the breakpoint caches both
+            body["system"] = [{"type": "text", "text": prefix_system, "cache_control": options["system_cache_control"]}]
+            if rest_system:
+                body["system"].append({"type": "text", "text": rest_system})
+        elif prefix_system or rest_system:
+            body["system"] = "\n\n".join(part for part in (prefix_system, rest_system) if part)
+        headers = {"anthropic-version": ANTHROPIC_VERSION}
+        if api_key:
+            headers["x-api-key"] = api_key
+        return "/v1/messages", headers, body
+
+    if context.provider == "google":
+        if cached_content:
+            # The cache holds the prefix; requests using it may not repeat a
+            # system instruction or tools, so later system messages go in as user turns
+            system = ""
+            messages = context.messages[len(context.prefix.messages):]
+        else:
+            system, messages = _split_system(context.messages)
+        body = {
+            "contents": [
+                {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+                for m in messages
+            ],
+            "generationConfig": {"temperature": context.temperature, "maxOutputTokens": context.max_tokens},
+        }
+        if cached_content:
+            body["cachedContent"] = cached_content
+        else:
+            if system:
+                body["systemInstruction"] = {"parts": [{"text": system}]}
+            if functions:
+                body["tools"] = [{"functionDeclarations": functions}]
+        path = f"/v1beta/models/{context.model}:streamGenerateContent?alt=sse"
+        return path, _google_headers(api_key), body
+
+    body = {
+        "model": context.model,
+        "messages": [{"role": m["role"], "content": m["content"]} for m in context.messages],
+        "max_tokens": context.max_tokens,
+        "temperature": context.temperature,
+        "stream": True,
+    }
+    if functions:
+        body["tools"] = [{"type": "function", "function": f} for f in functions]
+    if "prompt_cache_key" in options:
+        body["prompt_cache_key"] = options["prompt_cache_key"]
+    # Usage, including cached prompt tokens, only comes in a final chunk on request
+    body["stream_options"] = {"include_usage": True}
+    return "/v1/chat/completions", {"authorization": f"Bearer {api_key}"} if api_key else {}, body
+
+
+def _google_headers(api_key: str) -> Dict[str, str]:
+    return {"x-goog-api-key": api_key} if api_key else {}
+
+
+def build_cache_request(context: "RunContext", ttl_seconds: int) -> Tuple[str, Dict[str, Any]]:
+    """Path and body creating a Google cached content resource for the run's prefix"""
+    system, _ = _split_system(context.prefix.messages)
+    body: Dict[str, Any] = {
+        "model": f"models/{context.model}",
+        "displayName": context.prefix.provider_options["cached_content_display_name"],
+        "ttl": f"{ttl_seconds}s",
+    }
+    if system:
+        body["systemInstruction"] = {"parts": [{"text": system}]}
+    functions = _functions(context.prefix.tools)
+    if functions:
+        body["tools"] = [{"functionDeclarations": functions}]
+    return "/v1beta/cachedContents", body
+
+
+async def iter_sse(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[str, str]]:
+    """(event, data) pairs of a server-sent event stream"""
+    event = "message"
+    data: List[str] = []
+    async for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+    if data:
+        yield event, "\n".join(data)
+
+
+def _error_message(payload: Any) -> str:
+    error = payload.get("error") if isinstance(payload, dict) else None
+    if isinstance(error, dict):
+        return str(error.get("message") or error.get("type") or error)
+    return str(error or payload)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header in either its delay or HTTP-date form"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return max(0.0, seconds) if math.isfinite(seconds) else None
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def read_event(provider: str, event: str, data: str) -> Any:
+    """
+    Decoded payload of one stream event, or None for the end-of-stream marker
+
+    Raises ProviderError for error events sent after the stream started.
+    """
+    if data == "[DONE]":
+        return None
+    payload = loads(data)
+    if event == "error" or (isinstance(payload, dict) and "error" in payload):
+        raise ProviderError(provider, 500, _error_message(payload))
+    return payload
+
+
+def text_delta(provider: str, event: str, payload: Any) -> Optional[str]:
+    """Answer text carried by one stream event"""
+    if not isinstance(payload, dict):
+        return None
+    if provider == "anthropic":
+        delta = payload.get("delta") if event == "content_block_delta" else None
+        return delta.get("text") if delta else None
+    if provider == "google":
+        texts = [
+            part.get("text", "")
+            for candidate in payload.get("candidates", [])
+            for part in candidate.get("content", {}).get("parts", [])
+        ]
+        return "".join(texts) or None
+    choices = payload.get("choices") or []
+    return (choices[0].get("delta") or {}).get("content") if choices else None
+
+
+def cached_tokens(provider: str, event: str, payload: Any) -> Optional[int]:
+    """
+    Prompt tokens served from the provider's cache, if the event reports usage
+
+    Anthropic reports ``cache_read_input_tokens`` in ``message_start``, OpenAI
+    ``prompt_tokens_details.cached_tokens`` in its final usage chunk, and
+    Google ``cachedContentTokenCount`` in ``usageMetadata``.
+    """
+    if not isinstance(payload, dict):
+        return None
+    if provider == "anthropic":
+        message = payload.get("message") if event == "message_start" else None
+        usage = message.get("usage") if isinstance(message, dict) else None
+        return int(usage.get("cache_read_input_tokens") or 0) if isinstance(usage, dict) else None
+    if provider == "google":
+        metadata = payload.get("usageMetadata")
+        return int(metadata.get("cachedContentTokenCount") or 0) if isinstance(metadata, dict) else None
+    usage = payload.get("usage")
+    if not isinstance(usage, dict):
+        return None
+    details = usage.get("prompt_tokens_details")
+    return int(details.get("cached_tokens") or 0) if isinstance(details, dict) else 0
+
+
+class ProviderClient:
+    """
+    Streams answers from the provider serving a run's model
+
+    Disabled unless ``PROVIDER_BASE_URL`` is set; runs then use the built-in
+    mock responses. Point it at the provider emulator
+    (``python -m app.services.provider_emulator``) to exercise the real
+    streaming path without paying for provider calls.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        timeout: Optional[float] = None,
+    ):
+        self._base_url = base_url
+        self.transport = transport
+        self.timeout = timeout or settings.PROVIDER_TIMEOUT_SECONDS
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Prefix fingerprint -> (Google cached content name, monotonic expiry)
+        self._cached_contents: Dict[str, Tuple[str, float]] = {}
+
+    @property
+    def base_url(self) -> str:
+        return (settings.PROVIDER_BASE_URL if self._base_url is None else self._base_url).rstrip("/")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.base_url)
+
+    def _http(self) -> httpx.AsyncClient:
+        # Pooled connections belong to the loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._loop is not loop:
+            self._discard_client()
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                transport=self.transport,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=settings.PROVIDER_MAX_CONNECTIONS),
+            )
+            self._loop = loop
+        return self._client
+
+    def _discard_client(self):
+        """Drop the client opened on another event loop, closing it there if that loop still runs"""
+        client, loop = self._client, self._loop
+        self._client = None
+        self._loop = None
+        if client is not None and loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        # Otherwise the loop has stopped and its transports went with it;
+        # dropping the client lets its pool be collected
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    async def _cached_content(self, context: "RunContext", api_key: str) -> Optional[str]:
+        """
+        Name of a Google cached content resource holding the run's prefix
+
+        Created on first use and reused until shortly before its TTL runs
+        out. If creating it fails the run goes ahead without the cache.
+        """
+        if "cached_content_display_name" not in context.prefix.provider_options:
+            return None
+        fingerprint = context.prefix.fingerprint
+        entry = self._cached_contents.get(fingerprint)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        ttl = settings.PROMPT_CACHE_GOOGLE_TTL_SECONDS
+        path, body = build_cache_request(context, ttl)
+        try:
+            response = await self._http().post(
+                self.base_url + path,
+                headers={**_google_headers(api_key), "content-type": "application/json"},
+                content=dumps(body),
+            )
+            payload = response.json() if response.status_code < 400 else None
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning("provider_cache_create_failed", provider="google", error=str(e))
+            return None
+        name = payload.get("name") if isinstance(payload, dict) else None
+        if not name:
+            logger.warning("provider_cache_create_failed", provider="google", status_code=response.status_code)
+            return None
+
+        # Drop expired entries so prefixes that are no longer used do not pile up
+        now = time.monotonic()
+        for key in [key for key, (_, expires) in self._cached_contents.items() if expires <= now]:
+            del self._cached_contents[key]
+        # Leave a margin so a request never names a cache that just expired
+        self._cached_contents[fingerprint] = (name, now + ttl * 0.9)
+        return name
+
+    async def stream(self, context: "RunContext", usage: Optional[ProviderUsage] = None) -> AsyncIterator[str]:
+        """Text deltas of the answer, as the provider sends them; ``usage`` is filled in as it is reported"""
+        api_key = {
+            "openai": settings.OPENAI_API_KEY,
+            "anthropic": settings.ANTHROPIC_API_KEY,
+            "google": settings.GOOGLE_API_KEY,
+        }.get(context.provider, "")
+        cached_content = await self._cached_content(context, api_key) if context.provider == "google" else None
+        path, headers, body = build_request(context, api_key, cached_content)
+
+        request = self._http().build_request(
+            "POST", self.base_url + path, headers={**headers, "content-type": "application/json"}, content=dumps(body),
+        )
+        response = await self._http().send(request, stream=True)
+        try:
+            if response.status_code >= 400:
+                await response.aread()
+                try:
+                    message = _error_message(response.json())
+                except ValueError:
+                    message = response.text
+                raise ProviderError(
+                    context.provider,
+                    response.status_code,
+                    message,
+                    retry_after=parse_retry_after(response.headers.get("retry-after")),
+                )
+
+            async for event, data in iter_sse(response.aiter_lines()):
+                payload = read_event(context.provider, event, data)
+                text = text_delta(context.provider, event, payload)
+                if text:
+                    yield text
+                if usage is not None:
+                    cached = cached_tokens(context.provider, event, payload)
+                    if cached is not None:
+                        usage.cached_tokens = cached
+        finally:
+            await response.aclose()
+
+
+# Global provider client
+provider_client = ProviderClient()
@@ -0,0 +1,216 @@
+"""
+Readiness
+Dependency probes refreshed on a background schedule
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.database import get_engine
+from app.services.lazy import lazy_import
+from app.services.log_pipeline import log_pipeline
+from app.services.stream_journal import journals
+
+if TYPE_CHECKING:
+    import httpx
+else:
+    httpx = lazy_import("httpx")
+sqlalchemy = lazy_import("sqlalchemy")
+
+logger = structlog.get_logger(__name__)
+
+Probe = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class ProbeFailed(Exception):
+    """Raised by a probe whose dependency is unavailable"""
+
+    def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.details = details or {}
+
+
+async def probe_database() -> Dict[str, Any]:
+    """Check out a pooled connection and run ``SELECT 1``"""
+    def ping() -> str:
+        engine = get_engine()
+        with engine.connect() as connection:
+            connection.execute(sqlalchemy.text("SELECT 1"))
+        return engine.pool.status()
+
+    return {"pool": await asyncio.to_thread(ping)}
+
+
+class ProviderProbe:
+    """
+    Checks that model provider endpoints are reachable
+
+    Any HTTP response below 500 counts as reachable, so unauthenticated
+    requests to a provider's API are fine. Point the endpoints at a local
+    mock server (or pass an httpx transport) to run without network access.
+    """
+
+    def __init__(self, endpoints: Optional[Dict[str, str]] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.endpoints = endpoints
+        self.transport = transport
+
+    async def __call__(self) -> Dict[str, Any]:
+        endpoints = settings.READINESS_PROVIDER_ENDPOINTS if self.endpoints is None else self.endpoints
+        if not endpoints:
+            return {"skipped": "No provider endpoints configured"}
+
+        async with httpx.AsyncClient(transport=self.transport, timeout=settings.READINESS_PROBE_TIMEOUT_SECONDS) as client:
+            checks = await asyncio.gather(*(self._check(client, url) for url in endpoints.values()))
+        results = dict(zip(endpoints, checks))
+
+        unreachable = [name for name, result in results.items() if not result["reachable"]]
+        if unreachable:
+            raise ProbeFailed(f"Unreachable providers: {', '.join(unreachable)}", {"providers": results})
+        return {"providers": results}
+
+    @staticmethod
+    async def _check(client: httpx.AsyncClient, url: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            response = await client.get(url)
+        except httpx.HTTPError as e:
+            return {"reachable": False, "error": str(e) or type(e).__name__}
+        return {
+            "reachable": response.status_code < 500,
+            "status_code": response.status_code,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+
+async def probe_job_queue() -> Dict[str, Any]:
+    """
+    Check the background work queues this process runs
+
+    Streaming runs execute as background jobs in the run registry, and the
+    log pipeline's writer drains a bounded queue. The probe fails when the
+    writer has died or its queue is close to full.
+    """
+    logging = log_pipeline.stats()
+    capacity = log_pipeline.queue.maxsize if log_pipeline.queue is not None else 0
+    details = {
+        "active_runs": sum(1 for journal in journals.journals.values() if not journal.done),
+        "log_queue": {"queued": logging["queued"], "capacity": capacity, "dropped": logging["dropped"]},
+    }
+
+    if log_pipeline.thread is not None and not logging["running"]:
+        raise ProbeFailed("Log writer thread is not running", details)
+    if capacity and logging["queued"] >= 0.9 * capacity:
+        raise ProbeFailed("Log queue is nearly full", details)
+    return details
+
+
+class ReadinessMonitor:
+    """
+    Runs dependency probes in the background and caches their results
+
+    Readiness requests only read the cache, so load-balancer polling never
+    reaches the dependencies. Until the first results land (e.g. while the
+    app is still prewarming) every probe reports "starting" and the app is
+    not ready. Without a running monitor, a stale cache schedules one
+    background refresh that concurrent requests share. Results older than
+    three intervals count as failed.
+    """
+
+    def __init__(self, interval: Optional[float] = None, timeout: Optional[float] = None):
+        self.interval = interval or settings.READINESS_REFRESH_SECONDS
+        self.timeout = timeout or settings.READINESS_PROBE_TIMEOUT_SECONDS
+        self.probes: Dict[str, Probe] = {}
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refreshing: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def register(self, name: str, probe: Probe):
+        self.probes[name] = probe
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._refresh_forever(), name="readiness-monitor")
+
+    async def stop(self):
+        for task in (self._task, self._refreshing):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._refreshing = None
+
+    async def refresh(self):
+        """Run every probe concurrently and replace the cached results"""
+        names = list(self.probes)
+        results = await asyncio.gather(*(self._run(name, self.probes[name]) for name in names))
+        self.results = dict(zip(names, results))
+        self.checked_at = time.time()
+
+    async def snapshot(self) -> Tuple[bool, Dict[str, Dict[str, Any]]]:
+        """Cached readiness and probe results"""
+        checked_at = self.checked_at
+        if checked_at is None or (not self.running and time.time() - checked_at > self.interval):
+            self._refresh_soon()
+        if checked_at is None:
+            return False, {name: {"status": "starting"} for name in self.probes}
+
+        checks = {name: dict(result) for name, result in self.results.items()}
+        ready = all(result["status"] == "ok" for result in checks.values())
+
+        age = time.time() - checked_at
+        if age > 3 * self.interval:
+            ready = False
+            for result in checks.values():
+                result["stale"] = True
+
+        return ready, checks
+
+    def _refresh_soon(self):
+        """Start a background refresh unless one is already in flight"""
+        if self.running or (self._refreshing is not None and not self._refreshing.done()):
+            return
+        self._refreshing = asyncio.create_task(self.refresh(), name="readiness-refresh")
+
+    async def _refresh_forever(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("readiness_refresh_failed", error=str(e))
+            await asyncio.sleep(self.interval)
+
+    async def _run(self, name: str, probe: Probe) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            result = {"status": "ok", **await asyncio.wait_for(probe(), self.timeout)}
+        except asyncio.TimeoutError:
+            result = {"status": "error", "error": f"Timed out after {self.timeout}s"}
+        except ProbeFailed as e:
+            result = {"status": "error", "error": str(e), **e.details}
+        except Exception as e:
+            result = {"status": "error", "error": str(e) or type(e).__name__}
+
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        if result["status"] != "ok":
+            logger.warning("readiness_probe_failed", probe=name, error=result["error"])
+        return result
+
+
+# Global readiness monitor
+readiness = ReadinessMonitor()
+readiness.register("database", probe_database)
+readiness.register("providers", ProviderProbe())
+readiness.register("job_queue", probe_job_queue)
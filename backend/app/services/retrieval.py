@@ -0,0 +1,488 @@
+"""
+Knowledge Retrieval
+Document ingestion and a memory-mapped IVF vector index for agent RAG
+
+Each build writes an immutable generation directory:
+
+    manifest.json       dimensions, quantization, documents
+    vectors.npy         (rows, dim) int8 or float32 chunk embeddings
+    scales.npy          (rows,) float32 dequantization scales for int8
+    chunk_doc.npy       (rows,) int32 document index per chunk
+    text.bin            UTF-8 chunk texts, concatenated
+    text_offsets.npy    (rows + 1,) int64 byte offsets into text.bin
+    ivf_centroids.npy   (lists, dim) float32 coarse quantizer
+    ivf_order.npy       (rows,) int32 chunk ids grouped by list
+    ivf_offsets.npy     (lists + 1,) int64 list boundaries in ivf_order
+
+Readers open every array with ``mmap_mode="r"``, so all workers on a host
+share the same page cache instead of each loading a private copy. The
+``CURRENT`` file names the live generation and is swapped atomically.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.embeddings import get_embedder
+from app.services.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import("numpy")
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+logger = structlog.get_logger(__name__)
+
+_WORD_PATTERN = re.compile(r"\S+")
+
+# Below this many chunks an exhaustive scan beats the coarse quantizer
+IVF_MIN_ROWS = 1024
+
+KMEANS_ITERATIONS = 10
+KMEANS_BATCH_ROWS = 8192
+
+
+@dataclass
+class Document:
+    """A document submitted for ingestion"""
+    doc_id: str
+    text: str
+    title: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def content_hash(self) -> str:
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class RetrievedChunk:
+    """A chunk returned by a search"""
+    doc_id: str
+    title: Optional[str]
+    chunk_id: int
+    text: str
+    score: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+def chunk_text(text: str, chunk_words: int, overlap_words: int) -> List[str]:
+    """Split text into overlapping windows of whitespace-delimited words"""
+    words = _WORD_PATTERN.findall(text)
+    if not words:
+        return []
+
+    step = max(1, chunk_words - overlap_words)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+def quantize_int8(vectors: np.ndarray):
+    """Symmetric per-row int8 quantization; returns (codes, scales)"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def train_ivf(vectors: np.ndarray, scales: Optional[np.ndarray], lists: int, seed: int = 0):
+    """
+    Spherical k-means coarse quantizer
+
+    Returns (centroids, order, offsets) where ``order[offsets[i]:offsets[i + 1]]``
+    are the rows assigned to list ``i``.
+    """
+    rows = vectors.shape[0]
+    rng = np.random.default_rng(seed)
+    centroids = _dequantize(vectors, scales, rng.choice(rows, size=lists, replace=False))
+
+    assignments = np.zeros(rows, dtype=np.int32)
+    for _ in range(KMEANS_ITERATIONS):
+        sums = np.zeros_like(centroids)
+        for start in range(0, rows, KMEANS_BATCH_ROWS):
+            batch = _dequantize(vectors, scales, slice(start, start + KMEANS_BATCH_ROWS))
+            labels = np.argmax(batch @ centroids.T, axis=1)
+            assignments[start:start + len(batch)] = labels
+            np.add.at(sums, labels, batch)
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        sums[~empty] /= norms[~empty]
+        sums[empty] = centroids[empty]
+        centroids = sums.astype(np.float32)
+
+    order = np.argsort(assignments, kind="stable").astype(np.int32)
+    counts = np.bincount(assignments, minlength=lists)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return centroids, order, offsets
+
+
+def _dequantize(vectors: np.ndarray, scales: Optional[np.ndarray], rows) -> np.ndarray:
+    batch = np.asarray(vectors[rows], dtype=np.float32)
+    if scales is not None:
+        batch *= scales[rows][:, None]
+    return batch
+
+
+class IndexGeneration:
+    """Read-only, memory-mapped view of one index generation"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.manifest = json.loads((path / "manifest.json").read_text())
+        self.documents: List[Dict[str, Any]] = self.manifest["documents"]
+        self.rows = self.manifest["rows"]
+
+        def load(name):
+            return np.load(path / name, mmap_mode="r")
+
+        self.vectors = load("vectors.npy")
+        self.scales = load("scales.npy") if self.manifest["quantization"] == "int8" else None
+        self.chunk_doc = load("chunk_doc.npy")
+        self.text_offsets = load("text_offsets.npy")
+        self.text = np.memmap(path / "text.bin", dtype=np.uint8, mode="r") if self.rows else None
+        self.centroids = load("ivf_centroids.npy")
+        self.order = load("ivf_order.npy")
+        self.offsets = load("ivf_offsets.npy")
+
+    def chunk_text(self, row: int) -> str:
+        if self.text is None:
+            raise IndexError(f"chunk {row} out of range: the generation is empty")
+        start, end = int(self.text_offsets[row]), int(self.text_offsets[row + 1])
+        return bytes(self.text[start:end]).decode("utf-8")
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Rows to score exactly: the members of the ``nprobe`` closest lists"""
+        lists = len(self.centroids)
+        if lists <= 1 or nprobe >= lists:
+            return np.arange(self.rows)
+
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in probe])
+
+    def search(self, query: np.ndarray, k: int, nprobe: int) -> List[RetrievedChunk]:
+        if self.rows == 0 or k <= 0:
+            return []
+
+        rows = np.sort(self.candidates(query, nprobe))
+        if len(rows) == 0:
+            return []
+        scores = _dequantize(self.vectors, self.scales, rows) @ query
+
+        k = min(k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+
+        results = []
+        for index in best:
+            row = int(rows[index])
+            document = self.documents[int(self.chunk_doc[row])]
+            results.append(RetrievedChunk(
+                doc_id=document["doc_id"],
+                title=document.get("title"),
+                chunk_id=row - document["rows"][0],
+                text=self.chunk_text(row),
+                score=float(scores[index]),
+                metadata=document.get("metadata", {}),
+            ))
+        return results
+
+
+class KnowledgeBase:
+    """
+    Ingests documents into, and searches, the on-disk retrieval index
+
+    Builds are serialized with a file lock so several workers can share one
+    index directory. Chunks of unchanged documents are carried over from the
+    previous generation without being embedded again.
+    """
+
+    def __init__(self, root: Optional[str] = None, embedder=None):
+        self.root = Path(root or settings.RETRIEVAL_INDEX_DIR)
+        self._embedder = embedder
+        self._generation: Optional[IndexGeneration] = None
+        self._generation_name: Optional[str] = None
+        self._pointer_stamp: Optional[Tuple[int, int, int]] = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = get_embedder()
+        return self._embedder
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def current(self) -> Optional[IndexGeneration]:
+        """
+        The live generation, reopened if another worker published a new one
+
+        ``CURRENT`` is only reread when its inode or mtime changes, so checking
+        an unchanged index costs one ``stat``.
+        """
+        pointer = self.root / "CURRENT"
+        try:
+            info = pointer.stat()
+        except FileNotFoundError:
+            return None
+
+        stamp = (info.st_ino, info.st_mtime_ns, info.st_size)
+        if stamp != self._pointer_stamp:
+            with self._reload_lock:
+                if stamp != self._pointer_stamp:
+                    try:
+                        name = pointer.read_text().strip()
+                    except FileNotFoundError:
+                        return None
+                    if name != self._generation_name:
+                        self._generation = IndexGeneration(self.root / name)
+                        self._generation_name = name
+                    self._pointer_stamp = stamp
+        return self._generation
+
+    def search(self, query: str, k: Optional[int] = None, min_score: float = 0.0) -> List[RetrievedChunk]:
+        """Top-k chunks for ``query`` by cosine similarity"""
+        generation = self.current()
+        if generation is None:
+            return []
+
+        if generation.manifest["embedder"] != self.embedder.name:
+            logger.warning(
+                "retrieval_embedder_mismatch",
+                index=generation.manifest["embedder"],
+                configured=self.embedder.name,
+            )
+            return []
+
+        vector = self.embedder.embed(query)
+        k = k or settings.RETRIEVAL_DEFAULT_TOP_K
+        results = generation.search(vector, k, settings.RETRIEVAL_NPROBE)
+        return [chunk for chunk in results if chunk.score >= min_score]
+
+    def stats(self) -> Dict[str, Any]:
+        generation = self.current()
+        if generation is None:
+            return {"documents": 0, "chunks": 0, "generation": None}
+        return {
+            "documents": len(generation.documents),
+            "chunks": generation.rows,
+            "generation": self._generation_name,
+            "quantization": generation.manifest["quantization"],
+            "ivf_lists": len(generation.centroids),
+            "embedder": generation.manifest["embedder"],
+        }
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def ingest(self, documents: List[Document]) -> Dict[str, Any]:
+        """Add or replace documents and publish a new generation"""
+        with self._build_lock():
+            replaced = {doc.doc_id for doc in documents}
+            return self._rebuild(keep=lambda doc_id: doc_id not in replaced, added=documents)
+
+    def delete(self, doc_id: str) -> bool:
+        """Remove a document; returns False if it was not indexed"""
+        with self._build_lock():
+            generation = self.current()
+            if generation is None or all(d["doc_id"] != doc_id for d in generation.documents):
+                return False
+            self._rebuild(keep=lambda existing: existing != doc_id, added=[])
+            return True
+
+    def _rebuild(self, keep, added: List[Document]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        previous = self.current()
+        quantization = settings.RETRIEVAL_QUANTIZATION
+        # Vectors can only be carried over if they came from the same embedder
+        compatible = (
+            previous is not None
+            and previous.manifest["embedder"] == self.embedder.name
+            and previous.manifest["dim"] == self.embedder.dim
+        )
+        previous_docs = {d["doc_id"]: d for d in previous.documents} if previous is not None else {}
+
+        documents: List[Dict[str, Any]] = []
+        vector_parts: List[np.ndarray] = []
+        texts: List[str] = []
+        embedded = reused = 0
+
+        def add(doc_meta: Dict[str, Any], vectors: np.ndarray, chunk_texts: List[str]):
+            start = len(texts)
+            documents.append({**doc_meta, "rows": [start, start + len(chunk_texts)]})
+            vector_parts.append(vectors)
+            texts.extend(chunk_texts)
+
+        if previous is not None:
+            for existing in previous_docs.values():
+                if not keep(existing["doc_id"]):
+                    continue
+                start, end = existing["rows"]
+                chunks = [previous.chunk_text(row) for row in range(start, end)]
+                if compatible:
+                    vectors = _dequantize(previous.vectors, previous.scales, slice(start, end))
+                    reused += len(chunks)
+                else:
+                    vectors = self.embedder.embed_batch(chunks)
+                    embedded += len(chunks)
+                add({k: v for k, v in existing.items() if k != "rows"}, vectors, chunks)
+
+        for document in added:
+            prior = previous_docs.get(document.doc_id)
+            if previous is not None and compatible and prior is not None and prior["hash"] == document.content_hash:
+                start, end = prior["rows"]
+                chunks = [previous.chunk_text(row) for row in range(start, end)]
+                vectors = _dequantize(previous.vectors, previous.scales, slice(start, end))
+                reused += len(chunks)
+            else:
+                chunks = chunk_text(
+                    document.text, settings.RETRIEVAL_CHUNK_WORDS, settings.RETRIEVAL_CHUNK_OVERLAP
+                )
+                vectors = self.embedder.embed_batch(chunks)
+                embedded += len(chunks)
+            add(
+                {
+                    "doc_id": document.doc_id,
+                    "title": document.title,
+                    "hash": document.content_hash,
+                    "metadata": document.metadata,
+                },
+                vectors,
+                chunks,
+            )
+
+        dim = self.embedder.dim
+        vectors = np.vstack(vector_parts) if vector_parts else np.zeros((0, dim), dtype=np.float32)
+        name = self._write_generation(documents, vectors, texts, quantization)
+
+        logger.info(
+            "retrieval_index_built",
+            generation=name,
+            documents=len(documents),
+            chunks=len(texts),
+            embedded=embedded,
+            reused=reused,
+            duration_ms=(time.perf_counter() - started) * 1000,
+        )
+        return {
+            "generation": name,
+            "documents": len(documents),
+            "chunks": len(texts),
+            "embedded_chunks": embedded,
+            "reused_chunks": reused,
+        }
+
+    def _write_generation(
+        self, documents: List[Dict[str, Any]], vectors: np.ndarray, texts: List[str], quantization: str
+    ) -> str:
+        name = f"gen-{time.time_ns()}"
+        staging = self.root / f".{name}.tmp"
+        staging.mkdir(parents=True)
+
+        rows, dim = vectors.shape
+        scales = None
+        if quantization == "int8":
+            vectors, scales = quantize_int8(vectors)
+            np.save(staging / "scales.npy", scales)
+        else:
+            vectors = vectors.astype(np.float32)
+        np.save(staging / "vectors.npy", vectors)
+
+        chunk_doc = np.zeros(rows, dtype=np.int32)
+        for index, document in enumerate(documents):
+            chunk_doc[document["rows"][0]:document["rows"][1]] = index
+        np.save(staging / "chunk_doc.npy", chunk_doc)
+
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = np.zeros(rows + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(text) for text in encoded])
+        np.save(staging / "text_offsets.npy", offsets)
+        (staging / "text.bin").write_bytes(b"".join(encoded))
+
+        if rows >= IVF_MIN_ROWS:
+            lists = int(np.sqrt(rows))
+            centroids, order, offsets = train_ivf(vectors, scales, lists)
+        else:
+            centroids = np.zeros((1, dim), dtype=np.float32)
+            order = np.arange(rows, dtype=np.int32)
+            offsets = np.array([0, rows], dtype=np.int64)
+        np.save(staging / "ivf_centroids.npy", centroids)
+        np.save(staging / "ivf_order.npy", order)
+        np.save(staging / "ivf_offsets.npy", offsets)
+
+        manifest = {
+            "version": 1,
+            "rows": rows,
+            "dim": dim,
+            "quantization": quantization,
+            "embedder": self.embedder.name,
+            "documents": documents,
+        }
+        (staging / "manifest.json").write_text(json.dumps(manifest))
+
+        staging.rename(self.root / name)
+        previous_name = self._generation_name
+        self._publish(name)
+        self._remove_stale_generations(keep={name, previous_name})
+        return name
+
+    def _publish(self, name: str):
+        """Point ``CURRENT`` at ``name`` and switch this worker to it"""
+        pointer = self.root / "CURRENT.tmp"
+        pointer.write_text(name)
+        os.replace(pointer, self.root / "CURRENT")
+
+        info = (self.root / "CURRENT").stat()
+        with self._reload_lock:
+            self._generation = IndexGeneration(self.root / name)
+            self._generation_name = name
+            self._pointer_stamp = (info.st_ino, info.st_mtime_ns, info.st_size)
+
+    def _remove_stale_generations(self, keep):
+        # Mapped files stay valid for readers after unlink; keep the previous
+        # generation anyway so workers mid-reload never see a missing file
+        for path in self.root.glob("gen-*"):
+            if path.name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    @contextmanager
+    def _build_lock(self) -> Iterator[None]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.root / "build.lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Global knowledge base
+knowledge_base = KnowledgeBase()
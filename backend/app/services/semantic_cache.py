@@ -0,0 +1,301 @@
+"""
+Semantic Response Cache
+Serves cached answers to paraphrased repeat questions, per agent
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.embeddings import embed_off_loop, get_embedder
+from app.services.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from app.services.context import RunContext
+else:
+    np = lazy_import("numpy")
+
+logger = structlog.get_logger(__name__)
+
+# Upper bounds of the similarity histogram buckets for cache hits
+HIT_SIMILARITY_BUCKETS = (0.85, 0.9, 0.95, 0.99, 1.0)
+
+# Misses whose best match scored within this margin of the threshold
+NEAR_MISS_MARGIN = 0.05
+
+
+@dataclass
+class CacheEntry:
+    """A cached question and the answer given to it"""
+    query: str
+    answer: str
+    fingerprint: str
+    created_at: float
+    hits: int = 0
+
+
+@dataclass
+class SemanticHit:
+    """Result of a successful cache lookup"""
+    entry: CacheEntry
+    similarity: float
+
+
+@dataclass
+class RunLookup:
+    """Cache lookup made for an agent run, kept to store the answer on a miss"""
+    query: str
+    vector: np.ndarray
+    hit: Optional[SemanticHit]
+
+
+class SemanticNamespace:
+    """
+    Flat inner-product index over the cached questions of one agent
+
+    Vectors live in a preallocated float32 matrix. Each slot also records a
+    small integer code for its prompt prefix fingerprint, so searches only
+    rank entries made under the current prefix. A full namespace reuses
+    expired slots first and then evicts the least recently used entry.
+    """
+
+    def __init__(self, dim: int, max_entries: int, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self.last_used = np.zeros(max_entries, dtype=np.float64)
+        self.fingerprints = np.full(max_entries, -1, dtype=np.int32)
+        self.fingerprint_codes: Dict[str, int] = {}
+        self.entries: List[Optional[CacheEntry]] = [None] * max_entries
+        self.size = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def search(self, vector: np.ndarray, fingerprint: str, now: float) -> Tuple[Optional[int], float]:
+        """Return the slot of the most similar live entry for the fingerprint and its similarity"""
+        code = self.fingerprint_codes.get(fingerprint)
+        if self.size == 0 or code is None:
+            return None, 0.0
+
+        # Mask other fingerprints before ranking: entries cached under an old
+        # system prompt must not crowd out the ones that can still be served
+        similarities = self.vectors[:self.size] @ vector
+        similarities[self.fingerprints[:self.size] != code] = -np.inf
+
+        while True:
+            slot = int(np.argmax(similarities))
+            if similarities[slot] == -np.inf:
+                return None, 0.0
+            entry = self.entries[slot]
+            if entry is not None and now - entry.created_at <= self.ttl_seconds:
+                return slot, float(similarities[slot])
+            if entry is not None:
+                self._expire(slot)
+            similarities[slot] = -np.inf
+
+    def touch(self, slot: int, now: float) -> CacheEntry:
+        entry = self.entries[slot]
+        if entry is None:
+            raise KeyError(slot)
+        self.last_used[slot] = now
+        entry.hits += 1
+        return entry
+
+    def insert(self, vector: np.ndarray, entry: CacheEntry, now: float):
+        if self.size < len(self.entries):
+            slot = self.size
+            self.size += 1
+        else:
+            free = [i for i, e in enumerate(self.entries) if e is None]
+            if free:
+                slot = free[0]
+            else:
+                slot = int(np.argmin(self.last_used))
+                self.evictions += 1
+
+        self.vectors[slot] = vector
+        self.fingerprints[slot] = self.fingerprint_codes.setdefault(
+            entry.fingerprint, len(self.fingerprint_codes)
+        )
+        self.entries[slot] = entry
+        self.last_used[slot] = now
+
+    def live_entries(self) -> int:
+        return sum(1 for e in self.entries[:self.size] if e is not None)
+
+    def _expire(self, slot: int):
+        self.entries[slot] = None
+        self.vectors[slot] = 0.0
+        self.fingerprints[slot] = -1
+        self.last_used[slot] = 0.0
+        self.expirations += 1
+
+
+class SemanticCache:
+    """
+    Opt-in semantic cache keyed by the last user message
+
+    Only single-turn conversations are looked up, since the answer to a
+    follow-up question depends on the rest of the history. Entries are also
+    keyed by the prompt prefix fingerprint, so agents with a changed system
+    prompt or toolset never receive stale answers.
+    """
+
+    def __init__(
+        self,
+        agents: Optional[List[str]] = None,
+        threshold: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        embedder=None,
+    ):
+        self.agents = set(agents if agents is not None else settings.SEMANTIC_CACHE_AGENTS)
+        self.threshold = threshold if threshold is not None else settings.SEMANTIC_CACHE_THRESHOLD
+        self.max_entries = max_entries or settings.SEMANTIC_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.SEMANTIC_CACHE_TTL_SECONDS
+        self._embedder = embedder
+        self.clear()
+
+    def clear(self):
+        """Drop all cached answers and reset metrics"""
+        self.namespaces: Dict[str, SemanticNamespace] = {}
+        self.lookups = 0
+        self.hits = 0
+        self.near_misses = 0
+        self.stores = 0
+        self.hit_similarity_sum = 0.0
+        self.hit_similarity_min: Optional[float] = None
+        self.hit_histogram = [0] * len(HIT_SIMILARITY_BUCKETS)
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = get_embedder()
+        return self._embedder
+
+    def enabled_for(self, agent_id: str) -> bool:
+        return agent_id in self.agents
+
+    @staticmethod
+    def query_text(messages: List[Dict[str, Any]]) -> Optional[str]:
+        """The text to cache on, or None when the conversation is not single-turn"""
+        if not messages or messages[-1]["role"] != "user":
+            return None
+        if any(m["role"] == "assistant" for m in messages):
+            return None
+        if sum(1 for m in messages if m["role"] == "user") != 1:
+            return None
+        return messages[-1]["content"].strip() or None
+
+    async def lookup_run(self, context: "RunContext") -> Optional[RunLookup]:
+        """Look up a run's answer, or return None if the run is not cacheable"""
+        if not self.enabled_for(context.agent_id):
+            return None
+
+        # Answers grounded in retrieved knowledge go stale when the index changes
+        if context.retrieved is not None:
+            return None
+
+        query = self.query_text(context.messages)
+        if query is None:
+            return None
+
+        # User messages can be up to MAX_BODY_SIZE: embed them off the loop
+        vector = await embed_off_loop(self.embedder, query)
+        hit, vector = self.lookup(context.agent_id, context.prefix.fingerprint, query, vector)
+        return RunLookup(query=query, vector=vector, hit=hit)
+
+    def store_run(self, context: "RunContext", lookup: RunLookup, answer: str):
+        """Cache the answer produced for a run that missed the cache"""
+        self.store(context.agent_id, context.prefix.fingerprint, lookup.query, answer, lookup.vector)
+
+    def lookup(
+        self, agent_id: str, fingerprint: str, text: str, vector: Optional[np.ndarray] = None
+    ) -> Tuple[Optional[SemanticHit], np.ndarray]:
+        """Find a cached answer; the query vector is returned for a later ``store``"""
+        if vector is None:
+            vector = self.embedder.embed(text)
+        namespace = self.namespaces.get(agent_id)
+        self.lookups += 1
+
+        if namespace is None:
+            return None, vector
+
+        now = time.time()
+        slot, similarity = namespace.search(vector, fingerprint, now)
+
+        if slot is None or similarity < self.threshold:
+            if slot is not None and similarity >= self.threshold - NEAR_MISS_MARGIN:
+                self.near_misses += 1
+            return None, vector
+
+        entry = namespace.touch(slot, now)
+        self._record_hit(similarity)
+        logger.debug("semantic_cache_hit", agent_id=agent_id, similarity=similarity)
+        return SemanticHit(entry=entry, similarity=similarity), vector
+
+    def store(
+        self,
+        agent_id: str,
+        fingerprint: str,
+        text: str,
+        answer: str,
+        vector: Optional[np.ndarray] = None,
+    ):
+        """Cache the answer given to ``text``"""
+        if vector is None:
+            vector = self.embedder.embed(text)
+
+        namespace = self.namespaces.get(agent_id)
+        if namespace is None:
+            namespace = SemanticNamespace(self.embedder.dim, self.max_entries, self.ttl_seconds)
+            self.namespaces[agent_id] = namespace
+
+        now = time.time()
+        namespace.insert(vector, CacheEntry(text, answer, fingerprint, created_at=now), now)
+        self.stores += 1
+
+    def stats(self) -> Dict[str, Any]:
+        misses = self.lookups - self.hits
+        return {
+            "enabled_agents": sorted(self.agents),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "misses": misses,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "near_misses": self.near_misses,
+            "stores": self.stores,
+            "hit_similarity": {
+                "mean": self.hit_similarity_sum / self.hits if self.hits else None,
+                "min": self.hit_similarity_min,
+                "histogram": dict(zip((f"le_{b}" for b in HIT_SIMILARITY_BUCKETS), self.hit_histogram)),
+            },
+            "namespaces": {
+                agent_id: {
+                    "entries": ns.live_entries(),
+                    "evictions": ns.evictions,
+                    "expirations": ns.expirations,
+                }
+                for agent_id, ns in self.namespaces.items()
+            },
+        }
+
+    def _record_hit(self, similarity: float):
+        self.hits += 1
+        self.hit_similarity_sum += similarity
+        if self.hit_similarity_min is None or similarity < self.hit_similarity_min:
+            self.hit_similarity_min = similarity
+        for i, bound in enumerate(HIT_SIMILARITY_BUCKETS):
+            if similarity <= bound or i == len(HIT_SIMILARITY_BUCKETS) - 1:
+                self.hit_histogram[i] += 1
+                break
+
+
+# Global semantic cache
+semantic_cache = SemanticCache()
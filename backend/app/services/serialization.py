@@ -0,0 +1,115 @@
+"""
+JSON Serialization
+Pluggable JSON backend used for HTTP responses, WebSocket frames and audit logs
+"""
+
+import json
+from typing import Any, Dict, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import structlog
+
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None  # type: ignore[assignment]
+
+logger = structlog.get_logger(__name__)
+
+
+def _default(obj: Any) -> Any:
+    """Serialize types the backends do not handle natively"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class StdlibBackend:
+    """Standard library ``json`` with compact separators, rejecting NaN and infinity"""
+
+    name = "stdlib"
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        return json.dumps(
+            obj,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            sort_keys=sort_keys,
+            allow_nan=False,
+            default=_default,
+        ).encode("utf-8")
+
+    def loads(self, data: Any) -> Any:
+        return json.loads(data)
+
+
+class OrjsonBackend:
+    """orjson, serializing straight to UTF-8 bytes"""
+
+    name = "orjson"
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def loads(self, data: Any) -> Any:
+        return orjson.loads(data)
+
+
+BACKENDS: Dict[str, Type] = {
+    "stdlib": StdlibBackend,
+    "orjson": OrjsonBackend,
+}
+
+
+def load_backend(name: str = "auto"):
+    """
+    Resolve a backend by name
+
+    "auto" picks the fastest installed backend. Requesting a backend whose
+    package is missing falls back to the standard library.
+    """
+    if name == "auto":
+        name = "orjson" if orjson is not None else "stdlib"
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+
+    if name == "orjson" and orjson is None:
+        logger.warning("json_backend_unavailable", backend=name, fallback="stdlib")
+        name = "stdlib"
+
+    return BACKENDS[name]()
+
+
+# Active backend
+backend = load_backend(settings.JSON_BACKEND)
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    """Serialize to UTF-8 encoded JSON bytes"""
+    return backend.dumps(obj, sort_keys=sort_keys)
+
+
+def dumps_str(obj: Any) -> str:
+    """Serialize to a JSON string, e.g. for WebSocket text frames"""
+    return backend.dumps(obj).decode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from ``str`` or ``bytes``"""
+    return backend.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the active JSON backend"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
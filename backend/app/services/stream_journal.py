@@ -0,0 +1,305 @@
+"""
+Stream Journal
+Per-run event journal that lets WebSocket clients resume interrupted streams
+"""
+
+import asyncio
+import bisect
+import time
+import uuid
+from collections import deque
+from contextlib import suppress
+from pathlib import Path
+from typing import Any, AsyncGenerator, BinaryIO, Coroutine, Deque, Dict, List, Optional, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.executor import executors
+from app.services.serialization import dumps, loads
+
+logger = structlog.get_logger(__name__)
+
+# Spilled events are buffered in memory and written out in chunks this large
+SPILL_BUFFER_BYTES = 65536
+
+# One spill file offset is indexed per this many spilled events
+SPILL_INDEX_INTERVAL = 256
+
+# Followers read at most this many spilled events per trip to the thread pool
+SPILL_READ_BATCH = 1024
+
+
+class JournalTruncated(Exception):
+    """Requested events were evicted from the ring buffer and not spilled"""
+
+
+class RunJournal:
+    """
+    Sequence-numbered event log for a single agent run
+
+    The newest ``max_events`` events are kept in memory. Older events are
+    appended to ``spill_path`` when one is configured, otherwise they are
+    dropped and resuming from before them raises ``JournalTruncated``.
+    The spill file stays open with a write buffer while the run goes on, so
+    appending a token does not mean a file open and a write on the event loop.
+    A sparse index of byte offsets lets a replay seek close to the requested
+    sequence number instead of parsing the file from the start, and
+    followers read the spill file in the thread pool.
+    """
+
+    def __init__(self, run_id: str, max_events: int, spill_path: Optional[Path] = None):
+        self.run_id = run_id
+        self.max_events = max_events
+        self.spill_path = spill_path
+        self.events: Deque[Dict[str, Any]] = deque()
+        self.last_seq = 0
+        self.done = False
+        self.created_ns = time.time_ns()
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.orphan_timer: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Event()
+        self._spill: Optional[BinaryIO] = None
+        self._spill_bytes = 0
+        self._spill_index: List[Tuple[int, int]] = []
+        self._discarded = False
+
+    def append(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Assign the next sequence number to an event and store it"""
+        if self.done:
+            raise RuntimeError(f"Run {self.run_id} is already finished")
+
+        self.last_seq += 1
+        event = {**event, "seq": self.last_seq}
+        self.events.append(event)
+
+        if len(self.events) > self.max_events:
+            evicted = self.events.popleft()
+            # A cancelled producer may still append after cleanup: never
+            # recreate the spill file of a journal that has been dropped
+            if self.spill_path is not None and not self._discarded:
+                if self._spill is None:
+                    self._spill = self.spill_path.open("ab", buffering=SPILL_BUFFER_BYTES)
+                if not self._spill_index or evicted["seq"] - self._spill_index[-1][0] >= SPILL_INDEX_INTERVAL:
+                    self._spill_index.append((evicted["seq"], self._spill_bytes))
+                line = dumps(evicted) + b"\n"
+                self._spill.write(line)
+                self._spill_bytes += len(line)
+
+        if event.get("done"):
+            self.finish()
+        else:
+            self._notify()
+
+        return event
+
+    def finish(self):
+        """Mark the run as finished and wake up all followers"""
+        if not self.done:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._close_spill()
+        self._notify()
+
+    def replay(self, after_seq: int) -> List[Dict[str, Any]]:
+        """Return all stored events with a sequence number above ``after_seq``"""
+        if after_seq >= self.last_seq:
+            return []
+
+        spilled: List[Dict[str, Any]] = []
+        if self._spilled_after(after_seq):
+            spilled = self._read_spill(after_seq, self._flush_spill(), None)
+
+        return spilled + [event for event in self.events if event["seq"] > after_seq]
+
+    async def follow(self, after_seq: int = 0) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield missed events after ``after_seq``, then live ones until the run ends"""
+        cursor = after_seq
+        self.subscribers += 1
+        if self.orphan_timer is not None:
+            self.orphan_timer.cancel()
+            self.orphan_timer = None
+
+        try:
+            while True:
+                if self._spilled_after(cursor):
+                    # Lagging far behind: read from disk without blocking the loop
+                    end = self._flush_spill()
+                    events = await executors.run_in_thread(self._read_spill, cursor, end, SPILL_READ_BATCH)
+                else:
+                    events = [event for event in self.events if event["seq"] > cursor]
+
+                for event in events:
+                    cursor = event["seq"]
+                    yield event
+
+                if cursor < self.last_seq:
+                    continue
+                if self.done:
+                    return
+
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+
+    def cleanup(self):
+        """Remove the spill file, if any, and stop spilling for good"""
+        self._discarded = True
+        self._close_spill()
+        if self.spill_path is not None:
+            with suppress(OSError):
+                self.spill_path.unlink()
+
+    def _spilled_after(self, after_seq: int) -> bool:
+        """Whether events after ``after_seq`` have left the ring buffer"""
+        first_in_memory = self.events[0]["seq"] if self.events else self.last_seq + 1
+        if after_seq + 1 >= first_in_memory:
+            return False
+        if self.spill_path is None or not self._spill_index:
+            raise JournalTruncated(self.run_id)
+        return True
+
+    def _flush_spill(self) -> int:
+        """Write out buffered spill lines and return the size of the complete file"""
+        if self._spill is not None:
+            self._spill.flush()
+        return self._spill_bytes
+
+    def _read_spill(self, after_seq: int, end: int, limit: Optional[int]) -> List[Dict[str, Any]]:
+        """Spilled events after ``after_seq`` within the first ``end`` bytes, at most ``limit``"""
+        if self.spill_path is None:
+            raise JournalTruncated(self.run_id)
+        position = bisect.bisect_right(self._spill_index, after_seq + 1, key=lambda entry: entry[0]) - 1
+        offset = self._spill_index[max(position, 0)][1]
+        events: List[Dict[str, Any]] = []
+        try:
+            with self.spill_path.open("rb") as f:
+                f.seek(offset)
+                while offset < end and (limit is None or len(events) < limit):
+                    line = f.readline()
+                    if not line:
+                        break
+                    offset += len(line)
+                    event = loads(line)
+                    if event["seq"] > after_seq:
+                        events.append(event)
+        except FileNotFoundError:
+            raise JournalTruncated(self.run_id)
+        if not events or events[0]["seq"] != after_seq + 1:
+            raise JournalTruncated(self.run_id)
+        return events
+
+    def _close_spill(self):
+        if self._spill is not None:
+            with suppress(OSError):
+                self._spill.close()
+            self._spill = None
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class JournalRegistry:
+    """
+    Keeps run journals alive for the resume grace period
+
+    A run keeps producing events after its last client disconnects. If no
+    client reattaches within ``grace_seconds`` the run is cancelled. Finished
+    runs are forgotten ``grace_seconds`` after their final event.
+    """
+
+    def __init__(
+        self,
+        max_events: Optional[int] = None,
+        grace_seconds: Optional[float] = None,
+        spill_dir: Optional[str] = None,
+    ):
+        self.max_events = max_events or settings.STREAM_JOURNAL_MAX_EVENTS
+        self.grace_seconds = (
+            grace_seconds if grace_seconds is not None else settings.STREAM_RESUME_GRACE_SECONDS
+        )
+        spill_dir = spill_dir if spill_dir is not None else settings.STREAM_JOURNAL_SPILL_DIR
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.journals: Dict[str, RunJournal] = {}
+
+    def create(self) -> RunJournal:
+        """Create and register a journal for a new run"""
+        self.purge()
+
+        run_id = f"run_{uuid.uuid4().hex}"
+        spill_path = None
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            spill_path = self.spill_dir / f"{run_id}.jsonl"
+
+        journal = RunJournal(run_id, self.max_events, spill_path)
+        self.journals[run_id] = journal
+        return journal
+
+    def get(self, run_id: Optional[str]) -> Optional[RunJournal]:
+        """Look up a live or recently finished run"""
+        self.purge()
+        return self.journals.get(run_id) if run_id else None
+
+    def start(self, journal: RunJournal, producer: Coroutine[Any, Any, None]) -> asyncio.Task:
+        """Run the producer in the background, independent of any client"""
+        journal.task = asyncio.create_task(producer)
+        journal.task.add_done_callback(lambda _: journal.finish())
+        return journal.task
+
+    def detach(self, journal: RunJournal):
+        """Start the grace timer once the last follower of a running run leaves"""
+        if journal.done or journal.subscribers > 0 or journal.orphan_timer is not None:
+            return
+
+        logger.info("stream_run_detached", run_id=journal.run_id, grace_seconds=self.grace_seconds)
+        journal.orphan_timer = asyncio.get_running_loop().call_later(
+            self.grace_seconds, self._expire_orphan, journal.run_id
+        )
+
+    def purge(self):
+        """Forget finished runs whose grace period has elapsed"""
+        now = time.monotonic()
+        expired = [
+            run_id
+            for run_id, journal in self.journals.items()
+            if journal.done
+            and journal.subscribers == 0
+            and journal.finished_at is not None
+            and now - journal.finished_at >= self.grace_seconds
+        ]
+        for run_id in expired:
+            self.journals.pop(run_id).cleanup()
+
+    async def shutdown(self):
+        """Cancel all in-flight runs and drop their journals"""
+        tasks = [j.task for j in self.journals.values() if j.task and not j.task.done()]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with suppress(asyncio.CancelledError, Exception):
+                await task
+        for journal in self.journals.values():
+            journal.cleanup()
+        self.journals.clear()
+
+    def _expire_orphan(self, run_id: str):
+        journal = self.journals.get(run_id)
+        if journal is None:
+            return
+
+        journal.orphan_timer = None
+        if journal.subscribers > 0 or journal.done:
+            return
+
+        logger.info("stream_run_expired", run_id=run_id)
+        if journal.task is not None:
+            journal.task.cancel()
+        self.journals.pop(run_id).cleanup()
+
+
+# Global journal registry
+journals = JournalRegistry()
@@ -0,0 +1,409 @@
+"""
+Streaming JSON
+Incremental parsing of large JSON request bodies
+
+``StreamingObjectParser`` is fed the body chunk by chunk as it arrives. The
+top-level value must be an object; the elements of one of its arrays
+(``stream_key``) are handed to a callback as soon as each one is complete,
+so they can be validated and the request rejected before the rest of the
+body is read. Items that are already complete in the buffer are handed to
+orjson in one call; the incremental parser takes over for items that span
+chunks. Strings are scanned with ``find`` rather than byte by byte, strings
+that fit in one chunk are decoded straight from a slice of it, and strings
+longer than ``spool_threshold`` are accumulated in a ``SpooledTemporaryFile``
+instead of a growing buffer. The raw body is never held in memory as a whole.
+"""
+
+import re
+import tempfile
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.serialization import loads, orjson
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_NUMBER = re.compile(rb"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?")
+_NUMBER_RUN = re.compile(rb"[-+.eE0-9]*")
+_CONTROL = re.compile(rb"[\x00-\x1f]")  # Not allowed unescaped in strings
+_CONSTANTS = {b"true": True, b"false": False, b"null": None}
+_TRAILING_CONTENT = "unexpected content after document"
+_ITEM_WINDOW = 4096
+_BATCH_CANDIDATES = 4
+
+# Parser states: what the next token may be
+VALUE, VALUE_OR_END, KEY, KEY_OR_END, COLON, COMMA_OR_END, DONE = range(7)
+
+
+class JSONStreamError(ValueError):
+    """Raised for malformed JSON"""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(f"{message} at byte {offset}")
+        self.offset = offset
+
+
+class BodyTooLarge(ValueError):
+    """Raised when more than ``max_bytes`` are fed to a parser"""
+
+
+class _Frame:
+    __slots__ = ("container", "key", "streamed", "index")
+
+    def __init__(self, container: Any, streamed: bool = False):
+        self.container = container
+        self.key: Optional[str] = None
+        self.streamed = streamed
+        self.index = 0
+
+
+class _PendingString:
+    __slots__ = ("start", "scan", "escaped", "spool", "is_key")
+
+    def __init__(self, start: int, is_key: bool):
+        self.start = start  # Buffer offset of the first content byte
+        self.scan = start  # Where to resume looking for the closing quote
+        self.escaped = False
+        self.spool: Optional[Any] = None
+        self.is_key = is_key
+
+
+def _decode_string(raw: Any, escaped: bool, offset: int) -> str:
+    """Decode a string's content bytes; ``offset`` is where they start in the document"""
+    if escaped:
+        try:
+            return loads(b'"' + bytes(raw) + b'"')
+        except ValueError as e:  # Includes orjson.JSONDecodeError
+            raise JSONStreamError(f"Invalid string ({e})", offset)
+    control = _CONTROL.search(raw)
+    if control is not None:
+        raise JSONStreamError("Invalid control character in string", offset + control.start())
+    try:
+        return str(raw, "utf-8")
+    except UnicodeDecodeError as e:
+        raise JSONStreamError("Invalid UTF-8 in string", offset + e.start)
+
+
+class StreamingObjectParser:
+    """
+    Incremental parser for one JSON object with a streamed array member
+
+    ``on_item(index, value)`` is called for every element of the top-level
+    ``stream_key`` array as soon as it is parsed; those elements are not kept
+    in the result. Anything it raises propagates out of ``feed``.
+    """
+
+    def __init__(
+        self,
+        stream_key: str,
+        on_item: Callable[[int, Any], None],
+        spool_threshold: int = 256 * 1024,
+        spool_max_memory: int = 1024 * 1024,
+        max_bytes: Optional[int] = None,
+    ):
+        self.stream_key = stream_key
+        self.on_item = on_item
+        self.spool_threshold = spool_threshold
+        self.spool_max_memory = spool_max_memory
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.spooled_strings = 0
+        self._buf = bytearray()
+        self._pos = 0
+        self._offset = 0  # Bytes dropped from the front of the buffer
+        self._stack: List[_Frame] = []
+        self._expect = VALUE
+        self._string: Optional[_PendingString] = None
+        self._result: Optional[Dict[str, Any]] = None
+        self._batch_failed_at = -1
+
+    def feed(self, chunk: bytes):
+        self.received += len(chunk)
+        if self.max_bytes is not None and self.received > self.max_bytes:
+            raise BodyTooLarge(f"Body exceeds {self.max_bytes} bytes")
+        self._buf += chunk
+        self._parse(final=False)
+        self._compact()
+
+    def close(self) -> Dict[str, Any]:
+        """Finish parsing and return the object without the streamed array's elements"""
+        self._parse(final=True)
+        if self._expect != DONE or self._result is None:
+            raise JSONStreamError("Unexpected end of data", self._offset + len(self._buf))
+        return self._result
+
+    def _error(self, message: str) -> JSONStreamError:
+        return JSONStreamError(message, self._offset + self._pos)
+
+    def _compact(self):
+        keep_from = self._pos if self._string is None else self._string.start
+        if keep_from:
+            # Deleting from the front of a bytearray does not move the rest
+            del self._buf[:keep_from]
+            self._offset += keep_from
+            self._pos -= keep_from
+            if self._string is not None:
+                self._string.start -= keep_from
+                self._string.scan -= keep_from
+
+    def _parse(self, final: bool):
+        buf = self._buf
+        while True:
+            pending = self._string
+            if pending is not None and not self._scan_string(pending):
+                return
+
+            space = _WHITESPACE.match(buf, self._pos)
+            if space is not None:
+                self._pos = space.end()
+            if self._pos >= len(buf):
+                return
+            if self._expect == DONE:
+                raise self._error("Unexpected data after the top-level object")
+
+            byte = buf[self._pos]
+            expect = self._expect
+
+            if expect == COLON:
+                if byte != 0x3A:  # :
+                    raise self._error("Expected ':'")
+                self._pos += 1
+                self._expect = VALUE
+            elif expect == COMMA_OR_END:
+                frame = self._stack[-1]
+                is_object = isinstance(frame.container, dict)
+                if byte == 0x2C:  # ,
+                    self._pos += 1
+                    self._expect = KEY if is_object else VALUE
+                elif byte == (0x7D if is_object else 0x5D):  # } or ]
+                    self._pos += 1
+                    self._close_container()
+                else:
+                    raise self._error("Expected ',' or the end of the container")
+            elif expect in (KEY, KEY_OR_END):
+                if byte == 0x22:  # "
+                    self._pos += 1
+                    self._string = _PendingString(self._pos, is_key=True)
+                elif byte == 0x7D and expect == KEY_OR_END:
+                    self._pos += 1
+                    self._close_container()
+                else:
+                    raise self._error("Expected a string key")
+            elif byte == 0x5D and expect == VALUE_OR_END:
+                self._pos += 1
+                self._close_container()
+            elif byte == 0x22:
+                self._pos += 1
+                self._string = _PendingString(self._pos, is_key=False)
+            elif byte in b"{[" and self._stack and self._stack[-1].streamed and (
+                self._parse_complete_items() or self._parse_whole_item()
+            ):
+                pass
+            elif byte == 0x7B:  # {
+                if not self._stack and self._result is not None:
+                    raise self._error("Unexpected data after the top-level object")
+                self._pos += 1
+                self._stack.append(_Frame({}))
+                self._expect = KEY_OR_END
+            elif byte == 0x5B:  # [
+                if not self._stack:
+                    raise self._error("Expected an object")
+                parent = self._stack[-1]
+                streamed = len(self._stack) == 1 and parent.key == self.stream_key
+                self._pos += 1
+                self._stack.append(_Frame(None if streamed else [], streamed=streamed))
+                self._expect = VALUE_OR_END
+            elif not self._stack:
+                raise self._error("Expected an object")
+            elif byte in b"-0123456789":
+                run = _NUMBER_RUN.match(buf, self._pos)
+                end = self._pos if run is None else run.end()
+                if end == len(buf) and not final:
+                    return  # The number may continue in the next chunk
+                if _NUMBER.fullmatch(buf, self._pos, end) is None:
+                    raise self._error("Invalid number")
+                token = bytes(buf[self._pos:end])
+                self._pos = end
+                self._value(float(token) if any(c in token for c in b".eE") else int(token))
+            else:
+                for literal, value in _CONSTANTS.items():
+                    if buf.startswith(literal, self._pos):
+                        self._pos += len(literal)
+                        self._value(value)
+                        break
+                else:
+                    rest = bytes(buf[self._pos:])
+                    if not final and any(literal.startswith(rest) for literal in _CONSTANTS):
+                        return  # A literal split across chunks
+                    raise self._error("Invalid JSON value")
+
+    def _parse_complete_items(self) -> bool:
+        """
+        Parse the streamed items that are complete in the buffer with one orjson call
+
+        The run of items is taken to end at the last '}' followed by ',' or
+        ']'. That guess can be wrong when a string contains those characters;
+        orjson then rejects the run and the items are parsed one at a time
+        until more data arrives.
+        """
+        buf = self._buf
+        if orjson is None or self._offset + len(buf) == self._batch_failed_at:
+            return False
+        end = len(buf)
+        for _ in range(_BATCH_CANDIDATES):
+            end = buf.rfind(b"}", self._pos, end)
+            if end == -1:
+                return False
+            space = _WHITESPACE.match(buf, end + 1)
+            after = end + 1 if space is None else space.end()
+            if after < len(buf) and buf[after] in b",]":
+                break
+        else:
+            return False
+
+        with memoryview(buf) as view:
+            try:
+                values = orjson.loads(b"[" + view[self._pos:end + 1] + b"]")
+            except orjson.JSONDecodeError:
+                self._batch_failed_at = self._offset + len(buf)
+                return False
+        self._pos = end + 1
+        for value in values:
+            self._value(value)
+        return True
+
+    def _parse_whole_item(self) -> bool:
+        """
+        Parse a streamed item that is already complete in the buffer with orjson
+
+        orjson reports where trailing content starts, which is where the item
+        ends. It is given a window that doubles until the item fits, so the
+        error it raises (which decodes its whole input) stays proportional to
+        the item. False, leaving the item to the incremental parser, without
+        orjson or if the item is incomplete or invalid.
+        """
+        if orjson is None:
+            return False
+        size = len(self._buf) - self._pos
+        window = _ITEM_WINDOW
+        with memoryview(self._buf) as view:
+            while True:
+                window = min(window, size)
+                try:
+                    value = orjson.loads(view[self._pos:self._pos + window])
+                    end = self._pos + window
+                    break
+                except orjson.JSONDecodeError as e:
+                    if e.msg.startswith(_TRAILING_CONTENT):
+                        # The position counts characters, not bytes
+                        end = self._pos + len(e.doc[:e.pos].encode())
+                        value = orjson.loads(view[self._pos:end])
+                        break
+                    if window == size:
+                        return False
+                    window *= 2
+        self._pos = end
+        self._value(value)
+        return True
+
+    def _scan_string(self, pending: _PendingString) -> bool:
+        """Advance the pending string; False if its closing quote has not arrived yet"""
+        buf = self._buf
+        scan_from = pending.scan
+        end = -1
+        if self._may_close(pending):
+            while True:
+                end = buf.find(b'"', pending.scan)
+                if end == -1:
+                    break
+                # The quote is escaped if an odd number of backslashes precede it
+                backslash = end - 1
+                while backslash >= pending.start and buf[backslash] == 0x5C:
+                    backslash -= 1
+                if (end - backslash) % 2:
+                    break
+                pending.scan = end + 1
+
+        limit = len(buf) if end == -1 else end
+        if not pending.escaped and buf.find(b"\\", scan_from, limit) != -1:
+            pending.escaped = True
+        if end == -1:
+            pending.scan = limit
+            if not pending.is_key and limit - pending.start >= self.spool_threshold:
+                # Trailing backslashes stay buffered so escapes can still be counted
+                keep = limit
+                while keep > pending.start and buf[keep - 1] == 0x5C:
+                    keep -= 1
+                self._spool(pending, keep)
+            return False
+
+        if pending.spool is not None:
+            self._spool(pending, end)
+            end = pending.start  # The closing quote now directly follows the spooled bytes
+            pending.spool.seek(0)
+            raw = pending.spool.read()
+            pending.spool.close()
+            value = _decode_string(raw, pending.escaped, self._offset + end - len(raw))
+        else:
+            with memoryview(buf) as view:
+                value = _decode_string(view[pending.start:end], pending.escaped, self._offset + pending.start)
+
+        self._string = None
+        self._pos = end + 1
+        if pending.is_key:
+            self._stack[-1].key = value
+            self._expect = COLON
+        elif not self._stack:
+            raise self._error("Expected an object")
+        else:
+            self._value(value)
+        return True
+
+    def _may_close(self, pending: _PendingString) -> bool:
+        """
+        Whether a string continued from an earlier chunk may end in the new data
+
+        Inside long strings the new data usually has no backslash pairs and
+        only escaped quotes, which is checked without stepping through them.
+        """
+        buf = self._buf
+        region = pending.scan
+        if region == pending.start:
+            return True
+        while region > pending.start and buf[region - 1] == 0x5C:
+            region -= 1
+        return buf.find(b"\\\\", region) != -1 or buf.count(b'"', region) != buf.count(b'\\"', region)
+
+    def _spool(self, pending: _PendingString, end: int):
+        """Move the pending string's bytes up to buffer offset ``end`` into its spool file"""
+        end -= pending.start
+        self._compact()  # The pending string now starts the buffer
+        if pending.spool is None:
+            pending.spool = tempfile.SpooledTemporaryFile(max_size=self.spool_max_memory)
+            self.spooled_strings += 1
+        with memoryview(self._buf) as view:
+            pending.spool.write(view[:end])
+        del self._buf[:end]
+        self._offset += end
+        pending.scan -= end
+
+    def _close_container(self):
+        frame = self._stack.pop()
+        self._value(frame.container, from_stream=frame.streamed)
+
+    def _value(self, value: Any, from_stream: bool = False):
+        if not self._stack:
+            if not isinstance(value, dict):
+                raise self._error("Expected an object")
+            self._result = value
+            self._expect = DONE
+            return
+
+        frame = self._stack[-1]
+        if isinstance(frame.container, dict):
+            # Items of the streamed array went to on_item; it is left empty here
+            frame.container[frame.key] = [] if from_stream else value
+        elif frame.streamed:
+            self.on_item(frame.index, value)
+            frame.index += 1
+        else:
+            frame.container.append(value)
+        self._expect = COMMA_OR_END
@@ -0,0 +1,384 @@
+"""
+Tracing
+Lightweight per-stage spans with W3C trace context propagation
+
+Finished traces are kept in an in-memory ring buffer for the debug
+endpoints and, when TRACE_EXPORT_FILE is set, appended to it as OTLP/JSON
+lines that an OpenTelemetry collector can ingest with its file receiver.
+"""
+
+import asyncio
+import functools
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+import structlog
+
+from app.config import settings
+from app.services.serialization import dumps
+
+logger = structlog.get_logger(__name__)
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_route_started_ns: ContextVar[Optional[int]] = ContextVar("route_started_ns", default=None)
+
+
+def new_request_id() -> str:
+    """Collision-free request ID"""
+    return f"req_{uuid.uuid4().hex}"
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Return (trace_id, parent_span_id, sampled) from a W3C traceparent header"""
+    if not header:
+        return None
+    match = _TRACEPARENT.match(header.strip().lower())
+    if match is None:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 0x01)
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+        "attributes", "status", "recording", "_spans",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        spans: Optional[List["Span"]],
+        attributes: Optional[Dict[str, Any]] = None,
+        start_ns: Optional[int] = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.recording = spans is not None
+        self._spans = spans
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.recording else '00'}"
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return (self.end_ns - self.start_ns) / 1e6 if self.end_ns is not None else None
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns or time.time_ns()
+        if self._spans is not None:
+            self._spans.append(self)
+
+    def child(self, name: str, attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        return Span(name, self.trace_id, self.span_id, self._spans, attributes, start_ns)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class OTLPFileExporter:
+    """Appends finished traces as OTLP/JSON ``ExportTraceServiceRequest`` lines"""
+
+    def __init__(self, path: str, service_name: str):
+        self.path = path
+        self.resource = {
+            "attributes": [{"key": "service.name", "value": {"stringValue": service_name}}],
+        }
+        self.queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(maxsize=10000)
+        self.thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def export(self, spans: List[Span]):
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def encode(self, spans: List[Span]) -> bytes:
+        return dumps({
+            "resourceSpans": [{
+                "resource": self.resource,
+                "scopeSpans": [{
+                    "scope": {"name": "app.services.tracing"},
+                    "spans": [self._encode_span(span) for span in spans],
+                }],
+            }],
+        })
+
+    @staticmethod
+    def _encode_span(span: Span) -> Dict[str, Any]:
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 2 if span.parent_id is None else 1,  # SERVER for roots, else INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+            "status": {"code": 2 if span.status == "error" else 1},
+        }
+        if span.parent_id is not None:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for spans in batch:
+                if spans is None:
+                    stop = True
+                else:
+                    lines.append(self.encode(spans))
+
+            if lines:
+                try:
+                    with open(self.path, "ab") as f:
+                        f.write(b"\n".join(lines) + b"\n")
+                except OSError as e:
+                    self.dropped += len(lines)
+                    logger.error("trace_export_failed", error=str(e))
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    """
+    Creates spans and collects finished traces
+
+    Spans nest through a context variable, so child tasks started inside a
+    span (including BaseHTTPMiddleware's downstream call) attach to it.
+    Outside of a trace, ``span`` and ``record`` are no-ops.
+    """
+
+    def __init__(self, buffer_size: Optional[int] = None, sample_rate: Optional[float] = None):
+        self.enabled = settings.TRACING_ENABLED
+        self.sample_rate = settings.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.traces: Deque[List[Span]] = deque(maxlen=buffer_size or settings.TRACE_BUFFER_SIZE)
+        self.exporter: Optional[OTLPFileExporter] = None
+
+    @contextmanager
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+        """Open the local root span, continuing the caller's trace if one was propagated"""
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+            sampled = random.random() < self.sample_rate
+
+        recording = self.enabled and sampled
+        spans: Optional[List[Span]] = [] if recording else None
+        root = Span(name, trace_id, parent_id, spans, attributes)
+
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.status = "error"
+            root.set(error=type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            root.end()
+            if spans is not None:
+                self._finish(spans)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Time a stage as a child of the current span"""
+        parent = _current_span.get()
+        if parent is None or not parent.recording:
+            yield None
+            return
+
+        span = parent.child(name, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def record(self, name: str, start_ns: int, end_ns: Optional[int] = None, **attributes: Any):
+        """Add an already measured stage as a child of the current span"""
+        parent = _current_span.get()
+        if parent is not None and parent.recording:
+            parent.child(name, attributes, start_ns).end(end_ns)
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def start_exporter(self):
+        if settings.TRACE_EXPORT_FILE and self.exporter is None:
+            self.exporter = OTLPFileExporter(settings.TRACE_EXPORT_FILE, settings.APP_NAME)
+        if self.exporter is not None:
+            self.exporter.start()
+
+    def stop_exporter(self):
+        if self.exporter is not None:
+            self.exporter.stop()
+
+    def recent(self, limit: int = 50, name: Optional[str] = None) -> List[List[Span]]:
+        """Most recent traces first, optionally only those whose root has ``name``"""
+        traces = [t for t in reversed(self.traces) if name is None or t[-1].name == name]
+        return traces[:limit]
+
+    def find(self, trace_id: str) -> Optional[List[Span]]:
+        for spans in self.traces:
+            if spans[-1].trace_id == trace_id:
+                return spans
+        return None
+
+    def summary(self, name: Optional[str] = None, path: Optional[str] = None) -> Dict[str, Any]:
+        """Latency percentiles per span name across the buffered traces"""
+        durations: Dict[str, List[float]] = {}
+        count = 0
+        for spans in self.traces:
+            root = spans[-1]
+            if name is not None and root.name != name:
+                continue
+            if path is not None and root.attributes.get("path") != path:
+                continue
+            count += 1
+            for span in spans:
+                duration = span.duration_ms
+                if duration is not None:
+                    durations.setdefault(span.name, []).append(duration)
+
+        return {
+            "traces": count,
+            "spans": {
+                span_name: {
+                    "count": len(values),
+                    "p50_ms": _percentile(values, 50),
+                    "p95_ms": _percentile(values, 95),
+                    "p99_ms": _percentile(values, 99),
+                    "max_ms": max(values),
+                }
+                for span_name, values in durations.items()
+            },
+        }
+
+    def _finish(self, spans: List[Span]):
+        # The root ends last, so it is always spans[-1]
+        self.traces.append(spans)
+        if self.exporter is not None:
+            self.exporter.export(spans)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[index], 3)
+
+
+class TracedRoute(APIRoute):
+    """
+    Route class that splits request handling into spans
+
+    "body_validation" covers reading and validating the request up to the
+    endpoint call; "endpoint" covers the endpoint itself. Sync endpoints are
+    left unwrapped so FastAPI keeps running them in its threadpool.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        if asyncio.iscoroutinefunction(endpoint):
+            endpoint = _traced_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            token = _route_started_ns.set(time.time_ns())
+            try:
+                return await handler(request)
+            finally:
+                _route_started_ns.reset(token)
+
+        return traced_handler
+
+
+def _traced_endpoint(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(endpoint)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started = _route_started_ns.get()
+        if started is not None:
+            tracer.record("body_validation", started)
+        with tracer.span("endpoint", endpoint=endpoint.__name__):
+            return await endpoint(*args, **kwargs)
+
+    return wrapper
+
+
+# Global tracer
+tracer = Tracer()
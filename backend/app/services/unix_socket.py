@@ -0,0 +1,177 @@
+"""
+Unix Socket Transport
+Serves the app on a Unix domain socket authenticated by peer credentials
+
+The Electron shell and the backend run as the same user on the same
+machine, so the link between them does not need TCP or a Bearer token. The
+socket file is created owner-only (mode ``UNIX_SOCKET_MODE``, 0600 by
+default), and every connection is additionally checked with the kernel's
+peer credentials against ``UNIX_SOCKET_ALLOWED_UIDS``. Requests on an
+accepted connection carry the credentials in
+``scope["extensions"]["peer_credentials"]``, which ``AuthMiddleware``
+accepts in place of a token.
+"""
+
+import os
+import socket
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, List, Mapping, Optional, Set, Type
+
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+PEER_CREDENTIALS = "peer_credentials"
+
+
+@dataclass(frozen=True)
+class PeerCredentials:
+    """Identity of the process on the other end of a Unix socket"""
+    uid: int
+    gid: int
+    pid: Optional[int] = None
+
+
+def get_peer_credentials(sock: Optional[socket.socket]) -> Optional[PeerCredentials]:
+    """Kernel-reported credentials of a connected Unix socket's peer"""
+    if sock is None or sock.family != socket.AF_UNIX:
+        return None
+
+    if hasattr(socket, "SO_PEERCRED"):  # Linux
+        size = struct.calcsize("3i")
+        pid, uid, gid = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, size))
+        return PeerCredentials(uid=uid, gid=gid, pid=pid)
+
+    if hasattr(socket, "LOCAL_PEERCRED"):  # pragma: no cover - macOS and BSD
+        # struct xucred { u_int cr_version; uid_t cr_uid; short cr_ngroups; gid_t cr_groups[16]; }
+        size = struct.calcsize("IIh16I")
+        fields = struct.unpack("IIh16I", sock.getsockopt(0, socket.LOCAL_PEERCRED, size))
+        return PeerCredentials(uid=fields[1], gid=fields[3])
+
+    return None  # pragma: no cover
+
+
+def peer_credentials(scope: Mapping[str, Any]) -> Optional[PeerCredentials]:
+    """Credentials of an ASGI request that arrived over the Unix socket"""
+    return scope.get("extensions", {}).get(PEER_CREDENTIALS)
+
+
+def allowed_uids() -> Set[int]:
+    return set(settings.UNIX_SOCKET_ALLOWED_UIDS) or {os.getuid()}
+
+
+class PeerCredentialsMixin:
+    """
+    Checks peer credentials when a uvicorn protocol gets a connection
+
+    Mixed into both the HTTP and the WebSocket protocol classes: uvicorn
+    hands an upgraded connection's transport to a new WebSocket protocol
+    instance, which checks it again. TCP connections pass through unchanged.
+    """
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+
+        sock = transport.get_extra_info("socket")
+        if sock is None or sock.family != socket.AF_UNIX:
+            return
+
+        credentials = get_peer_credentials(sock)
+        if credentials is None or credentials.uid not in allowed_uids():
+            logger.warning("unix_socket_peer_rejected", uid=credentials.uid if credentials else None)
+            transport.close()
+            return
+
+        app = self.app
+
+        async def app_with_peer(scope, receive, send):
+            scope.setdefault("extensions", {})[PEER_CREDENTIALS] = credentials
+            return await app(scope, receive, send)
+
+        self.app = app_with_peer
+
+
+def peer_protocol(base: Type) -> Type:
+    return type(f"Peer{base.__name__}", (PeerCredentialsMixin, base), {})
+
+
+def bind_unix_socket(path: str, mode: Optional[int] = None) -> socket.socket:
+    """
+    Bind a listening Unix socket that only permitted users can connect to
+
+    The socket is created under a restrictive umask so it is never
+    world-accessible, even briefly. A stale socket file left by a previous
+    run is replaced, but a socket another server still accepts connections
+    on is left alone and the bind is refused.
+    """
+    mode = int(settings.UNIX_SOCKET_MODE, 8) if mode is None else mode
+    socket_path = Path(path)
+    socket_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    if socket_path.is_socket():
+        if _socket_in_use(socket_path):
+            raise RuntimeError(f"{socket_path} is in use by another server")
+        socket_path.unlink()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    previous_umask = os.umask(0o177)
+    try:
+        sock.bind(str(socket_path))
+    finally:
+        os.umask(previous_umask)
+    os.chmod(socket_path, mode)
+    return sock
+
+
+def _socket_in_use(socket_path: Path) -> bool:
+    """Whether something is listening on an existing socket file"""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(1.0)
+    try:
+        probe.connect(str(socket_path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+    except OSError:
+        # Timed out or not permitted to connect: assume a live server
+        return True
+    finally:
+        probe.close()
+    return True
+
+
+def make_config(app: Any = "app.main:app", **kwargs: Any):
+    """uvicorn config whose protocols check Unix socket peer credentials"""
+    import uvicorn
+    from uvicorn.config import HTTP_PROTOCOLS, WS_PROTOCOLS
+    from uvicorn.importer import import_from_string
+
+    http = peer_protocol(import_from_string(HTTP_PROTOCOLS["auto"]))
+    ws = import_from_string(WS_PROTOCOLS["auto"])
+    return uvicorn.Config(app, http=http, ws=peer_protocol(ws) if ws else "none", **kwargs)
+
+
+def serve(app: Any = "app.main:app"):
+    """
+    Serve on ``UNIX_SOCKET_PATH``, plus ``HOST:PORT`` if ``UNIX_SOCKET_KEEP_TCP`` is on
+
+    Runs a single worker: the socket is meant for a local sidecar client.
+    """
+    import uvicorn
+
+    sockets: List[socket.socket] = [bind_unix_socket(settings.UNIX_SOCKET_PATH)]
+    if settings.UNIX_SOCKET_KEEP_TCP:
+        sockets.append(socket.create_server((settings.HOST, settings.PORT)))
+
+    config = make_config(
+        app,
+        log_level=settings.LOG_LEVEL.lower(),
+        access_log=False,
+    )
+    logger.info("unix_socket_serving", path=settings.UNIX_SOCKET_PATH, tcp=settings.UNIX_SOCKET_KEEP_TCP)
+    try:
+        uvicorn.Server(config).run(sockets=sockets)
+    finally:
+        Path(settings.UNIX_SOCKET_PATH).unlink(missing_ok=True)
@@ -0,0 +1,508 @@
+"""
+Usage Accounting
+Token usage, latency and cost rolled up per agent, model and time bucket
+
+Every run is recorded in memory into minute, hour and day buckets keyed by
+agent, provider and model. A background task merges the pending buckets
+into the ``usage_rollups`` table every ``USAGE_FLUSH_SECONDS``, so
+dashboard queries read a few pre-aggregated rows instead of raw events.
+Latency is kept as a mergeable log-bucketed sketch, so percentiles can be
+combined across buckets, agents and worker processes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import structlog
+
+from app.config import settings
+from app.services.database import get_engine
+from app.services.lazy import lazy_import
+from app.services.serialization import dumps, loads
+
+sqlalchemy = lazy_import("sqlalchemy")
+
+logger = structlog.get_logger(__name__)
+
+# Bucket width in seconds for each rollup resolution
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+
+DIMENSIONS = ("agent_id", "provider", "model")
+
+COUNTERS = ("requests", "errors", "cache_hits", "prompt_tokens", "completion_tokens", "cached_prefix_tokens")
+
+RollupKey = Tuple[str, int, str, str, str]  # resolution, bucket start, agent, provider, model
+
+
+class LatencySketch:
+    """
+    Log-bucketed quantile sketch with bounded relative error
+
+    Values are counted in buckets whose bounds grow geometrically, so any
+    quantile is within ``relative_accuracy`` of the true value. Sketches
+    with the same accuracy merge by adding bucket counts.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero = 0  # Values too small to bucket
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        if value < 1e-3:
+            self.zero += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+
+    def merge(self, other: LatencySketch):
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_json(self) -> str:
+        return dumps({
+            "accuracy": self.relative_accuracy,
+            "zero": self.zero,
+            "bins": {str(index): count for index, count in self.bins.items()},
+        }).decode("utf-8")
+
+    @classmethod
+    def from_json(cls, data: Optional[str]) -> LatencySketch:
+        if not data:
+            return cls()
+        state = loads(data)
+        sketch = cls(state.get("accuracy", 0.01))
+        sketch.bins = {int(index): count for index, count in state["bins"].items()}
+        sketch.zero = state["zero"]
+        sketch.count = sketch.zero + sum(sketch.bins.values())
+        return sketch
+
+
+@dataclass
+class UsageEvent:
+    """One completed, cached or failed agent run"""
+    agent_id: str
+    provider: str
+    model: str
+    latency_ms: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_prefix_tokens: int = 0
+    cache_hit: bool = False
+    error: bool = False
+    timestamp: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_usage(
+        cls,
+        agent_id: str,
+        provider: str,
+        model: str,
+        usage: Dict[str, int],
+        latency_ms: float,
+        **kwargs: Any,
+    ) -> UsageEvent:
+        """Event from a response's ``usage`` dict"""
+        return cls(
+            agent_id=agent_id,
+            provider=provider,
+            model=model,
+            latency_ms=latency_ms,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            cached_prefix_tokens=usage.get("cached_prefix_tokens", 0),
+            **kwargs,
+        )
+
+
+@dataclass
+class Rollup:
+    """Aggregated counters and latency for one bucket"""
+    requests: int = 0
+    errors: int = 0
+    cache_hits: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_prefix_tokens: int = 0
+    latency_sum_ms: float = 0.0
+    latency: LatencySketch = field(default_factory=LatencySketch)
+
+    def add(self, event: UsageEvent):
+        self.requests += 1
+        self.errors += int(event.error)
+        self.cache_hits += int(event.cache_hit)
+        self.prompt_tokens += event.prompt_tokens
+        self.completion_tokens += event.completion_tokens
+        self.cached_prefix_tokens += event.cached_prefix_tokens
+        self.latency_sum_ms += event.latency_ms
+        self.latency.add(event.latency_ms)
+
+    def merge(self, other: Rollup):
+        for name in COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.latency_sum_ms += other.latency_sum_ms
+        self.latency.merge(other.latency)
+
+    def cost_usd(self, model: str) -> Optional[float]:
+        """Estimated cost from ``USAGE_MODEL_PRICES``, or None if the model has no price"""
+        prices = settings.USAGE_MODEL_PRICES.get(model)
+        if prices is None:
+            return None
+        return (
+            self.prompt_tokens * prices.get("prompt", 0.0)
+            + self.completion_tokens * prices.get("completion", 0.0)
+        ) / 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **{name: getattr(self, name) for name in COUNTERS},
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "latency": {
+                "avg_ms": round(self.latency_sum_ms / self.requests, 3) if self.requests else None,
+                "p50_ms": _round(self.latency.quantile(0.50)),
+                "p95_ms": _round(self.latency.quantile(0.95)),
+                "p99_ms": _round(self.latency.quantile(0.99)),
+            },
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 3)
+
+
+def bucket_start(timestamp: float, resolution: str) -> int:
+    width = RESOLUTIONS[resolution]
+    return int(timestamp // width * width)
+
+
+def retention_cutoffs(now: float) -> Dict[str, float]:
+    """Oldest bucket start kept for each pruned resolution"""
+    return {
+        "minute": now - settings.USAGE_MINUTE_RETENTION_HOURS * 3600,
+        "hour": now - settings.USAGE_HOUR_RETENTION_DAYS * 86400,
+    }
+
+
+def pick_resolution(start: float, end: float, now: Optional[float] = None) -> str:
+    """
+    Finest resolution that keeps a time series to a few hundred points
+
+    Resolutions whose rollups for ``start`` have already been pruned are
+    skipped, so old ranges fall back to coarser buckets instead of an
+    empty series.
+    """
+    cutoffs = retention_cutoffs(time.time() if now is None else now)
+    span = end - start
+    if span <= 6 * 3600 and start >= cutoffs["minute"]:
+        return "minute"
+    if span <= 14 * 86400 and start >= cutoffs["hour"]:
+        return "hour"
+    return "day"
+
+
+@lru_cache()
+def rollup_table():
+    """The ``usage_rollups`` table, defined on first use to keep SQLAlchemy off the import path"""
+    sa = sqlalchemy
+    return sa.Table(
+        "usage_rollups",
+        sa.MetaData(),
+        sa.Column("resolution", sa.String(8), primary_key=True),
+        sa.Column("bucket_start", sa.BigInteger, primary_key=True),
+        sa.Column("agent_id", sa.String(255), primary_key=True),
+        sa.Column("provider", sa.String(64), primary_key=True),
+        sa.Column("model", sa.String(255), primary_key=True),
+        *(sa.Column(name, sa.BigInteger, nullable=False, default=0) for name in COUNTERS),
+        sa.Column("latency_sum_ms", sa.Float, nullable=False, default=0.0),
+        sa.Column("latency_sketch", sa.Text, nullable=False, default=""),
+    )
+
+
+class UsageStore:
+    """Reads and merges rollup rows in the database"""
+
+    def __init__(self, engine_factory=get_engine):
+        self.engine_factory = engine_factory
+        self._schema_ready = False
+
+    def ensure_schema(self):
+        if not self._schema_ready:
+            rollup_table().create(self.engine_factory(), checkfirst=True)
+            self._schema_ready = True
+
+    def apply(self, pending: Dict[RollupKey, Rollup]):
+        """Merge pending rollups into their rows in one transaction"""
+        self.ensure_schema()
+        table = rollup_table()
+        with self.engine_factory().begin() as connection:
+            for key, rollup in pending.items():
+                where = _key_clause(table, key)
+                # Create the row first: on SQLite this takes the write lock,
+                # which serializes the read-merge-write below across workers
+                _insert_missing(connection, table, key)
+                current = connection.execute(
+                    sqlalchemy.select(table.c.latency_sketch).where(where).with_for_update()
+                ).scalar_one()
+                sketch = LatencySketch.from_json(current)
+                sketch.merge(rollup.latency)
+                connection.execute(
+                    table.update().where(where).values(
+                        **{name: table.c[name] + getattr(rollup, name) for name in COUNTERS},
+                        latency_sum_ms=table.c.latency_sum_ms + rollup.latency_sum_ms,
+                        latency_sketch=sketch.to_json(),
+                    )
+                )
+
+    def fetch(
+        self,
+        resolution: str,
+        start: float,
+        end: float,
+        filters: Optional[Dict[str, str]] = None,
+    ) -> List[Tuple[Dict[str, Any], Rollup]]:
+        """Rows with ``start <= bucket_start < end`` as (dimensions, rollup) pairs"""
+        self.ensure_schema()
+        table = rollup_table()
+        query = sqlalchemy.select(table).where(
+            table.c.resolution == resolution,
+            table.c.bucket_start >= bucket_start(start, resolution),
+            table.c.bucket_start < end,
+        )
+        for name, value in (filters or {}).items():
+            query = query.where(table.c[name] == value)
+
+        with self.engine_factory().connect() as connection:
+            rows = connection.execute(query.order_by(table.c.bucket_start)).mappings().all()
+        return [
+            (
+                {"bucket_start": row["bucket_start"], **{name: row[name] for name in DIMENSIONS}},
+                Rollup(
+                    **{name: row[name] for name in COUNTERS},
+                    latency_sum_ms=row["latency_sum_ms"],
+                    latency=LatencySketch.from_json(row["latency_sketch"]),
+                ),
+            )
+            for row in rows
+        ]
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete minute and hour rollups past their retention"""
+        self.ensure_schema()
+        now = time.time() if now is None else now
+        table = rollup_table()
+        cutoffs = retention_cutoffs(now)
+        deleted = 0
+        with self.engine_factory().begin() as connection:
+            for resolution, cutoff in cutoffs.items():
+                deleted += connection.execute(
+                    table.delete().where(table.c.resolution == resolution, table.c.bucket_start < cutoff)
+                ).rowcount
+        return deleted
+
+
+def _key_clause(table, key: RollupKey):
+    resolution, start, agent_id, provider, model = key
+    return sqlalchemy.and_(
+        table.c.resolution == resolution,
+        table.c.bucket_start == start,
+        table.c.agent_id == agent_id,
+        table.c.provider == provider,
+        table.c.model == model,
+    )
+
+
+def _insert_missing(connection, table, key: RollupKey):
+    """Insert an empty row for ``key`` unless it exists"""
+    resolution, start, agent_id, provider, model = key
+    values = dict(
+        resolution=resolution,
+        bucket_start=start,
+        agent_id=agent_id,
+        provider=provider,
+        model=model,
+        **{name: 0 for name in COUNTERS},
+        latency_sum_ms=0.0,
+        latency_sketch="",
+    )
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert  # type: ignore[assignment]
+    else:
+        exists = connection.execute(sqlalchemy.select(table.c.resolution).where(_key_clause(table, key))).first()
+        if exists is None:
+            connection.execute(table.insert().values(**values))
+        return
+    connection.execute(insert(table).values(**values).on_conflict_do_nothing())
+
+
+def aggregate(
+    rows: Iterable[Tuple[Dict[str, Any], Rollup]],
+    group_by: Iterable[str],
+    bucketed: bool = True,
+) -> List[Dict[str, Any]]:
+    """Merge rows that share a time bucket (if ``bucketed``) and the ``group_by`` dimensions"""
+    group_by = [name for name in DIMENSIONS if name in set(group_by)]
+    groups: Dict[Tuple, Tuple[Rollup, List[Optional[float]]]] = {}
+    for dimensions, rollup in rows:
+        key = ((dimensions["bucket_start"],) if bucketed else ()) + tuple(dimensions[name] for name in group_by)
+        merged, costs = groups.setdefault(key, (Rollup(), []))
+        merged.merge(rollup)
+        costs.append(rollup.cost_usd(dimensions["model"]))
+
+    results = []
+    for key, (rollup, costs) in groups.items():
+        labels = dict(zip((["bucket_start"] if bucketed else []) + group_by, key))
+        priced = [cost for cost in costs if cost is not None]
+        results.append({
+            **labels,
+            **rollup.to_dict(),
+            "cost_usd": round(sum(priced), 6) if priced else None,
+        })
+    return results
+
+
+class UsageAccounting:
+    """
+    Records usage events and periodically flushes them as rollups
+
+    ``record`` is cheap enough to call on the event loop: it only updates
+    in-memory buckets. Flushes run the database work in a thread; if one
+    fails, its rollups are merged back into the pending set and retried.
+    """
+
+    def __init__(self, store: Optional[UsageStore] = None, flush_interval: Optional[float] = None):
+        self.store = store or UsageStore()
+        self.flush_interval = flush_interval or settings.USAGE_FLUSH_SECONDS
+        self.pending: Dict[RollupKey, Rollup] = {}
+        self.recorded = 0
+        self.flushed = 0
+        self.flush_errors = 0
+        self.last_flush: Optional[float] = None
+        self._last_prune = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def record(self, event: UsageEvent):
+        if not settings.USAGE_ACCOUNTING_ENABLED:
+            return
+        for resolution in RESOLUTIONS:
+            key = (
+                resolution,
+                bucket_start(event.timestamp, resolution),
+                event.agent_id,
+                event.provider,
+                event.model,
+            )
+            rollup = self.pending.get(key)
+            if rollup is None:
+                rollup = self.pending[key] = Rollup()
+            rollup.add(event)
+        self.recorded += 1
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._flush_forever(), name="usage-flush")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Merge pending rollups into the database"""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, {}
+            try:
+                await asyncio.to_thread(self.store.apply, pending)
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error("usage_flush_failed", error=str(e), rollups=len(pending))
+                for key, rollup in pending.items():
+                    if key in self.pending:
+                        rollup.merge(self.pending[key])
+                    self.pending[key] = rollup
+                return
+            self.flushed += len(pending)
+            self.last_flush = time.time()
+
+            if self.last_flush - self._last_prune >= 3600:
+                self._last_prune = self.last_flush
+                try:
+                    await asyncio.to_thread(self.store.prune, self.last_flush)
+                except Exception as e:
+                    logger.error("usage_prune_failed", error=str(e))
+
+    async def query(
+        self,
+        start: float,
+        end: float,
+        resolution: Optional[str] = None,
+        group_by: Iterable[str] = ("agent_id", "model"),
+        filters: Optional[Dict[str, str]] = None,
+        bucketed: bool = True,
+    ) -> Dict[str, Any]:
+        resolution = resolution or pick_resolution(start, end)
+        rows = await asyncio.to_thread(self.store.fetch, resolution, start, end, filters)
+        return {
+            "resolution": resolution,
+            "start": start,
+            "end": end,
+            "rows": aggregate(rows, group_by, bucketed=bucketed),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "recorded": self.recorded,
+            "pending_rollups": len(self.pending),
+            "flushed_rollups": self.flushed,
+            "flush_errors": self.flush_errors,
+            "last_flush": self.last_flush,
+        }
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+# Global usage accounting
+usage_accounting = UsageAccounting()
@@ -0,0 +1,431 @@
+"""
+Workflows
+Runs a DAG of agent steps, feeding each step's output into the steps that depend on it
+
+A step's prompt is a template: ``{{ step_id }}`` is replaced with the output
+of a step it depends on and ``{{ input.name }}`` with a workflow input.
+Dependencies can carry a condition on the upstream output; a step runs once
+all of its dependencies have finished and at least one incoming edge is
+active, so a condition picks a branch and a later step joins whichever ran.
+Steps whose dependencies are met run concurrently, up to
+``WORKFLOW_MAX_PARALLEL_STEPS`` at a time.
+
+Step results are memoized by agent, parameters and rendered prompt. Since
+the rendered prompt contains the upstream outputs, re-running a partially
+changed graph reuses every step whose inputs did not change and recomputes
+the rest.
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union, cast
+
+import structlog
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+
+from app.config import settings
+from app.services.serialization import dumps
+from app.services.tracing import tracer
+
+logger = structlog.get_logger(__name__)
+
+_PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z0-9_.-]+)\s*\}\}")
+_INPUT_PREFIX = "input."
+
+# (output, usage) of a finished agent run
+StepOutcome = Tuple[str, Dict[str, int]]
+
+
+# ============================================================================
+# SPECIFICATION
+# ============================================================================
+
+class EdgeCondition(BaseModel):
+    """
+    Test on an upstream output; all given tests must pass
+
+    Only plain substring and equality tests are offered: a client-supplied
+    regular expression could backtrack for minutes on the event loop.
+    Unknown tests are rejected rather than silently treated as passing.
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    contains: Optional[str] = None
+    equals: Optional[str] = None
+    negate: bool = False
+
+    def evaluate(self, output: str) -> bool:
+        passed = (
+            (self.contains is None or self.contains in output)
+            and (self.equals is None or output.strip() == self.equals)
+        )
+        return passed != self.negate
+
+
+class Dependency(BaseModel):
+    """Edge from an upstream step, active when its condition holds"""
+    step: str
+    when: Optional[EdgeCondition] = None
+
+
+class WorkflowStep(BaseModel):
+    """One agent run in a workflow"""
+    id: str = Field(..., pattern=r"^[A-Za-z0-9_-]+$")
+    agent_id: str
+    prompt: str
+    system_prompt: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    depends_on: List[Union[str, Dependency]] = []
+    memoize: bool = True
+
+    @field_validator("depends_on")
+    @classmethod
+    def _normalize(cls, value: List[Union[str, Dependency]]) -> List[Dependency]:
+        return [Dependency(step=item) if isinstance(item, str) else item for item in value]
+
+    @property
+    def dependencies(self) -> List[Dependency]:
+        return cast(List[Dependency], self.depends_on)  # Normalized by the validator
+
+    def placeholders(self) -> List[str]:
+        return _PLACEHOLDER.findall(self.prompt)
+
+
+class WorkflowRequest(BaseModel):
+    """A DAG of agent steps"""
+    steps: List[WorkflowStep] = Field(..., min_length=1)
+    inputs: Dict[str, str] = {}
+    max_parallel: Optional[int] = Field(None, ge=1)
+    memoize: bool = True
+    metadata: Optional[Dict[str, Any]] = None
+
+    @model_validator(mode="after")
+    def _check_graph(self) -> "WorkflowRequest":
+        if len(self.steps) > settings.WORKFLOW_MAX_STEPS:
+            raise ValueError(f"A workflow has at most {settings.WORKFLOW_MAX_STEPS} steps")
+
+        ids = [step.id for step in self.steps]
+        duplicates = sorted({step_id for step_id in ids if ids.count(step_id) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate step id(s): {', '.join(duplicates)}")
+
+        known = set(ids)
+        for step in self.steps:
+            upstream = {dependency.step for dependency in step.dependencies}
+            unknown = sorted(upstream - known)
+            if unknown:
+                raise ValueError(f"Step {step.id} depends on unknown step(s): {', '.join(unknown)}")
+            if step.id in upstream:
+                raise ValueError(f"Step {step.id} depends on itself")
+            for name in step.placeholders():
+                if name.startswith(_INPUT_PREFIX):
+                    if name[len(_INPUT_PREFIX):] not in self.inputs:
+                        raise ValueError(f"Step {step.id} uses missing input: {name[len(_INPUT_PREFIX):]}")
+                elif name not in upstream:
+                    raise ValueError(f"Step {step.id} uses the output of {name} without depending on it")
+
+        topological_order(self.steps)
+        return self
+
+
+def topological_order(steps: List[WorkflowStep]) -> List[WorkflowStep]:
+    """Steps ordered so that every step follows its dependencies; ValueError on a cycle"""
+    by_id = {step.id: step for step in steps}
+    remaining = {step.id: len({d.step for d in step.dependencies}) for step in steps}
+    dependents: Dict[str, List[str]] = {step.id: [] for step in steps}
+    for step in steps:
+        for upstream in {d.step for d in step.dependencies}:
+            dependents[upstream].append(step.id)
+
+    ready = [step.id for step in steps if remaining[step.id] == 0]
+    order: List[WorkflowStep] = []
+    while ready:
+        step_id = ready.pop(0)
+        order.append(by_id[step_id])
+        for downstream in dependents[step_id]:
+            remaining[downstream] -= 1
+            if remaining[downstream] == 0:
+                ready.append(downstream)
+
+    if len(order) != len(steps):
+        cyclic = sorted(step_id for step_id, count in remaining.items() if count > 0)
+        raise ValueError(f"Workflow has a cycle through: {', '.join(cyclic)}")
+    return order
+
+
+# ============================================================================
+# MEMOIZATION
+# ============================================================================
+
+def step_key(step: WorkflowStep, prompt: str) -> str:
+    """Hash of everything that determines a step's result"""
+    canonical = dumps(
+        {
+            "agent_id": step.agent_id,
+            "model": settings.AGENTSCOPE_MODEL,
+            "prompt": prompt,
+            "system_prompt": step.system_prompt or "",
+            "temperature": step.temperature,
+            "max_tokens": step.max_tokens,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical).hexdigest()
+
+
+class StepMemo:
+    """
+    LRU cache of step results keyed by ``step_key``, with a TTL
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[float, StepOutcome]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[StepOutcome]:
+        entry = self.entries.get(key)
+        if entry is not None and time.time() - entry[0] < self.ttl_seconds:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, outcome: StepOutcome):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = (time.time(), outcome)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Global step result memo
+step_memo = StepMemo(settings.WORKFLOW_MEMO_MAX_ENTRIES, settings.WORKFLOW_MEMO_TTL_SECONDS)
+
+
+# ============================================================================
+# EXECUTION
+# ============================================================================
+
+@dataclass
+class StepResult:
+    """Outcome of one step in a workflow run"""
+    step_id: str
+    status: str
+    output: Optional[str] = None
+    usage: Dict[str, int] = field(default_factory=dict)
+    cached: bool = False
+    error: Optional[str] = None
+    reason: Optional[str] = None
+    duration_ms: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"status": self.status, "duration_ms": self.duration_ms}
+        if self.status == "completed":
+            data.update(output=self.output, usage=self.usage, cached=self.cached)
+        elif self.status == "failed":
+            data["error"] = self.error
+        else:
+            data["reason"] = self.reason
+        return data
+
+
+def render_prompt(step: WorkflowStep, inputs: Dict[str, str], outputs: Dict[str, str]) -> str:
+    """Fill in the step's placeholders; outputs of inactive edges render empty"""
+
+    def replace(match: "re.Match[str]") -> str:
+        name = match.group(1)
+        if name.startswith(_INPUT_PREFIX):
+            return inputs[name[len(_INPUT_PREFIX):]]
+        return outputs.get(name, "")
+
+    return _PLACEHOLDER.sub(replace, step.prompt)
+
+
+class WorkflowRun:
+    """
+    One execution of a workflow
+
+    ``execute(step, prompt)`` performs the agent run for a step. ``emit``, if
+    given, receives progress events in the WebSocket stream format; the final
+    event has ``done`` set.
+    """
+
+    def __init__(
+        self,
+        request: WorkflowRequest,
+        execute: Callable[[WorkflowStep, str], Awaitable[StepOutcome]],
+        emit: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        memo: Optional[StepMemo] = None,
+        run_id: Optional[str] = None,
+    ):
+        self.request = request
+        self.execute = execute
+        self.emit = emit or (lambda event: None)
+        self.memo = memo if memo is not None else step_memo
+        self.run_id = run_id
+        self.order = topological_order(request.steps)
+        self.results: Dict[str, StepResult] = {}
+        max_parallel = request.max_parallel or settings.WORKFLOW_MAX_PARALLEL_STEPS
+        self._slots = asyncio.Semaphore(min(max_parallel, settings.WORKFLOW_MAX_PARALLEL_STEPS))
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @property
+    def status(self) -> str:
+        failed = any(result.status == "failed" for result in self.results.values())
+        return "failed" if failed else "completed"
+
+    async def run(self) -> Dict[str, Any]:
+        """Run every step and return the summary also sent as the final event"""
+        start_time = time.time()
+        self.emit({
+            "type": "start",
+            "run_id": self.run_id,
+            "workflow": True,
+            "steps": [step.id for step in self.order],
+            "done": False,
+        })
+
+        with tracer.span("workflow", steps=len(self.order)):
+            for step in self.order:
+                self._tasks[step.id] = asyncio.create_task(self._run_step(step))
+            try:
+                await asyncio.gather(*self._tasks.values())
+            finally:
+                for task in self._tasks.values():
+                    task.cancel()
+
+        summary = self.summary((time.time() - start_time) * 1000)
+        logger.info("workflow_complete", run_id=self.run_id, status=summary["status"],
+                    steps=len(self.order), duration_ms=summary["duration_ms"])
+        if summary["status"] == "completed":
+            self.emit({"type": "complete", **summary, "done": True})
+        else:
+            failed = [step_id for step_id, result in self.results.items() if result.status == "failed"]
+            self.emit({"type": "error", "error": f"Step(s) failed: {', '.join(failed)}", **summary, "done": True})
+        return summary
+
+    def summary(self, duration_ms: float) -> Dict[str, Any]:
+        """Results by step, outputs of the final steps and the usage of this run"""
+        upstream = {d.step for step in self.order for d in step.dependencies}
+        usage: Dict[str, int] = {}
+        for result in self.results.values():
+            if result.status == "completed" and not result.cached:
+                for name, value in result.usage.items():
+                    usage[name] = usage.get(name, 0) + value
+        return {
+            "status": self.status,
+            "steps": {step.id: self.results[step.id].to_dict() for step in self.order},
+            "outputs": {
+                step.id: self.results[step.id].output
+                for step in self.order
+                if step.id not in upstream and self.results[step.id].status == "completed"
+            },
+            "usage": usage,
+            "duration_ms": duration_ms,
+        }
+
+    async def _run_step(self, step: WorkflowStep) -> StepResult:
+        upstream = [self._tasks[d.step] for d in step.dependencies]
+        if upstream:
+            await asyncio.wait(upstream)
+
+        result = self._blocked(step)
+        if result is None:
+            result = await self._execute(step)
+        self.results[step.id] = result
+
+        if result.status == "completed":
+            self.emit({
+                "type": "step_complete",
+                "step_id": step.id,
+                "output": result.output,
+                "usage": result.usage,
+                "cached": result.cached,
+                "duration_ms": result.duration_ms,
+                "done": False,
+            })
+        elif result.status == "failed":
+            self.emit({"type": "step_error", "step_id": step.id, "error": result.error, "done": False})
+        else:
+            self.emit({"type": "step_skipped", "step_id": step.id, "reason": result.reason, "done": False})
+        return result
+
+    def _blocked(self, step: WorkflowStep) -> Optional[StepResult]:
+        """The skipped result for a step that must not run, or None"""
+        if not step.dependencies:
+            return None
+        for dependency in step.dependencies:
+            if self.results[dependency.step].status == "failed":
+                return StepResult(step.id, "skipped", reason=f"Upstream step {dependency.step} failed")
+        if not any(self._edge_active(dependency) for dependency in step.dependencies):
+            return StepResult(step.id, "skipped", reason="No active incoming edge")
+        return None
+
+    def _edge_active(self, dependency: Dependency) -> bool:
+        upstream = self.results[dependency.step]
+        if upstream.status != "completed":
+            return False
+        return dependency.when is None or dependency.when.evaluate(upstream.output or "")
+
+    async def _execute(self, step: WorkflowStep) -> StepResult:
+        outputs = {
+            d.step: self.results[d.step].output or ""
+            for d in step.dependencies
+            if self._edge_active(d)
+        }
+        prompt = render_prompt(step, self.request.inputs, outputs)
+        memoize = self.request.memoize and step.memoize
+        key = step_key(step, prompt) if memoize else None
+
+        if key is not None:
+            hit = self.memo.get(key)
+            if hit is not None:
+                return StepResult(step.id, "completed", output=hit[0], usage=hit[1], cached=True)
+
+        async with self._slots:
+            self.emit({"type": "step_start", "step_id": step.id, "agent_id": step.agent_id, "done": False})
+            started = time.time()
+            try:
+                with tracer.span("workflow_step", step_id=step.id, agent_id=step.agent_id):
+                    output, usage = await self.execute(step, prompt)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("workflow_step_error", run_id=self.run_id, step_id=step.id, error=str(e))
+                return StepResult(step.id, "failed", error=str(e), duration_ms=(time.time() - started) * 1000)
+
+        if key is not None:
+            self.memo.put(key, (output, usage))
+        return StepResult(
+            step.id,
+            "completed",
+            output=output,
+            usage=usage,
+            duration_ms=(time.time() - started) * 1000,
+        )
@@ -0,0 +1,114 @@
+"""
+History Search Benchmark
+Indexed search against substring scans over a large conversation history
+
+Fills a temporary SQLite database with generated conversation messages,
+then times the first page, and walking ten pages, of each query through
+the FTS5 index and through the substring fallback, which is the LIKE scan
+the index replaces.
+
+The scan stops once it has a page, so words in many messages are cheap
+for it. Its cost shows on rare words, filters and misses, where it reads
+most of the table; the index answers those from its posting lists. Ranking
+by relevance scores every match, which costs more for common words than
+sorting by recency.
+
+Usage:
+    python -m benchmarks.bench_history_search [--messages 100000] [--repeat 5]
+"""
+
+import argparse
+import logging
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import structlog
+from sqlalchemy import create_engine
+
+from app.services.history import HistoryStore, SearchFilters
+
+VOCABULARY = [f"w{i}" for i in range(20000)] + [
+    "database", "deploy", "kubernetes", "invoice", "latency", "refund", "migration", "python", "error",
+]
+
+QUERIES = [
+    ("rare word", "kubernetes", None),
+    ("common word", "database", None),
+    ("two words", "deploy error", None),
+    ("filtered by agent", "latency", "agent-3"),
+    ("no match", "zebra", None),
+]
+
+
+def populate(store: HistoryStore, count: int, batch: int = 5000):
+    rng = random.Random(11)
+    weights = [1.0] * 20000 + [40.0, 25.0, 2.0, 10.0, 15.0, 8.0, 6.0, 30.0, 20.0]
+    now = time.time()
+    for offset in range(0, count, batch):
+        store.append([
+            {
+                "conversation_id": f"c{(offset + i) // 20}",
+                "agent_id": f"agent-{rng.randrange(10)}",
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": " ".join(rng.choices(VOCABULARY, weights=weights, k=rng.randint(8, 60))),
+                "model": None,
+                "created_at": now - (count - offset - i),
+            }
+            for i in range(min(batch, count - offset))
+        ])
+
+
+def timed(fn, repeat: int) -> float:
+    """Median latency in ms"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def page(store: HistoryStore, query: str, agent_id, sort: str, pages: int):
+    cursor = None
+    for _ in range(pages):
+        results, cursor = store.search(query, SearchFilters(agent_id=agent_id), sort=sort, cursor=cursor, limit=20)
+        if cursor is None:
+            break
+
+
+def run(count: int, repeat: int):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{Path(directory) / 'history.db'}")
+        store = HistoryStore(engine_factory=lambda: engine)
+
+        started = time.perf_counter()
+        populate(store, count)
+        print(f"Inserted {count} messages in {time.perf_counter() - started:.1f}s (backend: {store.backend})\n")
+
+        print(f"{'query':<20}{'fts5 relevance':>16}{'fts5 recent':>13}{'10 pages':>10}{'substring':>11}{'10 pages':>10}  (ms)")
+        for label, query, agent_id in QUERIES:
+            store.backend = "fts5"
+            relevance = timed(lambda: page(store, query, agent_id, "relevance", 1), repeat)
+            recent = timed(lambda: page(store, query, agent_id, "recent", 1), repeat)
+            recent_deep = timed(lambda: page(store, query, agent_id, "recent", 10), repeat)
+            store.backend = "substring"
+            scan = timed(lambda: page(store, query, agent_id, "recent", 1), repeat)
+            scan_deep = timed(lambda: page(store, query, agent_id, "recent", 10), repeat)
+            print(f"{label:<20}{relevance:>16.1f}{recent:>13.1f}{recent_deep:>10.1f}{scan:>11.1f}{scan_deep:>10.1f}")
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100000, help="Messages in the history")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per measurement")
+    args = parser.parse_args()
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    run(args.messages, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+JSON Serialization Microbenchmark
+Compares the available JSON backends on the payloads the backend emits most
+
+Usage:
+    python -m benchmarks.bench_json [--number 20000]
+"""
+
+import argparse
+import time
+import timeit
+
+from app.routes.agents import AgentRunResponse, Message
+from app.services.serialization import BACKENDS, load_backend, orjson
+
+
+def sample_payloads():
+    """Representative payloads for REST responses, token frames and audit lines"""
+    run_response = AgentRunResponse(
+        agent_id="agent-1",
+        message=Message(role="assistant", content="Lorem ipsum dolor sit amet. " * 40),
+        usage={"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+        metadata={"model": "gpt-4", "temperature": 0.7},
+        duration_ms=123.456,
+    ).model_dump()
+
+    token_frame = {"type": "token", "content": "Hello ", "done": False, "seq": 42}
+
+    audit_record = {
+        "timestamp": time.time(),
+        "method": "POST",
+        "path": "/api/agents/run",
+        "query_params": {},
+        "client_ip": "127.0.0.1",
+        "user_agent": "Electron/28.0.0",
+        "request_id": "req_1234567890",
+        "status_code": 200,
+        "duration_ms": 101.25,
+    }
+
+    return {
+        "AgentRunResponse": run_response,
+        "token frame": token_frame,
+        "audit record": audit_record,
+    }
+
+
+def run(number: int):
+    names = [name for name in BACKENDS if name != "orjson" or orjson is not None]
+    backends = {name: load_backend(name) for name in names}
+
+    print(f"{'payload':<18}" + "".join(f"{name + ' (us)':>16}" for name in names) + f"{'speedup':>10}")
+    for label, payload in sample_payloads().items():
+        timings = {}
+        for name, backend in backends.items():
+            seconds = min(timeit.repeat(lambda: backend.dumps(payload), number=number, repeat=3))
+            timings[name] = seconds / number * 1e6
+
+        speedup = timings["stdlib"] / min(timings.values())
+        row = "".join(f"{timings[name]:>16.3f}" for name in names)
+        print(f"{label:<18}{row}{speedup:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="Iterations per measurement")
+    args = parser.parse_args()
+    run(args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""
+Load and Soak Benchmark
+Drives the real server with concurrent REST runs and long-lived streams
+
+Starts the provider emulator and the backend under uvicorn. Then
+``--concurrency`` clients call POST /api/agents/run back to back while
+``--streams`` WebSockets each run one streamed answer after another on
+/api/agents/stream, for ``--warmup`` seconds unrecorded and ``--duration``
+seconds recorded. Every ``--sample-interval`` seconds it samples each
+worker's RSS and open file descriptors from /proc (Linux), so a long soak
+run shows leaks as drift.
+
+Results are saved as JSON. With ``--baseline`` they are compared against
+an earlier result and the exit status is 1 when a metric is worse by more
+than ``--tolerance``. Baselines only compare on the same machine and
+settings.
+
+The load generator is a single asyncio process. Its CPU use is in the
+report; near 100% it is the bottleneck, not the server. Thousands of
+connections need ``ulimit -n`` raised.
+
+Usage:
+    python -m benchmarks.bench_load [--duration 30] [--warmup 5] [--concurrency 200] [--streams 50] [--workers 2]
+        [--output results.json] [--baseline benchmarks/baselines/load.json] [--save-baseline]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+
+from app.config import settings
+from benchmarks.bench_startup import BACKEND_DIR, _free_port
+
+RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+BASELINE = BACKEND_DIR / "benchmarks" / "baselines" / "load.json"
+
+# (metric path, whether higher is better)
+COMPARED = [
+    ("rest.throughput_rps", True),
+    ("rest.latency_ms.p50", False),
+    ("rest.latency_ms.p95", False),
+    ("rest.latency_ms.p99", False),
+    ("stream.runs_per_s", True),
+    ("stream.ttft_ms.p50", False),
+    ("stream.ttft_ms.p95", False),
+    ("stream.ttft_ms.p99", False),
+    ("resources.rss_mb_max", False),
+    ("resources.fds_max", False),
+]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Mean, p50, p95, p99 and max, rounded to microseconds for ms samples"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(at(0.50), 3),
+        "p95": round(at(0.95), 3),
+        "p99": round(at(0.99), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+@dataclass
+class Recorder:
+    """Latencies and failures of one kind of client, from ``since`` on"""
+    since: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    ttfts: List[float] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+    connections: int = 0
+
+
+# ============================================================================
+# PROCESSES
+# ============================================================================
+
+def _wait_for(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url).status_code < 500:
+                return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise TimeoutError(f"{url} did not start")
+
+
+def start_emulator(port: int, args) -> subprocess.Popen:
+    emulator = subprocess.Popen(
+        [
+            sys.executable, "-m", "app.services.provider_emulator", "--port", str(port),
+            "--ttft-ms", str(args.ttft_ms), "--itl-ms", str(args.itl_ms), "--tokens", str(args.tokens),
+            "--rate-limit-rate", str(args.rate_limit_rate), "--error-rate", str(args.error_rate), "--seed", "1",
+        ],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    _wait_for(f"http://127.0.0.1:{port}/emulator/stats", emulator)
+    return emulator
+
+
+def start_server(port: int, workers: int, provider_url: str, directory: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "PROVIDER_BASE_URL": provider_url,
+        "DATABASE_URL": f"sqlite:///{directory}/load.db",
+        "LOG_LEVEL": "WARNING",
+        "AUDIT_LOG_ENABLED": "false",
+        "DEBUG": "false",
+    }
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    _wait_for(f"http://127.0.0.1:{port}/api/health/ping", server)
+    return server
+
+
+def worker_pids(master: int, workers: int) -> List[int]:
+    """
+    The server's worker processes
+
+    With one worker uvicorn serves from the master process, whose children
+    are then the executor's process pool.
+    """
+    if workers <= 1:
+        return [master]
+    try:
+        children = Path(f"/proc/{master}/task/{master}/children").read_text().split()
+    except OSError:
+        return [master]
+    pids = []
+    for pid in map(int, children):
+        try:
+            cmdline = Path(f"/proc/{pid}/cmdline").read_bytes()
+        except OSError:
+            continue
+        if b"resource_tracker" not in cmdline:
+            pids.append(pid)
+    return pids or [master]
+
+
+def process_resources(pid: int) -> Optional[Dict[str, float]]:
+    """RSS in MB and open file descriptors of one process"""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+        fds = len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return None
+    rss_kb = next((int(line.split()[1]) for line in status.splitlines() if line.startswith("VmRSS:")), 0)
+    return {"rss_mb": round(rss_kb / 1024, 1), "fds": fds}
+
+
+# ============================================================================
+# CLIENTS
+# ============================================================================
+
+async def rest_client(client: httpx.AsyncClient, body: bytes, deadline: float, recorder: Recorder):
+    headers = {"Authorization": f"Bearer {settings.API_TOKEN}", "Content-Type": "application/json"}
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/agents/run", content=body, headers=headers)
+            outcome = response.status_code
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        if outcome != 200:
+            await asyncio.sleep(0.01)
+        if started < recorder.since:
+            continue
+        if outcome == 200:
+            recorder.latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            recorder.errors[str(outcome)] += 1
+
+
+async def stream_client(url: str, message: str, deadline: float, recorder: Recorder):
+    try:
+        async with websockets.connect(url, max_size=None) as websocket:
+            recorder.connections += 1
+            while time.perf_counter() < deadline:
+                started, first_token = time.perf_counter(), None
+                await websocket.send(message)
+                while True:
+                    event = json.loads(await websocket.recv())
+                    if event["type"] == "ping":
+                        await websocket.send('{"action": "pong"}')
+                    elif event["type"] == "token" and first_token is None:
+                        first_token = time.perf_counter()
+                    if event.get("done"):
+                        break
+                if started < recorder.since:
+                    continue
+                if event["type"] == "complete" and first_token is not None:
+                    recorder.ttfts.append((first_token - started) * 1000)
+                    recorder.latencies.append((time.perf_counter() - started) * 1000)
+                else:
+                    recorder.errors[str(event.get("status_code") or event["type"])] += 1
+    except (OSError, websockets.WebSocketException) as e:
+        recorder.errors[type(e).__name__] += 1
+
+
+async def sample_resources(master: int, workers: int, interval: float, deadline: float, samples: List[Dict[str, Any]]):
+    started = time.perf_counter()
+    while True:
+        sample = {}
+        for pid in worker_pids(master, workers):
+            resources = process_resources(pid)
+            if resources is not None:
+                sample[str(pid)] = resources
+        samples.append({"t": round(time.perf_counter() - started, 1), "workers": sample})
+        if time.perf_counter() >= deadline:
+            return
+        await asyncio.sleep(min(interval, max(0.0, deadline - time.perf_counter())))
+
+
+async def drive(base_url: str, master: int, args) -> Tuple[Recorder, Recorder, List[Dict[str, Any]], float]:
+    run = {
+        "agent_id": "load-test",
+        "messages": [{"role": "user", "content": "Summarize the latest deployment status for the on-call team."}],
+        "max_tokens": args.tokens,
+    }
+    body = json.dumps(run).encode()
+    message = json.dumps({"action": "run", **run})
+    ws_url = base_url.replace("http", "ws", 1) + "/api/agents/stream"
+
+    # Runs that start during the warm-up are not recorded
+    since = time.perf_counter() + args.warmup
+    deadline = since + args.duration
+    rest, stream, samples = Recorder(since), Recorder(since), []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+        await asyncio.gather(
+            sample_resources(master, args.workers, args.sample_interval, deadline, samples),
+            *(rest_client(client, body, deadline, rest) for _ in range(args.concurrency)),
+            *(stream_client(ws_url, message, deadline, stream) for _ in range(args.streams)),
+        )
+        elapsed = time.perf_counter() - wall_started
+        client_cpu = (time.process_time() - cpu_started) / elapsed * 100
+    return rest, stream, samples, client_cpu
+
+
+# ============================================================================
+# REPORTING
+# ============================================================================
+
+def resource_summary(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Start, end and peak RSS and file descriptors per worker"""
+    workers: Dict[str, Dict[str, Any]] = {}
+    for sample in samples:
+        for pid, resources in sample["workers"].items():
+            summary = workers.setdefault(pid, {
+                "rss_mb_start": resources["rss_mb"],
+                "fds_start": resources["fds"],
+                "rss_mb_max": 0.0,
+                "fds_max": 0,
+            })
+            summary["rss_mb_end"] = resources["rss_mb"]
+            summary["fds_end"] = resources["fds"]
+            summary["rss_mb_max"] = max(summary["rss_mb_max"], resources["rss_mb"])
+            summary["fds_max"] = max(summary["fds_max"], resources["fds"])
+    return {
+        "workers": workers,
+        "rss_mb_max": max((w["rss_mb_max"] for w in workers.values()), default=0.0),
+        "fds_max": max((w["fds_max"] for w in workers.values()), default=0),
+        "samples": samples,
+    }
+
+
+def build_report(args, rest: Recorder, stream: Recorder, samples, client_cpu: float, emulator_stats) -> Dict[str, Any]:
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "streams": args.streams,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "emulator": {"ttft_ms": args.ttft_ms, "itl_ms": args.itl_ms, "tokens": args.tokens},
+            "client_cpu_percent": round(client_cpu, 1),
+        },
+        "rest": {
+            "requests": len(rest.latencies),
+            "errors": dict(rest.errors),
+            "throughput_rps": round(len(rest.latencies) / args.duration, 2),
+            "latency_ms": percentiles(rest.latencies),
+        },
+        "stream": {
+            "connections": stream.connections,
+            "runs": len(stream.ttfts),
+            "errors": dict(stream.errors),
+            "runs_per_s": round(len(stream.ttfts) / args.duration, 2),
+            "ttft_ms": percentiles(stream.ttfts),
+            "duration_ms": percentiles(stream.latencies),
+        },
+        "resources": resource_summary(samples),
+        "emulator": emulator_stats,
+    }
+
+
+def metric(report: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = report
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Print each compared metric against the baseline; return the regressed ones"""
+    regressions = []
+    print(f"\n{'metric':<24}{'baseline':>12}{'current':>12}{'change':>10}")
+    for path, higher_is_better in COMPARED:
+        current, previous = metric(report, path), metric(baseline, path)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            regressions.append(path)
+            flag = "  regressed"
+        print(f"{path:<24}{previous:>12.2f}{current:>12.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]):
+    rest, stream, resources = report["rest"], report["stream"], report["resources"]
+    print(f"\nREST   {rest['requests']} runs, {rest['throughput_rps']} req/s, errors {rest['errors'] or 'none'}")
+    print(f"       latency ms {rest['latency_ms']}")
+    print(f"Stream {stream['runs']} runs on {stream['connections']} sockets, {stream['runs_per_s']} runs/s, "
+          f"errors {stream['errors'] or 'none'}")
+    print(f"       ttft ms {stream['ttft_ms']}")
+    print(f"       duration ms {stream['duration_ms']}")
+    for pid, worker in resources["workers"].items():
+        print(f"Worker {pid}: RSS {worker['rss_mb_start']} -> {worker['rss_mb_end']} MB "
+              f"(max {worker['rss_mb_max']}), fds {worker['fds_start']} -> {worker['fds_end']} (max {worker['fds_max']})")
+    print(f"Load generator CPU {report['meta']['client_cpu_percent']}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of recorded load")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before recording")
+    parser.add_argument("--concurrency", type=int, default=200, help="Concurrent REST clients")
+    parser.add_argument("--streams", type=int, default=50, help="Concurrent WebSocket streams")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn workers")
+    parser.add_argument("--sample-interval", type=float, default=2.0, help="Seconds between resource samples")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Emulated time to first token")
+    parser.add_argument("--itl-ms", type=float, default=20.0, help="Emulated inter-token latency")
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens per emulated answer")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of emulated 429s")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of emulated provider errors")
+    parser.add_argument("--output", type=Path, help="Result file (default: benchmarks/results/load-<time>.json)")
+    parser.add_argument("--baseline", type=Path, help="Earlier result to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Also save the result as {BASELINE.relative_to(BACKEND_DIR)}")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    emulator_port, server_port = _free_port(), _free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        emulator = start_emulator(emulator_port, args)
+        server = None
+        try:
+            server = start_server(server_port, args.workers, f"http://127.0.0.1:{emulator_port}", directory)
+            base_url = f"http://127.0.0.1:{server_port}"
+            print(f"Driving {base_url} with {args.workers} workers for {args.warmup:g}s + {args.duration:g}s: "
+                  f"{args.concurrency} REST clients, {args.streams} streams")
+            rest, stream, samples, client_cpu = asyncio.run(drive(base_url, server.pid, args))
+            emulator_stats = httpx.get(f"http://127.0.0.1:{emulator_port}/emulator/stats").json()
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+            emulator.terminate()
+            emulator.wait(timeout=10)
+
+    report = build_report(args, rest, stream, samples, client_cpu, emulator_stats)
+    print_report(report)
+
+    output = args.output or RESULTS_DIR / f"load-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    destinations = [output] + ([BASELINE] if args.save_baseline else [])
+    for path in destinations:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Saved {path}")
+
+    if args.baseline is not None:
+        if not args.baseline.exists():
+            print(f"\nNo baseline at {args.baseline}; save one with --save-baseline")
+        elif compare(report, json.loads(args.baseline.read_text()), args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
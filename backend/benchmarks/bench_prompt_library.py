@@ -0,0 +1,119 @@
+"""
+Prompt Library Benchmark
+Search and render latency with thousands of prompts
+
+Fills a temporary SQLite database with generated prompts, then times
+searches through the FTS5 index against the substring fallback, and
+rendering a prompt from the compiled-template cache against compiling it
+from the database on every call.
+
+The substring fallback is unranked and stops at the first ``limit``
+matches, so it is quick for common words; its cost shows on rare ones,
+where it scans every row. FTS5 ranks every match by BM25, which costs a
+few milliseconds for words in thousands of prompts and nothing for rare
+ones.
+
+Usage:
+    python -m benchmarks.bench_prompt_library [--prompts 5000] [--repeat 200]
+"""
+
+import argparse
+import logging
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import structlog
+from sqlalchemy import create_engine
+
+from app.services.prompt_library import PromptLibrary
+
+WORDS = (
+    "review summarize translate classify extract explain refactor debug plan draft critique outline "
+    "python rust sql invoice contract incident release customer ticket dataset report email meeting "
+    "security latency budget onboarding roadmap architecture migration policy research interview"
+).split()
+
+QUERIES = ["review", "summ", "incident report", "python refactor", "customer email draft", "zebra"]
+
+
+def populate(library: PromptLibrary, count: int):
+    rng = random.Random(7)
+    for i in range(count):
+        words = rng.sample(WORDS, 8)
+        library.create(
+            f"{words[0].title()} {words[1]} {i}",
+            {
+                "system_prompt": f"You {words[0]} {words[2]} for {{{{ team }}}}. " + " ".join(rng.choices(WORDS, k=60)),
+                "messages": [{"role": "user", "content": f"{words[3]} this {words[4]}: {{{{ input }}}}"}],
+                "defaults": {"team": "support"},
+            },
+            description=" ".join(words[5:]),
+            category=rng.choice(["Development", "Writing", "Analytics", "Support"]),
+            tags=words[6:],
+            prompt_id=f"p{i}",
+        )
+
+
+def timed(fn, repeat: int) -> float:
+    """Median latency in ms"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def run(count: int, repeat: int):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{Path(directory) / 'prompts.db'}")
+        library = PromptLibrary(engine_factory=lambda: engine)
+
+        started = time.perf_counter()
+        populate(library, count)
+        print(f"Inserted {count} prompts in {time.perf_counter() - started:.1f}s (FTS5: {library.fts})\n")
+
+        print(f"{'query':<24}{'results':>9}{'fts5 ms':>10}{'substring ms':>14}")
+        for query in QUERIES:
+            library.fts = True
+            results = len(library.search(query))
+            fts_ms = timed(lambda: library.search(query), repeat)
+            library.fts = False
+            substring_ms = timed(lambda: library.search(query), repeat)
+            print(f"{query:<24}{results:>9}{fts_ms:>10.2f}{substring_ms:>14.2f}")
+        library.fts = True
+
+        variables = {"input": "the quarterly numbers"}
+        prompt_ids = [f"p{i}" for i in random.Random(3).sample(range(count), 100)]
+
+        def render_cached():
+            for prompt_id in prompt_ids:
+                library.compiled(prompt_id, 1).render(variables)
+
+        def render_uncached():
+            for prompt_id in prompt_ids:
+                library.clear_cache()
+                library.compiled(prompt_id, 1).render(variables)
+
+        render_cached()
+        cached_ms = timed(render_cached, max(1, repeat // 20)) / len(prompt_ids)
+        uncached_ms = timed(render_uncached, max(1, repeat // 20)) / len(prompt_ids)
+        print(f"\n{'render':<24}{'cached ms':>10}{'uncached ms':>14}")
+        print(f"{'one prompt':<24}{cached_ms:>10.3f}{uncached_ms:>14.3f}")
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=5000, help="Prompts in the library")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed runs per measurement")
+    args = parser.parse_args()
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    run(args.prompts, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
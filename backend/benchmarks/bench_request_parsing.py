@@ -0,0 +1,118 @@
+"""
+Request Parsing Benchmark
+Compares buffered and streaming parsing of large /agents/run bodies
+
+The buffered path is what FastAPI does for a body parameter: join the
+received chunks, decode the JSON and validate the model. The streaming path
+is ``_read_run_request`` without the HTTP layer: chunks go straight into
+``StreamingObjectParser`` and each message is validated as it completes.
+Both are fed 64KB chunks; peak memory is measured with tracemalloc.
+
+Usage:
+    python -m benchmarks.bench_request_parsing [--sizes 1 5 10] [--repeat 5]
+"""
+
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+
+from app.config import settings
+from app.routes.agents import AgentRunRequest, Message
+from app.services.streaming_json import StreamingObjectParser
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_body(size_mb: int, shape: str, invalid_first: bool = False) -> bytes:
+    """A run request of about ``size_mb`` megabytes"""
+    target = size_mb * 1024 * 1024
+    if shape == "few-large":
+        count = 4
+    else:
+        count = max(1, target // 2048)
+    paragraph = (
+        "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt "
+        "ut labore et dolore magna aliqua. Ut enim ad minim veniam, \"quis nostrud\" exercitation "
+        "ullamco laboris nisi ut aliquip ex ea commodo consequat.\n\n"
+    )
+    content = paragraph * max(1, target // count // len(paragraph))
+    messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": content} for i in range(count)]
+    if invalid_first:
+        messages[0]["content"] = 42
+    return json.dumps({
+        "agent_id": "bench-agent",
+        "messages": messages,
+        "temperature": 0.7,
+        "metadata": {"source": "bench"},
+    }).encode()
+
+
+def chunks(body: bytes):
+    view = memoryview(body)
+    for start in range(0, len(body), CHUNK_SIZE):
+        yield bytes(view[start:start + CHUNK_SIZE])
+
+
+def parse_buffered(body: bytes) -> AgentRunRequest:
+    data = b"".join(chunks(body))
+    return AgentRunRequest.model_validate(json.loads(data))
+
+
+def parse_streaming(body: bytes) -> AgentRunRequest:
+    messages = []
+    parser = StreamingObjectParser(
+        "messages",
+        lambda index, value: messages.append(Message.model_validate(value)),
+        spool_threshold=settings.REQUEST_SPOOL_THRESHOLD_BYTES,
+        spool_max_memory=settings.REQUEST_SPOOL_MEMORY_BYTES,
+    )
+    for chunk in chunks(body):
+        parser.feed(chunk)
+    return AgentRunRequest.model_validate({**parser.close(), "messages": messages})
+
+
+def measure(parse, body: bytes, repeat: int):
+    """Median latency in ms and peak traced memory in MB"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            parse(body)
+        except ValueError:
+            pass
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        parse(body)
+    except ValueError:
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak / 1024 / 1024
+
+
+def run(sizes, repeat: int):
+    print(f"{'body':<22}{'buffered ms':>13}{'streaming ms':>14}{'buffered MB':>13}{'streaming MB':>14}")
+    cases = [(size, shape, False) for size in sizes for shape in ("few-large", "many-small")]
+    cases += [(size, "many-small", True) for size in sizes]
+    for size, shape, invalid in cases:
+        body = make_body(size, shape, invalid_first=invalid)
+        label = f"{size}MB {shape}" + (" invalid" if invalid else "")
+        buffered_ms, buffered_mb = measure(parse_buffered, body, repeat)
+        streaming_ms, streaming_mb = measure(parse_streaming, body, repeat)
+        print(f"{label:<22}{buffered_ms:>13.1f}{streaming_ms:>14.1f}{buffered_mb:>13.1f}{streaming_mb:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 10], help="Body sizes in MB")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per measurement")
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Startup Benchmark
+Import-time report and time to first healthy ping for the sidecar
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5] [--top 20]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Time from spawning the server process to the first 200 from /api/health/ping
+FIRST_PING_TARGET_MS = 3000
+
+# Optional dependencies that must stay off the startup path
+LAZY_MODULES = ["numpy", "sqlalchemy", "httpx"]
+
+
+def import_times(module: str = "app.main") -> Dict[str, Tuple[int, int]]:
+    """Self and cumulative import time in microseconds per module, from ``-X importtime``"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if self_us.strip().isdigit():
+            times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_ping(timeout: float = 30.0) -> float:
+    """Milliseconds from spawning uvicorn to the first successful health ping"""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/api/health/ping"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"No healthy ping within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def report_imports(top: int) -> List[str]:
+    times = import_times()
+    total_ms = times["app.main"][1] / 1000
+    print(f"import app.main: {total_ms:.1f} ms cumulative\n")
+
+    print(f"{'module':<48}{'self (ms)':>12}{'cumulative (ms)':>18}")
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda item: -item[1][1])[:top]:
+        print(f"{name:<48}{self_us / 1000:>12.1f}{cumulative_us / 1000:>18.1f}")
+
+    eager = [name for name in LAZY_MODULES if name in times]
+    print(f"\nlazy modules imported eagerly: {', '.join(eager) or 'none'}")
+    return eager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    eager = report_imports(args.top)
+
+    samples = [time_to_first_ping() for _ in range(args.runs)]
+    median = statistics.median(samples)
+    print(
+        f"\ntime to first healthy ping: median {median:.0f} ms, "
+        f"min {min(samples):.0f} ms, max {max(samples):.0f} ms "
+        f"(target {FIRST_PING_TARGET_MS} ms)"
+    )
+
+    if eager or median > FIRST_PING_TARGET_MS:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Transport Latency Benchmark
+Compares request latency over TCP with Bearer auth and over the Unix socket
+
+Starts the backend serving both transports, then measures sequential
+keep-alive REST requests and WebSocket ping round trips on each.
+
+Usage:
+    python -m benchmarks.bench_transport [--requests 2000]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import httpx
+from websockets.sync.client import connect, unix_connect
+
+from app.config import settings
+from benchmarks.bench_startup import BACKEND_DIR, _free_port
+
+
+def _timed(call: Callable[[], None], number: int) -> List[float]:
+    for _ in range(min(100, number)):
+        call()  # Warm up
+    samples = []
+    for _ in range(number):
+        started = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p99": ordered[int(len(ordered) * 0.99) - 1],
+    }
+
+
+def _start_server(socket_path: str, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "UNIX_SOCKET_PATH": socket_path,
+        "UNIX_SOCKET_KEEP_TCP": "true",
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "LOG_LEVEL": "WARNING",
+        "AUDIT_LOG_ENABLED": "false",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.main"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            with httpx.Client(transport=httpx.HTTPTransport(uds=socket_path)) as client:
+                client.get("http://backend/api/health/ping")
+            httpx.get(f"http://127.0.0.1:{port}/api/health/ping")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.05)
+    server.terminate()
+    raise TimeoutError("Server did not start")
+
+
+def run(number: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = str(Path(tmp) / "backend.sock")
+        port = _free_port()
+        server = _start_server(socket_path, port)
+        try:
+            tcp = httpx.Client(
+                base_url=f"http://127.0.0.1:{port}",
+                headers={"Authorization": f"Bearer {settings.API_TOKEN}"},
+            )
+            uds = httpx.Client(transport=httpx.HTTPTransport(uds=socket_path), base_url="http://backend")
+            results = {
+                "REST tcp+bearer": _timed(lambda: tcp.get("/api/agents/").raise_for_status(), number),
+                "REST unix socket": _timed(lambda: uds.get("/api/agents/").raise_for_status(), number),
+            }
+            tcp.close()
+            uds.close()
+
+            ping = json.dumps({"action": "ping"})
+            with connect(f"ws://127.0.0.1:{port}/api/agents/stream") as websocket:
+                results["WS ping tcp"] = _timed(lambda: (websocket.send(ping), websocket.recv()), number)
+            with unix_connect(socket_path, uri="ws://backend/api/agents/stream") as websocket:
+                results["WS ping unix socket"] = _timed(lambda: (websocket.send(ping), websocket.recv()), number)
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+    print(f"{'transport':<22}{'mean (us)':>12}{'p50 (us)':>12}{'p99 (us)':>12}")
+    for label, samples in results.items():
+        summary = _summary(samples)
+        print(f"{label:<22}{summary['mean']:>12.1f}{summary['p50']:>12.1f}{summary['p99']:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Microbenchmark Harness
+Times hot paths and checks them against committed baselines
+
+Each benchmark is timed as the best of several rounds, each round long
+enough to swamp timer overhead. Timings are stored relative to a fixed
+pure-Python calibration workload whose rounds alternate with the
+benchmark's, so a baseline recorded on one machine still means something
+on another: a slower CPU makes both slower.
+
+A benchmark regresses when its relative cost exceeds the baseline by more
+than its tolerance. Baselines live in ``benchmarks/baselines/micro.json``
+and the latest results in ``benchmarks/results/micro.json``.
+
+Run with ``make bench-micro``; record new baselines with
+``make bench-micro-update`` after an intended change.
+"""
+
+import asyncio
+import json
+import os
+import platform
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.bench_startup import BACKEND_DIR
+
+BASELINE_FILE = BACKEND_DIR / "benchmarks" / "baselines" / "micro.json"
+RESULTS_FILE = BACKEND_DIR / "benchmarks" / "results" / "micro.json"
+
+# Allowed relative slowdown before a benchmark fails; MICROBENCH_TOLERANCE overrides
+DEFAULT_TOLERANCE = 0.30
+
+Batch = Callable[[int], None]
+
+
+def sync_batch(fn: Callable[[], Any]) -> Batch:
+    """Batch that calls ``fn`` n times"""
+    def run(n: int):
+        for _ in range(n):
+            fn()
+    return run
+
+
+def async_batch(fn: Callable[[], Awaitable[Any]], loop: asyncio.AbstractEventLoop) -> Batch:
+    """Batch that awaits ``fn()`` n times inside one event loop turn"""
+    async def many(n: int):
+        for _ in range(n):
+            await fn()
+
+    def run(n: int):
+        loop.run_until_complete(many(n))
+    return run
+
+
+def _round_size(batch: Batch, min_round_seconds: float) -> int:
+    """Calls per round needed for a round to last at least ``min_round_seconds``"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        batch(number)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_round_seconds:
+            return number
+        number *= 2 if elapsed * 4 >= min_round_seconds else 8
+
+
+def _round_ns(batch: Batch, number: int) -> float:
+    started = time.perf_counter()
+    batch(number)
+    return (time.perf_counter() - started) / number * 1e9
+
+
+def _calibration_workload():
+    # Dict, string and integer work, like the request paths being timed
+    record = {}
+    for i in range(200):
+        record[f"key{i}"] = str(i * 7)
+    return sum(len(value) for value in record.values())
+
+
+CALIBRATION = sync_batch(_calibration_workload)
+
+
+def time_relative(batch: Batch, rounds: int = 7, min_round_seconds: float = 0.05) -> Tuple[float, float]:
+    """Best time per call in nanoseconds, and the best calibration time
+
+    Benchmark and calibration rounds alternate, so a machine that slows
+    down part way through a run (a noisy neighbour, frequency scaling)
+    slows both sides of the ratio.
+    """
+    number = _round_size(batch, min_round_seconds)
+    calibration_number = _round_size(CALIBRATION, min_round_seconds)
+    best, calibration = float("inf"), float("inf")
+    for _ in range(rounds):
+        best = min(best, _round_ns(batch, number))
+        calibration = min(calibration, _round_ns(CALIBRATION, calibration_number))
+    return best, calibration
+
+
+@dataclass
+class Result:
+    """One benchmark's timing and verdict"""
+    name: str
+    ns: float
+    calibration_ns: float
+    baseline: Optional[float] = None
+    tolerance: float = DEFAULT_TOLERANCE
+
+    @property
+    def relative(self) -> float:
+        return self.ns / self.calibration_ns
+
+    @property
+    def change(self) -> Optional[float]:
+        return None if not self.baseline else self.relative / self.baseline - 1
+
+    @property
+    def regressed(self) -> bool:
+        return self.change is not None and self.change > self.tolerance
+
+    def describe(self) -> str:
+        line = f"{self.name}: {self.ns / 1000:.2f}us ({self.relative:.2f}x calibration)"
+        if self.change is not None:
+            line += f", {self.change:+.0%} vs baseline (tolerance {self.tolerance:.0%})"
+        return line
+
+
+class Baselines:
+    """Committed baselines, and the results of the current run"""
+
+    def __init__(self, path: Path = BASELINE_FILE, results_path: Path = RESULTS_FILE):
+        self.path = path
+        self.results_path = results_path
+        self.entries: Dict[str, Dict[str, float]] = {}
+        if path.exists():
+            self.entries = json.loads(path.read_text())["benchmarks"]
+        self.results: List[Result] = []
+
+    def tolerance(self, name: str) -> float:
+        override = os.environ.get("MICROBENCH_TOLERANCE")
+        if override:
+            return float(override)
+        return self.entries.get(name, {}).get("tolerance", DEFAULT_TOLERANCE)
+
+    def check(self, name: str, batch: Batch) -> Result:
+        ns, calibration = time_relative(batch)
+        baseline = self.entries.get(name, {}).get("relative")
+        result = Result(name, ns, calibration, baseline, self.tolerance(name))
+        self.results.append(result)
+        return result
+
+    def _document(self, results: List[Result], keep: Dict[str, Dict[str, float]]) -> Dict[str, Any]:
+        benchmarks = dict(keep)
+        for result in results:
+            benchmarks[result.name] = {
+                "relative": round(result.relative, 4),
+                "ns": round(result.ns, 1),
+                "calibration_ns": round(result.calibration_ns, 1),
+                "tolerance": self.entries.get(result.name, {}).get("tolerance", DEFAULT_TOLERANCE),
+            }
+        return {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "benchmarks": dict(sorted(benchmarks.items())),
+        }
+
+    def save_results(self):
+        self.results_path.parent.mkdir(parents=True, exist_ok=True)
+        self.results_path.write_text(json.dumps(self._document(self.results, {}), indent=2) + "\n")
+
+    def save_baselines(self):
+        """Write the current results over the baselines, keeping benchmarks that did not run"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self._document(self.results, self.entries), indent=2) + "\n")
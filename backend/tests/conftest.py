@@ -6,6 +6,15 @@ import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 from app.config import settings
+from app.services.provider_emulator import EmulatorProfile, ProviderEmulator
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--microbench-update",
+        action="store_true",
+        help="Record microbenchmark results as the new baselines instead of checking them",
+    )
 
 
 @pytest.fixture
@@ -22,6 +31,13 @@ def auth_headers():
     }
 
 
+@pytest.fixture
+def provider_emulator():
+    """Provider emulator on a local port, answering instantly"""
+    with ProviderEmulator(EmulatorProfile(ttft_ms=0, inter_token_ms=0, seed=1)) as emulator:
+        yield emulator
+
+
 @pytest.fixture
 def mock_agent_request():
     """Mock agent request fixture"""
@@ -0,0 +1,317 @@
+"""
+Tests for importing agent definitions from Git repositories
+"""
+
+import asyncio
+import json
+import subprocess
+
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine
+
+from app.routes import agents as agents_routes
+from app.services import agent_import
+from app.services.agent_import import AgentImporter
+from app.services.agent_registry import AgentRegistry
+
+
+def _git(cwd, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", "-c", "init.defaultBranch=main", *args],
+        cwd=cwd, check=True, capture_output=True,
+    )
+
+
+class Repo:
+    """A working tree pushing to a local bare repository"""
+
+    def __init__(self, root, name):
+        self.url = str(root / f"{name}.git")
+        self.work = root / name
+        _git(root, "init", "--bare", "--quiet", self.url)
+        _git(root, "init", "--quiet", str(self.work))
+        _git(self.work, "remote", "add", "origin", self.url)
+
+    def write(self, path, content):
+        target = self.work / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(content if isinstance(content, str) else json.dumps(content))
+
+    def delete(self, path):
+        _git(self.work, "rm", "--quiet", path)
+
+    def commit(self, message="update"):
+        _git(self.work, "add", "-A")
+        _git(self.work, "commit", "--quiet", "--allow-empty", "-m", message)
+        _git(self.work, "push", "--quiet", "--force", "origin", "HEAD:main")
+
+
+def _agent(name, **extra):
+    return {"name": name, "description": f"{name} agent", **extra}
+
+
+@pytest.fixture
+def registry(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'agents.db'}")
+    yield AgentRegistry(engine_factory=lambda: engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def importer(registry, tmp_path):
+    return AgentImporter(registry=registry, cache_dir=str(tmp_path / "mirrors"), concurrency=2)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = Repo(tmp_path, "team")
+    repo.write("agents/writer.json", _agent("Writer", model="claude-3-opus"))
+    repo.write("support/triage.agent.json", _agent("Triage", id="triage-bot", tags=["support"]))
+    repo.write("README.md", "not an agent")
+    repo.commit("initial")
+    return repo
+
+
+def _sync(importer, url, **kwargs):
+    return asyncio.run(importer.sync(url, **kwargs))
+
+
+class TestAgentImport:
+    """Test suite for syncing repositories into the registry"""
+
+    def test_initial_import(self, importer, registry, repo):
+        """Test that matching files are imported from a bare repository"""
+        result = _sync(importer, repo.url)
+
+        assert result["status"] == "synced"
+        assert result["mode"] == "full"
+        assert result["imported"] == 2
+        agents = {agent["id"]: agent for agent in registry.list_agents()}
+        assert agents["writer"]["model"] == "claude-3-opus"
+        assert agents["triage-bot"]["tags"] == ["support"]
+        assert agents["triage-bot"]["source"]["path"] == "support/triage.agent.json"
+        # Built-in agents come first
+        assert list(agents)[:2] == ["agent-1", "agent-2"]
+
+    def test_unchanged_resync(self, importer, registry, repo):
+        """Test that a sync at the recorded commit does no work"""
+        first = _sync(importer, repo.url)
+        second = _sync(importer, repo.url)
+
+        assert second["status"] == "unchanged"
+        assert second["commit_sha"] == first["commit_sha"]
+        assert registry.sources()[0]["last_commit_sha"] == first["commit_sha"]
+
+    def test_incremental_sync(self, importer, registry, repo):
+        """Test that later syncs only read files changed since the last commit"""
+        _sync(importer, repo.url)
+        repo.write("agents/writer.json", _agent("Writer", model="gpt-4"))
+        repo.write("agents/editor.json", _agent("Editor"))
+        repo.delete("support/triage.agent.json")
+        repo.write("README.md", "still not an agent")
+        repo.commit("second")
+
+        result = _sync(importer, repo.url)
+
+        assert result["mode"] == "incremental"
+        assert result["files_changed"] == 2
+        assert result["imported"] == 2
+        assert result["removed"] == 1
+        ids = [agent["id"] for agent in registry.list_agents()]
+        assert ids == ["agent-1", "agent-2", "editor", "writer"]
+        assert registry.get("writer")["model"] == "gpt-4"
+
+    def test_unchanged_content_is_not_parsed(self, importer, repo):
+        """Test that files with a known content hash are skipped"""
+        _sync(importer, repo.url)
+        repo.write("agents/writer.json", _agent("Writer", model="gpt-4"))
+        repo.commit("change")
+        repo.write("agents/writer.json", _agent("Writer", model="claude-3-opus"))
+        repo.commit("revert")
+        # Lose the recorded commit so the sync falls back to a full tree walk
+        importer.registry.apply_sync(repo.url, "HEAD", "0" * 40, [], [])
+
+        result = _sync(importer, repo.url)
+
+        assert result["mode"] == "full"
+        assert result["files_parsed"] == 0
+        assert importer.stats()["files_unchanged"] == 2
+
+    def test_force_push(self, importer, registry, repo):
+        """Test that a rewritten history removes agents missing from the new tree"""
+        _sync(importer, repo.url)
+        _git(repo.work, "checkout", "--quiet", "--orphan", "rewrite")
+        _git(repo.work, "rm", "-r", "--quiet", "--cached", ".")
+        repo.write("agents/fresh.json", _agent("Fresh"))
+        _git(repo.work, "add", "agents/fresh.json")
+        _git(repo.work, "commit", "--quiet", "-m", "rewrite")
+        _git(repo.work, "push", "--quiet", "--force", "origin", "HEAD:main")
+
+        result = _sync(importer, repo.url)
+
+        assert result["removed"] == 2
+        assert [agent["id"] for agent in registry.list_agents()][2:] == ["fresh"]
+
+    def test_duplicate_content_across_repos(self, importer, registry, repo, tmp_path):
+        """Test that the same definition in a second repository is deduplicated"""
+        fork = Repo(tmp_path, "fork")
+        fork.write("agents/writer.json", _agent("Writer", model="claude-3-opus"))
+        fork.commit()
+
+        _sync(importer, repo.url)
+        result = _sync(importer, fork.url)
+
+        assert result["duplicates"] == 1
+        assert result["imported"] == 0
+        assert registry.get("writer")["source"]["url"] == repo.url
+
+    def test_id_conflicts(self, importer, registry, repo, tmp_path):
+        """Test that ids owned by built-ins or other repositories are not overwritten"""
+        other = Repo(tmp_path, "other")
+        other.write("agents/writer.json", _agent("Another writer"))
+        other.write("agents/agent-1.json", _agent("Imposter"))
+        other.commit()
+
+        _sync(importer, repo.url)
+        result = _sync(importer, other.url)
+
+        assert sorted(conflict["id"] for conflict in result["conflicts"]) == ["agent-1", "writer"]
+        assert registry.get("writer")["name"] == "Writer"
+        assert registry.get("agent-1")["name"] == "General Assistant"
+
+    def test_invalid_definitions_are_reported(self, importer, registry, repo):
+        """Test that bad files are reported without blocking the rest"""
+        repo.write("agents/broken.json", "{not json")
+        repo.write("agents/nameless.json", {"description": "no name"})
+        repo.write("agents/list.json", [1, 2])
+        repo.commit()
+
+        result = _sync(importer, repo.url)
+
+        errors = {error["path"]: error["error"] for error in result["errors"]}
+        assert set(errors) == {"agents/broken.json", "agents/nameless.json", "agents/list.json"}
+        assert "name" in errors["agents/nameless.json"]
+        assert result["imported"] == 2
+
+    def test_path_filter(self, importer, registry, repo):
+        """Test that only definitions below the requested path are imported"""
+        result = _sync(importer, repo.url, path="support")
+
+        assert result["imported"] == 1
+        assert registry.get("writer") is None
+
+    def test_path_change_rescans(self, importer, registry, repo):
+        """Test that a sync with another path reads the whole tree at the same commit"""
+        _sync(importer, repo.url, path="support")
+        widened = _sync(importer, repo.url)
+
+        assert widened["status"] == "synced"
+        assert widened["mode"] == "full"
+        assert registry.get("writer") is not None
+
+        narrowed = _sync(importer, repo.url, path="/support/")
+        assert narrowed["removed"] == 1
+        assert registry.get("writer") is None
+        assert registry.sources()[0]["path"] == "support"
+        assert _sync(importer, repo.url, path="support")["status"] == "unchanged"
+
+    def test_missing_repository(self, importer, tmp_path):
+        """Test that an unreachable repository fails on its own"""
+        result = _sync(importer, str(tmp_path / "missing.git"))
+
+        assert result["status"] == "failed"
+        assert "clone" in result["error"]
+        # Only the mirror's lock file is left behind
+        assert [path.suffix for path in (tmp_path / "mirrors").iterdir()] == [".lock"]
+        assert importer.stats()["failures"] == 1
+
+    @pytest.mark.parametrize("repository", [
+        {"url": "--upload-pack=touch pwned"},
+        {"url": "unused", "ref": "--output=pwned"},
+    ])
+    def test_option_like_arguments_are_refused(self, importer, tmp_path, monkeypatch, repository):
+        """Test that a URL or ref that git would read as an option is refused"""
+        monkeypatch.chdir(tmp_path)
+        result = asyncio.run(importer.sync(**repository))
+
+        assert result["status"] == "failed"
+        assert "must not start with '-'" in result["error"]
+        assert not (tmp_path / "pwned").exists()
+
+    def test_mirror_lock_is_shared_across_workers(self, importer, registry, repo):
+        """Test that a sync waits while another worker holds the mirror's lock"""
+        fcntl = pytest.importorskip("fcntl")
+        importer.cache_dir.mkdir(parents=True)
+
+        async def blocked_then_released():
+            with open(importer.mirror_path(repo.url).with_suffix(".lock"), "w") as held:
+                fcntl.flock(held, fcntl.LOCK_EX)
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(importer.sync(repo.url), 0.3)
+            return await importer.sync(repo.url)
+
+        assert asyncio.run(blocked_then_released())["status"] == "synced"
+        assert not importer.mirror_path(repo.url).with_suffix(".partial").exists()
+
+    def test_repositories_sync_concurrently(self, importer, registry, tmp_path, monkeypatch):
+        """Test that Git operations overlap up to the concurrency limit"""
+        repos = []
+        for i in range(4):
+            repo = Repo(tmp_path, f"repo{i}")
+            repo.write(f"agents/agent{i}.json", _agent(f"Agent {i}"))
+            repo.commit()
+            repos.append(repo)
+
+        run_git = agent_import.run_git
+        running, peak = 0, 0
+
+        async def tracked(*args, **kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            try:
+                await asyncio.sleep(0.02)
+                return await run_git(*args, **kwargs)
+            finally:
+                running -= 1
+
+        monkeypatch.setattr(agent_import, "run_git", tracked)
+        results = asyncio.run(importer.sync_all(
+            [{"url": repo.url} for repo in repos] + [{"url": str(tmp_path / "missing.git")}]
+        ))
+
+        assert [result["status"] for result in results] == ["synced"] * 4 + ["failed"]
+        assert peak == 2
+        assert len(registry.list_agents()) == 6
+
+
+class TestAgentImportEndpoints:
+    """Test suite for the agent import and listing APIs"""
+
+    @pytest.fixture(autouse=True)
+    def _use_test_registry(self, monkeypatch, registry, importer):
+        monkeypatch.setattr(agents_routes, "agent_registry", registry)
+        monkeypatch.setattr(agents_routes, "agent_importer", importer)
+
+    def test_import_and_list(self, client, auth_headers, repo):
+        """Test that imported agents show up in the agent list"""
+        response = client.post(
+            "/api/agents/import", json={"repositories": [{"url": repo.url}]}, headers=auth_headers
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["results"][0]["imported"] == 2
+
+        agents = client.get("/api/agents/", headers=auth_headers).json()
+        assert agents["total"] == 4
+        assert client.get("/api/agents/writer", headers=auth_headers).json()["model"] == "claude-3-opus"
+
+        sources = client.get("/api/agents/import/sources", headers=auth_headers).json()["sources"]
+        assert [source["url"] for source in sources] == [repo.url]
+
+    def test_import_requires_repositories(self, client, auth_headers):
+        """Test that an empty import is rejected"""
+        response = client.post("/api/agents/import", json={"repositories": []}, headers=auth_headers)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
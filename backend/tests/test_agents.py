@@ -34,7 +34,7 @@ class TestAgentEndpoints:
     
     def test_get_agent_with_auth(self, client, auth_headers):
         """Test getting agent details with authentication"""
-        response = client.get("/api/agents/test-agent", headers=auth_headers)
+        response = client.get("/api/agents/agent-1", headers=auth_headers)
         
         assert response.status_code == status.HTTP_200_OK
         data = response.json()
@@ -44,6 +44,13 @@ class TestAgentEndpoints:
         assert "model" in data
         assert "status" in data
     
+    def test_get_unknown_agent(self, client, auth_headers):
+        """Test that an id that is neither built in nor imported is not found"""
+        response = client.get("/api/agents/test-agent", headers=auth_headers)
+        
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json()["detail"] == "Agent not found: test-agent"
+    
     def test_run_agent_requires_auth(self, client, mock_agent_request):
         """Test that running agent requires authentication"""
         response = client.post("/api/agents/run", json=mock_agent_request)
@@ -0,0 +1,262 @@
+"""
+Tests for the segmented audit log
+"""
+
+import gzip
+
+import pytest
+
+from app.routes import audit as audit_routes
+from app.services import audit_log as audit_log_module
+from app.services.audit_log import AuditLog, AuditQuery, BloomFilter
+from app.services.serialization import loads
+
+
+def record(timestamp, client_ip="10.0.0.1", path="/api/agents/", status_code=200):
+    return {
+        "timestamp": timestamp,
+        "method": "GET",
+        "path": path,
+        "client_ip": client_ip,
+        "request_id": f"req_{timestamp}",
+        "status_code": status_code,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    log = AuditLog(path=str(tmp_path / "audit.log"), block_records=10, max_bytes=10**9, rotate_seconds=10**9)
+    log.start()
+    yield log
+    log.stop()
+
+
+@pytest.fixture
+def decompressions(monkeypatch):
+    """Count gzip blocks decompressed by queries"""
+    calls = []
+    original = gzip.decompress
+
+    def counting(data):
+        calls.append(len(data))
+        return original(data)
+
+    monkeypatch.setattr(audit_log_module.gzip, "decompress", counting)
+    return calls
+
+
+def fill(store, timestamps, **fields):
+    for timestamp in timestamps:
+        store.append(record(timestamp, **fields))
+    store.flush()
+
+
+class TestBloomFilter:
+    """Test suite for the bloom filter"""
+
+    def test_membership_and_round_trip(self):
+        """Test that added values are found after serialization"""
+        bloom = BloomFilter.for_capacity(1000)
+        for i in range(1000):
+            bloom.add(f"10.0.{i // 256}.{i % 256}")
+
+        restored = BloomFilter.from_dict(bloom.to_dict())
+        assert all(f"10.0.{i // 256}.{i % 256}" in restored for i in range(1000))
+        false_positives = sum(f"192.168.{i // 256}.{i % 256}" in restored for i in range(1000))
+        assert false_positives < 50
+
+
+class TestAuditLog:
+    """Test suite for rotation, sealing and queries"""
+
+    def test_append_writes_active_file(self, store):
+        """Test that appended records land in the active file"""
+        fill(store, [1.0, 2.0])
+
+        lines = store.path.read_bytes().splitlines()
+        assert [loads(line)["timestamp"] for line in lines] == [1.0, 2.0]
+
+    def test_rotate_seals_compressed_segment(self, store):
+        """Test that rotation produces a gzip segment and an index"""
+        fill(store, range(25))
+        store.rotate()
+
+        assert not store.path.exists()
+        [data] = list(store.segment_dir.glob("*.log.gz"))
+        assert len(list(store.segment_dir.glob("*.idx.json"))) == 1
+        with gzip.open(data) as f:
+            assert len(f.read().splitlines()) == 25
+
+        segment = store.segments[0]
+        assert len(segment.blocks) == 3
+        assert (segment.min_timestamp, segment.max_timestamp) == (0, 24)
+
+    def test_rotates_by_size(self, tmp_path):
+        """Test that the active file is sealed once it reaches max bytes"""
+        log = AuditLog(path=str(tmp_path / "audit.log"), max_bytes=500, rotate_seconds=10**9)
+        try:
+            fill(log, range(20))
+            assert log.segments
+            assert log.stats()["active_bytes"] < 500
+        finally:
+            log.stop()
+
+    def test_time_range_reads_only_overlapping_blocks(self, store, decompressions):
+        """Test that a time range query decompresses only the blocks it needs"""
+        fill(store, range(100))
+        store.rotate()
+
+        records = list(store.query(AuditQuery(start=42, end=47)))
+
+        assert [r["timestamp"] for r in records] == [42, 43, 44, 45, 46, 47]
+        assert len(decompressions) == 1
+
+    def test_bloom_filter_skips_segments(self, store, decompressions):
+        """Test that segments without the requested client are not decompressed"""
+        fill(store, range(30), client_ip="10.0.0.1")
+        store.rotate()
+        fill(store, range(30, 60), client_ip="10.0.0.2")
+        store.rotate()
+
+        records = list(store.query(AuditQuery(client_ip="10.0.0.2")))
+
+        assert len(records) == 30
+        assert len(decompressions) == 3  # The second segment's blocks only
+
+    def test_query_spans_segments_and_active_file(self, store):
+        """Test that queries see sealed and not yet sealed records in order"""
+        fill(store, range(5))
+        store.rotate()
+        fill(store, range(5, 8))
+
+        records = list(store.query(AuditQuery(start=3)))
+        assert [r["timestamp"] for r in records] == [3, 4, 5, 6, 7]
+
+        assert len(list(store.query(AuditQuery(), limit=2))) == 2
+        assert [r["timestamp"] for r in store.query(AuditQuery(status_code=500))] == []
+
+    def test_recovers_interrupted_seal_and_reloads(self, store, tmp_path):
+        """Test that a restart finishes a half-done seal and reloads segment indexes"""
+        fill(store, range(10))
+        store.rotate()
+        store.stop()
+        store.sealing_path.write_bytes(b"".join(
+            audit_log_module.dumps(record(t)) + b"\n" for t in range(10, 15)
+        ))
+
+        reopened = AuditLog(path=str(store.path), block_records=10)
+        reopened.start()
+        try:
+            assert not reopened.sealing_path.exists()
+            assert len(reopened.segments) == 2
+            assert len(list(reopened.query(AuditQuery()))) == 15
+        finally:
+            reopened.stop()
+
+    def test_corrupt_lines_do_not_block_sealing(self, store):
+        """Test that undecodable lines are skipped and counted instead of failing the seal"""
+        fill(store, range(5))
+        with open(store.path, "ab") as f:
+            f.write(b'{"timestamp": 5, "path": "/torn\n[1, 2]\n')
+        fill(store, range(6, 9))
+
+        store.rotate()
+
+        assert not store.path.exists() and not store.sealing_path.exists()
+        assert [r["timestamp"] for r in store.query(AuditQuery())] == [0, 1, 2, 3, 4, 6, 7, 8]
+        assert store.stats()["corrupt_lines"] == 2
+        assert len(store.segments) == 1
+
+    def test_query_skips_corrupt_lines_in_active_file(self, store):
+        """Test that queries over the active file skip corrupt lines"""
+        fill(store, range(2))
+        with open(store.path, "ab") as f:
+            f.write(b"not json\n")
+        fill(store, range(2, 4))
+
+        assert [r["timestamp"] for r in store.query(AuditQuery())] == [0, 1, 2, 3]
+
+    def test_retention(self, tmp_path):
+        """Test that only the newest segments are kept"""
+        log = AuditLog(path=str(tmp_path / "audit.log"), max_segments=2)
+        try:
+            for start in (0, 10, 20):
+                fill(log, range(start, start + 10))
+                log.rotate()
+
+            assert len(log.segments) == 2
+            assert len(list(log.segment_dir.glob("*.log.gz"))) == 2
+            assert min(r["timestamp"] for r in log.query(AuditQuery())) == 10
+        finally:
+            log.stop()
+
+    def test_workers_share_segments(self, tmp_path):
+        """Test that segments sealed by one worker are queried and pruned by another"""
+        path = str(tmp_path / "audit.log")
+        first = AuditLog(path=path, max_segments=2)
+        second = AuditLog(path=path, max_segments=2)
+        first.start()
+        second.start()
+        try:
+            fill(first, range(0, 10))
+            first.rotate()
+            fill(second, range(10, 20))
+
+            assert [r["timestamp"] for r in second.query(AuditQuery(end=4))] == [0, 1, 2, 3, 4]
+            assert len(list(first.query(AuditQuery()))) == 20
+
+            first.rotate()
+            fill(second, range(20, 30))
+            second.rotate()
+
+            assert len(list(first.segment_dir.glob("*.log.gz"))) == 2
+            assert min(r["timestamp"] for r in first.query(AuditQuery())) == 10
+            assert first.stats()["segments"] == 2
+        finally:
+            first.stop()
+            second.stop()
+
+
+class TestAuditEndpoint:
+    """Test suite for GET /api/audit"""
+
+    @pytest.fixture(autouse=True)
+    def use_store(self, store, monkeypatch):
+        monkeypatch.setattr(audit_routes, "audit_log", store)
+
+    def test_requires_auth(self, client):
+        """Test that the audit log is not public"""
+        assert client.get("/api/audit/").status_code == 401
+
+    def test_streams_matching_records(self, client, auth_headers, store):
+        """Test filtering by time range and path"""
+        fill(store, range(20), path="/api/agents/")
+        fill(store, range(20, 25), path="/api/knowledge/search")
+        store.rotate()
+
+        response = client.get(
+            "/api/audit/",
+            params={"start": 10, "path": "/api/knowledge/search"},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        records = [loads(line) for line in response.text.splitlines()]
+        assert [r["timestamp"] for r in records] == [20, 21, 22, 23, 24]
+
+    def test_iso_timestamps(self, client, auth_headers, store):
+        """Test that ISO 8601 bounds are accepted"""
+        fill(store, [0.0, 86400.0 * 2])
+
+        response = client.get(
+            "/api/audit/",
+            params={"start": "1970-01-02T00:00:00+00:00"},
+            headers=auth_headers,
+        )
+        assert [loads(line)["timestamp"] for line in response.text.splitlines()] == [172800.0]
+
+    def test_rejects_bad_time(self, client, auth_headers):
+        """Test that malformed bounds are a client error"""
+        response = client.get("/api/audit/", params={"end": "yesterday"}, headers=auth_headers)
+        assert response.status_code == 400
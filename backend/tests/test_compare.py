@@ -0,0 +1,132 @@
+"""
+Tests for multi-model compare runs
+"""
+
+import pytest
+from fastapi import status
+
+from app.config import settings
+from app.routes import agents
+
+MODELS = ["gpt-4", "claude-3-opus", "gemini-pro"]
+
+
+def _compare_request(models=MODELS):
+    return {
+        "agent_id": "test-agent",
+        "models": models,
+        "messages": [{"role": "user", "content": "Compare me"}],
+    }
+
+
+def _receive_all(websocket):
+    events = []
+    while True:
+        event = websocket.receive_json()
+        events.append(event)
+        if event.get("done"):
+            return events
+
+
+@pytest.fixture
+def broken_model(monkeypatch):
+    """Make runs against the "broken" model fail"""
+    build = agents.build_run_context
+
+    def build_or_fail(request, model=None):
+        if model == "broken":
+            raise RuntimeError("provider unavailable")
+        return build(request, model=model)
+
+    monkeypatch.setattr(agents, "build_run_context", build_or_fail)
+
+
+@pytest.mark.websocket
+class TestCompareStream:
+    """Test suite for compare runs over the WebSocket"""
+
+    def test_tokens_interleave_by_model(self, client):
+        """Test that all models stream concurrently on one socket"""
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({"action": "compare", **_compare_request()})
+            events = _receive_all(websocket)
+
+        assert events[0]["type"] == "start"
+        assert events[0]["models"] == MODELS
+
+        tokens = [event for event in events if event["type"] == "token"]
+        assert {event["model"] for event in tokens[:len(MODELS)]} == set(MODELS)
+        for model in MODELS:
+            text = "".join(event["content"] for event in tokens if event["model"] == model)
+            assert text.strip()
+
+        assert sum(event["type"] == "model_complete" for event in events) == len(MODELS)
+        assert [event["seq"] for event in events] == list(range(1, len(events) + 1))
+
+    def test_complete_event_has_timings(self, client):
+        """Test that the comparison takes as long as the slowest model, not the sum"""
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({"action": "compare", **_compare_request()})
+            complete = _receive_all(websocket)[-1]
+
+        assert complete["type"] == "complete"
+        results = complete["models"]
+        assert set(results) == set(MODELS)
+        for result in results.values():
+            assert 0 < result["ttft_ms"] <= result["duration_ms"]
+            assert result["usage"]["completion_tokens"] > 0
+        durations = [result["duration_ms"] for result in results.values()]
+        assert complete["duration_ms"] < sum(durations) * 0.6
+
+    def test_one_model_failing(self, client, broken_model):
+        """Test that a failing model does not end the other streams"""
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({"action": "compare", **_compare_request(["gpt-4", "broken"])})
+            events = _receive_all(websocket)
+
+        errors = [event for event in events if event["type"] == "model_error"]
+        assert [event["model"] for event in errors] == ["broken"]
+        assert events[-1]["type"] == "complete"
+        assert events[-1]["models"]["broken"]["error"] == "provider unavailable"
+        assert "usage" in events[-1]["models"]["gpt-4"]
+
+    def test_invalid_compare(self, client):
+        """Test that duplicate models are rejected"""
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({"action": "compare", **_compare_request(["gpt-4", "gpt-4"])})
+            event = websocket.receive_json()
+
+        assert event["type"] == "error"
+        assert "unique" in event["error"]
+
+
+class TestCompareRest:
+    """Test suite for POST /agents/compare"""
+
+    def test_compare(self, client, auth_headers):
+        """Test that every model answers and the models run concurrently"""
+        response = client.post("/api/agents/compare", json=_compare_request(), headers=auth_headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert set(data["results"]) == set(MODELS)
+        for model, result in data["results"].items():
+            assert result["metadata"]["model"] == model
+            assert result["message"]["role"] == "assistant"
+        assert data["duration_ms"] < sum(r["duration_ms"] for r in data["results"].values()) * 0.6
+
+    def test_compare_partial_failure(self, client, auth_headers, broken_model):
+        """Test that a failing model is reported in its own result"""
+        response = client.post("/api/agents/compare", json=_compare_request(["gpt-4", "broken"]), headers=auth_headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        results = response.json()["results"]
+        assert results["broken"]["error"] == "provider unavailable"
+        assert results["gpt-4"]["error"] is None
+
+    def test_too_many_models(self, client, auth_headers, monkeypatch):
+        """Test that the fan-out is capped"""
+        monkeypatch.setattr(settings, "COMPARE_MAX_MODELS", 2)
+        response = client.post("/api/agents/compare", json=_compare_request(), headers=auth_headers)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,217 @@
+"""
+Tests for WebSocket heartbeats, idle reaping and connection limits
+"""
+
+import time
+
+import pytest
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from app.routes import agents as agents_routes
+from app.services.connections import Connection, ConnectionManager, TokenBucket, client_identity
+from app.services.unix_socket import PEER_CREDENTIALS, PeerCredentials
+
+RUN = {"action": "run", "agent_id": "agent-1", "messages": [{"role": "user", "content": "Hello"}]}
+
+# Everything off, so each test turns on only what it checks
+NO_LIMITS = dict(
+    heartbeat_interval=0,
+    heartbeat_timeout=0,
+    idle_timeout=0,
+    max_per_client=0,
+    max_runs=0,
+    max_buffered_bytes=0,
+    message_rate=0,
+    message_burst=1,
+)
+
+
+@pytest.fixture
+def use_manager(monkeypatch):
+    """Install a connection manager with the given limits in the stream route"""
+    def use(**limits):
+        manager = ConnectionManager(**{**NO_LIMITS, **limits})
+        monkeypatch.setattr(agents_routes, "connection_manager", manager)
+        return manager
+    return use
+
+
+def _until_done(websocket):
+    events = []
+    while not events or not events[-1].get("done"):
+        events.append(websocket.receive_json())
+    return events
+
+
+class TestHeartbeat:
+    """Test suite for server-initiated heartbeats"""
+
+    def test_answered_pings_keep_the_connection(self, client, use_manager):
+        """Test that a client answering pings stays connected"""
+        manager = use_manager(heartbeat_interval=0.05, heartbeat_timeout=0.2)
+
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            for _ in range(3):
+                assert websocket.receive_json()["type"] == "ping"
+                websocket.send_json({"action": "pong"})
+            websocket.send_json({"action": "ping"})
+            while (event := websocket.receive_json())["type"] == "ping":
+                websocket.send_json({"action": "pong"})
+            assert event["type"] == "pong"
+
+        assert manager.counts["pongs"] >= 3
+        assert manager.counts["heartbeat_timeouts"] == 0
+
+    def test_unanswered_ping_closes(self, client, use_manager):
+        """Test that a half-open client is closed after the heartbeat timeout"""
+        manager = use_manager(heartbeat_interval=0.05, heartbeat_timeout=0.1)
+
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            assert websocket.receive_json()["type"] == "ping"
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_json()
+
+        assert closed.value.code == 1001
+        assert manager.counts["heartbeat_timeouts"] == 1
+        assert manager.stats()["active"] == 0
+
+
+class TestIdleReaping:
+    """Test suite for closing idle connections"""
+
+    def test_idle_connection_closes(self, client, use_manager):
+        """Test that a connection without runs or actions is closed"""
+        manager = use_manager(idle_timeout=0.1)
+
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_json()
+
+        assert closed.value.code == 1000
+        assert manager.counts["idle_closed"] == 1
+
+    def test_running_connection_is_not_idle(self, client, use_manager):
+        """Test that a run longer than the idle timeout streams to completion"""
+        use_manager(idle_timeout=0.1)
+
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json(RUN)
+            events = _until_done(websocket)
+
+        assert events[-1]["type"] == "complete"
+
+
+class TestLimits:
+    """Test suite for per-client and per-connection caps"""
+
+    def test_connections_per_client(self, client, use_manager):
+        """Test that connections over the per-client limit are refused"""
+        manager = use_manager(max_per_client=1)
+
+        with client.websocket_connect("/api/agents/stream"):
+            with client.websocket_connect("/api/agents/stream") as second:
+                with pytest.raises(WebSocketDisconnect) as closed:
+                    second.receive_json()
+            assert manager.stats()["clients"] == 1
+
+        assert closed.value.code == 1008
+        assert manager.counts["rejected"] == 1
+        assert manager.per_client == {}
+
+    @pytest.mark.parametrize("peer, forwarded, expected", [
+        ("203.0.113.5", "198.51.100.1", "203.0.113.5"),  # Not a proxy: the header is ignored
+        ("172.28.0.10", "198.51.100.1", "198.51.100.1"),
+        ("172.28.0.10", "198.51.100.1, 10.0.0.7", "10.0.0.7"),  # Spoofed entries come first
+        ("172.28.0.10", "198.51.100.1, 172.28.0.3", "198.51.100.1"),  # Chained trusted proxies
+        ("172.28.0.10", None, "172.28.0.10"),
+    ])
+    def test_client_identity_behind_proxy(self, peer, forwarded, expected):
+        """Test that connections through a trusted proxy are attributed to the forwarded client"""
+        headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+        websocket = WebSocket({"type": "websocket", "client": (peer, 40000), "headers": headers}, None, None)
+
+        assert client_identity(websocket, ["172.28.0.0/24"]) == expected
+
+    def test_client_identity_over_unix_socket(self):
+        """Test that Unix socket peers are identified by user id"""
+        scope = {
+            "type": "websocket",
+            "client": None,
+            "headers": [],
+            "extensions": {PEER_CREDENTIALS: PeerCredentials(uid=1000, gid=1000)},
+        }
+
+        assert client_identity(WebSocket(scope, None, None), []) == "uid:1000"
+
+    def test_concurrent_runs(self, client, use_manager):
+        """Test that runs share a connection up to the limit"""
+        manager = use_manager(max_runs=2)
+
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            for _ in range(3):
+                websocket.send_json(RUN)
+            events = [websocket.receive_json() for _ in range(3)]
+            while sum(event.get("type") == "complete" for event in events) < 2:
+                events.append(websocket.receive_json())
+
+        errors = [event for event in events if event["type"] == "error"]
+        assert len(errors) == 1
+        assert "Too many concurrent runs" in errors[0]["error"]
+        run_ids = {event["run_id"] for event in events if event["type"] == "start"}
+        assert len(run_ids) == 2
+        assert {event["run_id"] for event in events if event["type"] == "token"} <= run_ids
+        assert manager.counts["runs_rejected"] == 1
+
+    def test_message_rate(self, client, use_manager):
+        """Test that messages beyond the burst are refused, pongs excepted"""
+        manager = use_manager(message_rate=0.5, message_burst=2)
+
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({"action": "pong"})
+            for _ in range(3):
+                websocket.send_json({"action": "ping"})
+            replies = [websocket.receive_json() for _ in range(3)]
+
+        assert [reply["type"] for reply in replies] == ["pong", "pong", "error"]
+        assert manager.counts["messages_rate_limited"] == 1
+
+    def test_slow_consumer(self):
+        """Test that a connection whose unsent frames exceed the cap is closed"""
+        manager = ConnectionManager(**{**NO_LIMITS, "max_buffered_bytes": 100})
+        connection = Connection(websocket=None, client="127.0.0.1", manager=manager)
+
+        assert connection.send_json({"type": "token", "content": "x" * 40})
+        assert not connection.send_json({"type": "token", "content": "x" * 40})
+
+        assert connection.closing
+        assert connection.close_code == 1013
+        assert not connection.send_json({"type": "pong"})
+        assert manager.counts["slow_consumers"] == 1
+
+
+class TestStats:
+    """Test suite for connection metrics"""
+
+    def test_stats_track_open_connections(self, client, use_manager):
+        """Test that stats count open connections, clients and limits"""
+        manager = use_manager(max_runs=4)
+
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({"action": "ping"})
+            websocket.receive_json()
+            stats = manager.stats()
+
+        assert stats["active"] == 1
+        assert stats["clients"] == 1
+        assert stats["limits"]["max_runs_per_connection"] == 4
+        assert manager.stats()["active"] == 0
+        assert manager.counts["opened"] == manager.counts["closed"] == 1
+
+    def test_token_bucket(self):
+        """Test that the bucket allows a burst and then refills at the rate"""
+        bucket = TokenBucket(rate=100.0, burst=2)
+
+        assert bucket.take() and bucket.take()
+        assert not bucket.take()
+        time.sleep(0.02)
+        assert bucket.take()
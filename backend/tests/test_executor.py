@@ -0,0 +1,147 @@
+"""
+Tests for the shared thread and process pools
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services import embeddings
+from app.services.embeddings import HashingEmbedder
+from app.services.executor import Executors, offload
+
+request_name = contextvars.ContextVar("request_name", default=None)
+
+
+@pytest.fixture(scope="module")
+def pools():
+    pools = Executors(threads=2, processes=2, preload=["numpy"])
+    pools.start()
+    yield pools
+    asyncio.run(pools.shutdown())
+
+
+@pytest.fixture
+def use_pools(pools, monkeypatch):
+    monkeypatch.setattr("app.services.executor.executors", pools)
+    return pools
+
+
+@offload("process")
+def square(x):
+    return x * x
+
+
+@offload("thread")
+def current_thread_name():
+    return threading.current_thread().name
+
+
+def fail():
+    raise ValueError("boom")
+
+
+class TestExecutors:
+    """Test suite for task submission and metrics"""
+
+    def test_thread_pool_keeps_context(self, pools):
+        """Test that thread tasks see the caller's context variables"""
+        async def scenario():
+            request_name.set("req-1")
+            return await pools.run_in_thread(request_name.get)
+
+        assert asyncio.run(scenario()) == "req-1"
+        assert pools.stats()["thread"]["completed"] >= 1
+
+    def test_process_pool_runs_elsewhere(self, pools):
+        """Test that process tasks run in a worker process"""
+        assert asyncio.run(pools.run_in_process(os.getpid)) != os.getpid()
+
+    def test_offload_decorator(self, use_pools):
+        """Test the decorator for both pools and the inline variant"""
+        async def scenario():
+            return await square(12), await current_thread_name()
+
+        squared, thread_name = asyncio.run(scenario())
+
+        assert squared == 144
+        assert square.sync(3) == 9
+        assert thread_name.startswith("offload")
+
+    def test_errors_propagate(self, pools):
+        """Test that task exceptions reach the caller and are counted"""
+        failed = pools.stats()["process"]["failed"]
+
+        with pytest.raises(ValueError, match="boom"):
+            asyncio.run(pools.run_in_process(fail))
+
+        assert pools.stats()["process"]["failed"] == failed + 1
+
+    def test_cancelled_caller_does_not_break_completion(self, caplog):
+        """Test that a task whose caller gave up still finishes and is counted"""
+        pools = Executors(threads=1, processes=0)
+        release = threading.Event()
+        try:
+            future = pools.submit("thread", release.wait, 5)
+            assert future.cancel()
+            release.set()
+
+            later = pools.submit("thread", time.sleep, 0)
+            later.result(timeout=5)
+            stats = pools.stats()["thread"]
+            assert stats["completed"] == 2
+            assert stats["failed"] == 0
+            assert "exception calling callback" not in caplog.text
+        finally:
+            asyncio.run(pools.shutdown())
+
+    def test_queue_depth_and_timings(self):
+        """Test that tasks beyond the worker count show up as queued"""
+        pools = Executors(threads=1, processes=0)
+        try:
+            futures = [pools.submit("thread", time.sleep, 0.1) for _ in range(3)]
+            time.sleep(0.02)
+            assert pools.stats()["thread"]["queue_depth"] == 2
+
+            for future in futures:
+                future.result()
+            stats = pools.stats()["thread"]
+            assert stats["completed"] == 3
+            assert stats["task_time"]["mean_ms"] >= 100
+            assert stats["queue_wait"]["max_ms"] >= 150
+        finally:
+            asyncio.run(pools.shutdown())
+
+    def test_rejects_unpicklable_targets(self):
+        """Test that nested functions cannot be offloaded to processes"""
+        with pytest.raises(ValueError, match="module level"):
+            @offload("process")
+            def nested(x):
+                return x
+
+        with pytest.raises(RuntimeError, match="disabled"):
+            Executors(threads=1, processes=0).submit("process", os.getpid)
+
+    def test_parallel_embedding_matches_serial(self, use_pools, monkeypatch):
+        """Test that large embedding batches split across processes give the same vectors"""
+        monkeypatch.setattr(embeddings, "executors", use_pools)
+        monkeypatch.setattr(settings, "EXECUTOR_PROCESS_MIN_BATCH", 4)
+        texts = [f"document number {i} about offloading feature hashing" for i in range(9)]
+        embedder = HashingEmbedder(64)
+        submitted = use_pools.stats()["process"]["submitted"]
+
+        vectors = embedder.embed_batch(texts)
+
+        assert np.allclose(vectors, np.vstack([embedder.embed(text) for text in texts]))
+        assert use_pools.stats()["process"]["submitted"] == submitted + 2
+
+    def test_metrics_endpoint(self, client, auth_headers):
+        """Test that pool metrics are exposed"""
+        response = client.get("/api/health/metrics", headers=auth_headers)
+        assert set(response.json()["executors"]) >= {"thread", "process"}
@@ -2,9 +2,13 @@
 Tests for health check endpoints
 """
 
+import asyncio
+
 import pytest
 from fastapi import status
 
+from app.services.readiness import readiness
+
 
 class TestHealthEndpoints:
     """Test suite for health check endpoints"""
@@ -32,6 +36,8 @@ class TestHealthEndpoints:
     
     def test_readiness_check(self, client):
         """Test readiness check"""
+        # Without the lifespan nothing has probed yet; readiness would be "starting"
+        asyncio.run(readiness.refresh())
         response = client.get("/api/health/ready")
         
         assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,251 @@
+"""
+Tests for conversation history search
+"""
+
+import asyncio
+
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine
+
+from app.routes import agents as agents_routes
+from app.routes import history as history_routes
+from app.services.history import ConversationHistory, HistoryStore, SearchFilters, highlight
+
+
+def _message(conversation_id, content, role="user", agent_id="agent-1", created_at=1000.0):
+    return {
+        "conversation_id": conversation_id,
+        "agent_id": agent_id,
+        "role": role,
+        "content": content,
+        "model": None,
+        "created_at": created_at,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    yield HistoryStore(engine_factory=lambda: engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def populated(store):
+    store.append([
+        _message("c1", "How do I configure the database connection pool?"),
+        _message("c1", "Set the pool size in the database settings.", role="assistant"),
+        _message("c2", "Write a poem about the sea", agent_id="agent-2", created_at=2000.0),
+        _message("c2", "The sea is wide, the database is not.", role="assistant", agent_id="agent-2", created_at=2000.0),
+        _message("c3", "Database database database: why is my database slow?", created_at=3000.0),
+    ])
+    return store
+
+
+def _ids(results):
+    return [result["id"] for result in results]
+
+
+class TestHistorySearch:
+    """Test suite for the full-text history index"""
+
+    def test_uses_fts5(self, populated):
+        """Test that SQLite builds with FTS5 use the full-text index"""
+        assert populated.backend == "fts5"
+
+    def test_ranked_results_with_snippets(self, populated):
+        """Test that denser matches rank first and snippets mark the matches"""
+        results, next_cursor = populated.search("database")
+
+        assert len(results) == 4
+        assert results[0]["conversation_id"] == "c3"
+        assert results[0]["score"] >= results[-1]["score"]
+        assert "<mark>database</mark>" in results[1]["snippet"]
+        assert "content" not in results[0]
+        assert next_cursor is None
+
+    def test_prefix_and_all_terms(self, populated):
+        """Test that terms match word prefixes and must all match"""
+        assert len(populated.search("conf")[0]) == 1
+        assert len(populated.search("database pool")[0]) == 2
+        assert populated.search("database giraffe")[0] == []
+
+    def test_filters(self, populated):
+        """Test filtering by agent, role, conversation and date"""
+        def count(**filters):
+            return len(populated.search("database", SearchFilters(**filters))[0])
+
+        assert count(agent_id="agent-2") == 1
+        assert count(role="assistant") == 2
+        assert count(conversation_id="c1") == 2
+        assert count(start=1500.0, end=3000.0) == 1
+
+    @pytest.mark.parametrize("sort", ["relevance", "recent"])
+    def test_cursor_pagination(self, populated, sort):
+        """Test that pages cover every result once, in order"""
+        full, _ = populated.search("database", sort=sort, limit=10)
+        pages, cursor = [], None
+        while True:
+            results, cursor = populated.search("database", sort=sort, cursor=cursor, limit=1)
+            pages.extend(results)
+            if cursor is None:
+                break
+
+        assert _ids(pages) == _ids(full)
+        if sort == "recent":
+            assert _ids(full) == sorted(_ids(full), reverse=True)
+
+    def test_cursor_must_match_sort(self, populated):
+        """Test that cursors are checked"""
+        _, cursor = populated.search("database", sort="recent", limit=1)
+
+        with pytest.raises(ValueError):
+            populated.search("database", sort="relevance", cursor=cursor)
+        with pytest.raises(ValueError):
+            populated.search("database", cursor="not-a-cursor")
+
+    def test_index_follows_deletes(self, populated):
+        """Test that deleted conversations disappear from search"""
+        assert populated.delete_conversation("c3") == 1
+
+        results, _ = populated.search("slow")
+        assert results == []
+
+    def test_index_built_for_existing_messages(self, tmp_path):
+        """Test that messages written before the index existed are indexed"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        legacy = HistoryStore(engine_factory=lambda: engine)
+        legacy.append([_message("c1", "an old message about kubernetes")])
+        with engine.begin() as connection:
+            connection.exec_driver_sql("DROP TABLE conversation_messages_fts")
+
+        upgraded = HistoryStore(engine_factory=lambda: engine)
+        assert len(upgraded.search("kube")[0]) == 1
+        engine.dispose()
+
+    def test_substring_fallback(self, populated):
+        """Test the search used without a full-text index"""
+        populated.backend = "substring"
+
+        results, cursor = populated.search("datab", limit=3)
+        assert len(results) == 3
+        assert _ids(results) == sorted(_ids(results), reverse=True)
+        rest, _ = populated.search("datab", cursor=cursor, limit=3)
+        assert len(rest) == 1
+
+    def test_snippet_is_escaped(self):
+        """Test that snippets are safe to render as HTML"""
+        snippet = highlight("<script>alert(1)</script> the database " + "word " * 50, ["datab"])
+
+        assert "&lt;script&gt;" in snippet
+        assert "<mark>database</mark>" in snippet
+        assert snippet.endswith("…")
+
+
+class TestHistoryRecording:
+    """Test suite for recording runs into the history"""
+
+    def test_only_new_messages_are_recorded(self, store):
+        """Test that a run records the user messages after the last answer"""
+        history = ConversationHistory(store=store, flush_interval=60)
+        history.record_turn("c1", "agent-1", [
+            {"role": "system", "content": "Be brief"},
+            {"role": "user", "content": "first question"},
+            {"role": "assistant", "content": "first answer"},
+            {"role": "user", "content": "second question"},
+            {"role": "user", "content": "with more detail"},
+        ], "second answer", model="gpt-4")
+        asyncio.run(history.flush())
+
+        messages, _ = store.conversation("c1")
+        assert [(m["role"], m["content"]) for m in messages] == [
+            ("user", "second question"),
+            ("user", "with more detail"),
+            ("assistant", "second answer"),
+        ]
+        assert messages[-1]["model"] == "gpt-4"
+        assert history.stats()["flushed"] == 3
+
+    def test_failed_flush_is_retried(self, store):
+        """Test that messages survive a failed flush"""
+        history = ConversationHistory(store=store, flush_interval=60)
+        history.record_turn("c1", "agent-1", [{"role": "user", "content": "hello"}], "hi")
+        engine_factory, store.engine_factory = store.engine_factory, None
+        asyncio.run(history.flush())
+
+        assert history.stats()["pending"] == 2
+        store.engine_factory = engine_factory
+        asyncio.run(history.flush())
+        assert len(store.conversation("c1")[0]) == 2
+
+    def test_pending_is_bounded(self, store):
+        """Test that the oldest messages are dropped while flushes keep failing"""
+        history = ConversationHistory(store=store, flush_interval=60, max_pending=3)
+        store.engine_factory = None
+        for n in range(2):
+            history.record_turn("c1", "agent-1", [{"role": "user", "content": f"question {n}"}], f"answer {n}")
+            asyncio.run(history.flush())
+
+        assert [m["content"] for m in history.pending] == ["answer 0", "question 1", "answer 1"]
+        assert history.stats()["dropped"] == 1
+        assert history.stats()["flush_errors"] == 2
+
+
+class TestHistoryEndpoints:
+    """Test suite for the history API"""
+
+    @pytest.fixture
+    def history(self, monkeypatch, store):
+        history = ConversationHistory(store=store, flush_interval=60)
+        monkeypatch.setattr(history_routes, "conversation_history", history)
+        monkeypatch.setattr(agents_routes, "conversation_history", history)
+        return history
+
+    def test_import_search_and_page(self, client, auth_headers, history):
+        """Test importing messages, searching them and reading a conversation"""
+        response = client.post("/api/history/messages", json={"messages": [
+            {"conversation_id": "c1", "agent_id": "agent-1", "role": "user", "content": f"deploy step {i}"}
+            for i in range(5)
+        ]}, headers=auth_headers)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(response.json()["ids"]) == 5
+
+        page = client.get("/api/history/search", params={"q": "deploy", "limit": 3}, headers=auth_headers).json()
+        assert len(page["results"]) == 3
+        assert page["search_backend"] == "fts5"
+        rest = client.get(
+            "/api/history/search", params={"q": "deploy", "limit": 3, "cursor": page["next_cursor"]}, headers=auth_headers,
+        ).json()
+        assert len(rest["results"]) == 2 and rest["next_cursor"] is None
+
+        conversation = client.get("/api/history/conversations/c1", params={"limit": 4}, headers=auth_headers).json()
+        assert [m["content"] for m in conversation["messages"]][0] == "deploy step 0"
+        assert conversation["next_cursor"]
+
+    def test_bad_requests(self, client, auth_headers, history):
+        """Test that bad sorts and cursors are a 400 and unknown conversations a 404"""
+        bad_sort = client.get("/api/history/search", params={"q": "x", "sort": "oldest"}, headers=auth_headers)
+        bad_cursor = client.get("/api/history/search", params={"q": "x", "cursor": "zzz"}, headers=auth_headers)
+        missing = client.delete("/api/history/conversations/nope", headers=auth_headers)
+
+        assert bad_sort.status_code == status.HTTP_400_BAD_REQUEST
+        assert bad_cursor.status_code == status.HTTP_400_BAD_REQUEST
+        assert missing.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_runs_are_recorded(self, client, auth_headers, history):
+        """Test that runs with a conversation_id land in the history"""
+        client.post("/api/agents/run", json={
+            "agent_id": "agent-1",
+            "messages": [{"role": "user", "content": "Explain idempotency keys"}],
+            "metadata": {"conversation_id": "c9"},
+        }, headers=auth_headers)
+        client.post("/api/agents/run", json={
+            "agent_id": "agent-1",
+            "messages": [{"role": "user", "content": "Not part of any conversation"}],
+        }, headers=auth_headers)
+        asyncio.run(history.flush())
+
+        results = client.get("/api/history/search", params={"q": "idempotency"}, headers=auth_headers).json()["results"]
+        assert [r["conversation_id"] for r in results] == ["c9"]
+        assert history.stats()["recorded"] == 2
@@ -106,3 +106,76 @@ class TestWebSocketIntegration:
             start_event = websocket.receive_json()
             assert start_event["type"] == "start"
             assert start_event["agent_id"] == "agent-2"
+    
+    def test_websocket_events_have_sequence_numbers(self, client):
+        """Test that streamed events carry a run ID and increasing sequence numbers"""
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({
+                "action": "run",
+                "agent_id": "agent-1",
+                "messages": [{"role": "user", "content": "Hello"}],
+            })
+            
+            start_event = websocket.receive_json()
+            assert start_event["run_id"].startswith("run_")
+            
+            seqs = [start_event["seq"]]
+            while True:
+                event = websocket.receive_json()
+                seqs.append(event["seq"])
+                if event["done"]:
+                    break
+            
+            assert seqs == list(range(1, len(seqs) + 1))
+    
+    def test_websocket_resume_after_disconnect(self, client):
+        """Test that a reconnecting client receives the events it missed"""
+        # One portal for both connections, so the run outlives the first one as on a server
+        with client:
+            with client.websocket_connect("/api/agents/stream") as websocket:
+                websocket.send_json({
+                    "action": "run",
+                    "agent_id": "agent-1",
+                    "messages": [{"role": "user", "content": "Hello"}],
+                })
+                start_event = websocket.receive_json()
+                first_token = websocket.receive_json()
+        
+            with client.websocket_connect("/api/agents/stream") as websocket:
+                websocket.send_json({
+                    "action": "resume",
+                    "run_id": start_event["run_id"],
+                    "last_seq": first_token["seq"],
+                })
+            
+                events = []
+                while True:
+                    event = websocket.receive_json()
+                    events.append(event)
+                    if event["done"]:
+                        break
+        
+        assert events[0]["seq"] == first_token["seq"] + 1
+        assert events[-1]["type"] == "complete"
+    
+    def test_websocket_resume_unknown_run(self, client):
+        """Test resuming a run that does not exist"""
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({"action": "resume", "run_id": "run_missing", "last_seq": 0})
+            
+            response = websocket.receive_json()
+            assert response["type"] == "error"
+            assert "Unknown or expired run" in response["error"]
+    
+    def test_websocket_resume_invalid_last_seq(self, client):
+        """Test that a malformed last_seq is reported without closing the connection"""
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            for last_seq in ("abc", None, -1, True):
+                websocket.send_json({"action": "resume", "run_id": "run_missing", "last_seq": last_seq})
+                response = websocket.receive_json()
+                assert response["type"] == "error"
+                assert response["done"] is True
+                assert "Invalid last_seq" in response["error"]
+            
+            websocket.send_json({"action": "ping"})
+            assert websocket.receive_json()["type"] == "pong"
@@ -0,0 +1,64 @@
+"""
+Tests for the load benchmark's measurements and baseline comparison
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from benchmarks.bench_load import compare, percentiles, process_resources, resource_summary, worker_pids
+
+
+def _report(throughput, p99, rss):
+    return {
+        "rest": {"throughput_rps": throughput, "latency_ms": {"p50": 10.0, "p95": 20.0, "p99": p99}},
+        "resources": {"rss_mb_max": rss},
+    }
+
+
+class TestLoadBenchmark:
+    """Test suite for the load benchmark helpers"""
+
+    def test_percentiles(self):
+        """Test nearest-rank percentiles of latency samples"""
+        summary = percentiles([float(ms) for ms in range(1, 101)])
+
+        assert summary["p50"] == 51.0
+        assert summary["p95"] == 96.0
+        assert summary["p99"] == 100.0
+        assert summary["mean"] == 50.5
+        assert percentiles([]) == {}
+
+    def test_resource_summary_tracks_drift(self):
+        """Test start, end and peak values per worker"""
+        summary = resource_summary([
+            {"t": 0, "workers": {"1": {"rss_mb": 60.0, "fds": 20}}},
+            {"t": 5, "workers": {"1": {"rss_mb": 90.0, "fds": 35}}},
+            {"t": 10, "workers": {"1": {"rss_mb": 80.0, "fds": 30}}},
+        ])
+
+        worker = summary["workers"]["1"]
+        assert (worker["rss_mb_start"], worker["rss_mb_end"], worker["rss_mb_max"]) == (60.0, 80.0, 90.0)
+        assert (worker["fds_start"], worker["fds_end"], worker["fds_max"]) == (20, 30, 35)
+        assert summary["fds_max"] == 35
+
+    def test_compare_flags_regressions_by_direction(self):
+        """Test that lower throughput and higher latency or memory regress"""
+        baseline = _report(throughput=100.0, p99=50.0, rss=100.0)
+
+        assert compare(_report(95.0, 52.0, 105.0), baseline, tolerance=0.10) == []
+        assert compare(_report(80.0, 40.0, 100.0), baseline, tolerance=0.10) == ["rest.throughput_rps"]
+        assert compare(_report(120.0, 70.0, 130.0), baseline, tolerance=0.10) == [
+            "rest.latency_ms.p99",
+            "resources.rss_mb_max",
+        ]
+
+    @pytest.mark.skipif(not Path("/proc/self/status").exists(), reason="Reads /proc")
+    def test_process_resources(self):
+        """Test reading RSS and descriptors of a running process"""
+        resources = process_resources(os.getpid())
+
+        assert resources["rss_mb"] > 0
+        assert resources["fds"] > 0
+        assert worker_pids(os.getpid(), workers=1) == [os.getpid()]
@@ -0,0 +1,109 @@
+"""
+Tests for the structured logging pipeline
+"""
+
+import io
+import json
+import pytest
+import structlog
+
+from app.services.log_pipeline import EventSampler, LogPipeline
+
+
+@pytest.fixture
+def pipeline():
+    stream = io.StringIO()
+    pipeline = LogPipeline()
+    pipeline.configure(
+        level="INFO",
+        log_format="json",
+        sample_rates={"http_request:/api/health": 0.0},
+        rate_limits={"chatty": 2},
+        stream=stream,
+    )
+    pipeline.start()
+    yield pipeline, stream
+    pipeline.stop()
+    structlog.reset_defaults()
+
+
+def emitted(pipeline, stream):
+    pipeline.stop()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestEventSampler:
+    """Test suite for event sampling"""
+    
+    def test_sampling_by_event_and_path(self):
+        """Test that matching events are dropped at a zero sample rate"""
+        sampler = EventSampler({"http_request:/api/health": 0.0}, {})
+        
+        with pytest.raises(structlog.DropEvent):
+            sampler(None, "info", {"event": "http_request", "path": "/api/health/ping"})
+        
+        kept = {"event": "http_request", "path": "/api/agents/run"}
+        assert sampler(None, "info", kept) is kept
+        assert sampler.sampled_out == 1
+    
+    def test_errors_are_never_sampled(self):
+        """Test that errors and failed requests always pass"""
+        sampler = EventSampler({"http_request": 0.0}, {"http_request": 0})
+        
+        sampler(None, "error", {"event": "http_request", "path": "/"})
+        sampler(None, "info", {"event": "http_request", "path": "/", "status_code": 503})
+        
+        assert sampler.sampled_out == 0
+    
+    def test_rate_limit(self):
+        """Test that events beyond the per-second cap are dropped"""
+        sampler = EventSampler({}, {"chatty": 2})
+        
+        sampler(None, "info", {"event": "chatty"})
+        sampler(None, "info", {"event": "chatty"})
+        with pytest.raises(structlog.DropEvent):
+            sampler(None, "info", {"event": "chatty"})
+        
+        assert sampler.rate_limited == 1
+
+
+class TestLogPipeline:
+    """Test suite for the background log pipeline"""
+    
+    def test_events_are_rendered_in_background(self, pipeline):
+        """Test that events are written as JSON lines by the writer thread"""
+        pipeline, stream = pipeline
+        logger = structlog.get_logger("test")
+        
+        logger.info("agent_run_request", agent_id="agent-1")
+        logger.debug("too_verbose")
+        logger.info("http_request", path="/api/health/ping", status_code=200)
+        logger.warning("http_request", path="/api/health/ping", status_code=200)
+        
+        lines = emitted(pipeline, stream)
+        
+        assert [line["event"] for line in lines] == ["agent_run_request", "http_request"]
+        assert lines[0]["agent_id"] == "agent-1"
+        assert lines[0]["level"] == "info"
+        assert "timestamp" in lines[0]
+        assert lines[1]["level"] == "warning"
+    
+    def test_unserializable_values_are_repr(self, pipeline):
+        """Test that values the JSON backend rejects are logged by repr"""
+        pipeline, stream = pipeline
+        
+        structlog.get_logger("test").info("odd_value", value=object())
+        
+        assert emitted(pipeline, stream)[0]["value"].startswith("<object object")
+    
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test that a full queue counts dropped events"""
+        pipeline = LogPipeline()
+        pipeline.configure(queue_size=1, stream=io.StringIO())
+        try:
+            pipeline.enqueue({"event": "a"})
+            pipeline.enqueue({"event": "b"})
+        finally:
+            structlog.reset_defaults()
+        
+        assert pipeline.stats()["dropped"] == 1
@@ -0,0 +1,92 @@
+"""
+Tests for the event loop monitor
+"""
+
+import asyncio
+import time
+
+from app.services.loop_monitor import LagHistogram, LoopMonitor
+
+
+def blocking_handler():
+    time.sleep(0.2)
+
+
+async def monitored(monitor: LoopMonitor, scenario):
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        await scenario()
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+    return monitor.stats()
+
+
+class TestLagHistogram:
+    """Test suite for the lag histogram"""
+
+    def test_buckets_and_quantiles(self):
+        """Test bucketing and bucket-bound quantiles"""
+        histogram = LagHistogram([1, 10, 100])
+        for lag in [0.5, 0.5, 5, 50, 5000]:
+            histogram.observe(lag)
+
+        stats = histogram.to_dict()
+        assert stats["buckets"] == {"le_1": 2, "le_10": 1, "le_100": 1, "le_inf": 1}
+        assert stats["p50_ms"] == 10.0
+        assert stats["p99_ms"] == 5000.0
+        assert stats["max_ms"] == 5000.0
+
+
+class TestLoopMonitor:
+    """Test suite for lag sampling and block detection"""
+
+    def test_records_lag_samples(self):
+        """Test that an idle loop produces low-lag samples"""
+        monitor = LoopMonitor(interval_ms=10, block_threshold_ms=500)
+
+        stats = asyncio.run(monitored(monitor, lambda: asyncio.sleep(0.1)))
+
+        assert stats["lag"]["count"] >= 5
+        assert stats["blocked"]["count"] == 0
+
+    def test_captures_blocking_stack(self):
+        """Test that a blocking call is reported with its stack"""
+        monitor = LoopMonitor(interval_ms=10, block_threshold_ms=50)
+
+        async def scenario():
+            blocking_handler()
+
+        stats = asyncio.run(monitored(monitor, scenario))
+
+        assert stats["blocked"]["count"] == 1
+        block = stats["blocked"]["recent"][0]
+        assert "blocking_handler" in block["stack"]
+        assert block["lag_ms"] >= 150
+        assert stats["lag"]["max_ms"] >= 150
+
+    def test_slow_callbacks_by_location(self):
+        """Test that debug mode reports slow callbacks by source location"""
+        monitor = LoopMonitor(
+            interval_ms=10,
+            block_threshold_ms=1000,
+            slow_callback_debug=True,
+            slow_callback_ms=50,
+        )
+
+        async def scenario():
+            async def slow_task():
+                blocking_handler()
+            await asyncio.create_task(slow_task())
+
+        stats = asyncio.run(monitored(monitor, scenario))
+
+        locations = stats["slow_callbacks"]
+        assert any("test_loop_monitor.py" in location for location in locations)
+        assert max(entry["max_ms"] for entry in locations.values()) >= 150
+
+    def test_metrics_endpoint(self, client, auth_headers):
+        """Test that loop stats are exposed in the metrics endpoint"""
+        response = client.get("/api/health/metrics", headers=auth_headers)
+        assert "lag" in response.json()["event_loop"]
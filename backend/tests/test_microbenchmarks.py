@@ -0,0 +1,203 @@
+"""
+Microbenchmarks for request hot paths
+
+Each benchmark fails when it is slower than its committed baseline by more
+than the baseline's tolerance (see benchmarks/microbench.py). They are
+skipped under coverage, whose tracing distorts timings; ``make bench-micro``
+runs them without it.
+"""
+
+import asyncio
+import sys
+
+import pytest
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.main import app
+from app.middleware import audit as audit_middleware
+from app.middleware.audit import AuditLogMiddleware
+from app.middleware.auth import AuthMiddleware
+from app.config import settings
+from app.routes.agents import AgentRunRequest
+from app.services.audit_log import AuditLog
+from app.services.serialization import dumps, dumps_str
+from app.services.stream_journal import RunJournal
+from benchmarks.microbench import Baselines, async_batch, sync_batch
+
+
+def _traced() -> bool:
+    try:
+        import coverage
+    except ImportError:
+        coverage = None
+    if coverage is not None and coverage.Coverage.current() is not None:
+        return True
+    return sys.gettrace() is not None
+
+
+pytestmark = [
+    pytest.mark.microbenchmark,
+    pytest.mark.skipif(_traced(), reason="Timings are distorted by coverage tracing; run make bench-micro"),
+]
+
+
+def _scope(path, headers=()):
+    return {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+
+
+async def _asgi_call(asgi, scope):
+    """One request through an ASGI app, with the client waiting until the response ends"""
+    requests = [{"type": "http.request", "body": b"", "more_body": False}]
+    finished = asyncio.Event()
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            finished.set()
+
+    await asgi(dict(scope), receive, send)
+
+
+@pytest.fixture(scope="module")
+def baselines(request):
+    baselines = Baselines()
+    yield baselines
+    baselines.save_results()
+    if request.config.getoption("--microbench-update"):
+        baselines.save_baselines()
+
+
+@pytest.fixture(scope="module")
+def check(request, baselines):
+    update = request.config.getoption("--microbench-update")
+
+    def check(name, batch):
+        result = baselines.check(name, batch)
+        print(result.describe())
+        if not update:
+            assert not result.regressed, result.describe()
+
+    return check
+
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def audit_log(tmp_path_factory):
+    """An audit log in a temporary directory, in place of the app's"""
+    log = AuditLog(path=str(tmp_path_factory.mktemp("audit") / "audit.log"))
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(audit_middleware, "audit_log", log)
+        yield log
+    log.stop()
+
+
+async def _ok(request):
+    return Response()
+
+
+class TestMiddlewareBenchmarks:
+    """Benchmarks for per-request middleware work"""
+
+    def test_auth_dispatch(self, check, loop):
+        """Bearer token check on a protected path"""
+        middleware = AuthMiddleware(app=None)
+        scope = _scope("/api/agents/", [("Authorization", f"Bearer {settings.API_TOKEN}")])
+
+        async def dispatch():
+            await middleware.dispatch(Request(scope), _ok)
+
+        check("auth_dispatch", async_batch(dispatch, loop))
+
+    def test_audit_record(self, check, loop, audit_log):
+        """Building an audit record and handing it to the writer thread"""
+        middleware = AuditLogMiddleware(app=None)
+        scope = _scope("/api/agents/run", [("User-Agent", "bench"), ("X-Request-ID", "req-1")])
+
+        async def dispatch():
+            await middleware.dispatch(Request(scope), _ok)
+
+        check("audit_record", async_batch(dispatch, loop))
+
+    def test_audit_write(self, check, tmp_path):
+        """Serializing and appending a batch of 256 audit records"""
+        # A log of its own, so the later benchmarks' writer thread is not left sealing this backlog
+        audit_log = AuditLog(path=str(tmp_path / "audit.log"))
+        audit_log.start()
+        audit_log.stop()
+        record = {
+            "timestamp": 1700000000.0,
+            "method": "POST",
+            "path": "/api/agents/run",
+            "query_params": {},
+            "client_ip": "127.0.0.1",
+            "user_agent": "bench",
+            "request_id": "req-1",
+            "status_code": 200,
+            "duration_ms": 12.5,
+        }
+        batch = [record] * 256
+
+        check("audit_write_256", sync_batch(lambda: audit_log._write([dumps(item) for item in batch])))
+
+    def test_ping_full_stack(self, check, loop, audit_log):
+        """The whole app, every middleware included, for the cheapest route"""
+        scope = _scope("/api/health/ping")
+        check("ping_full_stack", async_batch(lambda: _asgi_call(app, scope), loop))
+
+    def test_ping_router_only(self, check, loop):
+        """The same route without middleware, to read the stack's overhead against"""
+        scope = dict(_scope("/api/health/ping"), app=app)
+        check("ping_router_only", async_batch(lambda: _asgi_call(app.router, scope), loop))
+
+
+class TestRunBenchmarks:
+    """Benchmarks for run request and streaming hot paths"""
+
+    @pytest.mark.parametrize("messages", [1, 10, 100])
+    def test_run_request_validation(self, check, messages):
+        """Validating a buffered /agents/run body"""
+        body = dumps({
+            "agent_id": "agent-1",
+            "messages": [
+                {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i} about the deployment plan."}
+                for i in range(messages)
+            ],
+            "system_prompt": "You are a helpful assistant.",
+            "temperature": 0.7,
+            "max_tokens": 1000,
+        })
+
+        check(f"run_request_validation_{messages}", sync_batch(lambda: AgentRunRequest.model_validate_json(body)))
+
+    def test_token_frame(self, check):
+        """Journaling a token event and serializing the frame sent to the socket"""
+        journal = RunJournal("bench", max_events=1000)
+
+        def frame():
+            dumps_str(journal.append({"type": "token", "content": "word ", "done": False}))
+
+        check("token_frame", sync_batch(frame))
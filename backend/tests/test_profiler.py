@@ -0,0 +1,147 @@
+"""
+Tests for the sampling profiler
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.config import settings
+from app.services.profiler import ProfilerBusy, ProfilerGuard, SamplingProfiler
+
+
+def busy_spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def idle_wait(stop: threading.Event):
+    stop.wait()
+
+
+async def waiting_coroutine():
+    await asyncio.sleep(10)
+
+
+class TestSamplingProfiler:
+    """Test suite for stack sampling"""
+
+    def test_cpu_mode_skips_idle_threads(self):
+        """Test that CPU mode samples busy threads but not waiting ones"""
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=busy_spin, args=(stop,), name="spinner"),
+            threading.Thread(target=idle_wait, args=(stop,), name="sleeper"),
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)  # Let the sleeper settle into its wait
+        try:
+            profiler = SamplingProfiler(interval_ms=5, mode="cpu")
+            profiler.run(0.3)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        collapsed = profiler.collapsed()
+        assert "spinner;" in collapsed and "busy_spin (test_profiler.py:" in collapsed
+        assert "sleeper;" not in collapsed
+        for line in collapsed.splitlines():
+            assert int(line.rsplit(" ", 1)[1]) >= 1
+
+    def test_wall_mode_samples_suspended_tasks(self):
+        """Test that wall mode attributes awaiting time to suspended tasks"""
+        async def scenario():
+            task = asyncio.create_task(waiting_coroutine())
+            profiler = SamplingProfiler(interval_ms=5, mode="wall")
+            await profiler.profile(0.1)
+            task.cancel()
+            return profiler
+
+        profiler = asyncio.run(scenario())
+
+        assert profiler.samples > 0
+        assert any(
+            stack.startswith("suspended;task:waiting_coroutine;waiting_coroutine")
+            for stack in profiler.stacks
+        )
+
+    def test_rejects_unknown_mode(self):
+        """Test that unknown modes are rejected"""
+        with pytest.raises(ValueError):
+            SamplingProfiler(mode="memory")
+
+    def test_one_profile_at_a_time(self):
+        """Test that a second concurrent profile is refused"""
+        guard = ProfilerGuard()
+
+        async def scenario():
+            first = asyncio.create_task(guard.run(SamplingProfiler(interval_ms=5), 0.1))
+            await asyncio.sleep(0.02)
+            with pytest.raises(ProfilerBusy):
+                await guard.run(SamplingProfiler(interval_ms=5), 0.1)
+            await first
+
+        asyncio.run(scenario())
+        assert not guard.busy
+
+    def test_cancelled_profile_holds_guard_until_sampling_ends(self):
+        """Test that cancelling the caller does not free the guard while the sampler still runs"""
+        guard = ProfilerGuard()
+
+        async def scenario():
+            first = asyncio.create_task(guard.run(SamplingProfiler(interval_ms=5), 0.2))
+            await asyncio.sleep(0.02)
+            first.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await first
+
+            assert guard.busy
+            with pytest.raises(ProfilerBusy):
+                await guard.run(SamplingProfiler(interval_ms=5), 0.1)
+
+            await asyncio.sleep(0.3)
+            assert not guard.busy
+
+        asyncio.run(scenario())
+
+
+class TestProfileEndpoint:
+    """Test suite for /api/debug/profile"""
+
+    def test_collapsed_output(self, client, auth_headers):
+        """Test that the endpoint returns collapsed stacks"""
+        response = client.get("/api/debug/profile?seconds=0.1&interval_ms=5", headers=auth_headers)
+        assert response.status_code == 200
+        assert int(response.headers["X-Profile-Samples"]) > 0
+        line = response.text.splitlines()[0]
+        assert int(line.rsplit(" ", 1)[1]) >= 1
+
+    def test_json_output(self, client, auth_headers):
+        """Test the JSON summary format"""
+        response = client.get("/api/debug/profile?seconds=0.1&format=json", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["mode"] == "wall"
+
+    def test_requires_auth(self, client):
+        """Test that profiling requires authentication"""
+        response = client.get("/api/debug/profile?seconds=0.1")
+        assert response.status_code == 401
+
+    def test_limits(self, client, auth_headers):
+        """Test that long profiles and unknown modes are rejected"""
+        seconds = settings.PROFILER_MAX_SECONDS + 1
+        response = client.get(f"/api/debug/profile?seconds={seconds}", headers=auth_headers)
+        assert response.status_code == 400
+        response = client.get("/api/debug/profile?seconds=0.1&mode=memory", headers=auth_headers)
+        assert response.status_code == 400
+
+    def test_disabled(self, client, auth_headers, monkeypatch):
+        """Test that the profiler is unavailable unless enabled"""
+        monkeypatch.setattr(settings, "DEBUG", False)
+        monkeypatch.setattr(settings, "PROFILER_ENABLED", False)
+        response = client.get("/api/debug/profile?seconds=0.1", headers=auth_headers)
+        assert response.status_code == 404
@@ -0,0 +1,100 @@
+"""
+Tests for prompt prefix caching
+"""
+
+import pytest
+
+from app.services.prompt_cache import (
+    PrefixCache,
+    estimate_tokens,
+    fingerprint_prefix,
+    prefix_cache,
+    provider_for_model,
+)
+
+
+TOOLS = [{"type": "function", "function": {"name": "get_weather", "parameters": {}}}]
+
+
+class TestPrefixCache:
+    """Test suite for the prefix cache"""
+    
+    def test_fingerprint_ignores_key_order(self):
+        """Test that equivalent tool schemas share a fingerprint"""
+        reordered = [{"function": {"parameters": {}, "name": "get_weather"}, "type": "function"}]
+        
+        assert fingerprint_prefix("gpt-4", "sys", TOOLS, None) == fingerprint_prefix("gpt-4", "sys", reordered, None)
+        assert fingerprint_prefix("gpt-4", "sys", TOOLS, None) != fingerprint_prefix("gpt-4", "other", TOOLS, None)
+    
+    def test_repeat_prefix_is_served_from_cache(self):
+        """Test that the second run with the same prefix skips preparation"""
+        cache = PrefixCache(max_entries=4)
+        
+        first, first_cached = cache.get_or_prepare("gpt-4", "You are helpful.", TOOLS, ["Doc"])
+        second, second_cached = cache.get_or_prepare("gpt-4", "You are helpful.", TOOLS, ["Doc"])
+        
+        assert not first_cached
+        assert second_cached
+        assert second is first
+        assert first.messages[0]["role"] == "system"
+        assert "Doc" in first.messages[0]["content"]
+        assert cache.stats()["hits"] == 1
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used prefix is evicted"""
+        cache = PrefixCache(max_entries=2)
+        cache.get_or_prepare("gpt-4", "a")
+        cache.get_or_prepare("gpt-4", "b")
+        cache.get_or_prepare("gpt-4", "a")
+        cache.get_or_prepare("gpt-4", "c")
+        
+        assert cache.get_or_prepare("gpt-4", "a")[1]
+        assert not cache.get_or_prepare("gpt-4", "b")[1]
+    
+    @pytest.mark.parametrize("model,provider,option", [
+        ("gpt-4", "openai", "prompt_cache_key"),
+        ("claude-3-5-sonnet", "anthropic", "system_cache_control"),
+        ("gemini-1.5-pro", "google", "cached_content_display_name"),
+    ])
+    def test_provider_cache_options(self, model, provider, option):
+        """Test that long prefixes carry provider prompt-caching options"""
+        cache = PrefixCache(max_entries=4)
+        
+        short, _ = cache.get_or_prepare(model, "Short prompt")
+        long, _ = cache.get_or_prepare(model, "word " * 2000)
+        
+        assert provider_for_model(model) == provider
+        assert short.provider_options == {}
+        assert option in long.provider_options
+    
+    def test_estimate_tokens(self):
+        """Test the token estimate"""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("Hello, world!") == 4
+
+
+class TestPrefixCacheIntegration:
+    """Test suite for prefix caching in the run endpoint"""
+    
+    def test_cached_prefix_tokens_reported_in_usage(self, client, auth_headers, mock_agent_request):
+        """Test that repeat runs report cached prefix tokens"""
+        prefix_cache.clear()
+        mock_agent_request["system_prompt"] = "You are a meticulous assistant. " * 300
+        
+        first = client.post("/api/agents/run", json=mock_agent_request, headers=auth_headers).json()
+        second = client.post("/api/agents/run", json=mock_agent_request, headers=auth_headers).json()
+        
+        assert first["usage"]["cached_prefix_tokens"] == 0
+        assert second["usage"]["cached_prefix_tokens"] > 0
+        assert second["usage"]["prompt_tokens"] == first["usage"]["prompt_tokens"]
+        assert second["metadata"]["prefix_fingerprint"] == first["metadata"]["prefix_fingerprint"]
+    
+    def test_short_prefix_is_never_reported_cached(self, client, auth_headers, mock_agent_request):
+        """Test that prefixes below the provider minimum report no cached tokens"""
+        prefix_cache.clear()
+        mock_agent_request["system_prompt"] = "You are a meticulous assistant. " * 20
+        
+        client.post("/api/agents/run", json=mock_agent_request, headers=auth_headers)
+        second = client.post("/api/agents/run", json=mock_agent_request, headers=auth_headers).json()
+        
+        assert second["usage"]["cached_prefix_tokens"] == 0
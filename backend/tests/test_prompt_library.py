@@ -0,0 +1,294 @@
+"""
+Tests for the prompt library
+"""
+
+import asyncio
+
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine
+
+from app.routes import agents as agents_routes
+from app.routes import prompts as prompts_routes
+from app.services.prompt_library import PromptLibrary, PromptNotFound, TemplateError, compile_template
+
+REVIEW = {
+    "system_prompt": "You review {{ language }} code for {{team}}.",
+    "messages": [{"role": "user", "content": "Review this {{ language }}:\n{{ code }}"}],
+    "defaults": {"team": "platform"},
+}
+
+
+@pytest.fixture
+def library(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'prompts.db'}")
+    yield PromptLibrary(engine_factory=lambda: engine, cache_entries=8)
+    engine.dispose()
+
+
+class TestTemplates:
+    """Test suite for template compilation"""
+
+    def test_compile_and_render(self):
+        """Test that placeholders are split out once and filled on render"""
+        template = compile_template("Hi {{ name }}, {{name}} likes {{ thing }}!")
+
+        assert template.names == ("name", "name", "thing")
+        assert template.render({"name": "Ada", "thing": "tea"}) == "Hi Ada, Ada likes tea!"
+
+    def test_non_placeholders_are_literal(self):
+        """Test that malformed braces are left alone"""
+        template = compile_template("{{ 1abc }} {not} {{}}")
+
+        assert template.names == ()
+        assert template.render({}) == "{{ 1abc }} {not} {{}}"
+
+
+class TestPromptLibrary:
+    """Test suite for prompt storage, versioning and rendering"""
+
+    def test_create_and_render(self, library):
+        """Test that defaults fill unset variables"""
+        prompt = library.create("Code Review", REVIEW, category="Development", prompt_id="review")
+
+        assert prompt["latest_version"] == 1
+        assert prompt["template"]["variables"] == ["language", "team", "code"]
+
+        rendered = library.compiled("review").render({"language": "Python", "code": "x = 1"})
+        assert rendered.system_prompt == "You review Python code for platform."
+        assert rendered.messages == [{"role": "user", "content": "Review this Python:\nx = 1"}]
+
+    def test_missing_variables(self, library):
+        """Test that rendering without a required variable fails"""
+        library.create("Code Review", REVIEW, prompt_id="review")
+
+        with pytest.raises(TemplateError, match="language, code"):
+            library.compiled("review").render({})
+
+    def test_versions(self, library):
+        """Test that old versions stay renderable after a new one is saved"""
+        library.create("Code Review", REVIEW, prompt_id="review")
+        prompt = library.add_version(
+            "review", {**REVIEW, "system_prompt": "Be strict about {{ language }}."}, category="Quality",
+        )
+
+        assert prompt["latest_version"] == 2
+        assert prompt["versions"] == [1, 2]
+        assert prompt["category"] == "Quality"
+        assert prompt["name"] == "Code Review"
+        variables = {"language": "Go", "code": ""}
+        assert library.compiled("review").render(variables).system_prompt == "Be strict about Go."
+        assert library.compiled("review", 1).render(variables).system_prompt == "You review Go code for platform."
+
+    def test_unknown_prompt(self, library):
+        """Test that unknown prompts and versions are reported"""
+        library.create("Code Review", REVIEW, prompt_id="review")
+
+        with pytest.raises(PromptNotFound):
+            library.compiled("missing")
+        with pytest.raises(PromptNotFound):
+            library.compiled("review", 7)
+        with pytest.raises(PromptNotFound):
+            library.add_version("missing", REVIEW)
+
+    def test_compiled_versions_are_cached(self, library):
+        """Test that rendering a cached version does not read the database"""
+        library.create("Code Review", REVIEW, prompt_id="review")
+        library.compiled("review", 1)
+        library.engine_factory = None  # Any database access would now fail
+
+        rendered = asyncio.run(library.resolve("review", variables={"language": "C", "code": ""}))
+
+        assert rendered.version == 1
+        assert library.stats()["hits"] >= 1
+
+    def test_cache_is_bounded(self, library):
+        """Test that the least recently used versions are evicted"""
+        for i in range(12):
+            library.create(f"Prompt {i}", {"system_prompt": f"Prompt {i}"}, prompt_id=f"p{i}")
+            library.compiled(f"p{i}", 1)
+
+        assert library.stats()["entries"] == 8
+
+    def test_delete(self, library):
+        """Test that deleting a prompt removes it from storage, search and the cache"""
+        library.create("Code Review", REVIEW, prompt_id="review")
+        library.compiled("review", 1)
+
+        assert library.delete("review") is True
+        assert library.delete("review") is False
+        assert library.search("review") == []
+        with pytest.raises(PromptNotFound):
+            library.compiled("review", 1)
+
+
+class TestPromptSearch:
+    """Test suite for full-text prompt search"""
+
+    @pytest.fixture
+    def populated(self, library):
+        library.create("Code Review", REVIEW, category="Development", tags=["python"], prompt_id="review")
+        library.create(
+            "Content Writer", {"system_prompt": "Write blog posts that review products."},
+            category="Writing", prompt_id="writer",
+        )
+        library.create(
+            "Data Analyst", {"system_prompt": "Summarize the dataset."},
+            description="Explains trends", category="Analytics", prompt_id="analyst",
+        )
+        return library
+
+    def test_uses_fts5(self, populated):
+        """Test that SQLite builds with FTS5 use the full-text index"""
+        assert populated.fts is True
+
+    def test_ranking(self, populated):
+        """Test that name matches rank above template text matches"""
+        results = populated.search("review")
+
+        assert [prompt["id"] for prompt in results] == ["review", "writer"]
+
+    def test_prefix_and_all_terms(self, populated):
+        """Test that terms match word prefixes and must all match"""
+        assert [p["id"] for p in populated.search("summ")] == ["analyst"]
+        assert [p["id"] for p in populated.search("review blog")] == ["writer"]
+        assert populated.search("review spreadsheet") == []
+
+    def test_category_filter(self, populated):
+        """Test that search can be limited to one category"""
+        assert [p["id"] for p in populated.search("review", category="Writing")] == ["writer"]
+
+    def test_new_version_is_reindexed(self, populated):
+        """Test that search sees the latest template only"""
+        populated.add_version("analyst", {"system_prompt": "Forecast revenue."})
+
+        assert populated.search("dataset") == []
+        assert [p["id"] for p in populated.search("forecast")] == ["analyst"]
+
+    def test_query_syntax_is_escaped(self, populated):
+        """Test that FTS5 query syntax in a search is ignored"""
+        assert populated.search('"review*^(') == populated.search("review")
+        assert populated.search("***") == []
+
+    def test_substring_fallback(self, populated):
+        """Test the search used when FTS5 is unavailable"""
+        populated.fts = False
+
+        assert {p["id"] for p in populated.search("review")} == {"review", "writer"}
+        assert [p["id"] for p in populated.search("summ")] == ["analyst"]
+
+
+class TestPromptEndpoints:
+    """Test suite for the prompt API and prompts in runs"""
+
+    @pytest.fixture(autouse=True)
+    def _use_test_library(self, monkeypatch, library):
+        monkeypatch.setattr(prompts_routes, "prompt_library", library)
+        monkeypatch.setattr(agents_routes, "prompt_library", library)
+
+    @pytest.fixture
+    def captured_runs(self, monkeypatch):
+        runs = []
+        build = agents_routes.build_run_context
+
+        def capture(request, model=None):
+            runs.append(request)
+            return build(request, model=model)
+
+        monkeypatch.setattr(agents_routes, "build_run_context", capture)
+        return runs
+
+    def test_crud(self, client, auth_headers):
+        """Test creating, versioning, listing and deleting a prompt"""
+        response = client.post(
+            "/api/prompts/", json={"id": "review", "name": "Code Review", **REVIEW}, headers=auth_headers,
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+
+        duplicate = client.post("/api/prompts/", json={"id": "review", "name": "x", **REVIEW}, headers=auth_headers)
+        assert duplicate.status_code == status.HTTP_409_CONFLICT
+
+        response = client.post(
+            "/api/prompts/review/versions", json={"system_prompt": "Strict {{ language }}"}, headers=auth_headers,
+        )
+        assert response.json()["latest_version"] == 2
+
+        version = client.get("/api/prompts/review/versions/1", headers=auth_headers).json()
+        assert version["system_prompt"] == REVIEW["system_prompt"]
+
+        listing = client.get("/api/prompts/", headers=auth_headers).json()
+        assert listing["total"] == 1
+        search = client.get("/api/prompts/", params={"q": "strict"}, headers=auth_headers).json()
+        assert [p["id"] for p in search["prompts"]] == ["review"]
+
+        assert client.delete("/api/prompts/review", headers=auth_headers).status_code == status.HTTP_200_OK
+        assert client.get("/api/prompts/review", headers=auth_headers).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_empty_template_rejected(self, client, auth_headers):
+        """Test that a prompt needs some content"""
+        response = client.post("/api/prompts/", json={"name": "Empty"}, headers=auth_headers)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_render_preview(self, client, auth_headers):
+        """Test previewing a prompt, including missing variables"""
+        client.post("/api/prompts/", json={"id": "review", "name": "Code Review", **REVIEW}, headers=auth_headers)
+
+        response = client.post(
+            "/api/prompts/review/render", json={"variables": {"language": "Rust", "code": "fn main() {}"}},
+            headers=auth_headers,
+        )
+        assert response.json()["system_prompt"] == "You review Rust code for platform."
+
+        response = client.post("/api/prompts/review/render", json={}, headers=auth_headers)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_run_with_prompt(self, client, auth_headers, captured_runs):
+        """Test that a run renders the template before its own messages"""
+        client.post("/api/prompts/", json={"id": "review", "name": "Code Review", **REVIEW}, headers=auth_headers)
+
+        response = client.post("/api/agents/run", json={
+            "agent_id": "agent-2",
+            "prompt": {"id": "review", "variables": {"language": "Go", "code": "package main"}},
+            "messages": [{"role": "user", "content": "Focus on errors"}],
+        }, headers=auth_headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        run = captured_runs[0]
+        assert run.system_prompt == "You review Go code for platform."
+        assert [m.content for m in run.messages] == ["Review this Go:\npackage main", "Focus on errors"]
+        assert run.prompt.version == 1
+
+    def test_run_with_bad_prompt(self, client, auth_headers):
+        """Test that unknown prompts and missing variables fail the run up front"""
+        client.post("/api/prompts/", json={"id": "review", "name": "Code Review", **REVIEW}, headers=auth_headers)
+
+        missing = client.post("/api/agents/run", json={
+            "agent_id": "agent-2", "prompt": {"id": "nope"}, "messages": [],
+        }, headers=auth_headers)
+        unfilled = client.post("/api/agents/run", json={
+            "agent_id": "agent-2", "prompt": {"id": "review"}, "messages": [],
+        }, headers=auth_headers)
+
+        assert missing.status_code == status.HTTP_404_NOT_FOUND
+        assert unfilled.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.websocket
+    def test_stream_with_prompt(self, client, auth_headers, captured_runs):
+        """Test that streamed runs render the template too"""
+        client.post("/api/prompts/", json={"id": "review", "name": "Code Review", **REVIEW}, headers=auth_headers)
+
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({
+                "action": "run",
+                "agent_id": "agent-2",
+                "prompt": {"id": "review", "version": 1, "variables": {"language": "C", "code": "int x;"}},
+                "messages": [],
+            })
+            while not websocket.receive_json()["done"]:
+                pass
+            websocket.send_json({"action": "run", "agent_id": "agent-2", "prompt": {"id": "nope"}, "messages": []})
+            error = websocket.receive_json()
+
+        assert captured_runs[0].system_prompt == "You review C code for platform."
+        assert error["type"] == "error" and "nope" in error["error"]
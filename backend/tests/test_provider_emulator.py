@@ -0,0 +1,494 @@
+"""
+Tests for the provider emulator and the provider client
+"""
+
+import asyncio
+import email.utils
+import random
+import statistics
+import threading
+import time
+
+import httpx
+import pytest
+from fastapi import status
+
+from app.routes import agents as agents_routes
+from app.routes.agents import AgentRunRequest, Message
+from app.services.context import build_run_context
+from app.services.provider_emulator import Cassette, EmulatorProfile, ProviderEmulator
+from app.services.providers import ProviderClient, ProviderError, ProviderUsage, build_request, parse_retry_after
+
+MODELS = {"openai": "gpt-4", "anthropic": "claude-3-opus", "google": "gemini-pro"}
+
+INSTANT = dict(ttft_ms=0, inter_token_ms=0, tokens=8, seed=1)
+
+
+TOOLS = [{"type": "function", "function": {"name": "get_weather", "description": "Weather", "parameters": {"type": "object"}}}]
+
+LONG_PROMPT = "Answer with care. " * 600
+
+
+def _context(model, content="Explain backpressure", system_prompt="Be brief", tools=None):
+    return asyncio.run(build_run_context(
+        AgentRunRequest(
+            agent_id="agent-1",
+            system_prompt=system_prompt,
+            tools=tools,
+            messages=[Message(role="user", content=content)],
+        ),
+        model=model,
+    ))
+
+
+def _collect(client, context):
+    async def collect():
+        try:
+            return [text async for text in client.stream(context)]
+        finally:
+            await client.close()
+
+    return asyncio.run(collect())
+
+
+def _client(emulator):
+    return ProviderClient(base_url="http://emulator", transport=emulator.transport())
+
+
+class TestWireFormats:
+    """Test suite for the emulated provider APIs"""
+
+    @pytest.mark.parametrize("provider", list(MODELS))
+    def test_client_streams_each_format(self, provider):
+        """Test that the client parses each provider's stream into text deltas"""
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT))
+        deltas = _collect(_client(emulator), _context(MODELS[provider]))
+
+        assert len(deltas) == 8
+        assert "".join(deltas).endswith(".")
+        assert emulator.counts[f"{provider}_requests"] == 1
+
+    def test_answers_depend_only_on_the_request(self):
+        """Test that synthetic answers are reproducible"""
+        first = ProviderEmulator(EmulatorProfile(**INSTANT))
+        second = ProviderEmulator(EmulatorProfile(**INSTANT))
+
+        answer = _collect(_client(first), _context("gpt-4"))
+        assert _collect(_client(second), _context("gpt-4")) == answer
+        assert _collect(_client(second), _context("gpt-4", "Something else")) != answer
+
+    @pytest.mark.parametrize("path, body, field", [
+        ("/v1/chat/completions", {"model": "gpt-4", "messages": [{"role": "user", "content": "hi"}]}, "choices"),
+        ("/v1/messages", {"model": "claude-3", "max_tokens": 3, "messages": [{"role": "user", "content": "hi"}]}, "content"),
+        ("/v1beta/models/gemini-pro:generateContent", {"contents": [{"parts": [{"text": "hi"}]}]}, "candidates"),
+    ])
+    def test_non_streaming_bodies(self, path, body, field):
+        """Test that requests without streaming get a whole response"""
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT))
+
+        async def call():
+            async with httpx.AsyncClient(transport=emulator.transport(), base_url="http://emulator") as client:
+                return await client.post(path, json=body)
+
+        response = asyncio.run(call())
+        assert response.status_code == 200
+        assert response.json()[field]
+
+    def test_max_tokens_caps_the_answer(self):
+        """Test that answers stop at the requested max tokens"""
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT))
+        context = _context("claude-3-opus")
+        context.max_tokens = 3
+
+        assert len(_collect(_client(emulator), context)) == 3
+
+    def test_zero_temperature_is_kept(self):
+        """Test that an explicit temperature of 0 is not replaced by the default"""
+        context = asyncio.run(build_run_context(
+            AgentRunRequest(agent_id="agent-1", temperature=0.0, messages=[Message(role="user", content="hi")]),
+            model="gpt-4",
+        ))
+
+        assert build_request(context)[2]["temperature"] == 0.0
+
+    def test_client_from_another_loop_is_closed(self):
+        """Test that switching event loops closes the pooled client on its own loop"""
+        client = _client(ProviderEmulator(EmulatorProfile(**INSTANT)))
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        async def http():
+            return client._http()
+
+        try:
+            first = asyncio.run_coroutine_threadsafe(http(), loop).result()
+            second = asyncio.run(http())
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), loop).result()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+        assert second is not first
+        assert first.is_closed and not second.is_closed
+
+
+class TestRequestBodies:
+    """Test suite for tools and prompt caching options in provider requests"""
+
+    def test_anthropic_cache_breakpoint_and_tools(self):
+        """Test that a long prefix ends in a cache breakpoint and tools use input_schema"""
+        body = build_request(_context("claude-3-opus", system_prompt=LONG_PROMPT, tools=TOOLS))[2]
+
+        assert body["system"][0]["cache_control"] == {"type": "ephemeral"}
+        assert body["system"][0]["text"].startswith("Answer with care.")
+        assert body["tools"] == [{"name": "get_weather", "description": "Weather", "input_schema": {"type": "object"}}]
+
+    def test_openai_cache_key_and_tools(self):
+        """Test that a long prefix carries prompt_cache_key and tools stay functions"""
+        context = _context("gpt-4", system_prompt=LONG_PROMPT, tools=TOOLS)
+        body = build_request(context)[2]
+
+        assert body["prompt_cache_key"] == context.prefix.provider_options["prompt_cache_key"]
+        assert body["tools"][0]["type"] == "function"
+        assert body["tools"][0]["function"]["name"] == "get_weather"
+
+    def test_short_prefix_has_no_cache_options(self):
+        """Test that prefixes below the provider minimum are sent plainly"""
+        anthropic = build_request(_context("claude-3-opus", tools=TOOLS))[2]
+        openai = build_request(_context("gpt-4"))[2]
+
+        assert anthropic["system"] == "Be brief"
+        assert "prompt_cache_key" not in openai
+
+    def test_google_tools_without_cache(self):
+        """Test that Gemini requests declare tools and the system instruction"""
+        body = build_request(_context("gemini-pro", tools=TOOLS))[2]
+
+        assert body["tools"] == [{"functionDeclarations": [
+            {"name": "get_weather", "description": "Weather", "parameters": {"type": "object"}},
+        ]}]
+        assert body["systemInstruction"]["parts"][0]["text"] == "Be brief"
+        assert "cachedContent" not in body
+
+    def test_google_cached_content_is_created_once(self):
+        """Test that a long Gemini prefix goes through one cached content resource"""
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT))
+        client = _client(emulator)
+        context = _context("gemini-pro", system_prompt=LONG_PROMPT, tools=TOOLS)
+
+        async def run_twice():
+            try:
+                first = [text async for text in client.stream(context)]
+                second = [text async for text in client.stream(context)]
+                return first, second, await client._cached_content(context, "")
+            finally:
+                await client.close()
+
+        first, second, name = asyncio.run(run_twice())
+        body = build_request(context, cached_content=name)[2]
+
+        assert first and second
+        assert emulator.counts["google_cached_contents"] == 1
+        assert name.startswith("cachedContents/")
+        assert body["cachedContent"] == name
+        assert "systemInstruction" not in body and "tools" not in body
+
+    @pytest.mark.parametrize("provider, cached_first", [("openai", False), ("anthropic", False), ("google", True)])
+    def test_provider_reports_cached_prefix_tokens(self, provider, cached_first):
+        """Test that cached prompt tokens are read from each provider's usage events"""
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT))
+        client = _client(emulator)
+        context = _context(MODELS[provider], system_prompt=LONG_PROMPT, tools=TOOLS)
+
+        async def run_twice():
+            usages = [ProviderUsage(), ProviderUsage()]
+            try:
+                for usage in usages:
+                    [text async for text in client.stream(context, usage)]
+            finally:
+                await client.close()
+            return usages
+
+        first, second = asyncio.run(run_twice())
+
+        assert (first.cached_tokens > 0) == cached_first
+        assert second.cached_tokens >= context.prefix.token_count * 0.9
+
+    def test_uncached_prefix_reports_zero(self):
+        """Test that a usage event without cache reads reports 0 cached tokens"""
+        client = _client(ProviderEmulator(EmulatorProfile(**INSTANT)))
+        context = _context("claude-3-opus")
+        usage = ProviderUsage()
+
+        async def run():
+            try:
+                return [text async for text in client.stream(context, usage)]
+            finally:
+                await client.close()
+
+        asyncio.run(run())
+
+        assert usage.cached_tokens == 0
+
+    @pytest.mark.parametrize("failure", ["connect", "not_json"])
+    def test_google_cached_content_failure_is_skipped(self, failure):
+        """Test that a failed cached content creation lets the run go ahead uncached"""
+        def handler(request):
+            if failure == "connect":
+                raise httpx.ConnectError("connection refused", request=request)
+            return httpx.Response(200, text="<html>gateway</html>")
+
+        client = ProviderClient(base_url="http://provider", transport=httpx.MockTransport(handler))
+        context = _context("gemini-pro", system_prompt=LONG_PROMPT, tools=TOOLS)
+
+        async def create():
+            try:
+                return await client._cached_content(context, "")
+            finally:
+                await client.close()
+
+        assert asyncio.run(create()) is None
+
+    def test_expired_cached_contents_are_pruned(self):
+        """Test that expired cached content entries are dropped when a new one is added"""
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT))
+        client = _client(emulator)
+        client._cached_contents["stale"] = ("cachedContents/stale", time.monotonic() - 1)
+        context = _context("gemini-pro", system_prompt=LONG_PROMPT, tools=TOOLS)
+
+        async def create():
+            try:
+                return await client._cached_content(context, "")
+            finally:
+                await client.close()
+
+        name = asyncio.run(create())
+
+        assert list(client._cached_contents) == [context.prefix.fingerprint]
+        assert client._cached_contents[context.prefix.fingerprint][0] == name
+
+
+class TestFaultInjection:
+    """Test suite for injected rate limits and errors"""
+
+    def test_rate_limit(self):
+        """Test that rate limited requests carry Retry-After"""
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT, rate_limit_rate=1.0, retry_after_seconds=2))
+
+        with pytest.raises(ProviderError) as error:
+            _collect(_client(emulator), _context("gpt-4"))
+
+        assert error.value.status_code == 429
+        assert error.value.retry_after == 2.0
+        assert emulator.counts["status_429"] == 1
+
+    @pytest.mark.parametrize("header, expected", [
+        ("30", 30.0),
+        ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),
+        ("soon", None),
+    ])
+    def test_retry_after_forms(self, header, expected):
+        """Test that delay and HTTP-date Retry-After headers both give a ProviderError"""
+        def handler(request):
+            return httpx.Response(429, headers={"retry-after": header}, json={"error": {"message": "slow down"}})
+
+        client = ProviderClient(base_url="http://provider", transport=httpx.MockTransport(handler))
+
+        with pytest.raises(ProviderError) as error:
+            _collect(client, _context("gpt-4"))
+        assert error.value.status_code == 429
+        assert error.value.retry_after == expected
+
+    def test_retry_after_date_in_the_future(self):
+        """Test that an HTTP-date Retry-After becomes the seconds until that date"""
+        header = email.utils.formatdate(time.time() + 120, usegmt=True)
+
+        assert 100 < parse_retry_after(header) <= 120
+
+    def test_server_error_uses_provider_status(self):
+        """Test that Anthropic errors come back as 529 overloaded"""
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT, error_rate=1.0))
+
+        with pytest.raises(ProviderError) as error:
+            _collect(_client(emulator), _context("claude-3-opus"))
+        assert error.value.status_code == 529
+
+    @pytest.mark.parametrize("provider", list(MODELS))
+    def test_mid_stream_error(self, provider):
+        """Test that error events after the stream started are raised"""
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT, stream_error_rate=1.0))
+
+        with pytest.raises(ProviderError, match="Overloaded"):
+            _collect(_client(emulator), _context(MODELS[provider]))
+        assert emulator.counts["stream_errors"] == 1
+
+    def test_seeded_faults_repeat(self):
+        """Test that a seed fixes which requests fail"""
+        def outcomes():
+            emulator = ProviderEmulator(EmulatorProfile(**{**INSTANT, "seed": 7}, rate_limit_rate=0.5))
+            client = _client(emulator)
+            results = []
+            for _ in range(10):
+                try:
+                    _collect(client, _context("gpt-4"))
+                    results.append(200)
+                except ProviderError as e:
+                    results.append(e.status_code)
+            return results
+
+        first = outcomes()
+        assert first == outcomes()
+        assert set(first) == {200, 429}
+
+
+class TestPacing:
+    """Test suite for latency shaping"""
+
+    @pytest.mark.parametrize("jitter", ["fixed", "uniform", "exponential", "lognormal"])
+    def test_delays_keep_their_mean(self, jitter):
+        """Test that every distribution is centered on the configured mean"""
+        profile = EmulatorProfile(jitter=jitter)
+        rng = random.Random(3)
+        samples = [profile.delay(rng, 40.0) for _ in range(20000)]
+
+        assert statistics.fmean(samples) == pytest.approx(0.040, rel=0.05)
+        if jitter == "uniform":
+            assert 0.020 <= min(samples) and max(samples) <= 0.060
+
+    def test_unknown_jitter(self):
+        """Test that unknown distributions are rejected"""
+        with pytest.raises(ValueError):
+            EmulatorProfile(jitter="pareto")
+
+    def test_served_stream_is_paced(self, provider_emulator):
+        """Test TTFT and inter-token gaps over a real socket"""
+        provider_emulator.profile = EmulatorProfile(ttft_ms=150, inter_token_ms=20, jitter="fixed", tokens=5, seed=1)
+        client = ProviderClient(base_url=provider_emulator.base_url)
+        context = _context("gpt-4")
+
+        async def timed():
+            try:
+                started, arrivals = time.perf_counter(), []
+                async for _ in client.stream(context):
+                    arrivals.append(time.perf_counter() - started)
+                return arrivals
+            finally:
+                await client.close()
+
+        arrivals = asyncio.run(timed())
+
+        assert len(arrivals) == 5
+        assert arrivals[0] >= 0.14
+        assert arrivals[-1] - arrivals[0] >= 0.07
+
+
+class TestCassettes:
+    """Test suite for recording and replaying provider responses"""
+
+    def test_record_then_replay(self, tmp_path):
+        """Test that a recorded stream replays byte for byte without the upstream"""
+        path = tmp_path / "cassette.jsonl"
+        upstream = ProviderEmulator(EmulatorProfile(**INSTANT))
+        recorder = ProviderEmulator(
+            mode="record",
+            cassette=Cassette(path),
+            upstreams={"anthropic": "http://upstream"},
+            upstream_transport=upstream.transport(),
+        )
+        body = {"model": "claude-3", "max_tokens": 5, "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+
+        async def call(emulator, payload):
+            async with httpx.AsyncClient(transport=emulator.transport(), base_url="http://emulator") as client:
+                return await client.post("/v1/messages", json=payload, headers={"x-api-key": "secret"})
+
+        recorded = asyncio.run(call(recorder, body))
+        assert recorder.counts["recorded"] == 1
+
+        replayer = ProviderEmulator(mode="replay", cassette=Cassette(path))
+        # Key order does not matter
+        replayed = asyncio.run(call(replayer, dict(reversed(body.items()))))
+
+        assert len(replayer.cassette) == 1
+        assert replayed.text == recorded.text
+        assert replayed.headers["content-type"].startswith("text/event-stream")
+        assert replayer.counts["replayed"] == 1
+
+    def test_replay_miss_falls_back_to_synthetic(self, tmp_path):
+        """Test that unseen requests still get an answer"""
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT), mode="replay", cassette=Cassette(tmp_path / "empty.jsonl"))
+
+        assert _collect(_client(emulator), _context("gpt-4"))
+        assert emulator.counts["replay_misses"] == 1
+
+    def test_cassette_modes_need_a_cassette(self):
+        """Test that replay and record require a cassette"""
+        with pytest.raises(ValueError):
+            ProviderEmulator(mode="replay")
+
+
+class TestRunsThroughEmulator:
+    """Test suite for agent runs against the emulator"""
+
+    @pytest.fixture
+    def emulator(self, monkeypatch):
+        emulator = ProviderEmulator(EmulatorProfile(**INSTANT))
+        monkeypatch.setattr(agents_routes, "provider_client", _client(emulator))
+        return emulator
+
+    def test_run_returns_emulated_answer(self, client, auth_headers, emulator):
+        """Test that /run answers from the provider"""
+        response = client.post("/api/agents/run", json={
+            "agent_id": "agent-1",
+            "messages": [{"role": "user", "content": "Describe the emulator run"}],
+        }, headers=auth_headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["message"]["content"].endswith(".")
+        assert response.json()["usage"]["completion_tokens"] > 0
+        assert emulator.counts["openai_requests"] == 1
+
+    def test_cached_prefix_tokens_come_from_the_provider(self, client, auth_headers, emulator, monkeypatch):
+        """Test that a prefix this worker sent before counts as cached only if the provider says so"""
+        run = {
+            "agent_id": "agent-1",
+            "system_prompt": LONG_PROMPT + "provider usage",
+            "messages": [{"role": "user", "content": "Which tokens were cached?"}],
+        }
+        client.post("/api/agents/run", json=run, headers=auth_headers)
+
+        # A provider that never saw the prefix, as after an eviction or on another worker's cache
+        monkeypatch.setattr(agents_routes, "provider_client", _client(ProviderEmulator(EmulatorProfile(**INSTANT))))
+        evicted = client.post("/api/agents/run", json=run, headers=auth_headers).json()
+        cached = client.post("/api/agents/run", json=run, headers=auth_headers).json()
+
+        assert evicted["usage"]["cached_prefix_tokens"] == 0
+        assert cached["usage"]["cached_prefix_tokens"] > 0
+
+    def test_rate_limit_becomes_429(self, client, auth_headers, emulator):
+        """Test that provider rate limits reach the caller as 429 with Retry-After"""
+        emulator.profile.rate_limit_rate = 1.0
+        response = client.post("/api/agents/run", json={
+            "agent_id": "agent-1",
+            "messages": [{"role": "user", "content": "Rate limited run"}],
+        }, headers=auth_headers)
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response.headers["Retry-After"] == "1"
+
+    def test_stream_forwards_provider_tokens(self, client, auth_headers, emulator):
+        """Test that /stream forwards the provider's deltas as token events"""
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({
+                "action": "run",
+                "agent_id": "agent-1",
+                "messages": [{"role": "user", "content": "Stream through the emulator"}],
+            })
+            events = []
+            while not events or not events[-1]["done"]:
+                events.append(websocket.receive_json())
+
+        tokens = [event["content"] for event in events if event["type"] == "token"]
+        assert len(tokens) == 8
+        assert events[-1]["type"] == "complete"
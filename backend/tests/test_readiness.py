@@ -0,0 +1,161 @@
+"""
+Tests for readiness probes
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from fastapi import status
+
+from app.services.readiness import ProbeFailed, ProviderProbe, ReadinessMonitor, readiness
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """Replace the global monitor's probes and cache for one test"""
+    monkeypatch.setattr(readiness, "probes", {})
+    monkeypatch.setattr(readiness, "results", {})
+    monkeypatch.setattr(readiness, "checked_at", None)
+    return readiness
+
+
+class TestReadinessMonitor:
+    """Test suite for probe scheduling and caching"""
+
+    def test_probe_results(self):
+        """Test that ok, failed, crashed and slow probes are reported"""
+        async def ok():
+            return {"detail": 1}
+
+        async def failed():
+            raise ProbeFailed("down", {"host": "db"})
+
+        async def crashed():
+            raise RuntimeError("boom")
+
+        async def slow():
+            await asyncio.sleep(1)
+            return {}
+
+        monitor = ReadinessMonitor(interval=10, timeout=0.05)
+        for name, probe in [("ok", ok), ("failed", failed), ("crashed", crashed), ("slow", slow)]:
+            monitor.register(name, probe)
+
+        async def scenario():
+            await monitor.refresh()
+            return await monitor.snapshot()
+
+        ready, checks = run(scenario())
+
+        assert not ready
+        assert checks["ok"]["status"] == "ok" and checks["ok"]["detail"] == 1
+        assert checks["failed"] == {**checks["failed"], "status": "error", "error": "down", "host": "db"}
+        assert checks["crashed"]["error"] == "boom"
+        assert checks["slow"]["error"].startswith("Timed out")
+
+    def test_results_are_cached(self):
+        """Test that snapshots report starting, then share one refresh per interval"""
+        calls = []
+
+        async def counted():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {}
+
+        monitor = ReadinessMonitor(interval=60, timeout=1)
+        monitor.register("counted", counted)
+
+        async def scenario():
+            starting = await asyncio.gather(*(monitor.snapshot() for _ in range(5)))
+            await asyncio.sleep(0.05)
+            ready = [await monitor.snapshot() for _ in range(5)]
+            return starting, ready
+
+        starting, ready = run(scenario())
+
+        assert len(calls) == 1
+        assert all(result == (False, {"counted": {"status": "starting"}}) for result in starting)
+        assert all(result[0] for result in ready)
+
+    def test_background_refresh(self):
+        """Test that a running monitor refreshes on its own"""
+        calls = []
+
+        async def counted():
+            calls.append(1)
+            return {}
+
+        monitor = ReadinessMonitor(interval=0.02, timeout=1)
+        monitor.register("counted", counted)
+
+        async def scenario():
+            monitor.start()
+            await asyncio.sleep(0.1)
+            await monitor.stop()
+
+        run(scenario())
+        assert len(calls) >= 3
+
+    def test_provider_probe(self):
+        """Test provider reachability against a mocked transport"""
+        def handler(request):
+            if request.url.host == "down.local":
+                return httpx.Response(503)
+            return httpx.Response(401)
+
+        transport = httpx.MockTransport(handler)
+
+        result = run(ProviderProbe({"openai": "http://up.local/v1/models"}, transport)())
+        assert result["providers"]["openai"]["reachable"]
+
+        probe = ProviderProbe({"openai": "http://up.local/", "google": "http://down.local/"}, transport)
+        with pytest.raises(ProbeFailed, match="google"):
+            run(probe())
+
+        assert run(ProviderProbe({})())["skipped"]
+
+
+class TestReadinessEndpoint:
+    """Test suite for /api/health/ready"""
+
+    def test_ready(self, client, probes):
+        """Test that passing probes report ready"""
+        async def ok():
+            return {}
+
+        probes.register("database", ok)
+        run(probes.refresh())
+        response = client.get("/api/health/ready")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["checks"]["database"]["status"] == "ok"
+
+    def test_not_ready(self, client, probes):
+        """Test that a failing probe returns 503"""
+        async def down():
+            raise ProbeFailed("connection refused")
+
+        probes.register("database", down)
+        run(probes.refresh())
+        response = client.get("/api/health/ready")
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        data = response.json()
+        assert data["ready"] is False
+        assert data["checks"]["database"]["error"] == "connection refused"
+
+    def test_starting(self, client, probes):
+        """Test that readiness is 503 until the first probe results land"""
+        async def ok():
+            return {}
+
+        probes.register("database", ok)
+        response = client.get("/api/health/ready")
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.json()["checks"]["database"] == {"status": "starting"}
@@ -0,0 +1,169 @@
+"""
+Tests for knowledge retrieval
+"""
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services import retrieval
+from app.services.embeddings import HashingEmbedder
+from app.services.retrieval import Document, KnowledgeBase, chunk_text, quantize_int8
+
+
+DOCS = [
+    Document("vpn", "To connect to the VPN open the client and sign in with your badge.", "VPN guide"),
+    Document("leave", "Annual leave requests are approved by your manager in the HR portal.", "Leave policy"),
+    Document("expenses", "Submit expense receipts within thirty days using the finance app.", "Expenses"),
+]
+
+
+@pytest.fixture
+def kb(tmp_path):
+    return KnowledgeBase(root=str(tmp_path / "index"), embedder=HashingEmbedder(256))
+
+
+class TestIndexing:
+    """Test suite for chunking and quantization"""
+    
+    def test_chunk_text_overlaps(self):
+        """Test that chunks overlap by the configured number of words"""
+        words = " ".join(str(i) for i in range(10))
+        
+        chunks = chunk_text(words, chunk_words=4, overlap_words=1)
+        
+        assert chunks == ["0 1 2 3", "3 4 5 6", "6 7 8 9"]
+        assert chunk_text("   ", 4, 1) == []
+    
+    def test_int8_quantization_preserves_similarity(self):
+        """Test that int8 codes approximate the original vectors"""
+        rng = np.random.default_rng(1)
+        vectors = rng.normal(size=(20, 64)).astype(np.float32)
+        
+        codes, scales = quantize_int8(vectors)
+        restored = codes.astype(np.float32) * scales[:, None]
+        
+        assert codes.dtype == np.int8
+        assert np.abs(restored - vectors).max() < scales.max()
+
+
+class TestKnowledgeBase:
+    """Test suite for the knowledge base"""
+    
+    def test_search_returns_relevant_chunk(self, kb):
+        """Test that the most relevant document ranks first"""
+        kb.ingest(DOCS)
+        
+        results = kb.search("how do I request annual leave", k=2)
+        
+        assert results[0].doc_id == "leave"
+        assert results[0].title == "Leave policy"
+        assert "manager" in results[0].text
+        assert results[0].score >= results[1].score
+    
+    def test_index_files_are_memory_mapped(self, kb):
+        """Test that readers map index arrays instead of loading them"""
+        kb.ingest(DOCS)
+        
+        generation = kb.current()
+        
+        assert isinstance(generation.vectors, np.memmap)
+        assert generation.vectors.dtype == np.int8
+        assert isinstance(generation.text, np.memmap)
+    
+    def test_reingest_reuses_unchanged_documents(self, kb):
+        """Test that unchanged documents are not embedded again"""
+        kb.ingest(DOCS)
+        
+        summary = kb.ingest([DOCS[0], Document("vpn-2", "Reset your VPN token in the portal.")])
+        
+        assert summary["documents"] == 4
+        assert summary["reused_chunks"] == 3
+        assert summary["embedded_chunks"] == 1
+    
+    def test_delete_document(self, kb):
+        """Test that deleted documents are no longer returned"""
+        kb.ingest(DOCS)
+        
+        assert kb.delete("leave")
+        assert not kb.delete("leave")
+        assert all(r.doc_id != "leave" for r in kb.search("annual leave", k=3))
+    
+    def test_other_worker_sees_new_generation(self, kb, tmp_path):
+        """Test that a second process view picks up newly published generations"""
+        reader = KnowledgeBase(root=str(tmp_path / "index"), embedder=HashingEmbedder(256))
+        assert reader.search("VPN") == []
+        
+        kb.ingest(DOCS)
+        
+        assert reader.search("connect to the VPN", k=1)[0].doc_id == "vpn"
+
+    def test_generation_reopened_only_when_published(self, kb, tmp_path):
+        """Test that readers keep their generation until CURRENT changes"""
+        kb.ingest(DOCS)
+        reader = KnowledgeBase(root=str(tmp_path / "index"), embedder=HashingEmbedder(256))
+
+        generation = reader.current()
+        assert reader.current() is generation
+
+        kb.delete("leave")
+
+        assert reader.current() is not generation
+        assert reader.current().manifest == kb.current().manifest
+
+    def test_ivf_index_for_large_corpus(self, kb, monkeypatch):
+        """Test that large indexes are partitioned and still find exact matches"""
+        monkeypatch.setattr(retrieval, "IVF_MIN_ROWS", 50)
+        monkeypatch.setattr(settings, "RETRIEVAL_NPROBE", 4)
+        documents = [Document(f"doc-{i}", f"topic{i} alpha{i % 7} beta{i % 11} gamma") for i in range(200)]
+        
+        kb.ingest(documents)
+        
+        assert len(kb.current().centroids) == int(np.sqrt(200))
+        assert kb.search("topic123 alpha4 beta2", k=1)[0].doc_id == "doc-123"
+
+
+class TestKnowledgeIntegration:
+    """Test suite for knowledge endpoints and run retrieval"""
+    
+    @pytest.fixture(autouse=True)
+    def isolated_index(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(retrieval.knowledge_base, "root", tmp_path / "kb")
+        monkeypatch.setattr(retrieval.knowledge_base, "_generation_name", None)
+        monkeypatch.setattr(retrieval.knowledge_base, "_pointer_stamp", None)
+    
+    def test_ingest_and_search_endpoints(self, client, auth_headers):
+        """Test ingesting documents and searching over HTTP"""
+        response = client.post(
+            "/api/knowledge/documents",
+            json={"documents": [{"doc_id": d.doc_id, "title": d.title, "text": d.text} for d in DOCS]},
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+        assert response.json()["chunks"] == 3
+        
+        response = client.get("/api/knowledge/search", params={"q": "expense receipts"}, headers=auth_headers)
+        assert response.json()["results"][0]["doc_id"] == "expenses"
+    
+    def test_delete_missing_document(self, client, auth_headers):
+        """Test deleting a document that is not indexed"""
+        response = client.delete("/api/knowledge/documents/missing", headers=auth_headers)
+        
+        assert response.status_code == 404
+    
+    def test_run_with_retrieval(self, client, auth_headers):
+        """Test that runs can attach retrieved chunks"""
+        retrieval.knowledge_base.ingest(DOCS)
+        
+        response = client.post(
+            "/api/agents/run",
+            json={
+                "agent_id": "agent-1",
+                "messages": [{"role": "user", "content": "How do I connect to the VPN?"}],
+                "retrieval": {"top_k": 1},
+            },
+            headers=auth_headers,
+        )
+        
+        chunks = response.json()["metadata"]["retrieved_chunks"]
+        assert [c["doc_id"] for c in chunks] == ["vpn"]
@@ -0,0 +1,197 @@
+"""
+Tests for the semantic response cache
+"""
+
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from app.routes.agents import AgentRunRequest, Message
+from app.services import embeddings
+from app.services.context import build_run_context
+from app.services.embeddings import HashingEmbedder
+from app.services.executor import Executors
+from app.services.semantic_cache import SemanticCache, semantic_cache
+
+
+def make_cache(**kwargs):
+    options = {"agents": ["agent-1"], "threshold": 0.8, "max_entries": 4, "ttl_seconds": 3600}
+    options.update(kwargs)
+    return SemanticCache(embedder=HashingEmbedder(256), **options)
+
+
+class TestHashingEmbedder:
+    """Test suite for the hashing vectorizer"""
+    
+    def test_vectors_are_normalized_and_stable(self):
+        """Test that embeddings are unit length and deterministic"""
+        embedder = HashingEmbedder(128)
+        
+        first = embedder.embed("How do I reset my password?")
+        second = embedder.embed("How do I reset my password?")
+        
+        assert first.dtype == np.float32
+        assert np.isclose(np.linalg.norm(first), 1.0)
+        assert np.array_equal(first, second)
+    
+    def test_paraphrases_are_closer_than_unrelated_text(self):
+        """Test that paraphrases score higher than unrelated questions"""
+        embedder = HashingEmbedder(512)
+        query = embedder.embed("How do I reset my password?")
+        
+        paraphrase = float(query @ embedder.embed("how can I reset the password"))
+        unrelated = float(query @ embedder.embed("What is the capital of France?"))
+        
+        assert paraphrase > 0.9
+        assert unrelated < 0.3
+
+
+class TestSemanticCache:
+    """Test suite for the semantic cache"""
+    
+    def test_paraphrase_hits_cache(self):
+        """Test that a paraphrased question returns the cached answer"""
+        cache = make_cache()
+        cache.store("agent-1", "fp", "How do I reset my password?", "Use the reset link.")
+        
+        hit, _ = cache.lookup("agent-1", "fp", "how can I reset the password")
+        
+        assert hit is not None
+        assert hit.entry.answer == "Use the reset link."
+        assert hit.similarity >= 0.8
+        assert cache.stats()["hits"] == 1
+    
+    def test_unrelated_question_misses(self):
+        """Test that an unrelated question misses"""
+        cache = make_cache()
+        cache.store("agent-1", "fp", "How do I reset my password?", "Use the reset link.")
+        
+        hit, _ = cache.lookup("agent-1", "fp", "How do I change my email address?")
+        
+        assert hit is None
+        assert cache.stats()["misses"] == 1
+    
+    def test_namespaces_and_fingerprints_are_isolated(self):
+        """Test that answers never leak across agents or prompt prefixes"""
+        cache = make_cache(agents=["agent-1", "agent-2"])
+        cache.store("agent-1", "fp", "What are your opening hours?", "9 to 5")
+        
+        assert cache.lookup("agent-2", "fp", "What are your opening hours?")[0] is None
+        assert cache.lookup("agent-1", "other", "What are your opening hours?")[0] is None
+
+    def test_other_fingerprints_do_not_crowd_out_matches(self):
+        """Test that closer entries under an old prompt prefix do not hide a servable one"""
+        cache = make_cache(max_entries=16)
+        for i in range(10):
+            cache.store("agent-1", f"old-{i}", "What are your opening hours?", "8 to 4")
+        cache.store("agent-1", "fp", "What are your opening hours today?", "9 to 5")
+
+        hit, _ = cache.lookup("agent-1", "fp", "What are your opening hours?")
+
+        assert hit is not None
+        assert hit.entry.answer == "9 to 5"
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted when full"""
+        cache = make_cache(max_entries=2)
+        cache.store("agent-1", "fp", "opening hours", "9 to 5")
+        cache.store("agent-1", "fp", "reset password", "Use the link")
+        cache.lookup("agent-1", "fp", "opening hours")
+        cache.store("agent-1", "fp", "shipping cost", "Free")
+        
+        assert cache.lookup("agent-1", "fp", "opening hours")[0] is not None
+        assert cache.lookup("agent-1", "fp", "reset password")[0] is None
+        assert cache.stats()["namespaces"]["agent-1"]["evictions"] == 1
+    
+    def test_expired_entries_are_not_served(self, monkeypatch):
+        """Test that entries older than the TTL are dropped"""
+        cache = make_cache(ttl_seconds=10)
+        cache.store("agent-1", "fp", "opening hours", "9 to 5")
+        
+        import app.services.semantic_cache as module
+        real_time = module.time.time
+        monkeypatch.setattr(module.time, "time", lambda: real_time() + 60)
+        
+        assert cache.lookup("agent-1", "fp", "opening hours")[0] is None
+        assert cache.stats()["namespaces"]["agent-1"]["expirations"] == 1
+    
+    @pytest.mark.parametrize("messages,expected", [
+        ([{"role": "user", "content": "Hi"}], "Hi"),
+        ([{"role": "system", "content": "S"}, {"role": "user", "content": "Hi"}], "Hi"),
+        ([{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"},
+          {"role": "user", "content": "More"}], None),
+        ([], None),
+    ])
+    def test_only_single_turn_conversations_are_cached(self, messages, expected):
+        """Test which conversations are eligible for caching"""
+        assert SemanticCache.query_text(messages) == expected
+
+
+class TestSemanticCacheIntegration:
+    """Test suite for the semantic cache in the run endpoint"""
+    
+    def test_opted_in_agent_serves_cached_answer(self, client, auth_headers, monkeypatch):
+        """Test that a paraphrased repeat is answered from the cache"""
+        monkeypatch.setattr(semantic_cache, "agents", {"agent-1"})
+        semantic_cache.clear()
+        
+        def run(content):
+            return client.post(
+                "/api/agents/run",
+                json={"agent_id": "agent-1", "messages": [{"role": "user", "content": content}]},
+                headers=auth_headers,
+            ).json()
+        
+        first = run("How do I reset my password?")
+        second = run("how can I reset the password")
+        
+        assert first["metadata"]["semantic_cache"] == {"hit": False}
+        assert second["metadata"]["semantic_cache"]["hit"] is True
+        assert second["message"]["content"] == first["message"]["content"]
+        assert second["usage"]["total_tokens"] == 0
+    
+    def test_agents_are_not_cached_by_default(self, client, auth_headers, mock_agent_request):
+        """Test that agents that did not opt in bypass the cache"""
+        response = client.post("/api/agents/run", json=mock_agent_request, headers=auth_headers)
+        
+        assert "semantic_cache" not in response.json()["metadata"]
+
+    def test_large_message_is_embedded_off_the_loop(self, monkeypatch):
+        """Test that the event loop keeps running while a large cached-agent message is embedded"""
+        pools = Executors(threads=1, processes=1)
+        pools.start()
+        monkeypatch.setattr(embeddings, "executors", pools)
+        monkeypatch.setattr(semantic_cache, "agents", {"agent-1"})
+        semantic_cache.clear()
+        content = " ".join(f"word{i % 5000}" for i in range(40000))
+        request = AgentRunRequest(agent_id="agent-1", messages=[Message(role="user", content=content)])
+
+        async def scenario():
+            context = await build_run_context(request)
+            gaps = []
+
+            async def tick():
+                last = time.perf_counter()
+                while True:
+                    await asyncio.sleep(0.005)
+                    now = time.perf_counter()
+                    gaps.append(now - last)
+                    last = now
+
+            ticker = asyncio.create_task(tick())
+            started = time.perf_counter()
+            lookup = await semantic_cache.lookup_run(context)
+            elapsed = time.perf_counter() - started
+            ticker.cancel()
+            return lookup, max(gaps), elapsed
+
+        try:
+            lookup, longest_gap, elapsed = asyncio.run(scenario())
+        finally:
+            asyncio.run(pools.shutdown())
+
+        assert lookup is not None and lookup.hit is None
+        assert elapsed > 0.2
+        assert longest_gap < 0.1
@@ -0,0 +1,83 @@
+"""
+Tests for the pluggable JSON backend
+"""
+
+import json
+import pytest
+
+from app.routes.agents import Message
+from app.services import serialization
+from app.services.serialization import FastJSONResponse, StdlibBackend, load_backend
+
+
+class TestSerialization:
+    """Test suite for JSON serialization"""
+
+    @pytest.mark.parametrize("name", ["stdlib", "orjson"])
+    def test_backends_produce_equivalent_json(self, name):
+        """Test that every backend round-trips the same payload"""
+        if name == "orjson" and serialization.orjson is None:
+            pytest.skip("orjson not installed")
+
+        backend = load_backend(name)
+        payload = {"type": "token", "content": "Hej verden ✓", "done": False, "seq": 1}
+
+        encoded = backend.dumps(payload)
+
+        assert isinstance(encoded, bytes)
+        assert json.loads(encoded) == payload
+        assert backend.loads(encoded) == payload
+
+    @pytest.mark.parametrize("name", ["stdlib", "orjson"])
+    def test_non_finite_floats_are_never_emitted(self, name):
+        """Test that no backend writes NaN or Infinity, which are not valid JSON"""
+        if name == "orjson" and serialization.orjson is None:
+            pytest.skip("orjson not installed")
+
+        backend = load_backend(name)
+
+        for value in (float("nan"), float("inf")):
+            try:
+                encoded = backend.dumps({"score": value})
+            except ValueError:
+                continue
+            assert b"NaN" not in encoded and b"Infinity" not in encoded
+
+        with pytest.raises(ValueError):
+            StdlibBackend().dumps({"score": float("nan")})
+
+    def test_auto_falls_back_to_stdlib(self, monkeypatch):
+        """Test that a missing orjson falls back to the standard library"""
+        monkeypatch.setattr(serialization, "orjson", None)
+
+        assert load_backend("auto").name == "stdlib"
+        assert load_backend("orjson").name == "stdlib"
+
+    def test_unknown_backend(self):
+        """Test that an unknown backend name is rejected"""
+        with pytest.raises(ValueError):
+            load_backend("simplejson")
+
+    def test_pydantic_models_are_serialized(self):
+        """Test that pydantic models nested in payloads are serialized"""
+        message = Message(role="assistant", content="Hi")
+
+        encoded = StdlibBackend().dumps({"message": message})
+
+        assert json.loads(encoded) == {"message": {"role": "assistant", "content": "Hi", "name": None}}
+
+    def test_response_class_uses_active_backend(self, monkeypatch):
+        """Test that FastJSONResponse renders with the active backend"""
+        monkeypatch.setattr(serialization, "backend", StdlibBackend())
+
+        response = FastJSONResponse({"status": "healthy"})
+
+        assert response.body == b'{"status":"healthy"}'
+        assert response.headers["content-type"] == "application/json"
+
+    def test_default_response_class(self, client):
+        """Test that REST endpoints respond with compact JSON"""
+        response = client.get("/api/health/ping")
+
+        assert response.headers["content-type"] == "application/json"
+        assert b", " not in response.content
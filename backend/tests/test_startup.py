@@ -0,0 +1,75 @@
+"""
+Tests for startup time and prewarming
+"""
+
+import asyncio
+
+from benchmarks.bench_startup import FIRST_PING_TARGET_MS, LAZY_MODULES, import_times, time_to_first_ping
+from app.services.lazy import LazyModule, lazy_import
+from app.services.prewarm import Prewarmer
+
+
+class TestLazyImports:
+    """Test suite for keeping optional dependencies off the startup path"""
+
+    def test_app_import_skips_optional_dependencies(self):
+        """Test that importing the app does not import lazily loaded modules"""
+        times = import_times("app.main")
+        assert "app.main" in times
+        assert [name for name in LAZY_MODULES if name in times] == []
+
+    def test_lazy_module_loads_on_first_use(self):
+        """Test that a lazy module imports its target on attribute access"""
+        module = LazyModule("json")
+        assert module.dumps({"a": 1}) == '{"a": 1}'
+        assert "dumps" in module.__dict__
+        assert lazy_import("json").__name__ == "json"
+
+
+class TestStartup:
+    """Test suite for time to first healthy ping"""
+
+    def test_first_ping_within_target(self):
+        """Test that a fresh server answers its first health ping within the target"""
+        elapsed_ms = min(time_to_first_ping() for _ in range(2))
+        assert elapsed_ms < FIRST_PING_TARGET_MS
+
+
+class TestPrewarmer:
+    """Test suite for background warm-up"""
+
+    def test_runs_steps_then_callback(self):
+        """Test that steps run off the loop, failures are recorded and the callback fires"""
+        calls = []
+
+        def failing():
+            raise RuntimeError("no database")
+
+        prewarmer = Prewarmer(steps=[("ok", lambda: calls.append("ok")), ("db", failing)], delay=0)
+
+        async def scenario():
+            prewarmer.start(then=lambda: calls.append("then"))
+            await prewarmer._task
+
+        asyncio.run(scenario())
+
+        assert calls == ["ok", "then"]
+        stats = prewarmer.stats()
+        assert stats["done"]
+        assert stats["errors"] == {"db": "no database"}
+        assert set(stats["timings_ms"]) == {"ok", "db"}
+
+    def test_cancelled_warmup_skips_callback(self):
+        """Test that stopping the warm-up at shutdown does not start what follows it"""
+        calls = []
+        prewarmer = Prewarmer(steps=[("ok", lambda: calls.append("ok"))], delay=60)
+
+        async def scenario():
+            prewarmer.start(then=lambda: calls.append("then"))
+            await asyncio.sleep(0)
+            await prewarmer.stop()
+
+        asyncio.run(scenario())
+
+        assert calls == []
+        assert prewarmer.stats()["done"]
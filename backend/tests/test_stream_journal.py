@@ -0,0 +1,193 @@
+"""
+Tests for the resumable stream journal
+"""
+
+import asyncio
+import pytest
+
+from app.services import stream_journal
+from app.services.stream_journal import JournalRegistry, JournalTruncated, RunJournal
+
+
+def token(content):
+    return {"type": "token", "content": content, "done": False}
+
+
+class TestRunJournal:
+    """Test suite for the per-run event journal"""
+
+    def test_append_assigns_sequence_numbers(self):
+        """Test that events are numbered in order"""
+        journal = RunJournal("run-1", max_events=10)
+
+        first = journal.append(token("a"))
+        second = journal.append(token("b"))
+
+        assert first["seq"] == 1
+        assert second["seq"] == 2
+        assert [e["content"] for e in journal.replay(1)] == ["b"]
+
+    def test_done_event_finishes_run(self):
+        """Test that a terminal event closes the journal"""
+        journal = RunJournal("run-1", max_events=10)
+        journal.append({"type": "complete", "done": True})
+
+        assert journal.done
+        with pytest.raises(RuntimeError):
+            journal.append(token("late"))
+
+    def test_ring_buffer_truncates_without_spill(self):
+        """Test that evicted events cannot be replayed without a spill file"""
+        journal = RunJournal("run-1", max_events=3)
+        for i in range(5):
+            journal.append(token(str(i)))
+
+        assert [e["seq"] for e in journal.replay(2)] == [3, 4, 5]
+        with pytest.raises(JournalTruncated):
+            journal.replay(0)
+
+    def test_ring_buffer_spills_to_disk(self, tmp_path):
+        """Test that evicted events are replayed from the spill file"""
+        spill = tmp_path / "run-1.jsonl"
+        journal = RunJournal("run-1", max_events=2, spill_path=spill)
+        for i in range(6):
+            journal.append(token(str(i)))
+
+        assert len(journal.events) == 2
+        assert [e["seq"] for e in journal.replay(1)] == [2, 3, 4, 5, 6]
+
+        journal.cleanup()
+        assert not spill.exists()
+
+    def test_spill_writes_are_buffered(self, tmp_path):
+        """Test that spilled events reach the disk in chunks, not per token"""
+        spill = tmp_path / "run-1.jsonl"
+        journal = RunJournal("run-1", max_events=2, spill_path=spill)
+        for i in range(20):
+            journal.append(token(str(i)))
+
+        assert spill.stat().st_size == 0
+        assert [e["seq"] for e in journal.replay(0)][:3] == [1, 2, 3]
+        assert spill.stat().st_size > 0
+
+        journal.append({"type": "complete", "done": True})
+        assert journal._spill is None
+        journal.cleanup()
+
+    def test_replay_seeks_with_spill_index(self, tmp_path, monkeypatch):
+        """Test that replays start from the nearest indexed offset and see every later event"""
+        monkeypatch.setattr(stream_journal, "SPILL_INDEX_INTERVAL", 4)
+        journal = RunJournal("run-1", max_events=3, spill_path=tmp_path / "run-1.jsonl")
+        for i in range(30):
+            journal.append(token(str(i)))
+
+        assert len(journal._spill_index) == 7
+        for after_seq in (0, 3, 4, 5, 16, 26, 27, 29):
+            assert [e["seq"] for e in journal.replay(after_seq)] == list(range(after_seq + 1, 31))
+        journal.cleanup()
+
+    def test_follow_reads_spill_in_thread_pool(self, tmp_path, monkeypatch):
+        """Test that a lagging follower reads spilled events off the loop in batches"""
+        monkeypatch.setattr(stream_journal, "SPILL_READ_BATCH", 5)
+        reads = []
+        run_in_thread = stream_journal.executors.run_in_thread
+
+        async def counting(fn, *args):
+            reads.append(args)
+            return await run_in_thread(fn, *args)
+
+        monkeypatch.setattr(stream_journal.executors, "run_in_thread", counting)
+        journal = RunJournal("run-1", max_events=4, spill_path=tmp_path / "run-1.jsonl")
+        for i in range(20):
+            journal.append(token(str(i)))
+        journal.append({"type": "complete", "done": True})
+
+        async def scenario():
+            return [event["seq"] async for event in journal.follow(2)]
+
+        assert asyncio.run(scenario()) == list(range(3, 22))
+        assert [args[0] for args in reads] == [2, 7, 12]
+        journal.cleanup()
+
+    def test_follow_yields_missed_then_live_events(self):
+        """Test that a follower catches up and then receives live events"""
+        async def scenario():
+            journal = RunJournal("run-1", max_events=10)
+            journal.append(token("a"))
+            journal.append(token("b"))
+
+            async def produce():
+                await asyncio.sleep(0.01)
+                journal.append(token("c"))
+                journal.append({"type": "complete", "done": True})
+
+            producer = asyncio.create_task(produce())
+            received = [event async for event in journal.follow(1)]
+            await producer
+            return received
+
+        received = asyncio.run(scenario())
+
+        assert [e["seq"] for e in received] == [2, 3, 4]
+        assert received[-1]["type"] == "complete"
+
+
+class TestJournalRegistry:
+    """Test suite for the journal registry"""
+
+    def test_orphaned_run_is_cancelled_after_grace(self):
+        """Test that a run nobody resumes is cancelled after the grace period"""
+        async def scenario():
+            registry = JournalRegistry(max_events=10, grace_seconds=0.01, spill_dir="")
+            journal = registry.create()
+
+            async def produce():
+                await asyncio.sleep(10)
+
+            task = registry.start(journal, produce())
+            registry.detach(journal)
+            await asyncio.sleep(0.05)
+            return registry, journal, task
+
+        registry, journal, task = asyncio.run(scenario())
+
+        assert task.cancelled()
+        assert registry.get(journal.run_id) is None
+
+    def test_expired_run_does_not_recreate_spill_file(self, tmp_path):
+        """Test that events appended by a cancelled producer after cleanup are not spilled"""
+        async def scenario():
+            registry = JournalRegistry(max_events=2, grace_seconds=0.01, spill_dir=str(tmp_path))
+            journal = registry.create()
+
+            async def produce():
+                try:
+                    for i in range(5):
+                        journal.append(token(str(i)))
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    journal.append({"type": "error", "error": "Run cancelled", "done": True})
+                    raise
+
+            task = registry.start(journal, produce())
+            await asyncio.sleep(0)
+            registry.detach(journal)
+            await asyncio.sleep(0.05)
+            return registry, journal, task
+
+        registry, journal, task = asyncio.run(scenario())
+
+        assert task.cancelled()
+        assert registry.get(journal.run_id) is None
+        assert list(tmp_path.iterdir()) == []
+
+    def test_finished_run_is_kept_for_grace(self):
+        """Test that finished runs stay resumable until the grace period ends"""
+        registry = JournalRegistry(max_events=10, grace_seconds=60, spill_dir="")
+        journal = registry.create()
+        journal.append({"type": "complete", "done": True})
+
+        assert registry.get(journal.run_id) is journal
+
+        registry.grace_seconds = 0
+        assert registry.get(journal.run_id) is None
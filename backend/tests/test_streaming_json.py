@@ -0,0 +1,247 @@
+"""
+Tests for incremental request body parsing
+"""
+
+import json
+
+import pytest
+from fastapi import status
+
+from app.config import settings
+from app.services.streaming_json import BodyTooLarge, JSONStreamError, StreamingObjectParser
+
+
+def _chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _parse(document, chunk_size: int, **kwargs):
+    items = []
+    parser = StreamingObjectParser("messages", lambda index, value: items.append((index, value)), **kwargs)
+    for chunk in _chunks(json.dumps(document).encode(), chunk_size):
+        parser.feed(chunk)
+    return parser, parser.close(), items
+
+
+DOCUMENT = {
+    "agent_id": "agent-é中",
+    "messages": [
+        {"role": "user", "content": "line\nwith \"quotes\" and \\ slashes 😀"},
+        {"role": "assistant", "content": "x" * 5000, "name": None},
+        {"role": "user", "content": "", "extra": [1, -2.5, 3e10, True, False, None, {"a": []}]},
+        {"role": "user", "content": 'code: {"a": [1, 2]}, {"b": "\\\\"}], ' * 300 + "\\\\"},
+        [{"nested": "}, "}],
+        {"role": "system", "content": "é" * 3000 + '\\"' * 2000},
+    ],
+    "temperature": 0.7,
+    "max_tokens": 128,
+    "tools": [{"name": "search", "args": {"q": "nested [\"array\"]"}}],
+    "metadata": {},
+}
+
+
+class TestStreamingObjectParser:
+    """Test suite for the streaming JSON parser"""
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1000, 4099, 100000])
+    def test_round_trips_at_any_chunk_size(self, chunk_size):
+        """Test that chunk boundaries do not change the parsed result"""
+        _, fields, items = _parse(DOCUMENT, chunk_size)
+
+        assert [value for _, value in items] == DOCUMENT["messages"]
+        assert [index for index, _ in items] == list(range(len(DOCUMENT["messages"])))
+        assert fields == {**DOCUMENT, "messages": []}
+
+    @pytest.mark.parametrize("chunk_size", [1, 5, 4096])
+    def test_long_strings_are_spooled(self, chunk_size):
+        """Test that strings over the threshold go through a spool file intact"""
+        content = ("abc\\\"é" * 4000) + "\n"
+        parser, _, items = _parse(
+            {"agent_id": "a", "messages": [{"role": "user", "content": content}]},
+            chunk_size,
+            spool_threshold=1024,
+            spool_max_memory=4096,
+        )
+
+        assert items[0][1]["content"] == content
+        assert parser.spooled_strings == 1
+
+    def test_item_callback_stops_parsing(self):
+        """Test that an error raised for one item rejects the rest of the body"""
+        seen = []
+
+        def on_item(index, value):
+            seen.append(index)
+            if value["role"] == "bad":
+                raise ValueError("invalid message")
+
+        parser = StreamingObjectParser("messages", on_item)
+        parser.feed(b'{"messages": [{"role": "user"}, {"role": "bad"')
+        with pytest.raises(ValueError):
+            parser.feed(b'}, {"role": "user"}]}')
+        assert seen == [0, 1]
+
+    @pytest.mark.parametrize("body", [
+        b'[1, 2]',
+        b'{"a": 1,}',
+        b'{"a" 1}',
+        b'{"a": tru}',
+        b'{"a": 01}',
+        b'{"a": 1} {}',
+        b'{"a": "unterminated',
+        b'{"a": [1, 2}',
+        b'{"a": -}',
+    ])
+    def test_malformed_json(self, body):
+        """Test that malformed documents raise JSONStreamError"""
+        parser = StreamingObjectParser("messages", lambda index, value: None)
+        with pytest.raises(JSONStreamError):
+            for chunk in _chunks(body, 3):
+                parser.feed(chunk)
+            parser.close()
+
+    def test_error_offset(self):
+        """Test that errors report the absolute byte offset"""
+        parser = StreamingObjectParser("messages", lambda index, value: None)
+        parser.feed(b'{"messages": [], ')
+        with pytest.raises(JSONStreamError) as excinfo:
+            parser.feed(b'"a": ?}')
+        assert excinfo.value.offset == 22
+
+    @pytest.mark.parametrize("body, offset", [
+        (b'{"agent_id": "a\x01b"}', 15),
+        (b'{"agent_id": "ok\xffx"}', 16),
+        (b'{"agent_id": "\\q"}', 14),
+    ])
+    def test_invalid_strings(self, body, offset):
+        """Test that control characters, bad UTF-8 and bad escapes raise JSONStreamError"""
+        parser = StreamingObjectParser("messages", lambda index, value: None)
+        with pytest.raises(JSONStreamError) as excinfo:
+            parser.feed(body)
+        assert excinfo.value.offset == offset
+
+    def test_invalid_spooled_string(self):
+        """Test that errors in spooled strings point into the string"""
+        parser = StreamingObjectParser("messages", lambda index, value: None, spool_threshold=8)
+        with pytest.raises(JSONStreamError) as excinfo:
+            for chunk in _chunks(b'{"agent_id": "' + b"x" * 40 + b'\x01"}', 5):
+                parser.feed(chunk)
+        assert excinfo.value.offset == 54
+
+    def test_max_bytes(self):
+        """Test that feeding more than max_bytes raises BodyTooLarge"""
+        parser = StreamingObjectParser("messages", lambda index, value: None, max_bytes=10)
+        parser.feed(b'{"a": ')
+        with pytest.raises(BodyTooLarge):
+            parser.feed(b'"0123456789"}')
+
+
+class TestRunRequestParsing:
+    """Test suite for /agents/run body parsing"""
+
+    @pytest.fixture
+    def stream_everything(self, monkeypatch):
+        monkeypatch.setattr(settings, "REQUEST_STREAM_PARSE_MIN_BYTES", 0)
+        monkeypatch.setattr(settings, "REQUEST_SPOOL_THRESHOLD_BYTES", 1024)
+
+    def test_large_body_runs(self, client, auth_headers, stream_everything):
+        """Test that a streamed body with long contents is accepted"""
+        body = {
+            "agent_id": "test-agent",
+            "messages": [{"role": "user", "content": "word " * 50000}] * 3,
+            "temperature": 0.2,
+        }
+        response = client.post("/api/agents/run", json=body, headers=auth_headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["agent_id"] == "test-agent"
+
+    def test_chunked_body_runs(self, client, auth_headers, mock_agent_request):
+        """Test that a body without Content-Length is streamed"""
+        data = json.dumps(mock_agent_request).encode()
+        response = client.post(
+            "/api/agents/run",
+            content=iter(_chunks(data, 16)),
+            headers={**auth_headers, "Content-Type": "application/json"},
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_invalid_message_location(self, client, auth_headers, stream_everything):
+        """Test that message errors point at the offending message"""
+        body = {
+            "agent_id": "test-agent",
+            "messages": [{"role": "user", "content": "ok"}, {"role": "user", "content": 42}],
+        }
+        response = client.post("/api/agents/run", json=body, headers=auth_headers)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["detail"][0]["loc"] == ["body", "messages", 1, "content"]
+
+    def test_missing_field(self, client, auth_headers, stream_everything):
+        """Test that top-level fields are validated after streaming"""
+        body = {"messages": [{"role": "user", "content": "hi"}]}
+        response = client.post("/api/agents/run", json=body, headers=auth_headers)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["detail"][0]["loc"] == ["body", "agent_id"]
+
+    @pytest.mark.parametrize("messages", ['"hi"', '{"role": "user", "content": "hi"}', None])
+    def test_messages_not_an_array(self, client, auth_headers, stream_everything, messages):
+        """Test that a messages value that is not an array, or is missing, is rejected"""
+        body = '{"agent_id": "test-agent"' + (f', "messages": {messages}' if messages else "") + "}"
+        response = client.post(
+            "/api/agents/run",
+            content=body.encode(),
+            headers={**auth_headers, "Content-Type": "application/json"},
+        )
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["detail"][0]["loc"] == ["body", "messages"]
+
+    @pytest.mark.parametrize("streamed", [False, True])
+    def test_malformed_body(self, client, auth_headers, monkeypatch, streamed):
+        """Test that malformed JSON is a 422 on both paths"""
+        if streamed:
+            monkeypatch.setattr(settings, "REQUEST_STREAM_PARSE_MIN_BYTES", 0)
+        response = client.post(
+            "/api/agents/run",
+            content=b'{"agent_id": "a", "messages": [',
+            headers={**auth_headers, "Content-Type": "application/json"},
+        )
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["detail"][0]["type"] == "json_invalid"
+
+    @pytest.mark.parametrize("content", [b'"a\x01b"', b'"\xff"', b'"\\q"'])
+    def test_invalid_string_body(self, client, auth_headers, monkeypatch, content):
+        """Test that bad strings are a 422 on the streamed path, as on the buffered one"""
+        monkeypatch.setattr(settings, "REQUEST_STREAM_PARSE_MIN_BYTES", 0)
+        response = client.post(
+            "/api/agents/run",
+            content=b'{"agent_id": ' + content + b', "messages": []}',
+            headers={**auth_headers, "Content-Type": "application/json"},
+        )
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["detail"][0]["type"] == "json_invalid"
+
+    def test_chunked_body_too_large(self, client, auth_headers, monkeypatch):
+        """Test that chunked bodies are held to MAX_BODY_SIZE"""
+        monkeypatch.setattr(settings, "MAX_BODY_SIZE", 1000)
+        data = json.dumps({"agent_id": "a", "messages": [{"role": "user", "content": "x" * 5000}]}).encode()
+        response = client.post(
+            "/api/agents/run",
+            content=iter(_chunks(data, 256)),
+            headers={**auth_headers, "Content-Type": "application/json"},
+        )
+
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    def test_request_body_documented(self, client, auth_headers):
+        """Test that the OpenAPI document still describes the request body"""
+        schema = client.get("/openapi.json", headers=auth_headers).json()
+        body = schema["paths"]["/api/agents/run"]["post"]["requestBody"]["content"]["application/json"]["schema"]
+
+        assert "agent_id" in body["required"]
+        assert body["properties"]["messages"]["items"]["properties"]["content"]["type"] == "string"
@@ -0,0 +1,169 @@
+"""
+Tests for request tracing
+"""
+
+import json
+import time
+
+from app.services.tracing import (
+    OTLPFileExporter,
+    Tracer,
+    new_request_id,
+    parse_traceparent,
+    tracer,
+)
+
+PARENT_TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_TRACEPARENT = f"00-{PARENT_TRACE_ID}-00f067aa0ba902b7-01"
+
+
+class TestTraceContext:
+    """Test suite for IDs and W3C trace context"""
+
+    def test_request_ids_are_unique(self):
+        """Test that request IDs do not collide within the same millisecond"""
+        ids = {new_request_id() for _ in range(1000)}
+        assert len(ids) == 1000
+
+    def test_parse_traceparent(self):
+        """Test parsing valid and invalid traceparent headers"""
+        assert parse_traceparent(PARENT_TRACEPARENT) == (PARENT_TRACE_ID, "00f067aa0ba902b7", True)
+        assert parse_traceparent(f"00-{PARENT_TRACE_ID}-00f067aa0ba902b7-00")[2] is False
+        assert parse_traceparent("garbage") is None
+        assert parse_traceparent(f"00-{'0' * 32}-00f067aa0ba902b7-01") is None
+        assert parse_traceparent(None) is None
+
+
+class TestTracer:
+    """Test suite for span collection"""
+
+    def test_nested_spans(self):
+        """Test that spans nest under the current span and traces are buffered"""
+        local = Tracer(buffer_size=10, sample_rate=1.0)
+
+        with local.start_trace("root", path="/x") as root:
+            with local.span("outer") as outer:
+                with local.span("inner") as inner:
+                    pass
+            local.record("measured", time.time_ns() - 1_000_000)
+
+        spans = local.find(root.trace_id)
+        assert [span.name for span in spans] == ["inner", "outer", "measured", "root"]
+        assert inner.parent_id == outer.span_id
+        assert outer.parent_id == root.span_id
+        assert all(span.trace_id == root.trace_id for span in spans)
+        assert local.summary(path="/x")["spans"]["measured"]["count"] == 1
+
+    def test_continues_propagated_trace(self):
+        """Test that an incoming traceparent sets the trace and parent IDs"""
+        local = Tracer(buffer_size=10, sample_rate=0.0)
+
+        with local.start_trace("root", traceparent=PARENT_TRACEPARENT) as root:
+            pass
+
+        # Sampled by the caller even though local sampling is off
+        assert root.trace_id == PARENT_TRACE_ID
+        assert root.parent_id == "00f067aa0ba902b7"
+        assert root.traceparent.startswith(f"00-{PARENT_TRACE_ID}-{root.span_id}")
+        assert len(local.traces) == 1
+
+    def test_unsampled_traces_are_not_recorded(self):
+        """Test that spans outside a sampled trace are no-ops"""
+        local = Tracer(buffer_size=10, sample_rate=0.0)
+
+        with local.span("orphan") as orphan:
+            assert orphan is None
+        with local.start_trace("root") as root:
+            with local.span("child") as child:
+                assert child is None
+
+        assert root.traceparent.endswith("-00")
+        assert len(local.traces) == 0
+
+    def test_error_status(self):
+        """Test that exceptions mark the span as failed"""
+        local = Tracer(buffer_size=10, sample_rate=1.0)
+
+        try:
+            with local.start_trace("root") as root:
+                with local.span("failing"):
+                    raise ValueError("boom")
+        except ValueError:
+            pass
+
+        spans = local.find(root.trace_id)
+        assert [span.status for span in spans] == ["error", "error"]
+        assert spans[0].attributes["error"] == "ValueError"
+
+    def test_otlp_file_export(self, tmp_path):
+        """Test that exported traces are OTLP/JSON lines"""
+        local = Tracer(buffer_size=10, sample_rate=1.0)
+        path = tmp_path / "traces.jsonl"
+        local.exporter = OTLPFileExporter(str(path), "test-service")
+        local.exporter.start()
+
+        with local.start_trace("root", status_code=200):
+            with local.span("child"):
+                pass
+        local.exporter.stop()
+
+        request = json.loads(path.read_text().strip())
+        resource_spans = request["resourceSpans"][0]
+        assert resource_spans["resource"]["attributes"][0]["value"]["stringValue"] == "test-service"
+        spans = resource_spans["scopeSpans"][0]["spans"]
+        assert [span["name"] for span in spans] == ["child", "root"]
+        assert spans[0]["parentSpanId"] == spans[1]["spanId"]
+        assert spans[1]["attributes"] == [{"key": "status_code", "value": {"intValue": "200"}}]
+
+
+class TestRequestTracing:
+    """Test suite for traced HTTP requests"""
+
+    def test_agent_run_stage_breakdown(self, client, auth_headers, mock_agent_request):
+        """Test that an agent run records a span per stage"""
+        response = client.post(
+            "/api/agents/run",
+            json=mock_agent_request,
+            headers={**auth_headers, "traceparent": PARENT_TRACEPARENT},
+        )
+        assert response.status_code == 200
+        assert response.headers["X-Request-ID"].startswith("req_")
+        assert response.headers["traceparent"].startswith(f"00-{PARENT_TRACE_ID}-")
+
+        spans = tracer.find(PARENT_TRACE_ID)
+        names = {span.name for span in spans}
+        assert {"http_request", "auth", "audit", "body_validation", "endpoint",
+                "context_build", "provider_call"} <= names
+
+    def test_trace_endpoints(self, client, auth_headers):
+        """Test listing, fetching and summarizing buffered traces"""
+        client.get("/api/agents/", headers=auth_headers)
+
+        response = client.get("/api/debug/traces?name=http_request&limit=5", headers=auth_headers)
+        assert response.status_code == 200
+        trace_id = response.json()["traces"][0]["trace_id"]
+
+        response = client.get(f"/api/debug/traces/{trace_id}", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["spans"][0]["name"] == "http_request"
+
+        response = client.get("/api/debug/traces/summary?path=/api/agents/", headers=auth_headers)
+        assert response.json()["spans"]["http_request"]["count"] >= 1
+
+        response = client.get(f"/api/debug/traces/{'f' * 32}", headers=auth_headers)
+        assert response.status_code == 404
+
+    def test_stream_run_trace(self, client, mock_agent_request):
+        """Test that a streaming run records queue wait, TTFT and streaming spans"""
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({"action": "run", **mock_agent_request})
+            while not websocket.receive_json()["done"]:
+                pass
+
+        deadline = time.time() + 2
+        while not tracer.recent(limit=1, name="agent_stream_run") and time.time() < deadline:
+            time.sleep(0.01)
+
+        spans = tracer.recent(limit=1, name="agent_stream_run")[0]
+        names = {span.name for span in spans}
+        assert {"queue_wait", "context_build", "provider_ttft", "streaming"} <= names
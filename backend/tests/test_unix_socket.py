@@ -0,0 +1,120 @@
+"""
+Tests for the Unix domain socket transport
+"""
+
+import json
+import os
+import socket
+import stat
+import threading
+import time
+
+import httpx
+import pytest
+from websockets.sync.client import unix_connect
+
+from app.config import settings
+from app.main import app
+from app.services.unix_socket import bind_unix_socket, get_peer_credentials, make_config
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix sockets only")
+
+
+@pytest.fixture
+def unix_server(tmp_path):
+    """Serve the app on a Unix socket from a background thread"""
+    import uvicorn
+
+    path = str(tmp_path / "backend.sock")
+    sock = bind_unix_socket(path)
+    server = uvicorn.Server(make_config(app, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.01)
+
+    yield path
+
+    server.should_exit = True
+    thread.join(timeout=10)
+
+
+def uds_client(path):
+    return httpx.Client(transport=httpx.HTTPTransport(uds=path), base_url="http://backend")
+
+
+class TestPeerCredentials:
+    """Test suite for socket setup and peer credentials"""
+
+    def test_socket_is_owner_only(self, tmp_path):
+        """Test that the socket file is created with restrictive permissions"""
+        path = tmp_path / "run" / "backend.sock"
+        sock = bind_unix_socket(str(path))
+        try:
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+            assert stat.S_ISSOCK(os.stat(path).st_mode)
+        finally:
+            sock.close()
+
+    def test_replaces_stale_socket(self, tmp_path):
+        """Test that a socket file left by a previous run is replaced"""
+        path = str(tmp_path / "backend.sock")
+        bind_unix_socket(path).close()
+        bind_unix_socket(path).close()
+
+    def test_refuses_socket_in_use(self, tmp_path):
+        """Test that a socket another server is listening on is not taken over"""
+        path = str(tmp_path / "backend.sock")
+        sock = bind_unix_socket(path)
+        sock.listen()
+        try:
+            with pytest.raises(RuntimeError, match="in use"):
+                bind_unix_socket(path)
+            assert os.path.exists(path)
+        finally:
+            sock.close()
+
+    def test_peer_credentials(self):
+        """Test reading the peer's uid and pid from the kernel"""
+        left, right = socket.socketpair(socket.AF_UNIX)
+        try:
+            credentials = get_peer_credentials(left)
+        finally:
+            left.close()
+            right.close()
+
+        assert credentials.uid == os.getuid()
+        assert credentials.pid in (None, os.getpid())
+
+    def test_tcp_has_no_peer_credentials(self):
+        """Test that non-Unix sockets have no peer credentials"""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            assert get_peer_credentials(sock) is None
+
+
+class TestUnixSocketServer:
+    """Test suite for serving REST and WebSocket traffic over the socket"""
+
+    def test_rest_without_token(self, unix_server):
+        """Test that authenticated peers skip the Bearer check"""
+        with uds_client(unix_server) as client:
+            response = client.get("/api/agents/")
+
+        assert response.status_code == 200
+        assert "agents" in response.json()
+
+    def test_websocket_stream(self, unix_server):
+        """Test the agent stream over the socket"""
+        with unix_connect(unix_server, uri="ws://backend/api/agents/stream") as websocket:
+            websocket.send(json.dumps({"action": "ping"}))
+            assert json.loads(websocket.recv(timeout=5)) == {"type": "pong"}
+
+    def test_rejects_other_users(self, unix_server, monkeypatch):
+        """Test that peers outside the allowed uids are disconnected"""
+        monkeypatch.setattr(settings, "UNIX_SOCKET_ALLOWED_UIDS", [os.getuid() + 1])
+
+        with uds_client(unix_server) as client:
+            with pytest.raises(httpx.TransportError):
+                client.get("/api/agents/")
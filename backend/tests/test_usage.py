@@ -0,0 +1,247 @@
+"""
+Tests for usage accounting and rollups
+"""
+
+import asyncio
+import random
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.config import settings
+from app.routes import agents as agents_routes
+from app.routes import usage as usage_routes
+from app.services.usage import (
+    LatencySketch,
+    UsageAccounting,
+    UsageEvent,
+    UsageStore,
+    aggregate,
+    bucket_start,
+    pick_resolution,
+)
+
+HOUR = 3600
+T0 = int(time.time() // 86400 - 1) * 86400  # Yesterday midnight UTC, inside minute retention
+
+
+@pytest.fixture
+def store(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'usage.db'}")
+    yield UsageStore(engine_factory=lambda: engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def accounting(store):
+    return UsageAccounting(store=store)
+
+
+def event(timestamp, agent_id="agent-1", model="gpt-4", latency_ms=100.0, **kwargs):
+    return UsageEvent(
+        agent_id=agent_id,
+        provider="anthropic" if model.startswith("claude") else "openai",
+        model=model,
+        latency_ms=latency_ms,
+        prompt_tokens=kwargs.pop("prompt_tokens", 10),
+        completion_tokens=kwargs.pop("completion_tokens", 5),
+        timestamp=timestamp,
+        **kwargs,
+    )
+
+
+class TestLatencySketch:
+    """Test suite for the quantile sketch"""
+
+    def test_quantiles_within_relative_error(self):
+        """Test that quantiles are within the configured accuracy"""
+        values = [random.lognormvariate(5, 1) for _ in range(10000)]
+        sketch = LatencySketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        ordered = sorted(values)
+        for q in (0.5, 0.95, 0.99):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            assert abs(sketch.quantile(q) - exact) / exact <= 0.011
+
+    def test_merge_matches_combined(self):
+        """Test that merged sketches equal one sketch of all values"""
+        left, right, combined = LatencySketch(), LatencySketch(), LatencySketch()
+        for i in range(1, 200):
+            (left if i % 2 else right).add(i)
+            combined.add(i)
+
+        left.merge(LatencySketch.from_json(right.to_json()))
+        assert left.bins == combined.bins
+        assert left.quantile(0.9) == combined.quantile(0.9)
+
+
+class TestRollups:
+    """Test suite for bucketing and database merges"""
+
+    def test_bucket_boundaries(self):
+        """Test bucket alignment and automatic resolution"""
+        assert bucket_start(T0 + 3661, "minute") == T0 + 3660
+        assert bucket_start(T0 + 3661, "hour") == T0 + 3600
+        assert bucket_start(T0 + 3661, "day") == T0
+        assert pick_resolution(T0, T0 + HOUR) == "minute"
+        assert pick_resolution(T0, T0 + 7 * 86400) == "hour"
+        assert pick_resolution(T0, T0 + 90 * 86400) == "day"
+
+    def test_resolution_respects_retention(self):
+        """Test that ranges older than a resolution's retention use coarser rollups"""
+        now = T0 + 365 * 86400
+
+        assert pick_resolution(now - 3 * 86400, now - 3 * 86400 + HOUR, now=now) == "hour"
+        assert pick_resolution(now - 100 * 86400, now - 100 * 86400 + HOUR, now=now) == "day"
+        assert pick_resolution(now - 100 * 86400, now - 93 * 86400, now=now) == "day"
+        assert pick_resolution(now - HOUR, now, now=now) == "minute"
+
+    def test_record_aggregates_in_memory(self, accounting):
+        """Test that each event updates one bucket per resolution"""
+        accounting.record(event(T0 + 10))
+        accounting.record(event(T0 + 20))
+
+        assert len(accounting.pending) == 3
+        minute = accounting.pending[("minute", T0, "agent-1", "openai", "gpt-4")]
+        assert minute.requests == 2
+        assert minute.prompt_tokens == 20
+
+    def test_flushes_merge_into_rows(self, accounting, store):
+        """Test that repeated flushes add to existing rows"""
+        async def scenario():
+            accounting.record(event(T0 + 10, latency_ms=100))
+            await accounting.flush()
+            accounting.record(event(T0 + 20, latency_ms=300, error=True))
+            await accounting.flush()
+            return await accounting.query(T0, T0 + HOUR, resolution="hour")
+
+        result = asyncio.run(scenario())
+
+        assert accounting.pending == {}
+        [row] = result["rows"]
+        assert row["requests"] == 2
+        assert row["errors"] == 1
+        assert row["total_tokens"] == 30
+        assert row["latency"]["avg_ms"] == 200
+        assert row["latency"]["p50_ms"] == pytest.approx(100, rel=0.01)
+
+    def test_failed_flush_keeps_pending(self, accounting, monkeypatch):
+        """Test that rollups survive a database failure"""
+        def broken(pending):
+            raise RuntimeError("database is locked")
+
+        monkeypatch.setattr(accounting.store, "apply", broken)
+        accounting.record(event(T0))
+
+        asyncio.run(accounting.flush())
+
+        assert accounting.flush_errors == 1
+        assert len(accounting.pending) == 3
+
+    def test_group_by_and_cost(self, accounting, monkeypatch):
+        """Test grouping across dimensions and cost estimates"""
+        monkeypatch.setattr(settings, "USAGE_MODEL_PRICES", {"gpt-4": {"prompt": 0.03, "completion": 0.06}})
+
+        async def scenario():
+            for i in range(3):
+                accounting.record(event(T0 + i * HOUR, agent_id="agent-1", model="gpt-4",
+                                        prompt_tokens=1000, completion_tokens=1000))
+                accounting.record(event(T0 + i * HOUR, agent_id="agent-2", model="claude-3-haiku"))
+            await accounting.flush()
+            return (
+                await accounting.query(T0, T0 + 3 * HOUR, resolution="hour", group_by=["model"]),
+                await accounting.query(T0, T0 + 3 * HOUR, group_by=["provider"], bucketed=False),
+            )
+
+        series, summary = asyncio.run(scenario())
+
+        assert len(series["rows"]) == 6
+        gpt = [row for row in series["rows"] if row["model"] == "gpt-4"]
+        assert [row["bucket_start"] for row in gpt] == [T0, T0 + HOUR, T0 + 2 * HOUR]
+        assert gpt[0]["cost_usd"] == pytest.approx(0.09)
+
+        by_provider = {row["provider"]: row for row in summary["rows"]}
+        assert by_provider["openai"]["requests"] == 3
+        assert by_provider["openai"]["cost_usd"] == pytest.approx(0.27)
+        assert by_provider["anthropic"]["cost_usd"] is None
+
+    def test_prune_keeps_day_rollups(self, accounting, store):
+        """Test that old minute and hour rollups are deleted"""
+        asyncio.run(self._record_and_flush(accounting, event(T0)))
+
+        store.prune(now=T0 + 365 * 86400)
+
+        assert store.fetch("minute", T0, T0 + 86400) == []
+        assert store.fetch("hour", T0, T0 + 86400) == []
+        assert len(store.fetch("day", T0, T0 + 86400)) == 1
+
+    def test_old_short_range_reads_retained_rollups(self, accounting, store):
+        """Test that an old, short range is served from rollups that survive pruning"""
+        old = T0 - 10 * 86400
+        asyncio.run(self._record_and_flush(accounting, event(old + 10)))
+        store.prune()
+
+        result = asyncio.run(accounting.query(old, old + HOUR))
+
+        assert result["resolution"] == "hour"
+        assert [row["requests"] for row in result["rows"]] == [1]
+
+    def test_aggregate_without_rows(self):
+        """Test that an empty range yields no rows"""
+        assert aggregate([], ["agent_id"]) == []
+
+    @staticmethod
+    async def _record_and_flush(accounting, *events):
+        for e in events:
+            accounting.record(e)
+        await accounting.flush()
+
+
+class TestUsageEndpoints:
+    """Test suite for the usage API"""
+
+    @pytest.fixture(autouse=True)
+    def use_accounting(self, accounting, monkeypatch):
+        monkeypatch.setattr(usage_routes, "usage_accounting", accounting)
+        monkeypatch.setattr(agents_routes, "usage_accounting", accounting)
+
+    def test_runs_are_recorded(self, client, auth_headers, accounting, mock_agent_request):
+        """Test that agent runs reach the rollups and the summary endpoint"""
+        client.post("/api/agents/run", json=mock_agent_request, headers=auth_headers)
+        asyncio.run(accounting.flush())
+
+        response = client.get("/api/usage/summary", headers=auth_headers)
+
+        assert response.status_code == 200
+        [row] = response.json()["rows"]
+        assert row["agent_id"] == "test-agent"
+        assert row["requests"] == 1
+        assert row["latency"]["p50_ms"] >= 100
+
+    def test_timeseries(self, client, auth_headers, accounting):
+        """Test the per-bucket endpoint"""
+        for i in range(5):
+            accounting.record(event(T0 + i * 60))
+        asyncio.run(accounting.flush())
+
+        response = client.get(
+            "/api/usage/timeseries",
+            params={"start": T0, "end": T0 + HOUR, "group_by": "agent_id"},
+            headers=auth_headers,
+        )
+
+        body = response.json()
+        assert body["resolution"] == "minute"
+        assert [row["requests"] for row in body["rows"]] == [1] * 5
+
+    def test_validation(self, client, auth_headers):
+        """Test rejected parameters"""
+        assert client.get("/api/usage/summary", params={"group_by": "user"}, headers=auth_headers).status_code == 400
+        assert client.get("/api/usage/timeseries", params={"resolution": "week"}, headers=auth_headers).status_code == 400
+        assert client.get("/api/usage/summary", params={"start": 10, "end": 5}, headers=auth_headers).status_code == 400
+
+    def test_requires_auth(self, client):
+        assert client.get("/api/usage/summary").status_code == 401
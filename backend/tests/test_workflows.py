@@ -0,0 +1,201 @@
+"""
+Tests for the workflow orchestrator
+"""
+
+import asyncio
+
+import pytest
+from fastapi import status
+from pydantic import ValidationError
+
+from app.services.workflows import StepMemo, WorkflowRequest, WorkflowRun
+
+
+class FakeAgents:
+    """Step executor that echoes prompts and records concurrency"""
+
+    def __init__(self, delay: float = 0.05, outputs=None, fail=()):
+        self.delay = delay
+        self.outputs = outputs or {}
+        self.fail = set(fail)
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, step, prompt):
+        self.calls.append((step.id, prompt))
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        if step.id in self.fail:
+            raise RuntimeError(f"{step.id} exploded")
+        output = self.outputs.get(step.id, f"<{step.id}: {prompt}>")
+        return output, {"prompt_tokens": 2, "completion_tokens": 3, "total_tokens": 5}
+
+
+def _run(spec, agents, memo=None, events=None):
+    request = WorkflowRequest.model_validate(spec)
+    emit = events.append if events is not None else None
+    return asyncio.run(WorkflowRun(request, agents, emit=emit, memo=memo or StepMemo(100, 60)).run())
+
+
+DIAMOND = {
+    "inputs": {"topic": "caching"},
+    "steps": [
+        {"id": "outline", "agent_id": "a", "prompt": "Outline {{ input.topic }}"},
+        {"id": "pros", "agent_id": "a", "prompt": "Pros of {{outline}}", "depends_on": ["outline"]},
+        {"id": "cons", "agent_id": "a", "prompt": "Cons of {{outline}}", "depends_on": ["outline"]},
+        {"id": "verdict", "agent_id": "b", "prompt": "{{pros}} vs {{cons}}", "depends_on": ["pros", "cons"]},
+    ],
+}
+
+
+class TestWorkflowValidation:
+    """Test suite for workflow graph validation"""
+
+    @pytest.mark.parametrize("steps, message", [
+        ([{"id": "a", "agent_id": "x", "prompt": "p"}, {"id": "a", "agent_id": "x", "prompt": "p"}], "Duplicate"),
+        ([{"id": "a", "agent_id": "x", "prompt": "p", "depends_on": ["b"]}], "unknown step"),
+        ([{"id": "a", "agent_id": "x", "prompt": "p", "depends_on": ["a"]}], "itself"),
+        ([
+            {"id": "a", "agent_id": "x", "prompt": "p", "depends_on": ["b"]},
+            {"id": "b", "agent_id": "x", "prompt": "p", "depends_on": ["a"]},
+        ], "cycle"),
+        ([{"id": "a", "agent_id": "x", "prompt": "{{ b }}"}, {"id": "b", "agent_id": "x", "prompt": "p"}], "without depending"),
+        ([{"id": "a", "agent_id": "x", "prompt": "{{ input.missing }}"}], "missing input"),
+        ([{"id": "a", "agent_id": "x", "prompt": "p", "depends_on": [{"step": "a", "when": {"matches": "(a+)+$"}}]}],
+         "Extra inputs are not permitted"),
+    ])
+    def test_invalid_graphs(self, steps, message):
+        """Test that malformed graphs are rejected before running"""
+        with pytest.raises(ValidationError, match=message):
+            WorkflowRequest.model_validate({"steps": steps})
+
+
+class TestWorkflowRun:
+    """Test suite for workflow execution"""
+
+    def test_outputs_feed_inputs(self):
+        """Test that each step sees its dependencies' outputs"""
+        agents = FakeAgents()
+        result = _run(DIAMOND, agents)
+
+        assert result["status"] == "completed"
+        prompts = dict(agents.calls)
+        assert prompts["outline"] == "Outline caching"
+        assert prompts["pros"] == "Pros of <outline: Outline caching>"
+        assert list(result["outputs"]) == ["verdict"]
+        assert result["usage"]["total_tokens"] == 20
+
+    def test_independent_branches_run_concurrently(self):
+        """Test that fan-out steps overlap and the join waits for both"""
+        agents = FakeAgents(delay=0.2)
+        events = []
+        result = _run(DIAMOND, agents, events=events)
+
+        assert agents.peak == 2
+        # Three levels of 0.2s each, not four
+        assert result["duration_ms"] < 750
+        order = [e["step_id"] for e in events if e["type"] == "step_complete"]
+        assert order[0] == "outline" and order[-1] == "verdict"
+
+    def test_max_parallel(self):
+        """Test that max_parallel bounds concurrent steps"""
+        agents = FakeAgents()
+        steps = [{"id": f"s{i}", "agent_id": "a", "prompt": "p"} for i in range(6)]
+        _run({"steps": steps, "max_parallel": 1}, agents)
+
+        assert agents.peak == 1
+
+    def test_conditional_edges(self):
+        """Test that a condition picks a branch and the join runs after it"""
+        agents = FakeAgents(outputs={"triage": "This is a BUG report"})
+        spec = {
+            "steps": [
+                {"id": "triage", "agent_id": "a", "prompt": "classify"},
+                {"id": "fix", "agent_id": "a", "prompt": "fix {{triage}}",
+                 "depends_on": [{"step": "triage", "when": {"contains": "BUG"}}]},
+                {"id": "plan", "agent_id": "a", "prompt": "plan {{triage}}",
+                 "depends_on": [{"step": "triage", "when": {"contains": "BUG", "negate": True}}]},
+                {"id": "reply", "agent_id": "a", "prompt": "[{{fix}}][{{plan}}]", "depends_on": ["fix", "plan"]},
+            ],
+        }
+        result = _run(spec, agents)
+
+        assert result["steps"]["fix"]["status"] == "completed"
+        assert result["steps"]["plan"]["status"] == "skipped"
+        assert dict(agents.calls)["reply"].endswith("][]")
+
+    def test_failure_skips_dependents(self):
+        """Test that a failed step skips its dependents but not other branches"""
+        agents = FakeAgents(fail={"pros"})
+        events = []
+        result = _run(DIAMOND, agents, events=events)
+
+        assert result["status"] == "failed"
+        assert result["steps"]["pros"]["error"] == "pros exploded"
+        assert result["steps"]["cons"]["status"] == "completed"
+        assert result["steps"]["verdict"]["status"] == "skipped"
+        assert events[-1]["type"] == "error" and events[-1]["done"] is True
+
+    def test_memoized_rerun_of_changed_graph(self):
+        """Test that only steps with changed inputs run again"""
+        memo = StepMemo(100, 60)
+        _run(DIAMOND, FakeAgents(), memo=memo)
+
+        changed = {**DIAMOND, "steps": [*DIAMOND["steps"][:2], {**DIAMOND["steps"][2], "prompt": "Risks of {{outline}}"},
+                                        DIAMOND["steps"][3]]}
+        agents = FakeAgents()
+        result = _run(changed, agents, memo=memo)
+
+        assert sorted(step_id for step_id, _ in agents.calls) == ["cons", "verdict"]
+        assert result["steps"]["outline"]["cached"] is True
+        assert result["usage"]["total_tokens"] == 10
+
+    def test_memo_expiry(self):
+        """Test that memoized results expire after the TTL"""
+        memo = StepMemo(10, ttl_seconds=0)
+        memo.put("k", ("out", {}))
+        assert memo.get("k") is None
+
+
+class TestWorkflowEndpoints:
+    """Test suite for the workflow REST and WebSocket APIs"""
+
+    def test_rest_workflow(self, client, auth_headers):
+        """Test running a workflow over REST"""
+        response = client.post("/api/agents/workflow", json=DIAMOND, headers=auth_headers)
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["status"] == "completed"
+        assert set(data["steps"]) == {"outline", "pros", "cons", "verdict"}
+
+    def test_rest_invalid_workflow(self, client, auth_headers):
+        """Test that invalid graphs are a 422"""
+        spec = {"steps": [{"id": "a", "agent_id": "x", "prompt": "p", "depends_on": ["a"]}]}
+        response = client.post("/api/agents/workflow", json=spec, headers=auth_headers)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    @pytest.mark.websocket
+    def test_websocket_progress(self, client):
+        """Test that workflow progress streams in the run event format"""
+        spec = {**DIAMOND, "memoize": False}
+        with client.websocket_connect("/api/agents/stream") as websocket:
+            websocket.send_json({"action": "workflow", **spec})
+            events = []
+            while True:
+                event = websocket.receive_json()
+                events.append(event)
+                if event["done"]:
+                    break
+
+        assert events[0]["type"] == "start" and events[0]["run_id"]
+        assert [e["seq"] for e in events] == list(range(1, len(events) + 1))
+        assert sum(e["type"] == "step_start" for e in events) == 4
+        assert events[-1]["type"] == "complete"
+        assert events[-1]["outputs"]["verdict"]
@@ -34,7 +34,7 @@ export interface AgentRunResponse {
 }
 
 export interface StreamEvent {
-  type: 'start' | 'token' | 'complete' | 'error';
+  type: 'start' | 'token' | 'complete' | 'error' | 'ping';
   content?: string;
   agent_id?: string;
   usage?: any;
@@ -83,6 +83,10 @@ export class AgentScopeClient {
       const data: StreamEvent = JSON.parse(event.data);
 
       switch (data.type) {
+        case 'ping':
+          // Server heartbeat; an unanswered ping closes the connection
+          ws.send(JSON.stringify({ action: 'pong' }));
+          break;
         case 'token':
           if (data.content) onToken(data.content);
           break;